@@ -44,6 +44,35 @@ CREATE TABLE "trigger_control" (
     "enabled" INTEGER
 );
 INSERT INTO gpkg_contents (table_name, data_type) VALUES ('trigger_control', 'aspatial');
+-- Switch of deferred mode of cell triggers (see GeoPackageUtils.deferred_cell_triggers)
+INSERT INTO trigger_control (name, enabled) VALUES ('defer_cells', 0);
+
+
+-- Source rows changed in deferred mode, their cells are resolved by GeoPackageUtils.resolve_deferred_cells
+CREATE TABLE "deferred_cells" (
+    "source" TEXT NOT NULL,
+    "fid" INTEGER NOT NULL,
+    PRIMARY KEY (source, fid) ON CONFLICT IGNORE
+);
+
+
+-- Plugin metadata: schema version (SCHEMA_VERSION of geopackage_utils.py, older GeoPackages are upgraded
+-- by GeoPackageUtils.migrate) and random identity of the database
+CREATE TABLE "flo2d_metadata" (
+    "name" TEXT PRIMARY KEY NOT NULL,
+    "value" TEXT
+);
+INSERT INTO gpkg_contents (table_name, data_type) VALUES ('flo2d_metadata', 'aspatial');
+INSERT INTO flo2d_metadata (name, value) VALUES ('schema_version', '5');
+INSERT INTO flo2d_metadata (name, value) VALUES ('database_id', lower(hex(randomblob(16))));
+
+
+-- Tables modification counters (see GeoPackageUtils.track_table_changes)
+CREATE TABLE IF NOT EXISTS "table_changes" (
+    "name" TEXT PRIMARY KEY NOT NULL,
+    "counter" INTEGER NOT NULL DEFAULT 0
+);
+INSERT OR IGNORE INTO gpkg_contents (table_name, data_type) VALUES ('table_changes', 'aspatial');
 
 
 -- Grid table - data from FPLAIN.DAT, CADPTS.DAT, TOPO.DAT, MANNINGS_N.DAT
@@ -62,6 +91,12 @@ SELECT gpkgAddGeometryColumn('grid', 'geom', 'POLYGON', 0, 0, 0);
 SELECT gpkgAddGeometryTriggers('grid', 'geom');
 SELECT gpkgAddSpatialIndex('grid', 'geom');
 
+-- Grid modification counters used by grid indexes ('grid' for any change, 'grid_geom' for geometry changes),
+-- incremented once per write statement by GeoPackageUtils.execute (see STATEMENT_COUNTERS)
+INSERT INTO table_changes (name, counter) VALUES ('grid', 0);
+INSERT INTO table_changes (name, counter) VALUES ('grid_geom', 0);
+INSERT INTO table_changes (name, counter) VALUES ('raincell_blocks', 0);
+
 -- Inflow - INFLOW.DAT
 
 CREATE TABLE "inflow" (
@@ -1130,23 +1165,45 @@ SELECT gpkgAddGeometryTriggers('mult_lines', 'geom');
 INSERT INTO trigger_control (name, enabled) VALUES ('find_cells_mult_insert', 1);
 CREATE TRIGGER IF NOT EXISTS "find_cells_mult_insert"
     AFTER INSERT ON "mult_areas"
-    WHEN (SELECT enabled FROM trigger_control WHERE name = 'find_cells_mult_insert') AND (NEW."geom" NOT NULL AND NOT ST_IsEmpty(NEW."geom"))
+    WHEN (SELECT enabled FROM trigger_control WHERE name = 'find_cells_mult_insert') AND (NEW."geom" NOT NULL AND NOT ST_IsEmpty(NEW."geom")) AND (SELECT enabled FROM trigger_control WHERE name = 'defer_cells') IS NOT 1
     BEGIN
         DELETE FROM "mult_cells" WHERE area_fid = NEW."fid";
         INSERT INTO "mult_cells" (area_fid, grid_fid, wdr, dm, nodchns, xnmult)
             SELECT NEW.fid, g.fid, NEW.wdr, NEW.dm, NEW.nodchns, NEW. xnmult  FROM grid as g
-            WHERE ST_Intersects(CastAutomagic(g.geom), CastAutomagic(NEW.geom));
+            WHERE g.ROWID IN (
+                SELECT id FROM rtree_grid_geom
+                WHERE ST_MinX(CastAutomagic(NEW.geom)) <= maxx AND ST_MaxX(CastAutomagic(NEW.geom)) >= minx
+                AND ST_MinY(CastAutomagic(NEW.geom)) <= maxy AND ST_MaxY(CastAutomagic(NEW.geom)) >= miny)
+            AND ST_Intersects(CastAutomagic(g.geom), CastAutomagic(NEW.geom));
+    END;
+
+CREATE TRIGGER IF NOT EXISTS "find_cells_mult_deferred_insert"
+    AFTER INSERT ON "mult_areas"
+    WHEN (SELECT enabled FROM trigger_control WHERE name = 'find_cells_mult_insert') AND (NEW."geom" NOT NULL AND NOT ST_IsEmpty(NEW."geom")) AND (SELECT enabled FROM trigger_control WHERE name = 'defer_cells') IS 1
+    BEGIN
+        INSERT INTO "deferred_cells" (source, fid) VALUES ('mult_areas', NEW."fid");
     END;
 
 INSERT INTO trigger_control (name, enabled) VALUES ('find_cells_mult_update', 1);
 CREATE TRIGGER IF NOT EXISTS "find_cells_mult_update"
     AFTER UPDATE ON "mult_areas"
-    WHEN (SELECT enabled FROM trigger_control WHERE name = 'find_cells_mult_update') AND (NEW."geom" NOT NULL AND NOT ST_IsEmpty(NEW."geom"))
+    WHEN (SELECT enabled FROM trigger_control WHERE name = 'find_cells_mult_update') AND (NEW."geom" NOT NULL AND NOT ST_IsEmpty(NEW."geom")) AND (SELECT enabled FROM trigger_control WHERE name = 'defer_cells') IS NOT 1
     BEGIN
         DELETE FROM "mult_cells" WHERE area_fid = OLD."fid";
         INSERT INTO "mult_cells" (area_fid, grid_fid, wdr, dm, nodchns, xnmult)
         SELECT NEW.fid, g.fid, NEW.wdr, NEW.dm, NEW.nodchns, NEW.xnmult  FROM grid as g
-        WHERE ST_Intersects(CastAutomagic(g.geom), CastAutomagic(NEW.geom));
+        WHERE g.ROWID IN (
+            SELECT id FROM rtree_grid_geom
+            WHERE ST_MinX(CastAutomagic(NEW.geom)) <= maxx AND ST_MaxX(CastAutomagic(NEW.geom)) >= minx
+            AND ST_MinY(CastAutomagic(NEW.geom)) <= maxy AND ST_MaxY(CastAutomagic(NEW.geom)) >= miny)
+        AND ST_Intersects(CastAutomagic(g.geom), CastAutomagic(NEW.geom));
+    END;
+
+CREATE TRIGGER IF NOT EXISTS "find_cells_mult_deferred_update"
+    AFTER UPDATE ON "mult_areas"
+    WHEN (SELECT enabled FROM trigger_control WHERE name = 'find_cells_mult_update') AND (NEW."geom" NOT NULL AND NOT ST_IsEmpty(NEW."geom")) AND (SELECT enabled FROM trigger_control WHERE name = 'defer_cells') IS 1
+    BEGIN
+        INSERT INTO "deferred_cells" (source, fid) VALUES ('mult_areas', NEW."fid");
     END;
 
 INSERT INTO trigger_control (name, enabled) VALUES ('find_cells_mult_delete', 1);
@@ -1161,24 +1218,46 @@ CREATE TRIGGER IF NOT EXISTS "find_cells_mult_delete"
 INSERT INTO trigger_control (name, enabled) VALUES ('find_cells_mult_line_insert', 1);
 CREATE TRIGGER IF NOT EXISTS "find_cells_mult_line_insert"
     AFTER INSERT ON "mult_lines"
-    WHEN (SELECT enabled FROM trigger_control WHERE name = 'find_cells_mult_line_insert') AND (NEW."geom" NOT NULL AND NOT ST_IsEmpty(NEW."geom"))
+    WHEN (SELECT enabled FROM trigger_control WHERE name = 'find_cells_mult_line_insert') AND (NEW."geom" NOT NULL AND NOT ST_IsEmpty(NEW."geom")) AND (SELECT enabled FROM trigger_control WHERE name = 'defer_cells') IS NOT 1
     BEGIN
         DELETE FROM "mult_cells" WHERE line_fid = NEW."fid";
         INSERT INTO "mult_cells" (line_fid, grid_fid, wdr, dm, nodchns, xnmult)
             SELECT NEW.fid, g.fid, NEW.wdr, NEW.dm, NEW.nodchns, NEW.xnmult  FROM grid as g
-            WHERE ST_Crosses(CastAutomagic(g.geom), CastAutomagic(NEW.geom));
+            WHERE g.ROWID IN (
+                SELECT id FROM rtree_grid_geom
+                WHERE ST_MinX(CastAutomagic(NEW.geom)) <= maxx AND ST_MaxX(CastAutomagic(NEW.geom)) >= minx
+                AND ST_MinY(CastAutomagic(NEW.geom)) <= maxy AND ST_MaxY(CastAutomagic(NEW.geom)) >= miny)
+            AND ST_Crosses(CastAutomagic(g.geom), CastAutomagic(NEW.geom));
+    END;
+
+CREATE TRIGGER IF NOT EXISTS "find_cells_mult_line_deferred_insert"
+    AFTER INSERT ON "mult_lines"
+    WHEN (SELECT enabled FROM trigger_control WHERE name = 'find_cells_mult_line_insert') AND (NEW."geom" NOT NULL AND NOT ST_IsEmpty(NEW."geom")) AND (SELECT enabled FROM trigger_control WHERE name = 'defer_cells') IS 1
+    BEGIN
+        INSERT INTO "deferred_cells" (source, fid) VALUES ('mult_lines', NEW."fid");
     END;
 
 
 INSERT INTO trigger_control (name, enabled) VALUES ('find_cells_mult_line_update', 1);
 CREATE TRIGGER IF NOT EXISTS "find_cells_mult_line_update"
     AFTER UPDATE ON "mult_lines"
-    WHEN (SELECT enabled FROM trigger_control WHERE name = 'find_cells_mult_line_update') AND (NEW."geom" NOT NULL AND NOT ST_IsEmpty(NEW."geom"))
+    WHEN (SELECT enabled FROM trigger_control WHERE name = 'find_cells_mult_line_update') AND (NEW."geom" NOT NULL AND NOT ST_IsEmpty(NEW."geom")) AND (SELECT enabled FROM trigger_control WHERE name = 'defer_cells') IS NOT 1
     BEGIN
         DELETE FROM "mult_cells" WHERE line_fid = OLD."fid";
         INSERT INTO "mult_cells" (line_fid, grid_fid, wdr, dm, nodchns, xnmult)
         SELECT NEW.fid, g.fid, NEW.wdr, NEW.dm, NEW.nodchns, NEW.xnmult FROM grid as g
-        WHERE ST_Crosses(CastAutomagic(g.geom), CastAutomagic(NEW.geom));
+        WHERE g.ROWID IN (
+            SELECT id FROM rtree_grid_geom
+            WHERE ST_MinX(CastAutomagic(NEW.geom)) <= maxx AND ST_MaxX(CastAutomagic(NEW.geom)) >= minx
+            AND ST_MinY(CastAutomagic(NEW.geom)) <= maxy AND ST_MaxY(CastAutomagic(NEW.geom)) >= miny)
+        AND ST_Crosses(CastAutomagic(g.geom), CastAutomagic(NEW.geom));
+    END;
+
+CREATE TRIGGER IF NOT EXISTS "find_cells_mult_line_deferred_update"
+    AFTER UPDATE ON "mult_lines"
+    WHEN (SELECT enabled FROM trigger_control WHERE name = 'find_cells_mult_line_update') AND (NEW."geom" NOT NULL AND NOT ST_IsEmpty(NEW."geom")) AND (SELECT enabled FROM trigger_control WHERE name = 'defer_cells') IS 1
+    BEGIN
+        INSERT INTO "deferred_cells" (source, fid) VALUES ('mult_lines', NEW."fid");
     END;
 
 
@@ -1213,23 +1292,45 @@ INSERT INTO gpkg_contents (table_name, data_type) VALUES ('simple_mult_cells', '
 INSERT INTO trigger_control (name, enabled) VALUES ('find_cells_simple_mult_line_insert', 1);
 CREATE TRIGGER IF NOT EXISTS "find_cells_simple_mult_line_insert"
     AFTER INSERT ON "simple_mult_lines"
-    WHEN (SELECT enabled FROM trigger_control WHERE name = 'find_cells_simple_mult_line_insert') AND (NEW."geom" NOT NULL AND NOT ST_IsEmpty(NEW."geom"))
+    WHEN (SELECT enabled FROM trigger_control WHERE name = 'find_cells_simple_mult_line_insert') AND (NEW."geom" NOT NULL AND NOT ST_IsEmpty(NEW."geom")) AND (SELECT enabled FROM trigger_control WHERE name = 'defer_cells') IS NOT 1
     BEGIN
         DELETE FROM "simple_mult_cells" WHERE line_fid = NEW."fid";
         INSERT INTO "simple_mult_cells" (line_fid, grid_fid)
             SELECT NEW.fid, g.fid FROM grid as g
-            WHERE ST_Crosses(CastAutomagic(g.geom), CastAutomagic(NEW.geom));
+            WHERE g.ROWID IN (
+                SELECT id FROM rtree_grid_geom
+                WHERE ST_MinX(CastAutomagic(NEW.geom)) <= maxx AND ST_MaxX(CastAutomagic(NEW.geom)) >= minx
+                AND ST_MinY(CastAutomagic(NEW.geom)) <= maxy AND ST_MaxY(CastAutomagic(NEW.geom)) >= miny)
+            AND ST_Crosses(CastAutomagic(g.geom), CastAutomagic(NEW.geom));
+    END;
+
+CREATE TRIGGER IF NOT EXISTS "find_cells_simple_mult_line_deferred_insert"
+    AFTER INSERT ON "simple_mult_lines"
+    WHEN (SELECT enabled FROM trigger_control WHERE name = 'find_cells_simple_mult_line_insert') AND (NEW."geom" NOT NULL AND NOT ST_IsEmpty(NEW."geom")) AND (SELECT enabled FROM trigger_control WHERE name = 'defer_cells') IS 1
+    BEGIN
+        INSERT INTO "deferred_cells" (source, fid) VALUES ('simple_mult_lines', NEW."fid");
     END;
 
 INSERT INTO trigger_control (name, enabled) VALUES ('find_cells_simple_mult_line_update', 1);
 CREATE TRIGGER IF NOT EXISTS "find_cells_simple_mult_line_update"
     AFTER UPDATE ON "simple_mult_lines"
-    WHEN (SELECT enabled FROM trigger_control WHERE name = 'find_cells_simple_mult_line_update') AND (NEW."geom" NOT NULL AND NOT ST_IsEmpty(NEW."geom"))
+    WHEN (SELECT enabled FROM trigger_control WHERE name = 'find_cells_simple_mult_line_update') AND (NEW."geom" NOT NULL AND NOT ST_IsEmpty(NEW."geom")) AND (SELECT enabled FROM trigger_control WHERE name = 'defer_cells') IS NOT 1
     BEGIN
         DELETE FROM "simple_mult_cells" WHERE line_fid = OLD."fid";
         INSERT INTO "simple_mult_cells" (line_fid, grid_fid)
         SELECT NEW.fid, g.fid FROM grid as g
-        WHERE ST_Crosses(CastAutomagic(g.geom), CastAutomagic(NEW.geom));
+        WHERE g.ROWID IN (
+            SELECT id FROM rtree_grid_geom
+            WHERE ST_MinX(CastAutomagic(NEW.geom)) <= maxx AND ST_MaxX(CastAutomagic(NEW.geom)) >= minx
+            AND ST_MinY(CastAutomagic(NEW.geom)) <= maxy AND ST_MaxY(CastAutomagic(NEW.geom)) >= miny)
+        AND ST_Crosses(CastAutomagic(g.geom), CastAutomagic(NEW.geom));
+    END;
+
+CREATE TRIGGER IF NOT EXISTS "find_cells_simple_mult_line_deferred_update"
+    AFTER UPDATE ON "simple_mult_lines"
+    WHEN (SELECT enabled FROM trigger_control WHERE name = 'find_cells_simple_mult_line_update') AND (NEW."geom" NOT NULL AND NOT ST_IsEmpty(NEW."geom")) AND (SELECT enabled FROM trigger_control WHERE name = 'defer_cells') IS 1
+    BEGIN
+        INSERT INTO "deferred_cells" (source, fid) VALUES ('simple_mult_lines', NEW."fid");
     END;
 
   
@@ -1799,22 +1900,44 @@ INSERT INTO gpkg_contents (table_name, data_type) VALUES ('breach_fragility_curv
 
 CREATE TRIGGER IF NOT EXISTS "find_breach_cells_insert"
     AFTER INSERT ON "breach"
-    WHEN (new."geom" NOT NULL AND NOT ST_IsEmpty(NEW."geom"))
+    WHEN (new."geom" NOT NULL AND NOT ST_IsEmpty(NEW."geom")) AND (SELECT enabled FROM trigger_control WHERE name = 'defer_cells') IS NOT 1
     BEGIN
         DELETE FROM "breach_cells" WHERE breach_fid = NEW."fid";
         INSERT INTO "breach_cells" (breach_fid, grid_fid) SELECT NEW.fid, g.fid FROM grid as g
-        WHERE ST_Intersects(CastAutomagic(g.geom), CastAutomagic(NEW.geom));
+        WHERE g.ROWID IN (
+            SELECT id FROM rtree_grid_geom
+            WHERE ST_MinX(CastAutomagic(NEW.geom)) <= maxx AND ST_MaxX(CastAutomagic(NEW.geom)) >= minx
+            AND ST_MinY(CastAutomagic(NEW.geom)) <= maxy AND ST_MaxY(CastAutomagic(NEW.geom)) >= miny)
+        AND ST_Intersects(CastAutomagic(g.geom), CastAutomagic(NEW.geom));
+    END;
+
+CREATE TRIGGER IF NOT EXISTS "find_breach_cells_deferred_insert"
+    AFTER INSERT ON "breach"
+    WHEN (new."geom" NOT NULL AND NOT ST_IsEmpty(NEW."geom")) AND (SELECT enabled FROM trigger_control WHERE name = 'defer_cells') IS 1
+    BEGIN
+        INSERT INTO "deferred_cells" (source, fid) VALUES ('breach', NEW."fid");
     END;
 
 
 CREATE TRIGGER IF NOT EXISTS "find_breach_cells_update"
     AFTER UPDATE ON "breach"
-    WHEN (NEW."geom" NOT NULL AND NOT ST_IsEmpty(NEW."geom"))
+    WHEN (NEW."geom" NOT NULL AND NOT ST_IsEmpty(NEW."geom")) AND (SELECT enabled FROM trigger_control WHERE name = 'defer_cells') IS NOT 1
     BEGIN
         DELETE FROM "breach_cells" WHERE breach_fid = NEW."fid";
         INSERT INTO "breach_cells" (breach_fid, grid_fid)
         SELECT NEW.fid, g.fid FROM grid as g
-        WHERE ST_Intersects(CastAutomagic(g.geom), CastAutomagic(NEW.geom));
+        WHERE g.ROWID IN (
+            SELECT id FROM rtree_grid_geom
+            WHERE ST_MinX(CastAutomagic(NEW.geom)) <= maxx AND ST_MaxX(CastAutomagic(NEW.geom)) >= minx
+            AND ST_MinY(CastAutomagic(NEW.geom)) <= maxy AND ST_MaxY(CastAutomagic(NEW.geom)) >= miny)
+        AND ST_Intersects(CastAutomagic(g.geom), CastAutomagic(NEW.geom));
+    END;
+
+CREATE TRIGGER IF NOT EXISTS "find_breach_cells_deferred_update"
+    AFTER UPDATE ON "breach"
+    WHEN (NEW."geom" NOT NULL AND NOT ST_IsEmpty(NEW."geom")) AND (SELECT enabled FROM trigger_control WHERE name = 'defer_cells') IS 1
+    BEGIN
+        INSERT INTO "deferred_cells" (source, fid) VALUES ('breach', NEW."fid");
     END;
 
 CREATE TRIGGER IF NOT EXISTS "find_breach_cells_delete"
@@ -1960,23 +2083,45 @@ INSERT INTO gpkg_contents (table_name, data_type) VALUES ('sed_supply_frac_data'
 INSERT INTO trigger_control (name, enabled) VALUES ('find_cells_sed_areas_insert', 1);
 CREATE TRIGGER IF NOT EXISTS "find_cells_sed_areas_insert"
     AFTER INSERT ON "sed_group_areas"
-    WHEN (SELECT enabled FROM trigger_control WHERE name = 'find_cells_sed_areas_insert') AND (NEW."geom" NOT NULL AND NOT ST_IsEmpty(NEW."geom"))
+    WHEN (SELECT enabled FROM trigger_control WHERE name = 'find_cells_sed_areas_insert') AND (NEW."geom" NOT NULL AND NOT ST_IsEmpty(NEW."geom")) AND (SELECT enabled FROM trigger_control WHERE name = 'defer_cells') IS NOT 1
     BEGIN
         DELETE FROM "sed_group_cells" WHERE area_fid = NEW."fid";
         INSERT INTO "sed_group_cells" (area_fid, grid_fid)
             SELECT NEW.fid, g.fid FROM grid as g
-            WHERE ST_Intersects(CastAutomagic(g.geom), CastAutomagic(NEW.geom));
+            WHERE g.ROWID IN (
+                SELECT id FROM rtree_grid_geom
+                WHERE ST_MinX(CastAutomagic(NEW.geom)) <= maxx AND ST_MaxX(CastAutomagic(NEW.geom)) >= minx
+                AND ST_MinY(CastAutomagic(NEW.geom)) <= maxy AND ST_MaxY(CastAutomagic(NEW.geom)) >= miny)
+            AND ST_Intersects(CastAutomagic(g.geom), CastAutomagic(NEW.geom));
+    END;
+
+CREATE TRIGGER IF NOT EXISTS "find_cells_sed_areas_deferred_insert"
+    AFTER INSERT ON "sed_group_areas"
+    WHEN (SELECT enabled FROM trigger_control WHERE name = 'find_cells_sed_areas_insert') AND (NEW."geom" NOT NULL AND NOT ST_IsEmpty(NEW."geom")) AND (SELECT enabled FROM trigger_control WHERE name = 'defer_cells') IS 1
+    BEGIN
+        INSERT INTO "deferred_cells" (source, fid) VALUES ('sed_group_areas', NEW."fid");
     END;
     
 INSERT INTO trigger_control (name, enabled) VALUES ('find_cells_sed_areas_update', 1);
 CREATE TRIGGER IF NOT EXISTS "find_cells_sed_areas_update"
     AFTER UPDATE ON "sed_group_areas"
-    WHEN (SELECT enabled FROM trigger_control WHERE name = 'find_cells_sed_areas_update') AND (NEW."geom" NOT NULL AND NOT ST_IsEmpty(NEW."geom"))
+    WHEN (SELECT enabled FROM trigger_control WHERE name = 'find_cells_sed_areas_update') AND (NEW."geom" NOT NULL AND NOT ST_IsEmpty(NEW."geom")) AND (SELECT enabled FROM trigger_control WHERE name = 'defer_cells') IS NOT 1
     BEGIN
         DELETE FROM "sed_group_cells" WHERE area_fid = OLD."fid";
         INSERT INTO "sed_group_cells" (area_fid, grid_fid)
         SELECT NEW.fid, g.fid FROM grid as g
-        WHERE ST_Intersects(CastAutomagic(g.geom), CastAutomagic(NEW.geom));
+        WHERE g.ROWID IN (
+            SELECT id FROM rtree_grid_geom
+            WHERE ST_MinX(CastAutomagic(NEW.geom)) <= maxx AND ST_MaxX(CastAutomagic(NEW.geom)) >= minx
+            AND ST_MinY(CastAutomagic(NEW.geom)) <= maxy AND ST_MaxY(CastAutomagic(NEW.geom)) >= miny)
+        AND ST_Intersects(CastAutomagic(g.geom), CastAutomagic(NEW.geom));
+    END;
+
+CREATE TRIGGER IF NOT EXISTS "find_cells_sed_areas_deferred_update"
+    AFTER UPDATE ON "sed_group_areas"
+    WHEN (SELECT enabled FROM trigger_control WHERE name = 'find_cells_sed_areas_update') AND (NEW."geom" NOT NULL AND NOT ST_IsEmpty(NEW."geom")) AND (SELECT enabled FROM trigger_control WHERE name = 'defer_cells') IS 1
+    BEGIN
+        INSERT INTO "deferred_cells" (source, fid) VALUES ('sed_group_areas', NEW."fid");
     END;
 
 INSERT INTO trigger_control (name, enabled) VALUES ('find_cells_sed_areas_delete', 1);
@@ -1991,11 +2136,22 @@ CREATE TRIGGER IF NOT EXISTS "find_cells_sed_areas_delete"
 INSERT INTO trigger_control (name, enabled) VALUES ('find_sed_rigid_cells_insert', 1);
 CREATE TRIGGER IF NOT EXISTS "find_sed_rigid_cells_insert"
     AFTER INSERT ON "sed_rigid_areas"
-    WHEN (new."geom" NOT NULL AND NOT ST_IsEmpty(NEW."geom"))
+    WHEN (new."geom" NOT NULL AND NOT ST_IsEmpty(NEW."geom")) AND (SELECT enabled FROM trigger_control WHERE name = 'defer_cells') IS NOT 1
     BEGIN
         DELETE FROM "sed_rigid_cells" WHERE area_fid = NEW."fid";
         INSERT INTO "sed_rigid_cells" (area_fid, grid_fid) SELECT NEW.fid, g.fid FROM grid as g
-        WHERE ST_Intersects(CastAutomagic(g.geom), CastAutomagic(NEW.geom));
+        WHERE g.ROWID IN (
+            SELECT id FROM rtree_grid_geom
+            WHERE ST_MinX(CastAutomagic(NEW.geom)) <= maxx AND ST_MaxX(CastAutomagic(NEW.geom)) >= minx
+            AND ST_MinY(CastAutomagic(NEW.geom)) <= maxy AND ST_MaxY(CastAutomagic(NEW.geom)) >= miny)
+        AND ST_Intersects(CastAutomagic(g.geom), CastAutomagic(NEW.geom));
+    END;
+
+CREATE TRIGGER IF NOT EXISTS "find_sed_rigid_cells_deferred_insert"
+    AFTER INSERT ON "sed_rigid_areas"
+    WHEN (new."geom" NOT NULL AND NOT ST_IsEmpty(NEW."geom")) AND (SELECT enabled FROM trigger_control WHERE name = 'defer_cells') IS 1
+    BEGIN
+        INSERT INTO "deferred_cells" (source, fid) VALUES ('sed_rigid_areas', NEW."fid");
     END;
 
 INSERT INTO trigger_control (name, enabled) VALUES ('find_sed_rigid_cell_delete', 1);
@@ -2010,23 +2166,45 @@ CREATE TRIGGER IF NOT EXISTS "find_sed_rigid_cell_delete"
 INSERT INTO trigger_control (name, enabled) VALUES ('find_cells_sed_supply_areas_insert', 1);
 CREATE TRIGGER IF NOT EXISTS "find_cells_sed_supply_areas_insert"
     AFTER INSERT ON "sed_supply_areas"
-    WHEN (SELECT enabled FROM trigger_control WHERE name = 'find_cells_sed_supply_areas_insert') AND (NEW."geom" NOT NULL AND NOT ST_IsEmpty(NEW."geom"))
+    WHEN (SELECT enabled FROM trigger_control WHERE name = 'find_cells_sed_supply_areas_insert') AND (NEW."geom" NOT NULL AND NOT ST_IsEmpty(NEW."geom")) AND (SELECT enabled FROM trigger_control WHERE name = 'defer_cells') IS NOT 1
     BEGIN
         DELETE FROM "sed_supply_cells" WHERE area_fid = NEW."fid";
         INSERT INTO "sed_supply_cells" (area_fid, grid_fid)
             SELECT NEW.fid, g.fid FROM grid as g
-            WHERE ST_Intersects(CastAutomagic(g.geom), CastAutomagic(NEW.geom));
+            WHERE g.ROWID IN (
+                SELECT id FROM rtree_grid_geom
+                WHERE ST_MinX(CastAutomagic(NEW.geom)) <= maxx AND ST_MaxX(CastAutomagic(NEW.geom)) >= minx
+                AND ST_MinY(CastAutomagic(NEW.geom)) <= maxy AND ST_MaxY(CastAutomagic(NEW.geom)) >= miny)
+            AND ST_Intersects(CastAutomagic(g.geom), CastAutomagic(NEW.geom));
+    END;
+
+CREATE TRIGGER IF NOT EXISTS "find_cells_sed_supply_areas_deferred_insert"
+    AFTER INSERT ON "sed_supply_areas"
+    WHEN (SELECT enabled FROM trigger_control WHERE name = 'find_cells_sed_supply_areas_insert') AND (NEW."geom" NOT NULL AND NOT ST_IsEmpty(NEW."geom")) AND (SELECT enabled FROM trigger_control WHERE name = 'defer_cells') IS 1
+    BEGIN
+        INSERT INTO "deferred_cells" (source, fid) VALUES ('sed_supply_areas', NEW."fid");
     END;
 
 INSERT INTO trigger_control (name, enabled) VALUES ('find_cells_sed_supply_areas_update', 1);
 CREATE TRIGGER IF NOT EXISTS "find_cells_sed_supply_areas_update"
     AFTER UPDATE ON "sed_supply_areas"
-    WHEN (SELECT enabled FROM trigger_control WHERE name = 'find_cells_sed_supply_areas_update') AND (NEW."geom" NOT NULL AND NOT ST_IsEmpty(NEW."geom"))
+    WHEN (SELECT enabled FROM trigger_control WHERE name = 'find_cells_sed_supply_areas_update') AND (NEW."geom" NOT NULL AND NOT ST_IsEmpty(NEW."geom")) AND (SELECT enabled FROM trigger_control WHERE name = 'defer_cells') IS NOT 1
     BEGIN
         DELETE FROM "sed_supply_cells" WHERE area_fid = OLD."fid";
         INSERT INTO "sed_supply_cells" (area_fid, grid_fid)
         SELECT NEW.fid, g.fid FROM grid as g
-        WHERE ST_Intersects(CastAutomagic(g.geom), CastAutomagic(NEW.geom));
+        WHERE g.ROWID IN (
+            SELECT id FROM rtree_grid_geom
+            WHERE ST_MinX(CastAutomagic(NEW.geom)) <= maxx AND ST_MaxX(CastAutomagic(NEW.geom)) >= minx
+            AND ST_MinY(CastAutomagic(NEW.geom)) <= maxy AND ST_MaxY(CastAutomagic(NEW.geom)) >= miny)
+        AND ST_Intersects(CastAutomagic(g.geom), CastAutomagic(NEW.geom));
+    END;
+
+CREATE TRIGGER IF NOT EXISTS "find_cells_sed_supply_areas_deferred_update"
+    AFTER UPDATE ON "sed_supply_areas"
+    WHEN (SELECT enabled FROM trigger_control WHERE name = 'find_cells_sed_supply_areas_update') AND (NEW."geom" NOT NULL AND NOT ST_IsEmpty(NEW."geom")) AND (SELECT enabled FROM trigger_control WHERE name = 'defer_cells') IS 1
+    BEGIN
+        INSERT INTO "deferred_cells" (source, fid) VALUES ('sed_supply_areas', NEW."fid");
     END;
 
 INSERT INTO trigger_control (name, enabled) VALUES ('find_cells_sed_supply_areas_delete', 1);
@@ -2746,6 +2924,16 @@ CREATE TABLE "raincell_data" (
 );
 INSERT INTO gpkg_contents (table_name, data_type) VALUES ('raincell_data', 'aspatial');
 
+CREATE TABLE "raincell_blocks" (
+    "fid" INTEGER PRIMARY KEY NOT NULL,
+    "interval_nr" INTEGER, -- Time interval number (-1 for blocks of cells fids)
+    "block" INTEGER,
+    "data" BLOB -- zlib compressed float32 values (int32 cells fids) of the block cells.
+);
+CREATE UNIQUE INDEX "raincell_blocks_interval" ON "raincell_blocks" (interval_nr, block);
+CREATE INDEX "raincell_blocks_block" ON "raincell_blocks" (block);
+INSERT INTO gpkg_contents (table_name, data_type) VALUES ('raincell_blocks', 'aspatial');
+
 CREATE TABLE "buildings_areas" (
     "fid" INTEGER NOT NULL PRIMARY KEY,
     "adjustment_factor" REAL
@@ -2782,3 +2970,16 @@ SELECT gpkgAddSpatialIndex('buildings_stats', 'geom');
 
 
 
+
+CREATE TABLE "debug_issues" (
+    "fid" INTEGER PRIMARY KEY NOT NULL,
+    "grid_fid" INTEGER, -- Cell of the issue
+    "code" INTEGER, -- Error or warning code of DEBUG and diagnostics files
+    "description" TEXT,
+    "source" TEXT -- Name of the imported file
+);
+CREATE INDEX "debug_issues_grid_fid" ON "debug_issues" ("grid_fid");
+CREATE INDEX "debug_issues_code" ON "debug_issues" ("code");
+INSERT INTO gpkg_contents (table_name, data_type, srs_id) VALUES ('debug_issues', 'features', 4326);
+SELECT gpkgAddGeometryColumn('debug_issues', 'geom', 'POINT', 0, 0, 0);
+SELECT gpkgAddGeometryTriggers('debug_issues', 'geom');
@@ -27,6 +27,7 @@ from .layers import Layers
 from .user_communication import UserCommunication
 from .geopackage_utils import connection_required, database_disconnect, GeoPackageUtils
 from .flo2d_ie.flo2dgeopackage import Flo2dGeoPackage
+from .flo2d_ie.export_scheduler import ExportScheduler, export_files, MANIFEST
 from .flo2d_tools.grid_info_tool import GridInfoTool
 from .flo2d_tools.info_tool import InfoTool
 from .flo2d_tools.channel_profile_tool import ChannelProfile
@@ -828,6 +829,25 @@ class Flo2D(object):
                 else:
                     raise
 
+    def call_export_methods(self, calls, outdir, incremental=False):
+        """
+        Running export methods with ExportScheduler (independent DAT files are written concurrently).
+        In incremental mode, DAT files with unchanged sources since the last export to 'outdir' are kept.
+        """
+        self.files_used = ""
+        self.files_not_used = ""
+        start_time = time.time()
+        track = QSettings().value("FLO-2D/track_export_sources", False, type=bool)
+        scheduler = ExportScheduler(self.f2g, outdir, incremental=incremental, track=track)
+        results = scheduler.run(calls)
+        scheduler.report(results, time.time() - start_time)
+        for r in results:
+            if r.exported:
+                for dat in export_files(r.call):
+                    self.files_used += dat + "\n"
+                if r.call == "export_swmmflo":
+                    self.files_used += "SWMM.INP" + "\n"
+
     @connection_required
     def import_gds(self):
         """
@@ -1033,7 +1053,7 @@ class Flo2D(object):
                         "rain_time_series",
                         "rain_time_series_data",
                         "raincell",
-                        "raincell_data",
+                        "raincell_blocks",
                         "rat_curves",
                         "rat_table",
                         "rbank",
@@ -1626,6 +1646,13 @@ class Flo2D(object):
                         export_calls.remove("export_swmmflort")
                         export_calls.remove("export_swmmoutf")                
                 
+                incremental = False
+                if os.path.isfile(os.path.join(outdir, MANIFEST)):
+                    incremental = self.uc.question(
+                        "This directory contains a previous export.\n\n"
+                        + "Do you want to rewrite only the files with changed data?"
+                    )
+
                 QApplication.setOverrideCursor(Qt.WaitCursor)
 
                 try:
@@ -1634,7 +1661,7 @@ class Flo2D(object):
                     s.setValue("FLO-2D/lastGdsDir", outdir)
 
                     QApplication.setOverrideCursor(Qt.WaitCursor)      
-                    self.call_IO_methods(export_calls, True, outdir)                             
+                    self.call_export_methods(export_calls, outdir, incremental)
                             
                     # The strings list 'export_calls', contains the names of
                     # the methods in the class Flo2dGeoPackage to export (write) the
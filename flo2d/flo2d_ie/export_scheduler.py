@@ -0,0 +1,450 @@
+# -*- coding: utf-8 -*-
+
+# FLO-2D Preprocessor tools for QGIS
+# Copyright © 2021 Lutra Consulting for FLO-2D
+
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version
+"""
+Concurrent export of FLO-2D DAT files.
+
+Export methods of Flo2dGeoPackage are grouped into chains. Methods are chained only if they depend on each other
+(EXPORT_DEPENDENCIES), every chain runs in a worker thread with its own read-only connection to the GeoPackage.
+SQLite queries and files writing release the GIL, so the export takes about as long as the slowest chain.
+Methods changing the GeoPackage (MAIN_CONNECTION_EXPORTS) run first, on the main connection.
+Messages of methods running in worker threads are shown in the main thread when all chains are finished,
+worker threads don't touch the override cursor or any other GUI object.
+
+The manifest in the output directory records identity of the GeoPackage, change counters of source tables
+(EXPORT_TABLES) and hashes of files written by every method. In incremental mode, methods with unchanged tables
+and files of the same GeoPackage are skipped. Changes tracking of source tables (row triggers slowing down writes
+of the tables) is set up only by incremental exports or when opted in (QSettings 'FLO-2D/track_export_sources').
+Counters of just tracked tables are unknown, so their methods are skipped from the next incremental export.
+"""
+import os
+import json
+import time
+import hashlib
+import pathlib
+import traceback
+import multiprocessing
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from qgis.PyQt.QtWidgets import QApplication
+
+from ..geopackage_utils import spatialite_connect
+from .flo2dgeopackage import Flo2dGeoPackage
+
+# Files written by export methods, other methods write single '<suffix>.DAT' file.
+EXPORT_FILES = {
+    "export_cont_toler": ("CONT.DAT", "TOLER.DAT"),
+    "export_mannings_n_topo": ("MANNINGS_N.DAT", "TOPO.DAT"),
+    "export_chan": ("CHAN.DAT", "CHANBANK.DAT"),
+    "export_mult": ("MULT.DAT", "SIMPLE_MULT.DAT"),
+    "export_shallowNSpatial": ("SHALLOWN_SPATIAL.DAT",),
+}
+
+# Export method -> method which has to be finished before it.
+EXPORT_DEPENDENCIES = {
+    "export_xsec": "export_chan",
+    "export_swmmflort": "export_swmmflo",
+    "export_swmmoutf": "export_swmmflort",
+}
+
+# Export methods updating the GeoPackage (CONT parameters, default gutter and multiple channels globals).
+MAIN_CONNECTION_EXPORTS = ("export_cont_toler", "export_gutter", "export_mult")
+
+# Tables read by export methods, besides 'cont' which is read by all of them.
+EXPORT_TABLES = {
+    "export_cont_toler": ("inflow_cells",),
+    "export_mannings_n_topo": ("grid",),
+    "export_inflow": ("inflow", "inflow_cells", "inflow_time_series_data", "reservoirs"),
+    "export_outflow": ("outflow", "outflow_cells", "outflow_time_series_data", "qh_params_data", "qh_table_data"),
+    "export_rain": ("rain", "rain_arf_cells", "rain_time_series_data"),
+    "export_raincell": ("raincell", "raincell_blocks"),
+    "export_infil": (
+        "infil",
+        "infil_cells_green",
+        "infil_cells_horton",
+        "infil_cells_scs",
+        "infil_chan_elems",
+        "infil_chan_seg",
+    ),
+    "export_evapor": ("evapor", "evapor_hourly", "evapor_monthly"),
+    "export_chan": (
+        "chan",
+        "chan_confluences",
+        "chan_elems",
+        "chan_n",
+        "chan_r",
+        "chan_t",
+        "chan_v",
+        "chan_wsel",
+        "noexchange_chan_cells",
+    ),
+    "export_xsec": ("chan_n", "xsec_n_data"),
+    "export_hystruc": (
+        "bridge_variables",
+        "culvert_equations",
+        "rat_curves",
+        "rat_table",
+        "repl_rat_curves",
+        "storm_drains",
+        "struct",
+    ),
+    "export_street": ("street_elems", "street_general", "street_seg", "streets"),
+    "export_arf": ("blocked_cells", "user_blocked_areas"),
+    "export_mult": ("mult", "mult_cells", "simple_mult_cells"),
+    "export_tolspatial": ("tolspatial", "tolspatial_cells"),
+    "export_gutter": ("gutter_areas", "gutter_cells", "gutter_globals", "gutter_lines"),
+    "export_sed": (
+        "mud",
+        "mud_areas",
+        "mud_cells",
+        "sed",
+        "sed_group_areas",
+        "sed_group_cells",
+        "sed_group_frac_data",
+        "sed_groups",
+        "sed_rigid_cells",
+        "sed_supply_areas",
+        "sed_supply_cells",
+        "sed_supply_frac_data",
+    ),
+    "export_levee": ("levee_data", "levee_failure", "levee_fragility", "levee_general"),
+    "export_fpxsec": ("fpxsec", "fpxsec_cells"),
+    "export_breach": ("breach", "breach_cells", "breach_fragility_curves", "breach_global", "levee_data", "levee_general"),
+    "export_fpfroude": ("fpfroude", "fpfroude_cells"),
+    "export_shallowNSpatial": ("spatialshallow", "spatialshallow_cells"),
+    "export_swmmflo": ("swmmflo",),
+    "export_swmmflort": ("swmmflo", "swmmflo_culvert", "swmmflort", "swmmflort_data", "user_swmm_nodes"),
+    "export_swmmoutf": ("swmmoutf",),
+    "export_wsurf": ("wsurf",),
+    "export_wstime": ("wstime",),
+}
+
+# Manifest of exported files written in the output directory.
+MANIFEST = "export_manifest.json"
+
+ExportResult = namedtuple("ExportResult", ["call", "exported", "seconds", "files", "error", "skipped"])
+
+
+def export_files(call):
+    return EXPORT_FILES.get(call, (call.split("_")[-1].upper() + ".DAT",))
+
+
+def export_chains(calls):
+    """
+    Splitting export calls into chains of dependent calls, keeping order of calls within chains.
+    """
+    chains = []
+    chain_of = {}
+    for call in calls:
+        dependency = EXPORT_DEPENDENCIES.get(call)
+        if dependency in chain_of:
+            chain = chain_of[dependency]
+        else:
+            chain = []
+            chains.append(chain)
+        chain.append(call)
+        chain_of[call] = chain
+    return chains
+
+
+def read_only_connection(gpkg_path):
+    """
+    Read-only SpatiaLite connection to the GeoPackage, usable from other thread.
+    """
+    uri = pathlib.Path(os.path.abspath(gpkg_path)).as_uri() + "?mode=ro"
+    return spatialite_connect(uri, uri=True, check_same_thread=False)
+
+
+def database_identity(gutils, gpkg_path):
+    """
+    Identity of the GeoPackage: random id of the database and creation time and size of its file.
+    """
+    try:
+        stat = os.stat(gpkg_path)
+        ctime, size = stat.st_ctime, stat.st_size
+    except (OSError, TypeError, ValueError):
+        ctime = size = None
+    return {"id": gutils.database_id(), "ctime": ctime, "size": size}
+
+
+def same_database(identity, other):
+    """
+    Databases with the id are compared by the id, file ctime and size are only used for databases without it.
+    """
+    if identity is None or other is None or identity["id"] != other["id"]:
+        return False
+    if identity["id"] is None:
+        return identity["ctime"] is not None and (identity["ctime"], identity["size"]) == (other["ctime"], other["size"])
+    return True
+
+
+def file_hash(path):
+    sha = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 ** 2), b""):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+class ExportManifest(object):
+    """
+    JSON manifest of export methods results in the output directory.
+    """
+
+    def __init__(self, outdir):
+        self.outdir = outdir
+        self.entries = {}
+        self.load()
+
+    @property
+    def path(self):
+        return os.path.join(self.outdir, MANIFEST)
+
+    def load(self):
+        self.entries = {}
+        try:
+            with open(self.path, "r") as f:
+                self.entries = json.load(f)["entries"]
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+
+    def save(self):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"entries": self.entries}, f, indent=1)
+        os.replace(tmp_path, self.path)
+
+    def is_current(self, call, gpkg_path, identity, counters):
+        """
+        Checking if the call was exported from the same GeoPackage state and its files are unchanged.
+        Unknown (None) counters are never current.
+        """
+        entry = self.entries.get(call)
+        if entry is None or None in counters.values():
+            return False
+        if entry["gpkg"] != gpkg_path or not same_database(entry.get("database"), identity):
+            return False
+        if entry["counters"] != counters:
+            return False
+        for name, sha in entry["files"].items():
+            path = os.path.join(self.outdir, name)
+            if not os.path.isfile(path) or file_hash(path) != sha:
+                return False
+        return True
+
+    def result(self, call):
+        entry = self.entries[call]
+        files = [(name, os.path.getsize(os.path.join(self.outdir, name))) for name in entry["files"]]
+        return ExportResult(call, entry["exported"], 0.0, files, None, True)
+
+    def update(self, result, gpkg_path, identity, counters):
+        if result.error is not None or None in counters.values():
+            self.entries.pop(result.call, None)
+            return
+        self.entries[result.call] = {
+            "gpkg": gpkg_path,
+            "database": identity,
+            "counters": counters,
+            "exported": result.exported,
+            "files": {name: file_hash(os.path.join(self.outdir, name)) for name, size in result.files},
+        }
+
+
+class DeferredCommunication(object):
+    """
+    UserCommunication of export running in worker thread. Calls of all its methods are recorded and replayed
+    by 'replay' in the main thread. Questions can't wait for an answer there, they are answered with DEFERRED_ANSWER.
+    """
+
+    # UserCommunication methods opening dialogs, the override cursor is restored before them.
+    DIALOGS = ("show_info", "show_warn", "show_critical", "question", "customized_question")
+
+    DEFERRED_ANSWER = False
+
+    def __init__(self, uc):
+        self.uc = uc
+        self.messages = []
+
+    def __getattr__(self, name):
+        if not callable(getattr(self.uc, name)):
+            raise AttributeError(name)
+
+        def record(*args, **kwargs):
+            self.messages.append((name, args, kwargs))
+
+        return record
+
+    def show_error(self, msg, e):
+        # Traceback is only available in the worker thread.
+        self.messages.append(("log_info", (traceback.format_exc(),), {}))
+        self.messages.append(("show_critical", (msg + "\n\nError:\n   " + type(e).__name__ + ": " + str(e),), {}))
+
+    def question(self, msg):
+        self.messages.append(("log_info", ("{} => {}".format(msg, "Yes" if self.DEFERRED_ANSWER else "No"),), {}))
+        return self.DEFERRED_ANSWER
+
+    def replay(self):
+        """
+        Showing recorded messages, must be called in the main thread.
+        """
+        if any(method in self.DIALOGS for method, args, kwargs in self.messages):
+            QApplication.restoreOverrideCursor()
+        for method, args, kwargs in self.messages:
+            getattr(self.uc, method)(*args, **kwargs)
+        self.messages = []
+
+
+class ExportScheduler(object):
+    """
+    Running export methods of 'f2g' (Flo2dGeoPackage) into 'outdir', chains of independent methods concurrently.
+    """
+
+    def __init__(self, f2g, outdir, workers=None, incremental=False, track=False):
+        self.f2g = f2g
+        self.outdir = outdir
+        self.workers = workers
+        self.incremental = incremental
+        # Setting up changes tracking of source tables also in full export.
+        self.track = track
+        # Tables which changes tracking was set up by this export.
+        self.new_tracking = set()
+
+    def track_sources(self, calls):
+        """
+        Setting up changes tracking of source tables of the calls which aren't tracked yet (on the main connection).
+        """
+        tables = {"cont"}
+        for call in calls:
+            tables.update(EXPORT_TABLES.get(call, ()))
+        existing = {row[0] for row in self.f2g.execute("SELECT name FROM sqlite_master WHERE type = 'table';")}
+        with self.f2g.unit_of_work():
+            for table in sorted(tables & existing):
+                if self.f2g.table_change_counter(table) is None:
+                    self.f2g.track_table_changes(table)
+                    self.new_tracking.add(table)
+
+    def source_counters(self, call):
+        """
+        Change counters of tables read by the call (None for tables which aren't tracked or just started to be).
+        """
+        counters = {}
+        for table in ("cont",) + EXPORT_TABLES.get(call, ()):
+            if table in self.new_tracking:
+                counters[table] = None
+                continue
+            try:
+                counters[table] = self.f2g.table_change_counter(table)
+            except Exception:
+                counters[table] = None
+        if call not in EXPORT_TABLES:
+            # Sources of the call are unknown, it is always exported.
+            counters["unknown"] = None
+        return counters
+
+    def run_call(self, f2g, call):
+        start = time.time()
+        error = None
+        try:
+            exported = bool(getattr(f2g, call)(self.outdir))
+        except Exception:
+            exported = False
+            error = traceback.format_exc()
+        seconds = time.time() - start
+        files = []
+        if exported:
+            for name in export_files(call):
+                path = os.path.join(self.outdir, name)
+                # Files not written by this export (e.g. SIMPLE_MULT.DAT of previous export) are not reported.
+                if os.path.isfile(path) and os.path.getmtime(path) >= start - 2:
+                    files.append((name, os.path.getsize(path)))
+        return ExportResult(call, exported, seconds, files, error, False)
+
+    def run_chain(self, f2g, chain):
+        return [self.run_call(f2g, call) for call in chain]
+
+    def worker(self, gpkg_path):
+        """
+        Flo2dGeoPackage on own read-only connection, created in the main thread and used by one worker thread.
+        """
+        f2g = Flo2dGeoPackage(read_only_connection(gpkg_path), self.f2g.iface)
+        f2g.uc = f2g.gutils.uc = DeferredCommunication(self.f2g.uc)
+        f2g.main_thread = False
+        return f2g
+
+    def run(self, calls):
+        """
+        Running export calls. Returns list of ExportResult in order of calls.
+        """
+        results = {}
+        gpkg_path = self.f2g.get_gpkg_path()
+        identity = database_identity(self.f2g, gpkg_path)
+        # Manifest is written by every export, so the next one can be incremental.
+        manifest = ExportManifest(self.outdir)
+        if self.incremental or self.track:
+            self.track_sources(calls)
+        for call in calls:
+            if call not in MAIN_CONNECTION_EXPORTS:
+                continue
+            if self.incremental and manifest.is_current(call, gpkg_path, identity, self.source_counters(call)):
+                results[call] = manifest.result(call)
+                continue
+            results[call] = self.run_call(self.f2g, call)
+            # Counters after the call, which may have updated its own sources.
+            manifest.update(results[call], gpkg_path, identity, self.source_counters(call))
+        counters = {}
+        remaining = []
+        for call in calls:
+            if call in MAIN_CONNECTION_EXPORTS:
+                continue
+            counters[call] = self.source_counters(call)
+            if self.incremental and manifest.is_current(call, gpkg_path, identity, counters[call]):
+                results[call] = manifest.result(call)
+                continue
+            remaining.append(call)
+        chains = export_chains(remaining)
+        workers = self.workers
+        if workers is None:
+            workers = min(len(chains), max(2, multiprocessing.cpu_count()))
+        if workers < 2 or len(chains) < 2 or not gpkg_path or not os.path.isfile(gpkg_path):
+            # Nothing to run concurrently or database without file (e.g. in memory).
+            for chain in chains:
+                results.update((r.call, r) for r in self.run_chain(self.f2g, chain))
+        else:
+            f2gs = [self.worker(gpkg_path) for chain in chains]
+            try:
+                with ThreadPoolExecutor(max_workers=workers) as pool:
+                    futures = [pool.submit(self.run_chain, f2g, chain) for f2g, chain in zip(f2gs, chains)]
+                    for future in futures:
+                        results.update((r.call, r) for r in future.result())
+            finally:
+                for f2g in f2gs:
+                    f2g.uc.replay()
+                    self.f2g.export_messages += f2g.export_messages
+                    f2g.con.close()
+        for call in remaining:
+            manifest.update(results[call], gpkg_path, identity, counters[call])
+        manifest.save()
+        return [results[call] for call in calls]
+
+    def report(self, results, wall_seconds=None):
+        """
+        Logging time and bytes written by every export call.
+        """
+        uc = self.f2g.uc
+        for r in results:
+            if r.error is not None:
+                uc.log_info(r.error)
+            size = sum(s for name, s in r.files)
+            if r.skipped:
+                uc.log_info('unchanged, {0:,d} bytes => "{1}"'.format(size, r.call))
+            else:
+                uc.log_info('{0:.3f} seconds, {1:,d} bytes => "{2}"'.format(r.seconds, size, r.call))
+        if wall_seconds is not None:
+            total = sum(r.seconds for r in results)
+            uc.log_info("Export: {0:.3f} seconds (sum of files {1:.3f} seconds)".format(wall_seconds, total))
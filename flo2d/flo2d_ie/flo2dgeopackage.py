@@ -8,19 +8,37 @@
 # as published by the Free Software Foundation; either version 2
 # of the License, or (at your option) any later version
 import os
+import time
 import traceback
 from ..layers import Layers
 from math import isclose
-from itertools import chain, groupby
+from itertools import chain, groupby, islice
 from operator import itemgetter
+import numpy as np
 from .flo2d_parser import ParseDAT
+from .rainfall_io import RaincellStore, MISSING
 from ..gui.bc_editor_widget import BCEditorWidget
 from ..geopackage_utils import GeoPackageUtils
+from ..flo2d_tools.grid_index import project_grid_index
 from ..utils import float_or_zero
 from qgis.PyQt.QtCore import Qt
 from qgis.PyQt.QtWidgets import QApplication
 from ..utils import get_BC_Border, BC_BORDER
 
+# Buffer size of DAT files written in blocks.
+DAT_BUFFER_SIZE = 4 * 1024 ** 2
+
+
+def format_rows(line_format, *columns):
+    """
+    Formatting rows of columns (NumPy arrays) with printf style line format in a single call.
+    """
+    values = [None] * (len(columns) * columns[0].shape[0])
+    for i, column in enumerate(columns):
+        values[i :: len(columns)] = column.tolist()
+    return (line_format * columns[0].shape[0]) % tuple(values)
+
+
 class Flo2dGeoPackage(GeoPackageUtils):
     """
     Class for proper import and export FLO-2D data.
@@ -31,11 +49,21 @@ class Flo2dGeoPackage(GeoPackageUtils):
         self.cell_size = None
         self.buffer = None
         self.shrink = None
-        self.chunksize = float("inf")
+        self.chunksize = 100000
         self.gutils = GeoPackageUtils(con, iface)
         self.lyrs = Layers(iface)
         self.export_messages = ""
+        # False for exports running in worker threads, the cursor is left to the main thread (see ExportScheduler).
+        self.main_thread = True
         
+    def set_wait_cursor(self):
+        if self.main_thread:
+            QApplication.setOverrideCursor(Qt.WaitCursor)
+
+    def restore_cursor(self):
+        if self.main_thread:
+            QApplication.restoreOverrideCursor()
+
     def set_parser(self, fpath):
         self.parser = ParseDAT()
         self.parser.scan_project_dir(fpath)
@@ -71,35 +99,36 @@ class Flo2dGeoPackage(GeoPackageUtils):
         self.batch_execute(sql)
 
     def import_mannings_n_topo(self):
-        
+        """
+        Streaming import of MANNINGS_N.DAT and TOPO.DAT in chunks of 'self.chunksize' rows.
+        Each chunk geometries are encoded in bulk and inserted in its own transaction.
+        """
         try:
-            sql = ["""INSERT INTO grid (fid, n_value, elevation, geom) VALUES""", 4]
-            
+            qry = """INSERT INTO grid (fid, n_value, elevation, geom) VALUES (?,?,?,?);"""
+
             self.clear_tables("grid")
             data = self.parser.parse_mannings_n_topo()
-            
-            c = 0
-            man = slice(0, 2)
-            coords = slice(2, 4)
-            elev = slice(4, None)
-            for row in data:
-                if c < self.chunksize:
-                    geom = " ".join(row[coords])
-                    g = self.build_square(geom, self.cell_size)
-                    sql += [tuple(row[man] + row[elev] + [g])]
-                    c += 1
-                else:
-                    self.batch_execute(sql)
-                    c = 0
-            if len(sql) > 2:
-                self.batch_execute(sql)
-            else:
-                pass
-        
+
+            start_time = time.time()
+            imported = 0
+            while True:
+                chunk = list(islice(data, self.chunksize))
+                if not chunk:
+                    break
+                xs = np.array([row[2] for row in chunk], dtype=float)
+                ys = np.array([row[3] for row in chunk], dtype=float)
+                geoms = self.build_squares(xs, ys, self.cell_size)
+                self.execute_many(qry, ((row[0], row[1], row[4], g) for row, g in zip(chunk, geoms)))
+                imported += len(chunk)
+                elapsed = time.time() - start_time
+                rate = imported / elapsed if elapsed > 0 else imported
+                self.uc.log_info("TOPO.DAT import: {0} cells ({1:.0f} cells/s)".format(imported, rate))
+                del chunk, xs, ys, geoms
+
         except Exception as e:
             QApplication.restoreOverrideCursor()
             self.uc.show_error("ERROR 040521.1154: importing TOP.DAT!.\n", e)
-            
+
     def import_inflow(self):
         cont_sql = ["""INSERT INTO cont (name, value, note) VALUES""", 3]
         inflow_sql = ["""INSERT INTO inflow (time_series_fid, ident, inoutfc, bc_fid) VALUES""", 4]
@@ -298,25 +327,7 @@ class Flo2dGeoPackage(GeoPackageUtils):
         self.execute(name_qry)
 
     def import_raincell(self):
-        head_sql = ["""INSERT INTO raincell (rainintime, irinters, timestamp) VALUES""", 3]
-        data_sql = ["""INSERT INTO raincell_data (time_interval, rrgrid, iraindum) VALUES""", 3]
-
-        self.clear_tables("raincell", "raincell_data")
-
-        header, data = self.parser.parse_raincell()
-        head_sql += [tuple(header)]
-
-        time_step = float(header[0])
-        irinters = int(header[1])
-        data_len = len(data)
-        grid_count = data_len // irinters
-        data_gen = (data[i : i + grid_count] for i in range(0, data_len, grid_count))
-        time_interval = 0
-        for data_series in data_gen:
-            for row in data_series:
-                data_sql += [(time_interval,) + tuple(row)]
-            time_interval += time_step
-        self.batch_execute(head_sql, data_sql)
+        RaincellStore(self).import_dat(self.parser.dat_files["RAINCELL.DAT"])
 
     def import_infil(self):
         infil_params = [
@@ -1011,7 +1022,8 @@ class Flo2dGeoPackage(GeoPackageUtils):
         self.clear_tables("breach_global", "breach", "breach_cells", "breach_fragility_curves")
         # NOTE: 'cells_sql' was removed in next self.batch_execute since there is a trigger for ´breach' table that inserts them.
         # self.batch_execute(global_sql, local_sql, cells_sql, frag_sql)
-        self.batch_execute(global_sql, local_sql, frag_sql)
+        with self.gutils.deferred_cell_triggers():
+            self.batch_execute(global_sql, local_sql, frag_sql)
 
         # Set 'useglobaldata' to 1 if there are 'G' lines, 0 otherwise:
         self.gutils.execute("UPDATE breach_global SET useglobaldata = ?;", (use_global_data,))
@@ -1315,34 +1327,36 @@ class Flo2dGeoPackage(GeoPackageUtils):
             return True
 
         except Exception as e:
-            QApplication.restoreOverrideCursor()
+            self.restore_cursor()
             self.uc.show_error("ERROR 101218.1535: exporting CONT.DAT or TOLER.DAT failed!.\n", e)
             return False
 
     def export_mannings_n_topo(self, outdir):
+        """
+        Writing MANNINGS_N.DAT and TOPO.DAT in blocks of 'self.chunksize' cells, with cells centers of the grid index.
+        """
         try:
-            sql = (
-                """SELECT fid, n_value, elevation, ST_AsText(ST_Centroid(GeomFromGPB(geom))) FROM grid ORDER BY fid;"""
-            )
-            records = self.execute(sql)
+            index = project_grid_index(self)
+            fids = index.fids()
+            n_values = index.n_values[fids]
+            elevations = index.elevations[fids]
+            if np.isnan(n_values).any() or np.isnan(elevations).any():
+                raise ValueError("Grid has cells without Manning's n value or elevation.")
             mannings = os.path.join(outdir, "MANNINGS_N.DAT")
             topo = os.path.join(outdir, "TOPO.DAT")
 
-            mline = "{0: >10} {1: >10}\n"
-            tline = "{0: >15} {1: >15} {2: >10}\n"
-
-            with open(mannings, "w") as m, open(topo, "w") as t:
-                for row in records:
-                    fid, man, elev, geom = row
-                    x, y = geom.strip("POINT()").split()
-                    m.write(mline.format(fid, "{0:.3f}".format(man)))
-                    t.write(
-                        tline.format("{0:.4f}".format(float(x)), "{0:.4f}".format(float(y)), "{0:.4f}".format(elev))
-                    )
+            mline = "%10d %10.3f\n"
+            tline = "%15.4f %15.4f %10.4f\n"
+
+            with open(mannings, "w", buffering=DAT_BUFFER_SIZE) as m, open(topo, "w", buffering=DAT_BUFFER_SIZE) as t:
+                for start in range(0, fids.shape[0], self.chunksize):
+                    block = slice(start, start + self.chunksize)
+                    m.write(format_rows(mline, fids[block], n_values[block]))
+                    t.write(format_rows(tline, index.xs[fids[block]], index.ys[fids[block]], elevations[block]))
             return True
 
         except Exception as e:
-            QApplication.restoreOverrideCursor()
+            self.restore_cursor()
             self.uc.show_error("ERROR 101218.1541: exporting MANNINGS_N.DAT or TOPO.DAT failed!.\n", e)
             return False
 
@@ -1451,7 +1465,7 @@ class Flo2dGeoPackage(GeoPackageUtils):
                             else:
                                 i.write(res_line1.format(*res))
 
-            QApplication.restoreOverrideCursor()
+            self.restore_cursor()
             if warning != "":
                 self.uc.show_warn(
                     "ERROR 180319.1020: error while exporting INFLOW.DAT!\n\n"
@@ -1462,7 +1476,7 @@ class Flo2dGeoPackage(GeoPackageUtils):
             return True
 
         except Exception as e:
-            QApplication.restoreOverrideCursor()
+            self.restore_cursor()
             self.uc.show_error("ERROR 101218.1542: exporting INFLOW.DAT failed!.\n", e)
             return False
 
@@ -1555,7 +1569,7 @@ class Flo2dGeoPackage(GeoPackageUtils):
                     for b in border:
                         o.write(o_line.format("O", b)) 
                 
-            QApplication.restoreOverrideCursor()
+            self.restore_cursor()
             if warning != "":
                 msg = "ERROR 170319.2018: error while exporting OUTFLOW.DAT!<br><br>" +  warning
                 msg += "<br><br><FONT COLOR=red>Did you schematize the Boundary Conditions?</FONT>"
@@ -1563,7 +1577,7 @@ class Flo2dGeoPackage(GeoPackageUtils):
             return True
  
         except Exception as e:
-            QApplication.restoreOverrideCursor()
+            self.restore_cursor()
             self.uc.show_error("ERROR 101218.1543: exporting OUTFLOW.DAT failed!.\n", e)
             return False
 
@@ -1633,43 +1647,37 @@ class Flo2dGeoPackage(GeoPackageUtils):
             return True
 
         except Exception as e:
-            QApplication.restoreOverrideCursor()
+            self.restore_cursor()
             self.uc.show_error("ERROR 101218.1543: exporting RAIN.DAT failed!.\n", e)
             return False
 
     def export_raincell(self, outdir):
-        QApplication.setOverrideCursor(Qt.WaitCursor)
+        self.set_wait_cursor()
         try:
-            if self.is_table_empty("raincell"):
+            store = RaincellStore(self)
+            raincell_head = store.header()
+            if raincell_head is None:
                 return False
-            head_sql = """SELECT rainintime, irinters, timestamp FROM raincell LIMIT 1;"""
-            data_sql = """SELECT rrgrid, iraindum FROM raincell_data ORDER BY time_interval, rrgrid;"""
-
+            cells = store.cells()
             line1 = "{0} {1} {2}\n"
-            line2 = "{0} {1}\n"
-
-            raincell_head = self.execute(head_sql).fetchone()
-            raincell_rows = self.execute(data_sql)
 
             raincell = os.path.join(outdir, "RAINCELL.DAT")
-            with open(raincell, "w") as r:
+            with open(raincell, "w", buffering=DAT_BUFFER_SIZE) as r:
                 r.write(line1.format(*raincell_head))
-                for row in raincell_rows:
-                    if row[1] is None:
-                        r.write(line2.format(row[0], "0"))
-                    else:
-                        # r.write(line2.format(*row))
-                        r.write(line2.format(row[0], "{0:.4f}".format(float(row[1]))))
-                        # r.write(tline.format('{0:.3f}'.format(float(x)), '{0:.3f}'.format(float(y)), '{0:.2f}'.format(elev)))
+                for interval_nr, values in store.intervals():
+                    present = values != MISSING
+                    rows = format_rows("%d %.4f\n", cells[present], values[present].astype(float))
+                    # NULL rainfall is written as 0.
+                    r.write(rows.replace(" nan\n", " 0\n"))
 
             return True
 
         except Exception as e:
-            QApplication.restoreOverrideCursor()
+            self.restore_cursor()
             self.uc.show_error("ERROR 101218.1558: exporting RAINCELL.DAT failed!.\n", e)
             return False
         finally:
-            QApplication.restoreOverrideCursor()
+            self.restore_cursor()
 
     def export_infil(self, outdir):
         # check if there is any infiltration defined.
@@ -1743,7 +1751,7 @@ class Flo2dGeoPackage(GeoPackageUtils):
             return True
 
         except Exception as e:
-            QApplication.restoreOverrideCursor()
+            self.restore_cursor()
             self.uc.show_error("ERROR 101218.1559: exporting INFIL.DAT failed!.\n", e)
             return False
 
@@ -1777,7 +1785,7 @@ class Flo2dGeoPackage(GeoPackageUtils):
             return True
 
         except Exception as e:
-            QApplication.restoreOverrideCursor()
+            self.restore_cursor()
             self.uc.show_error("ERROR 101218.1544: exporting EVAPOR.DAT failed!.\n", e)
             return False
 
@@ -1916,7 +1924,7 @@ class Flo2dGeoPackage(GeoPackageUtils):
             return True
 
         except Exception as e:
-            QApplication.restoreOverrideCursor()
+            self.restore_cursor()
             self.uc.show_error("ERROR 101218.1607:  exporting XSEC.DAT  failed!.\n", e)
             return False
 
@@ -2004,7 +2012,7 @@ class Flo2dGeoPackage(GeoPackageUtils):
             return True
 
         except Exception as e:
-            QApplication.restoreOverrideCursor()
+            self.restore_cursor()
             self.uc.show_error("ERROR 101218.1608: exporting HYSTRUC.DAT failed!.\n", e)
             return False
 
@@ -2043,7 +2051,7 @@ class Flo2dGeoPackage(GeoPackageUtils):
             return True
 
         except Exception as e:
-            QApplication.restoreOverrideCursor()
+            self.restore_cursor()
             self.uc.show_error("ERROR 101218.1609: exporting STREET.DAT failed!.\n", e)
             return False
 
@@ -2111,7 +2119,7 @@ class Flo2dGeoPackage(GeoPackageUtils):
             return True
 
         except Exception as e:
-            QApplication.restoreOverrideCursor()
+            self.restore_cursor()
             self.uc.show_error("ERROR 101218.1610: exporting ARF.DAT failed!.", e)
             return False
 
@@ -2154,7 +2162,7 @@ class Flo2dGeoPackage(GeoPackageUtils):
                         m.write(line2.format(*vals))
                 
             except Exception as e:
-                QApplication.restoreOverrideCursor()
+                self.restore_cursor()
                 self.uc.show_error("ERROR 101218.1611: exporting MULT.DAT failed!.\n", e)
                 return False
         
@@ -2183,7 +2191,7 @@ class Flo2dGeoPackage(GeoPackageUtils):
                 return True
     
             except Exception as e:
-                QApplication.restoreOverrideCursor()
+                self.restore_cursor()
                 self.uc.show_error("ERROR 101218.1611: exporting SIMPLE_MULT.DAT failed!.\n", e)
                 return False
             
@@ -2214,7 +2222,7 @@ class Flo2dGeoPackage(GeoPackageUtils):
             return True
 
         except Exception as e:
-            QApplication.restoreOverrideCursor()
+            self.restore_cursor()
             self.uc.show_error("ERROR 101218.1539: exporting TOLSPATIAL.DAT failed!", e)
             return False
 
@@ -2299,7 +2307,7 @@ class Flo2dGeoPackage(GeoPackageUtils):
         except Exception:
             self.uc.log_info(traceback.format_exc())
             self.uc.show_warn('WARNING 060319.1613: Export to "GUTTER.DAT" failed!.')
-            QApplication.restoreOverrideCursor()
+            self.restore_cursor()
             return False
 
     def export_sed(self, outdir):
@@ -2394,7 +2402,7 @@ class Flo2dGeoPackage(GeoPackageUtils):
             return True
 
         except Exception as e:
-            QApplication.restoreOverrideCursor()
+            self.restore_cursor()
             self.uc.show_error("ERROR 101218.1612: exporting SED.DAT failed!.\n", e)
             return False
 
@@ -2450,7 +2458,7 @@ class Flo2dGeoPackage(GeoPackageUtils):
             return True
 
         except Exception as e:
-            QApplication.restoreOverrideCursor()
+            self.restore_cursor()
             self.uc.show_error("ERROR 101218.1614: exporting LEVEE.DAT failed!.\n", e)
             return False
 
@@ -2485,7 +2493,7 @@ class Flo2dGeoPackage(GeoPackageUtils):
             return True
 
         except Exception as e:
-            QApplication.restoreOverrideCursor()
+            self.restore_cursor()
             self.uc.show_error("ERROR 101218.1613: exporting FPXSEC.DAT failed!.\n", e)
             return False
 
@@ -2572,7 +2580,7 @@ class Flo2dGeoPackage(GeoPackageUtils):
             return True
 
         except Exception as e:
-            QApplication.restoreOverrideCursor()
+            self.restore_cursor()
             self.uc.show_error("ERROR 101218.1616: exporting BREACH.DAT failed!.\n", e)
             return False
 
@@ -2601,7 +2609,7 @@ class Flo2dGeoPackage(GeoPackageUtils):
             return True
 
         except Exception as e:
-            QApplication.restoreOverrideCursor()
+            self.restore_cursor()
             self.uc.show_error("ERROR 101218.1617: exporting FPFROUDE.DAT failed!.\n", e)
             return False
 
@@ -2630,7 +2638,7 @@ class Flo2dGeoPackage(GeoPackageUtils):
             return True
 
         except Exception as e:
-            QApplication.restoreOverrideCursor()
+            self.restore_cursor()
             self.uc.show_error("ERROR 101218.1901: exporting SHALLOWN_SPATIAL.DAT failed!", e)
             return False
 
@@ -2664,7 +2672,7 @@ class Flo2dGeoPackage(GeoPackageUtils):
             return True
 
         except Exception as e:
-            QApplication.restoreOverrideCursor()
+            self.restore_cursor()
             self.uc.show_error("ERROR 101218.1618: exporting SWMMFLO.DAT failed!.\n", e)
             return False
 
@@ -2768,7 +2776,7 @@ class Flo2dGeoPackage(GeoPackageUtils):
             return True
 
         except Exception as e:
-            QApplication.restoreOverrideCursor()
+            self.restore_cursor()
             self.uc.show_error("ERROR 101218.1619: exporting SWMMFLORT.DAT failed!.\n", e)
             return False
 
@@ -2795,7 +2803,7 @@ class Flo2dGeoPackage(GeoPackageUtils):
             return True
 
         except Exception as e:
-            QApplication.restoreOverrideCursor()
+            self.restore_cursor()
             self.uc.show_error("ERROR 101218.1620: exporting SWMMOUTF.DAT failed!.\n", e)
             return False
 
@@ -2825,7 +2833,7 @@ class Flo2dGeoPackage(GeoPackageUtils):
             return True
 
         except Exception as e:
-            QApplication.restoreOverrideCursor()
+            self.restore_cursor()
             self.uc.show_error("ERROR 101218.1621: exporting WSURF.DAT failed!.\n", e)
             return False
 
@@ -2855,6 +2863,6 @@ class Flo2dGeoPackage(GeoPackageUtils):
             return True
 
         except Exception as e:
-            QApplication.restoreOverrideCursor()
+            self.restore_cursor()
             self.uc.show_error("ERROR 101218.1622: exporting WSTIME.DAT failed!.\n", e)
             return False
@@ -8,14 +8,63 @@
 # as published by the Free Software Foundation; either version 2
 # of the License, or (at your option) any later version
 import os
+import zlib
+import multiprocessing
+from collections import deque, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice, groupby
+from operator import itemgetter
 import numpy as np
 from ..flo2d_tools.grid_tools import rasters2centroids
+from ..flo2d_tools.grid_index import project_grid_index
 
 try:
     import h5py
 except ImportError:
     pass
 
+try:
+    from osgeo import gdal
+except ImportError:
+    pass
+
+# Number of cells in a single compressed block of the realtime rainfall store.
+BLOCK_CELLS = 65536
+
+# Bytes of decoded blocks kept in memory by RaincellStore (cell time series of neighbouring cells).
+BLOCK_CACHE_BYTES = 64 * 1024 * 1024
+
+# Store value of cells without record in the interval (NaN stands for NULL rainfall).
+MISSING = -np.inf
+
+# Number of RAINCELL.DAT lines parsed at once.
+READ_LINES = 1000000
+
+# Maximum number of values buffered while writing IRAINDUM dataset of the HDF5 file.
+HDF_BUFFER_VALUES = 16 * 1024 ** 2
+
+
+def parse_values(lines):
+    """
+    Parsing block of text lines of numbers into 1D float array.
+    """
+    return np.array(" ".join(lines).split(), dtype=float)
+
+
+def raincell_dat_rows(path, header_lines=1, lines=READ_LINES):
+    """
+    Generator of (cells, values) arrays of RAINCELL.DAT data lines, read in blocks of 'lines' lines.
+    """
+    with open(path, "r") as f:
+        for _ in range(header_lines):
+            next(f)
+        while True:
+            block = list(islice(f, lines))
+            if not block:
+                break
+            data = parse_values(block).reshape(-1, 2)
+            yield data[:, 0].astype(np.int64), data[:, 1]
+
 
 class ASCProcessor(object):
     def __init__(self, vlayer, asc_dir):
@@ -50,6 +99,350 @@ class ASCProcessor(object):
         for raster_values in rasters2centroids(self.vlayer, None, *self.asc_files):
             yield raster_values
 
+    def rainfall_arrays(self, gutils, workers=None):
+        """
+        Generator of (cells, values) arrays of rasters sampled in grid centroids (NULL values are NaN).
+        Rasters are read and sampled in parallel workers and yielded in order of files.
+        """
+        index = project_grid_index(gutils)
+        fids = index.fids()
+        sampler = RasterSampler(fids, index.xs[fids], index.ys[fids])
+        for values in sampler.sample_files(self.asc_files, workers):
+            if values is not None:
+                yield values
+
+
+class RasterSampler(object):
+    """
+    Sampling rasters in points (usually grid centroids) with a single array read and gather per raster.
+    Pixel indices of points are computed once per raster geotransform and shape.
+    """
+
+    def __init__(self, cells, xs, ys):
+        self.cells = np.asarray(cells, dtype=np.int64)
+        self.xs = np.asarray(xs, dtype=float)
+        self.ys = np.asarray(ys, dtype=float)
+        self._pixels = {}
+
+    def pixels(self, geotransform, shape):
+        """
+        Returns (positions, rows, cols) of points inside raster of north-up 'geotransform' and 'shape'.
+        """
+        key = (tuple(geotransform), tuple(shape))
+        if key not in self._pixels:
+            x0, dx, __, y0, __, dy = geotransform
+            cols = np.floor((self.xs - x0) / dx).astype(np.int64)
+            rows = np.floor((self.ys - y0) / dy).astype(np.int64)
+            inside = (rows >= 0) & (rows < shape[0]) & (cols >= 0) & (cols < shape[1])
+            positions = np.nonzero(inside)[0]
+            self._pixels[key] = positions, rows[positions], cols[positions]
+        return self._pixels[key]
+
+    @staticmethod
+    def read_raster(path):
+        """
+        Reading first band of raster into (array, geotransform, nodata). Returns None for unreadable raster.
+        """
+        try:
+            ds = gdal.Open(path)
+        except RuntimeError:
+            return None
+        if ds is None:
+            return None
+        band = ds.GetRasterBand(1)
+        return band.ReadAsArray().astype(float), ds.GetGeoTransform(), band.GetNoDataValue()
+
+    def sample_array(self, array, geotransform, nodata=None):
+        """
+        Values of the raster array in points inside the raster, rounded to 4 decimals (NaN for no data).
+        Returns (cells, values) arrays.
+        """
+        positions, rows, cols = self.pixels(geotransform, array.shape)
+        values = array[rows, cols]
+        if nodata is not None:
+            values[values == nodata] = np.nan
+        return self.cells[positions], np.round(values, 4)
+
+    def sample_file(self, path):
+        raster = self.read_raster(path)
+        if raster is None:
+            return None
+        return self.sample_array(*raster)
+
+    def sample_files(self, paths, workers=None):
+        """
+        Generator of sample_file results in order of paths. At most 2 * workers rasters are held in memory.
+        """
+        if workers is None:
+            workers = max(1, multiprocessing.cpu_count())
+        if workers < 2 or len(paths) < 2:
+            for path in paths:
+                yield self.sample_file(path)
+            return
+        for path in paths[:1]:
+            # Pixel indices are cached before workers start, usually all rasters share the geotransform.
+            yield self.sample_file(path)
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            pending = deque()
+            for path in paths[1:]:
+                pending.append(pool.submit(self.sample_file, path))
+                if len(pending) >= 2 * workers:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+
+
+class RaincellStore(object):
+    """
+    Realtime rainfall (RAINCELL) kept in the GeoPackage as compressed float32 blocks.
+
+    Header is stored in the 'raincell' table. Values of every time interval are stored in 'raincell_blocks'
+    as zlib compressed blocks of BLOCK_CELLS cells, in order of sorted cells fids (blocks with interval -1).
+    Single interval or cell time series are read without loading the whole storm.
+    Decoded blocks are cached until the blocks table is changed ('raincell_blocks' statement counter).
+    """
+
+    def __init__(self, gutils, block_cells=BLOCK_CELLS):
+        self.gutils = gutils
+        self.block_cells = block_cells
+        self._cells = None
+        self._blocks = OrderedDict()
+        self._blocks_bytes = 0
+        self._counter = None
+
+    def create(self):
+        """
+        Creating blocks table in GeoPackages older than the table.
+        """
+        self.gutils.execute(
+            """CREATE TABLE IF NOT EXISTS "raincell_blocks" (
+                "fid" INTEGER PRIMARY KEY NOT NULL,
+                "interval_nr" INTEGER,
+                "block" INTEGER,
+                "data" BLOB
+            );"""
+        )
+        self.gutils.execute(
+            """CREATE UNIQUE INDEX IF NOT EXISTS "raincell_blocks_interval" ON "raincell_blocks" (interval_nr, block);"""
+        )
+        self.gutils.execute("""CREATE INDEX IF NOT EXISTS "raincell_blocks_block" ON "raincell_blocks" (block);""")
+
+    def clear(self):
+        self.create()
+        self.gutils.clear_tables("raincell", "raincell_blocks")
+        self._cells = None
+        self.clear_blocks()
+        self.written()
+
+    def written(self):
+        """
+        Keeping caches valid after writes of this store.
+        """
+        self._counter = self.gutils.table_change_counter("raincell_blocks")
+
+    def check_cache(self):
+        """
+        Dropping cached cells and blocks if the blocks table was changed by another writer.
+        """
+        counter = self.gutils.table_change_counter("raincell_blocks")
+        if counter != self._counter:
+            self._cells = None
+            self.clear_blocks()
+            self._counter = counter
+
+    def clear_blocks(self):
+        self._blocks.clear()
+        self._blocks_bytes = 0
+
+    def decoded_block(self, interval_nr, block, data=None):
+        """
+        Values (cells fids for interval -1) of the block, 'data' is the compressed block if already fetched.
+        """
+        key = (interval_nr, block)
+        values = self._blocks.get(key)
+        if values is not None:
+            self._blocks.move_to_end(key)
+            return values
+        if data is None:
+            qry = """SELECT data FROM raincell_blocks WHERE interval_nr = ? AND block = ?;"""
+            data = self.gutils.execute(qry, key).fetchone()[0]
+        values = np.frombuffer(zlib.decompress(data), dtype="<i4" if interval_nr < 0 else "<f4")
+        self._blocks[key] = values
+        self._blocks_bytes += values.nbytes
+        while self._blocks_bytes > BLOCK_CACHE_BYTES and len(self._blocks) > 1:
+            self._blocks_bytes -= self._blocks.popitem(last=False)[1].nbytes
+        return values
+
+    def header(self):
+        """
+        Returns (rainintime, irinters, timestamp) or None if there is no realtime rainfall.
+        """
+        return self.gutils.execute("""SELECT rainintime, irinters, timestamp FROM raincell LIMIT 1;""").fetchone()
+
+    def intervals_number(self):
+        row = self.gutils.execute("""SELECT MAX(interval_nr) FROM raincell_blocks;""").fetchone()
+        return 0 if row[0] is None else row[0] + 1
+
+    def cells(self):
+        """
+        Sorted array of cells fids of the store.
+        """
+        self.check_cache()
+        if self._cells is None:
+            qry = """SELECT data FROM raincell_blocks WHERE interval_nr = -1 ORDER BY block;"""
+            blocks = [np.frombuffer(zlib.decompress(row[0]), dtype="<i4") for row in self.gutils.execute(qry)]
+            self._cells = np.concatenate(blocks).astype(np.int64) if blocks else np.zeros(0, dtype=np.int64)
+        return self._cells
+
+    def blocks_data(self, interval_nr, values):
+        values = np.asarray(values, dtype="<f4")
+        for block, start in enumerate(range(0, values.shape[0], self.block_cells)):
+            chunk = values[start : start + self.block_cells]
+            yield interval_nr, block, zlib.compress(chunk.tobytes(), 1)
+
+    def write_header(self, rainintime, irinters, timestamp):
+        qry = """INSERT INTO raincell (rainintime, irinters, timestamp) VALUES (?,?,?);"""
+        self.gutils.execute(qry, (rainintime, irinters, timestamp))
+
+    def write_cells(self, cells):
+        self._cells = np.asarray(cells, dtype=np.int64)
+        data = []
+        for block, start in enumerate(range(0, self._cells.shape[0], self.block_cells)):
+            chunk = self._cells[start : start + self.block_cells].astype("<i4")
+            data.append((-1, block, zlib.compress(chunk.tobytes(), 1)))
+        qry = """INSERT INTO raincell_blocks (interval_nr, block, data) VALUES (?,?,?);"""
+        self.gutils.execute_many(qry, data)
+        self.written()
+
+    def write_interval(self, interval_nr, cells, values):
+        """
+        Writing values of cells in the interval. Store cells without value are MISSING.
+        """
+        store_cells = self.cells()
+        positions = np.searchsorted(store_cells, cells)
+        row_values = np.full(store_cells.shape, MISSING, dtype=np.float32)
+        row_values[positions] = values
+        qry = """INSERT INTO raincell_blocks (interval_nr, block, data) VALUES (?,?,?);"""
+        self.gutils.execute_many(qry, self.blocks_data(interval_nr, row_values))
+        self.written()
+
+    def import_intervals(self, header, cells, series):
+        """
+        Replacing the store with 'header' and intervals of 'series' (iterable of (cells, values) arrays).
+        """
+        with self.gutils.unit_of_work():
+            self.clear()
+            self.write_header(*header)
+            self.write_cells(np.unique(cells))
+            for interval_nr, (interval_cells, values) in enumerate(series):
+                self.write_interval(interval_nr, interval_cells, values)
+
+    def import_dat(self, path):
+        """
+        Streaming import of RAINCELL.DAT. Data lines are split into 'irinters' intervals of the same number of lines.
+        """
+        with open(path, "r") as f:
+            line1 = f.readline().split()
+        header = line1[:2] + [" ".join(line1[2:])]
+        irinters = int(header[1])
+        rows = 0
+        cells = []
+        for row_cells, values in raincell_dat_rows(path):
+            rows += row_cells.shape[0]
+            cells.append(np.unique(row_cells))
+        cells = np.unique(np.concatenate(cells)) if cells else np.zeros(0, dtype=np.int64)
+        grid_count = rows // irinters if irinters > 0 else rows
+        self.import_intervals(header, cells, self.dat_intervals(path, max(grid_count, 1)))
+
+    @staticmethod
+    def dat_intervals(path, grid_count):
+        buffer_cells, buffer_values, buffered = [], [], 0
+        for row_cells, values in raincell_dat_rows(path):
+            buffer_cells.append(row_cells)
+            buffer_values.append(values)
+            buffered += row_cells.shape[0]
+            while buffered >= grid_count:
+                all_cells, all_values = np.concatenate(buffer_cells), np.concatenate(buffer_values)
+                yield all_cells[:grid_count], all_values[:grid_count]
+                buffer_cells, buffer_values = [all_cells[grid_count:]], [all_values[grid_count:]]
+                buffered -= grid_count
+        if buffered > 0:
+            yield np.concatenate(buffer_cells), np.concatenate(buffer_values)
+
+    def interval(self, interval_nr):
+        """
+        Values of all store cells in the interval (NaN for NULL, MISSING for cells without record).
+        """
+        self.check_cache()
+        qry = """SELECT block, data FROM raincell_blocks WHERE interval_nr = ? ORDER BY block;"""
+        rows = self.gutils.execute(qry, (interval_nr,)).fetchall()
+        blocks = [self.decoded_block(interval_nr, block, data) for block, data in rows]
+        return np.concatenate(blocks) if blocks else np.zeros(0, dtype=np.float32)
+
+    def intervals(self):
+        """
+        Generator of (interval_nr, values) of all intervals.
+        """
+        for interval_nr in range(self.intervals_number()):
+            yield interval_nr, self.interval(interval_nr)
+
+    def cell_series(self, cell):
+        """
+        Time series (times, values) of the cell, only intervals with record of the cell.
+        """
+        cells = self.cells()
+        position = int(np.searchsorted(cells, cell))
+        header = self.header()
+        if header is None or position >= cells.shape[0] or cells[position] != cell:
+            return np.zeros(0), np.zeros(0)
+        block, offset = divmod(position, self.block_cells)
+        qry = """SELECT {} FROM raincell_blocks WHERE block = ? AND interval_nr >= 0 ORDER BY interval_nr;"""
+        numbers = [row[0] for row in self.gutils.execute(qry.format("interval_nr"), (block,))]
+        if all((nr, block) in self._blocks for nr in numbers):
+            rows = [(nr, self.decoded_block(nr, block)[offset]) for nr in numbers]
+        else:
+            # Compressed data is fetched only if some blocks of the cell aren't cached.
+            data_rows = self.gutils.execute(qry.format("interval_nr, data"), (block,))
+            rows = [(nr, self.decoded_block(nr, block, data)[offset]) for nr, data in data_rows]
+        times = np.array([nr for nr, value in rows], dtype=float) * float(header[0])
+        values = np.array([value for nr, value in rows], dtype=float)
+        present = values != MISSING
+        return times[present], values[present]
+
+    def has_legacy_data(self):
+        """
+        Checking for realtime rainfall of former plugin versions ('raincell_data' rows not moved into the store).
+        """
+        qry = """SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?;"""
+        if self.gutils.execute(qry, ("raincell_data",)).fetchone() is None:
+            return False
+        if self.header() is None or self.gutils.execute("""SELECT 1 FROM raincell_data LIMIT 1;""").fetchone() is None:
+            return False
+        if self.gutils.execute(qry, ("raincell_blocks",)).fetchone() is None:
+            return True
+        return self.gutils.execute("""SELECT 1 FROM raincell_blocks LIMIT 1;""").fetchone() is None
+
+    def migrate(self):
+        """
+        Moving rows of former 'raincell_data' table into the store, only on the user's request (see
+        SettingsDialog.migrate_raincell). Not backward compatible: 'raincell_data' is emptied, so former plugin
+        versions don't see the realtime rainfall anymore.
+        """
+        if not self.has_legacy_data():
+            return
+        self.create()
+        header = self.header()
+        cells = [row[0] for row in self.gutils.execute("""SELECT DISTINCT rrgrid FROM raincell_data ORDER BY rrgrid;""")]
+        qry = """SELECT time_interval, rrgrid, iraindum FROM raincell_data ORDER BY time_interval, rrgrid;"""
+
+        def series():
+            for time_interval, rows in groupby(self.gutils.execute(qry), key=itemgetter(0)):
+                data = np.array([(r[1], np.nan if r[2] is None else r[2]) for r in rows], dtype=float)
+                yield data[:, 0].astype(np.int64), data[:, 1]
+
+        self.import_intervals(header, np.array(cells, dtype=np.int64), series())
+        self.gutils.execute("""DELETE FROM raincell_data;""")
+
 
 class HDFProcessor(object):
     def __init__(self, hdf_path):
@@ -71,3 +464,37 @@ class HDFProcessor(object):
             for name, value, description in datasets:
                 dts = grp.create_dataset(name, data=value)
                 dts.attrs["description"] = np.array([description], dtype=np.string_)
+
+    def export_raincell_store_to_binary_hdf5(self, store):
+        """
+        Streaming export of RaincellStore with the same layout as 'export_rainfall_to_binary_hdf5'.
+        IRAINDUM is written in slices of intervals (NULL and missing values are written as 0).
+        """
+        rainintime, irinters, timestamp = store.header()
+        n_cells = store.cells().shape[0]
+        n_intervals = store.intervals_number()
+        with h5py.File(self.hdf_path, "w") as hdf_file:
+            hdf_file.attrs["hdf5_version"] = np.array([h5py.version.hdf5_version], dtype=np.string_)
+            hdf_file.attrs["plugin"] = np.array(["FLO-2D"], dtype=np.string_)
+            grp = hdf_file.create_group("raincell")
+            datasets = [
+                ("RAININTIME", np.int64(rainintime), "Time interval in minutes of the realtime rainfall data."),
+                ("IRINTERS", np.int64(irinters), "Number of intervals in the dataset."),
+                ("TIMESTAMP", np.array([timestamp], dtype=np.string_), "Timestamp indicates the start and end time of the storm."),
+            ]
+            for name, value, description in datasets:
+                dts = grp.create_dataset(name, data=value)
+                dts.attrs["description"] = np.array([description], dtype=np.string_)
+            dts = grp.create_dataset("IRAINDUM", shape=(n_cells, n_intervals, 1), dtype=float)
+            dts.attrs["description"] = np.array(
+                ["Cumulative rainfall in inches or mm over the time interval."], dtype=np.string_
+            )
+            step = max(1, HDF_BUFFER_VALUES // max(n_cells, 1))
+            for start in range(0, n_intervals, step):
+                end = min(start + step, n_intervals)
+                buffer = np.zeros((n_cells, end - start, 1))
+                for i in range(start, end):
+                    values = store.interval(i).astype(float)
+                    values[~np.isfinite(values)] = 0
+                    buffer[:, i - start, 0] = values
+                dts[:, start:end, :] = buffer
@@ -8,11 +8,254 @@
 # as published by the Free Software Foundation; either version 2
 # of the License, or (at your option) any later version
 from collections import OrderedDict
-from itertools import zip_longest, chain
+from itertools import zip_longest, chain, islice
+import numpy as np
 from ..utils import float_or_zero
 from qgis.PyQt.QtWidgets import QApplication
 from ..user_communication import UserCommunication
 
+# Buffer size of written .INP files.
+INP_BUFFER_SIZE = 4 * 1024 ** 2
+
+# Number of lines joined into a single write.
+INP_WRITE_LINES = 10000
+
+# Typed columns of .INP groups read by INPGroups.table. Missing trailing values are None (NaN in float columns).
+INP_GROUP_COLUMNS = {
+    "JUNCTIONS": (
+        ("name", str),
+        ("invert_elev", float),
+        ("max_depth", float),
+        ("init_depth", float),
+        ("surcharge_depth", float),
+        ("ponded_area", float),
+    ),
+    "CONDUITS": (
+        ("name", str),
+        ("inlet", str),
+        ("outlet", str),
+        ("length", float),
+        ("manning", float),
+        ("inlet_offset", float),
+        ("outlet_offset", float),
+        ("init_flow", float),
+        ("max_flow", float),
+    ),
+    "XSECTIONS": (
+        ("link", str),
+        ("shape", str),
+        ("geom1", float),
+        ("geom2", float),
+        ("geom3", float),
+        ("geom4", float),
+        ("barrels", float),
+    ),
+    "LOSSES": (("link", str), ("inlet", float), ("outlet", float), ("average", float), ("flapgate", str)),
+    "COORDINATES": (("node", str), ("x", float), ("y", float)),
+    "VERTICES": (("link", str), ("x", float), ("y", float)),
+    "CURVES": (("name", str), ("type", str), ("x", float), ("y", float)),
+    "TIMESERIES": (("name", str), ("date", str), ("time", str), ("value", float)),
+}
+
+
+def typed_column(values, column_type):
+    """
+    Converting list of tokens into float array (NaN for missing or invalid values) or list of strings.
+    """
+    if column_type is not float:
+        return values
+    try:
+        return np.array(values, dtype=float)
+    except (TypeError, ValueError):
+        pass
+    column = np.full(len(values), np.nan)
+    for i, value in enumerate(values):
+        try:
+            column[i] = float(value)
+        except (TypeError, ValueError):
+            continue
+    return column
+
+
+class INPGroups(OrderedDict):
+    """
+    Groups [xxxx] of .INP file, ordered as entered. Each group is a list of lines, the first one is the rest
+    of the [xxxx] line (as in former split of the whole file by '[').
+
+    Groups are found by lower case beginning of the tag in O(1). Data lines are tokenized on the fly (not kept,
+    millions of small lists slow down the garbage collector) or read into typed columns by 'table'.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self._prefixes = None
+        self._tables = {}
+        super().__init__(*args, **kwargs)
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self._prefixes = None
+        self._tables = {}
+
+    def __delitem__(self, key):
+        super().__delitem__(key)
+        self._prefixes = None
+        self._tables = {}
+
+    def tag(self, chars):
+        """
+        Returns first tag beginning with 'chars' (lower case) or None.
+        """
+        if self._prefixes is None:
+            self._prefixes = {}
+            for tag in self.keys():
+                low_tag = tag.lower()
+                for i in range(len(low_tag) + 1):
+                    self._prefixes.setdefault(low_tag[:i], tag)
+        return self._prefixes.get(chars)
+
+    def select(self, chars):
+        tag = self.tag(chars)
+        return None if tag is None else self[tag]
+
+    def replace(self, chars, part):
+        tag = self.tag(chars)
+        if tag is not None:
+            self[tag] = part
+
+    def rows(self, chars, ignore=";\n"):
+        """
+        Generator of (line, tokens) of data lines of the group (empty and comment lines are skipped).
+        """
+        part = self.select(chars)
+        if part is None:
+            return
+        for line in islice(part, 1, None):
+            if not line or line[0] in ignore:
+                continue
+            tokens = line.split()
+            if tokens:
+                yield line, tokens
+
+    def table(self, tag, columns=None):
+        """
+        Column oriented records of the group: OrderedDict of column name -> float array or list of strings.
+        Columns are taken from INP_GROUP_COLUMNS unless given as ((name, type), ...), these tables are cached.
+        """
+        if columns is None:
+            if tag.upper() not in self._tables:
+                self._tables[tag.upper()] = self.table(tag, INP_GROUP_COLUMNS[tag.upper()])
+            return self._tables[tag.upper()]
+        tokens = [tokens for line, tokens in self.rows(tag.lower())]
+        if tag.upper() == "CURVES":
+            tokens = self.curves_tokens(tokens)
+        elif tag.upper() == "TIMESERIES":
+            # Rows without date, external file rows are kept with NaN value.
+            tokens = [t if len(t) > 3 else [t[0], None] + t[1:] for t in tokens]
+        width = len(columns)
+        padded = [t[:width] + [None] * (width - len(t)) for t in tokens]
+        return OrderedDict(
+            (name, typed_column([t[i] for t in padded], column_type)) for i, (name, column_type) in enumerate(columns)
+        )
+
+    @staticmethod
+    def curves_tokens(tokens):
+        # Type of the curve is given only in its first row.
+        curve_type = None
+        typed = []
+        for t in tokens:
+            if len(t) >= 4:
+                curve_type = t[1]
+                typed.append(t)
+            else:
+                typed.append([t[0], curve_type] + t[1:])
+        return typed
+
+
+def INP_headers(text):
+    """
+    Generator of (start, end, tag) of group headers [xxxx] at the beginning of lines (leading whitespace is allowed).
+    """
+    pos = text.find("[")
+    while pos != -1:
+        line_start = text.rfind("\n", 0, pos) + 1
+        close = text.find("]", pos)
+        line_end = text.find("\n", pos)
+        if close != -1 and (line_end == -1 or close < line_end) and not text[line_start:pos].strip():
+            yield line_start, close + 1, text[pos + 1 : close]
+        pos = text.find("[", pos + 1)
+
+
+def read_INP_groups(inp_file):
+    """
+    Reading .INP file into INPGroups in a single pass over the text.
+    """
+    groups = INPGroups()
+    with open(inp_file) as swmm_inp:
+        text = swmm_inp.read()
+    headers = list(INP_headers(text))
+    for (start, end, tag), next_header in zip(headers, headers[1:] + [None]):
+        group_end = len(text) if next_header is None else next_header[0]
+        groups[tag] = text[end:group_end].split("\n")
+    return groups
+
+
+class INPWriter(object):
+    """
+    Buffered writer of .INP groups and formatted rows, joining INP_WRITE_LINES lines into each write.
+    """
+
+    def __init__(self, swmm_inp_file, lines=INP_WRITE_LINES):
+        self.file = swmm_inp_file
+        self.lines = lines
+
+    def write(self, text):
+        self.file.write(text)
+
+    def write_group(self, tag, part, skip_empty=False):
+        """
+        Writing [tag] and lines of 'part' (INPGroups item, its first line is replaced by the tag).
+        """
+        self.file.write("[{}]".format(tag))
+        lines = iter(part[1:])
+        while True:
+            chunk = list(islice(lines, self.lines))
+            if not chunk:
+                break
+            if skip_empty:
+                chunk = [line for line in chunk if line != ""]
+                if not chunk:
+                    continue
+            self.file.write("\n")
+            self.file.write("\n".join(chunk))
+
+    def write_section(self, tag, *comments):
+        """
+        Writing [tag] after an empty line, followed by comment lines (column captions).
+        """
+        self.file.write("\n\n[{}]".format(tag))
+        self.file.write("".join("\n" + comment for comment in comments))
+
+    def write_lines(self, lines):
+        """
+        Writing list of formatted lines (including their line breaks).
+        """
+        for start in range(0, len(lines), self.lines):
+            self.file.write("".join(lines[start : start + self.lines]))
+
+    def write_rows(self, line, rows):
+        """
+        Writing rows formatted by 'line' template. Returns number of written rows.
+        """
+        rows = iter(rows)
+        count = 0
+        while True:
+            chunk = list(islice(rows, self.lines))
+            if not chunk:
+                break
+            self.file.write("".join([line.format(*row) for row in chunk]))
+            count += len(chunk)
+        return count
+
 
 class StormDrainProject(object):
     def __init__(self, iface, inp_file):
@@ -20,7 +263,7 @@ class StormDrainProject(object):
         self.uc = UserCommunication(iface, "FLO-2D")
         self.inp_file = inp_file
         self.ignore = ";\n"
-        self.INP_groups = OrderedDict()  # ".INP_groups" will contain all groups [xxxx] in .INP file,
+        self.INP_groups = INPGroups()  # ".INP_groups" will contain all groups [xxxx] in .INP file,
         # ordered as entered.
         self.INP_nodes = {}
         self.INP_inflows = {}
@@ -50,27 +293,13 @@ class StormDrainProject(object):
             CONDUITS
             etc.
 
+        E.g. INP_groups['JUNCTIONS'] is list of strings:
+            I1  4685.00    6.00000    0.00       0.00       0.00
+            I2  4684.95    6.00000    0.00       0.00       0.00
+            I3  4688.87    6.00000    0.00       0.00       0.00
         """
         try:
-            with open(self.inp_file) as swmm_inp:  # open(file, mode='r',...) defaults to mode 'r' read.
-                for chunk in swmm_inp.read().split("["):  #  chunk gets all text (including newlines) until next '[' (may be empty).
-                    try:
-                        key, value = chunk.split("]")  # divide chunk into:
-                        # key = name of group (e.g. JUNCTIONS) and
-                        # value = rest of text until ']'
-                        self.INP_groups[key] = value.split(
-                            "\n"
-                        )  # add new item {key, value.split('\n')} to dictionary INP_groups.
-                        # E.g.:
-                        #   key:
-                        #     JUNCTIONS
-                        #   value.split('\n') is list of strings:
-                        #    I1  4685.00    6.00000    0.00       0.00       0.00
-                        #    I2  4684.95    6.00000    0.00       0.00       0.00
-                        #    I3  4688.87    6.00000    0.00       0.00       0.00
-
-                    except ValueError:
-                        continue
+            self.INP_groups = read_INP_groups(self.inp_file)
             try:
                 return len(self.INP_groups["COORDINATES"])
             except Exception as e:
@@ -88,35 +317,39 @@ class StormDrainProject(object):
         Returns a list of strings of the whole group, one list item for each line of the original .INP file.
 
         """
-        part = None
-        for tag in list(self.INP_groups.keys()):
-            low_tag = tag.lower()
-            if low_tag.startswith(chars):
-                part = self.INP_groups[tag]
-                break
-            else:
-                continue
-        return part  # List of strings in .INT_groups dictionary item keyed by 'chars' (e.e.´junc', 'cond', 'outf',...)
+        return self.INP_groups.select(chars)
+
+    def group_records(self, tag, names):
+        """
+        Generator of dictionaries of rows of typed group 'tag' (INPGroups.table) with columns renamed to 'names'.
+        Missing or invalid numbers are None.
+        """
+        columns = [
+            values if isinstance(values, list) else [None if v != v else v for v in values.tolist()]
+            for values in self.INP_groups.table(tag).values()
+        ]
+        for row in zip(*columns):
+            yield dict(zip(names, row))
+
+    def group_lines(self, chars, names):
+        """
+        Lines of the group with the first token in 'names' (lines reported in the status report).
+        """
+        return [line for line, tokens in self.INP_groups.rows(chars) if tokens[0] in names]
 
     def update_tag_in_INP_groups(self, tag_to_update, new_part):
         """
         Find group 'tag_to_update' in INP_groups, and replace it with new_part list.
         """
-        for tag in list(self.INP_groups.keys()):  # Go thru all groups
-            low_tag = tag.lower()
-            if low_tag.startswith(tag_to_update):
-                self.INP_groups[tag] = new_part
-                break
-            else:
-                continue
+        self.INP_groups.replace(tag_to_update, new_part)
 
     def write_INP(self):
-        with open(self.inp_file, "w") as swmm_inp_file:
+        with open(self.inp_file, "w", buffering=INP_BUFFER_SIZE) as swmm_inp_file:
+            writer = INPWriter(swmm_inp_file)
             for tag, part in list(
                 self.INP_groups.items()
             ):  # The iterator self.INP_groups.items() contains all groups of .INP file
-                part[0] = "[{}]".format(tag)
-                swmm_inp_file.write("\n".join(part))
+                writer.write_group(tag, part)
 
     #         with open(self.inp_file, 'w') as swmm_inp_file:
     #             for tag, part in list(self.INP_groups.items()): # The iterator self.INP_groups.items() contains all groups of .INP file
@@ -364,20 +597,15 @@ class StormDrainProject(object):
                 "coor"
             )  # coord_list is a copy of the whole [COORDINATES] group of .INP file.
             if len(coord_list) > 0:
-                for coord in coord_list:
-                    if not coord or coord[0] in self.ignore:
-                        continue
-                    coord_dict = dict(
-                        zip_longest(coord_cols, coord.split())
-                    )  # Creates one dictionary element {'node', x, y}
+                for coord_dict in self.group_records("COORDINATES", coord_cols):  # One element {'node', x, y}
                     node = coord_dict.pop("node")
                     self.INP_nodes[node] = coord_dict  # Inserts one new element to dictionary with key "node".
                     # At the end, it will have all elements from the [COORDINATES] group in .INP file.
                     # E.g:
                     # "self.INP_nodes":
-                    # {'I1': {'x': '366976.000', 'y': '1185380.000'},
-                    #  'I3': {'x': '366875.000', 'y': '1185664.000'},
-                    #  'I2': {'x': '366969.000', 'y': '1185492.000'}, etc.
+                    # {'I1': {'x': 366976.0, 'y': 1185380.0},
+                    #  'I3': {'x': 366875.0, 'y': 1185664.0},
+                    #  'I2': {'x': 366969.0, 'y': 1185492.0}, etc.
 
             return len(coord_list)
 
@@ -400,15 +628,15 @@ class StormDrainProject(object):
             ]
             conduits = self.select_this_INP_group("condu")
             if conduits:
-                for cond in conduits:
-                    if not cond or cond[0] in self.ignore:
-                        continue
-                    conduit_dict = dict(zip_longest(conduit_cols, cond.split()))
+                undefined = set()
+                for conduit_dict in self.group_records("CONDUITS", conduit_cols):
                     conduit = conduit_dict.pop("conduit_name")
                     self.INP_conduits[conduit] = conduit_dict
                     
                     if conduit_dict["conduit_inlet"] == "?" or conduit_dict["conduit_outlet"] == "?":
-                        self.status_report +=  "Undefined Node (?) reference at \n[CONDUITS]\n" + cond + "\n\n"                                        
+                        undefined.add(conduit)
+                for cond in self.group_lines("condu", undefined):
+                    self.status_report +=  "Undefined Node (?) reference at \n[CONDUITS]\n" + cond + "\n\n"                                        
                     
         except Exception as e:
             self.uc.bar_warn("WARNING 221121.1018: Reading conduits from SWMM input data failed!")
@@ -428,10 +656,8 @@ class StormDrainProject(object):
             
             pumps = self.select_this_INP_group("pumps")
             if pumps:
-                for p in pumps:
-                    if not p or p[0] in self.ignore:
-                        continue
-                    pump_dict = dict(zip_longest(pumps_cols, p.split()))
+                for p, tokens in self.INP_groups.rows("pumps"):
+                    pump_dict = dict(zip_longest(pumps_cols, tokens))
                     pump = pump_dict.pop("pump_name")
                     self.INP_pumps[pump] = pump_dict
         except Exception:
@@ -453,10 +679,8 @@ class StormDrainProject(object):
             
             orifices = self.select_this_INP_group("orifices")
             if orifices:
-                for ori in orifices:
-                    if not ori or ori[0] in self.ignore:
-                        continue
-                    ori_dict = dict(zip_longest(orifices_cols, ori.split()))
+                for ori, tokens in self.INP_groups.rows("orifices"):
+                    ori_dict = dict(zip_longest(orifices_cols, tokens))
                     orifice = ori_dict.pop("ori_name")
                     self.INP_orifices[orifice] = ori_dict
         except Exception as e:
@@ -478,10 +702,8 @@ class StormDrainProject(object):
             
             weirs = self.select_this_INP_group("weirs")
             if weirs:
-                for we in weirs:
-                    if not we or we[0] in self.ignore:
-                        continue
-                    weir_dict = dict(zip_longest(weirs_cols, we.split()))
+                for we, tokens in self.INP_groups.rows("weirs"):
+                    weir_dict = dict(zip_longest(weirs_cols, tokens))
                     weir = weir_dict.pop("weir_name")
                     self.INP_weirs[weir] = weir_dict
         except Exception as e:
@@ -498,11 +720,9 @@ class StormDrainProject(object):
             
             curves = self.select_this_INP_group("curves")
             if curves:
-                for c in curves:
-                    if not c or c[0] in self.ignore:
-                        continue
-                    curve_list = list(zip_longest(curves_cols, c.split()))
-                    curve_dict = dict(zip_longest(curves_cols, c.split()))
+                for c, tokens in self.INP_groups.rows("curves"):
+                    curve_list = list(zip_longest(curves_cols, tokens))
+                    curve_dict = dict(zip_longest(curves_cols, tokens))
                     curve_name = curve_dict.pop("pump_curve_name")
                     if curve_name in self.INP_curves:
                         nxt = dict()
@@ -520,10 +740,8 @@ class StormDrainProject(object):
             losses_cols = ["conduit_name", "losses_inlet", "losses_outlet", "losses_average", "losses_flapgate"]
             losses = self.select_this_INP_group("losses")
             if losses is not None:
-                for lo in losses:
-                    if not lo or lo[0] in self.ignore:
-                        continue
-                    losses_dict = dict(zip_longest(losses_cols, lo.split()))
+                undefined = set()
+                for losses_dict in self.group_records("LOSSES", losses_cols):
                     loss = losses_dict.pop("conduit_name")
                     if loss in self.INP_conduits:   
                         self.INP_conduits[loss].update(
@@ -531,7 +749,9 @@ class StormDrainProject(object):
                         )  # Adds new values (from "losses_dict" , that include the "losses_cols") to
                         # an already existing key in dictionary INP_conduits.
                     else:
-                        self.status_report +=  "Undefined Link (" + loss + ") reference at \n[LOSSES]\n" + lo + "\n\n"
+                        undefined.add(loss)
+                for lo in self.group_lines("losses", undefined):
+                    self.status_report +=  "Undefined Link (" + lo.split()[0] + ") reference at \n[LOSSES]\n" + lo + "\n\n"
         except Exception as e:
             self.uc.show_error("ERROR 010422.0513: couldn't create a [LOSSES] group from storm drain .INP file!", e)
 
@@ -548,10 +768,8 @@ class StormDrainProject(object):
             ]
             xsections = self.select_this_INP_group("xsections")
             if xsections is not None:
-                for xs in xsections:
-                    if not xs or xs[0] in self.ignore:
-                        continue                        
-                    xsections_dict = dict(zip_longest(xsections_cols, xs.split()))
+                undefined = set()
+                for xsections_dict in self.group_records("XSECTIONS", xsections_cols):
                     xsec = xsections_dict.pop("conduit_name")
                     
                     if xsec in self.INP_conduits:
@@ -562,7 +780,9 @@ class StormDrainProject(object):
                     elif xsec in self.INP_weirs:  
                         pass                                         
                     else:
-                        self.status_report +=  "Undefined Link (" + xsec + ") reference at  [XSECTIONS]\n" + xs + "\n\n"
+                        undefined.add(xsec)
+                for xs in self.group_lines("xsections", undefined):
+                    self.status_report +=  "Undefined Link (" + xs.split()[0] + ") reference at  [XSECTIONS]\n" + xs + "\n\n"
                                                          
         except Exception as e:
             self.uc.show_error(
@@ -583,10 +803,7 @@ class StormDrainProject(object):
             ]
             xsections = self.select_this_INP_group("xsections")
             if xsections is not None:
-                for xs in xsections:
-                    if not xs or xs[0] in self.ignore:
-                        continue                        
-                    xsections_dict = dict(zip_longest(xsections_cols, xs.split()))
+                for xsections_dict in self.group_records("XSECTIONS", xsections_cols):
                     xsec = xsections_dict.pop("orifice_name")
                     
                     if xsec in self.INP_orifices:
@@ -612,10 +829,7 @@ class StormDrainProject(object):
             ]
             xsections = self.select_this_INP_group("xsections")
             if xsections is not None:
-                for xs in xsections:
-                    if not xs or xs[0] in self.ignore:
-                        continue                        
-                    xsections_dict = dict(zip_longest(xsections_cols, xs.split()))
+                for xsections_dict in self.group_records("XSECTIONS", xsections_cols):
                     xsec = xsections_dict.pop("weir_name")
                     
                     if xsec in self.INP_weirs:
@@ -643,11 +857,9 @@ class StormDrainProject(object):
             ]
             subcatchments = self.select_this_INP_group("subc")
             if subcatchments is not None:
-                for sub in subcatchments:
-                    if not sub or sub[0] in self.ignore:
-                        continue
+                for sub, tokens in self.INP_groups.rows("subc"):
                     sub_dict = dict(
-                        zip_longest(sub_cols, sub.split())
+                        zip_longest(sub_cols, tokens)
                     )  # creates dictionary 'sub_dict' with column names defined in 'sub_cols'
                     out = sub_dict.pop("outlet")  # out is the value of the key, i.e. "I37CP1WTRADL"
                     if out is not None:
@@ -670,10 +882,8 @@ class StormDrainProject(object):
                 "outf"
             )  # Returns the whole [OUTFALLS] group. NOTE: Somehow 'outf' is used as key instead of 'OUTFALLS'. Why?
             if outfalls is not None:
-                for out in outfalls:
-                    if not out or out[0] in self.ignore:
-                        continue
-                    items = out.split()
+                for out, tokens in self.INP_groups.rows("outf"):
+                    items = tokens
                     i0 = items[0]
                     i1 = items[1]
                     if items[2] == "TIDAL":
@@ -705,10 +915,7 @@ class StormDrainProject(object):
                 "junc"
             )  # Returns the whole [JUNCTIONS] group from self.INP_groups. NOTE: Somehow 'junc' is used as key instead of 'JUNCTIONS'. Why?
             if jnctns is not None:
-                for jun in jnctns:
-                    if not jun or jun[0] in self.ignore:
-                        continue
-                    jun_dict = dict(zip_longest(jun_cols, jun.split()))
+                for jun_dict in self.group_records("JUNCTIONS", jun_cols):
                     junction = jun_dict.pop("junction")
                     if junction is not None:
                         self.INP_nodes[junction].update(
@@ -736,10 +943,8 @@ class StormDrainProject(object):
             ]
             inflows = self.select_this_INP_group("inflow")
             if inflows:
-                for infl in inflows:
-                    if not infl or infl[0] in self.ignore:
-                        continue
-                    inflow_dict = dict(zip_longest(inflows_cols, infl.split()))
+                for infl, tokens in self.INP_groups.rows("inflow"):
+                    inflow_dict = dict(zip_longest(inflows_cols, tokens))
                     inflow = inflow_dict.pop("node_name")
                     self.INP_inflows[inflow] = inflow_dict
         except Exception as e:
@@ -798,10 +1003,8 @@ class StormDrainProject(object):
             msg = ""
             curves = self.select_this_INP_group("curves")
             if curves:
-                for c in curves:
-                    if not c or c[0] in self.ignore:
-                        continue
-                    items = c.split()
+                for c, tokens in self.INP_groups.rows("curves"):
+                    items = tokens
                     if len(items) == 4:
                         prev_type = items[1]
                         self.INP_curves.append(items)    
@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+
+# FLO-2D Preprocessor tools for QGIS
+# Copyright © 2021 Lutra Consulting for FLO-2D
+
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version
+"""
+Conflicts between components assigned to the same grid cells.
+
+Cells of every component are read once and stored as bits of one cell -> component bitmask array,
+together with a second bitmask of components assigned more than once to a cell.
+All CONFLICT_RULES are then evaluated with vectorized bitwise operations on cells used by
+at least two components (or twice by one component).
+"""
+import numpy as np
+
+# Cells sources: key, component name shown in the Issues dialog, table and cell column.
+COMPONENT_CELLS = (
+    ("inflow", "Inflows", "inflow_cells", "grid_fid"),
+    ("outflow", "Outflows", "outflow_cells", "grid_fid"),
+    ("arf", "Reduction Factors", "blocked_cells", "grid_fid"),
+    ("struct_in", "Hydr. Structures", "struct", "inflonod"),
+    ("struct_out", "Hydr. Structures", "struct", "outflonod"),
+    ("left_bank", "Channels (Left Bank)", "chan_elems", "fid"),
+    ("right_bank", "Channels (Right Bank)", "chan_elems", "rbankgrid"),
+    ("levee", "Levees", "levee_data", "grid_fid"),
+    ("mult_channel", "Mult. Channels", "mult_cells", "grid_fid"),
+    ("inlet", "Storm Drain Inlets", "swmmflo", "swmm_jt"),
+    ("outfall", "Storm Drain Outfalls", "swmmoutf", "grid_fid"),
+    ("street", "Streets", "street_seg", "igridn"),
+)
+
+# Pairs of cells sources which shouldn't share a cell. Same source twice means more than one record in a cell.
+CONFLICT_RULES = (
+    # Inflow conflicts:
+    ("inflow", "inflow", "2 or more inflows"),
+    ("inflow", "outflow", "Inflow and outflow in same cell"),
+    ("inflow", "arf", "Inflow and Reduction Factors in same cell (check partial ARF, full ARF, or WRF)"),
+    ("inflow", "struct_in", "Inflow and Hyd. Struct in-cell in same cell"),
+    ("inflow", "struct_out", "Inflow and Hyd. Struct out-cell in same cell"),
+    ("inflow", "left_bank", "Inflow and Channel Left Bank in same cell"),
+    ("inflow", "right_bank", "Inflow and Channel Right Bank in same cell"),
+    ("inflow", "levee", "Inflow and levee in same cell"),
+    ("inflow", "mult_channel", "Inflow and Multiple Channels in same cell"),
+    ("inflow", "inlet", "Inflow and Storm Drain Inlet in same cell"),
+    ("inflow", "outfall", "Inflow and Storm Drain Outfall in same cell"),
+    # Outflow conflicts:
+    ("outflow", "outflow", "2 or more outflows"),
+    ("outflow", "arf", "Outflow and Reduction Factors in same cell (check partial ARF, full ARF, or WRF)"),
+    ("outflow", "struct_in", "Outflow and Hyd. Struct in-cell in same cell"),
+    ("outflow", "struct_out", "Outflow and Hyd. Struct out-cell in same cell"),
+    ("outflow", "left_bank", "Outflow and Channel Left Bank in same cell"),
+    ("outflow", "right_bank", "Outflow and Channel Right Bank in same cell"),
+    ("outflow", "levee", "Outflow and levee in same cell"),
+    ("outflow", "mult_channel", "Outflow and Multiple Channels in same cell"),
+    ("outflow", "inlet", "Outflow and Storm Drain Inlet in same cell"),
+    ("outflow", "outfall", "Outflow and Storm Drain Outfall in same cell"),
+    ("outflow", "street", "Outflow and Street in same cell"),
+    # Reduction Factors conflicts:
+    ("arf", "arf", "Duplicate Reduction Factors in same cell (check partial ARF, full ARF, or WRF)"),
+    ("arf", "struct_in", "Reduction Factors and Hyd. Struct in-cell in same cell (not recomended)"),
+    ("arf", "struct_out", "Reduction Factors and Hyd. Struc out-cell in same cell (not recomended)"),
+    ("arf", "left_bank", "Reduction Factors and Channel Left Bank in same cell"),
+    ("arf", "right_bank", "Reduction Factors and Channel Right Bank in same cell"),
+    ("arf", "levee", "Reduction Factors and Levees in same cell (not recomended)"),
+    ("arf", "mult_channel", "Reduction Factors and Multiple Channels in same cell (not recomended)"),
+    ("arf", "inlet", "Reduction Factors and Storm Drain Inlet in same cell (not recomended)"),
+    ("arf", "outfall", "Reduction Factors and Storm Drain Outfall in same cell (not recomended)"),
+    # Hydraulic Structures conflicts:
+    ("struct_in", "struct_in", "More than one Hyd. Struct in-cell in same element"),
+    ("struct_out", "struct_out", "More than one Hyd. Struc out-cell in same element"),
+    ("struct_in", "struct_out", "Hyd. Struct in-cell and Hyd. Struct out-cell in same element"),
+    ("struct_in", "right_bank", "Hyd. Struc in-cell and Channel Right Bank in same cell"),
+    ("struct_out", "right_bank", "Hyd. Struc out-cell and Channel Right Bank in same cell"),
+    ("struct_in", "levee", "Hyd. Struc in-cell and Levee in same element (not recomended)"),
+    ("struct_out", "levee", "Hyd. Struct out-cell and Levee in same element (not recomended)"),
+    ("struct_in", "mult_channel", "Hyd. Struc in-cell and Multiple Channel in same cell"),
+    ("struct_out", "mult_channel", "Hyd. Struct out-cell and Multiple Channel in same cell"),
+    ("struct_in", "inlet", "Hyd. Struc in-cell and Storm Drain Inlet in same cell"),
+    ("struct_out", "outfall", "Hyd. Struct out-cell and Storm Drain Outlet in same cell (not recomended)"),
+    ("struct_in", "street", "Hyd. Struc in-cell and Street in same cell"),
+    ("struct_out", "street", "Hyd. Struct out-cell and Streett in same cell"),
+    # Channels conflicts:
+    ("left_bank", "left_bank", "2 or more Channel Left Banks in same cell"),
+    ("left_bank", "right_bank", "Channel Left Bank and Channel Right Bank in same cell"),
+    ("right_bank", "right_bank", "2 or more Channel Right Banks in same cell"),
+    ("left_bank", "levee", "Channel Left Bank and Levee in same cell"),
+    ("right_bank", "levee", "Channel Right Bank and Levee in same cell"),
+    ("left_bank", "mult_channel", "Channel Left Bank and Multiple Channel in same cell"),
+    ("right_bank", "mult_channel", "Channel Right Bank and Multiple Channel same cell"),
+    ("right_bank", "inlet", "Channel Right Bank and Storm Drain Inlet same cell"),
+    ("right_bank", "outfall", "Channel Right Bank and Storm Drain Outfall same cell"),
+    ("left_bank", "street", "Channel Left Bank and Street in same cell"),
+    ("right_bank", "street", "Channel Right Bank and Street in same cell"),
+    # Levee conflicts:
+    ("levee", "levee", "2 or more Levees in same cell (review)"),
+    ("levee", "mult_channel", "Levee and Multiple Channels in same cell"),
+    ("levee", "inlet", "Levee and Storm Drain Inlet in same cell"),
+    ("levee", "outfall", "Levee and Storm Drain Outfall in same cell"),
+    # Multiple Channels conflicts:
+    ("mult_channel", "mult_channel", "2 or more Multiple Channels in same cell"),
+    ("mult_channel", "inlet", "Multiple Channels and Storm Drain Inlet in same cell"),
+    ("mult_channel", "outfall", "Multiple Channels and Storm Drain Outfall in same cell"),
+    ("mult_channel", "street", "Multiple Channels and Street in same cell"),
+    # Storm Drain conflicts:
+    ("inlet", "inlet", "2 or more Storm Drain Inlets in same cell"),
+    ("inlet", "outfall", "Storm Drain Inlet and Storm Drain Outfall in same cell"),
+    ("outfall", "outfall", "2 or more Storm Drain Outfalls in same cell"),
+    # Street conflicts:
+    ("street", "street", "2 or more Streets in same cell"),
+)
+
+
+def rule_selected(comp1, comp2, issue1="All", issue2="All"):
+    """
+    Checking if conflict between components is requested by the Issues dialog components filter.
+    """
+    return (
+        (issue1 == "All" and issue2 in ("All", ""))
+        or (issue1 == "" and issue2 == "All")
+        or (issue1 == "All" and (comp1 == issue2 or comp2 == issue2))
+        or (issue2 == "All" and (comp1 == issue1 or comp2 == issue1))
+        or (comp1 == issue1 and comp2 in issue2)
+        or (comp2 == issue1 and comp1 in issue2)
+    )
+
+
+class Conflicts(object):
+    """
+    Cell -> component bitmasks of the project and evaluation of CONFLICT_RULES on them.
+    """
+
+    def __init__(self, gutils, sources=COMPONENT_CELLS, rules=CONFLICT_RULES):
+        self.gutils = gutils
+        self.sources = sources
+        self.rules = rules
+        self.bits = {key: 1 << i for i, (key, comp, table, column) in enumerate(sources)}
+        self.names = {key: comp for key, comp, table, column in sources}
+        # Cells used by at least two sources or twice by one source, with their bitmasks.
+        self.cells = np.zeros(0, dtype=np.int64)
+        self.present = np.zeros(0, dtype=np.int64)
+        self.repeated = np.zeros(0, dtype=np.int64)
+
+    def source_cells(self, table, column):
+        qry = "SELECT {0} FROM {1} WHERE {0} IS NOT NULL;".format(column, table)
+        cells = np.array([row[0] for row in self.gutils.execute(qry).fetchall()], dtype=np.int64)
+        return cells[cells >= 0]
+
+    def load(self):
+        """
+        Reading cells of all sources into bitmasks.
+        """
+        source_cells = []
+        cached = {}
+        for key, comp, table, column in self.sources:
+            if (table, column) not in cached:
+                cached[table, column] = np.unique(self.source_cells(table, column), return_counts=True)
+            source_cells.append((self.bits[key],) + cached[table, column])
+        size = max([int(cells[-1]) + 1 for bit, cells, counts in source_cells if cells.shape[0] > 0] + [0])
+        present = np.zeros(size, dtype=np.int64)
+        repeated = np.zeros(size, dtype=np.int64)
+        n_sources = np.zeros(size, dtype=np.int8)
+        for bit, cells, counts in source_cells:
+            present[cells] |= bit
+            repeated[cells[counts > 1]] |= bit
+            n_sources[cells] += 1
+        self.cells = np.nonzero((n_sources > 1) | (repeated != 0))[0]
+        self.present = present[self.cells]
+        self.repeated = repeated[self.cells]
+
+    def rule_cells(self, key1, key2):
+        """
+        Sorted cells breaking the rule between two sources.
+        """
+        if key1 == key2:
+            return self.cells[(self.repeated & self.bits[key1]) != 0]
+        both = self.bits[key1] | self.bits[key2]
+        return self.cells[(self.present & both) == both]
+
+    def errors(self, issue1="All", issue2="All"):
+        """
+        List of [cell, component 1, component 2, description] for selected rules, in order of CONFLICT_RULES.
+        """
+        self.load()
+        errors = []
+        for key1, key2, description in self.rules:
+            comp1, comp2 = self.names[key1], self.names[key2]
+            if not rule_selected(comp1, comp2, issue1, issue2):
+                continue
+            for cell in self.rule_cells(key1, key2).tolist():
+                errors.append([str(cell), comp1, comp2, description])
+        return errors
@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+
+# FLO-2D Preprocessor tools for QGIS
+# Copyright © 2021 Lutra Consulting for FLO-2D
+
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version
+"""
+Ingestion of FLO-2D DEBUG and diagnostics files into the 'debug_issues' GeoPackage table.
+
+Files are parsed in blocks, cells and codes with np.loadtxt, cells centers are taken from the grid index arrays
+and the issue points are written with a single executemany. The table is indexed on cell and error code,
+so the Issues dialog filters are plain indexed queries.
+"""
+import numpy as np
+
+from ..gpb_utils import points_gpb
+from .grid_index import project_grid_index
+
+ISSUES_TABLE = "debug_issues"
+
+# Bytes of DEBUG file text parsed at once.
+BLOCK_SIZE = 16 * 1024 * 1024
+
+
+def debug_numbers(lines):
+    """
+    Cells and codes of DEBUG lines with (n, 2) array of numbers and mask of lines with valid integer cell and code.
+    """
+    try:
+        numbers = np.loadtxt(lines, delimiter=",", usecols=(0, 1), dtype=np.int64, comments=None, ndmin=2)
+        return numbers, np.ones(len(lines), dtype=bool)
+    except ValueError:
+        # Block with invalid lines (e.g. headers), numbers are validated per line.
+        text = np.char.strip(np.loadtxt(lines, delimiter=",", usecols=(0, 1), dtype=str, comments=None, ndmin=2))
+        valid = np.char.isdigit(np.char.lstrip(text, "+-")).all(axis=1)
+        return text[valid].astype(np.int64).reshape(-1, 2), valid
+
+
+def read_debug_file(path, block_size=BLOCK_SIZE):
+    """
+    Reading DEBUG file lines 'cell, code, description' in blocks of about 'block_size' bytes.
+    Cells not greater than 0 are reported in cell 1.
+    Returns (cells array, codes array, list of descriptions, number of skipped lines with invalid cell or code).
+    """
+    numbers, descriptions = [], []
+    skipped = 0
+    with open(path, "r") as f:
+        while True:
+            lines = f.readlines(block_size)
+            if not lines:
+                break
+            lines = [line for line in lines if line.count(",") >= 2]
+            if not lines:
+                continue
+            block_numbers, valid = debug_numbers(lines)
+            skipped += len(lines) - block_numbers.shape[0]
+            numbers.append(block_numbers)
+            descriptions += [
+                line.split(",", 2)[2].replace(",", ", ").strip() for line, ok in zip(lines, valid.tolist()) if ok
+            ]
+    numbers = np.concatenate(numbers) if numbers else np.zeros((0, 2), dtype=np.int64)
+    cells, codes = numbers[:, 0].copy(), numbers[:, 1].copy()
+    cells[cells <= 0] = 1
+    return cells, codes, descriptions, skipped
+
+
+class DebugIssues(object):
+    """
+    Issues imported from DEBUG and other FLO-2D diagnostics files, stored as points in the GeoPackage.
+    """
+
+    def __init__(self, gutils):
+        self.gutils = gutils
+
+    def clear(self):
+        self.gutils.execute("""DELETE FROM "{}";""".format(ISSUES_TABLE))
+
+    def insert(self, cells, codes, descriptions, source, xs=None, ys=None):
+        """
+        Writing issues in bulk. Points are placed in cells centers unless coordinates are given.
+        Returns mask of written issues (issues in cells missing in the grid are skipped without coordinates).
+        """
+        cells = np.asarray(cells, dtype=np.int64)
+        codes = np.broadcast_to(np.asarray(codes, dtype=np.int64), cells.shape)
+        if xs is None:
+            index = project_grid_index(self.gutils)
+            valid = index.has_cells_np(cells)
+            xs = np.zeros(cells.shape)
+            ys = np.zeros(cells.shape)
+            xs[valid] = index.xs[cells[valid]]
+            ys[valid] = index.ys[cells[valid]]
+        else:
+            valid = np.ones(cells.shape, dtype=bool)
+        srs_id = self.gutils.execute(
+            """SELECT srs_id FROM gpkg_contents WHERE table_name = ?;""", (ISSUES_TABLE,)
+        ).fetchone()[0]
+        positions = np.nonzero(valid)[0]
+        geoms = points_gpb(np.asarray(xs, dtype=float)[positions], np.asarray(ys, dtype=float)[positions], srs_id)
+        data = zip(
+            geoms,
+            cells[positions].tolist(),
+            codes[positions].tolist(),
+            [descriptions[i] for i in positions.tolist()],
+            [source] * positions.shape[0],
+        )
+        qry = """INSERT INTO "{}" (geom, grid_fid, code, description, source) VALUES (?, ?, ?, ?, ?);"""
+        self.gutils.execute_many(qry.format(ISSUES_TABLE), data)
+        return valid
+
+    def count(self):
+        return self.gutils.execute("""SELECT COUNT(*) FROM "{}";""".format(ISSUES_TABLE)).fetchone()[0]
+
+    def cells(self):
+        qry = """SELECT DISTINCT grid_fid FROM "{}" ORDER BY grid_fid;"""
+        return [row[0] for row in self.gutils.execute(qry.format(ISSUES_TABLE))]
+
+    def codes(self):
+        qry = """SELECT DISTINCT code FROM "{}" ORDER BY code;"""
+        return [row[0] for row in self.gutils.execute(qry.format(ISSUES_TABLE))]
+
+    def issues(self, cell=None, first_code=None, last_code=None):
+        """
+        List of (cell, code, description) of issues in cell and/or range of codes (all issues by default).
+        """
+        conditions, values = [], []
+        if cell is not None:
+            conditions.append("grid_fid = ?")
+            values.append(cell)
+        if first_code is not None:
+            conditions.append("code BETWEEN ? AND ?")
+            values += [first_code, first_code if last_code is None else last_code]
+        where = " WHERE " + " AND ".join(conditions) if conditions else ""
+        qry = """SELECT grid_fid, code, description FROM "{}"{} ORDER BY fid;""".format(ISSUES_TABLE, where)
+        return self.gutils.execute(qry, values).fetchall()
@@ -221,9 +221,7 @@ class LeveesElevation(ElevationCorrector):
             )
             for elev, fid in poly_values:
                 qry_values.append((round(elev, 4), fid))
-        cur = self.gutils.con.cursor()
-        cur.executemany(qry, qry_values)
-        self.gutils.con.commit()
+        self.gutils.execute_many(qry, qry_values)
 
 
 class GridElevation(ElevationCorrector):
@@ -278,7 +276,8 @@ class GridElevation(ElevationCorrector):
                 cur.execute(add_qry, (cor, fid))
             elif not el_null and not cor_null:
                 cur.execute(set_add_qry, (el, cor, fid))
-
+        # Rows are written one by one on the cursor, grid counters are incremented once.
+        self.gutils.count_changes(set_qry)
         self.gutils.con.commit()
 
     def elevation_from_tin(self):
@@ -302,9 +301,7 @@ class GridElevation(ElevationCorrector):
             if succes != 0:
                 continue
             qry_values.append((round(value, 4), feat.id()))
-        cur = self.gutils.con.cursor()
-        cur.executemany(qry, qry_values)
-        self.gutils.con.commit()
+        self.gutils.execute_many(qry, qry_values)
         self.remove_virtual_sum(self.user_points)
 
     def tin_elevation_within_polygons(self):
@@ -344,9 +341,7 @@ class GridElevation(ElevationCorrector):
             if succes != 0:
                 continue
             qry_values.append((round(value, 4), feat.id()))
-        cur = self.gutils.con.cursor()
-        cur.executemany(qry, qry_values)
-        self.gutils.con.commit()
+        self.gutils.execute_many(qry, qry_values)
 
     def elevation_within_arf(self, calculation_type):
         if calculation_type == "Mean":
@@ -385,9 +380,7 @@ class GridElevation(ElevationCorrector):
             elevation = round(calculation_method(elevs), 4)
             for g in gids:
                 qry_values.append((elevation, g))
-        cur = self.gutils.con.cursor()
-        cur.executemany(qry, qry_values)
-        self.gutils.con.commit()
+        self.gutils.execute_many(qry, qry_values)
 
 
 class ExternalElevation(ElevationCorrector):
@@ -527,6 +520,7 @@ class ExternalElevation(ElevationCorrector):
             fids_elevs[fid] = {"elev": elevation}
             for g in grids_fids:
                 cur.execute(qry, (elevation, g))
+        self.gutils.count_changes(qry)
         self.gutils.con.commit()
         if self.copy_features is True:
             self.import_features(fids_elevs)
@@ -0,0 +1,265 @@
+# -*- coding: utf-8 -*-
+
+# FLO-2D Preprocessor tools for QGIS
+# Copyright © 2021 Lutra Consulting for FLO-2D
+
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version
+import threading
+
+import numpy as np
+
+# Neighbours (row, col) offsets in the dense raster, in the order N, NE, E, SE, S, SW, W, NW.
+NEIGHBOUR_NAMES = ("N", "NE", "E", "SE", "S", "SW", "W", "NW")
+NEIGHBOUR_OFFSETS = np.array([[-1, 0], [-1, 1], [0, 1], [1, 1], [1, 0], [1, -1], [0, -1], [-1, -1]], dtype=int)
+NEIGHBOUR_POSITION = {name: i for i, name in enumerate(NEIGHBOUR_NAMES)}
+
+# FLO-2D direction numbers (1 = N, 2 = E, 3 = S, 4 = W, 5 = NE, 6 = SE, 7 = SW, 8 = NW).
+FLO2D_DIRECTIONS = {1: "N", 2: "E", 3: "S", 4: "W", 5: "NE", 6: "SE", 7: "SW", 8: "NW"}
+
+# Position in NEIGHBOUR_NAMES of each FLO-2D direction number (index 0 unused).
+FLO2D_DIRECTION_POSITION = np.array([-1] + [NEIGHBOUR_POSITION[FLO2D_DIRECTIONS[d]] for d in range(1, 9)], dtype=int)
+
+# Padding value for missing neighbours in array results.
+NO_NEIGHBOUR = -9999
+
+# Grid indexes shared by all tools working on the same GeoPackage file (path -> GridIndex).
+grid_indexes = {}
+grid_indexes_lock = threading.Lock()
+
+
+class GridIndex(object):
+    """
+    In-memory index of the 'grid' table.
+
+    Holds cells attributes as contiguous NumPy arrays indexed by fid (NaN or 0 for missing fids)
+    and a dense 2D raster of cells fids (0 outside the grid) which gives O(1) point to cell and neighbours lookups.
+    Raster row 0 is the top (north) row and column 0 is the left (west) column.
+    """
+
+    def __init__(self, gutils):
+        self.gutils = gutils
+        self.counter = None
+        self.geom_counter = None
+        self.cell_size = None
+        self.xs = None
+        self.ys = None
+        self.cols = None
+        self.rows = None
+        self.elevations = None
+        self.n_values = None
+        self.raster = None
+        self.raster_rows = None
+        self.raster_cols = None
+        self.x0 = None
+        self.y0 = None
+        self.load()
+
+    def snapshot(self, geom=False):
+        """
+        Identity of the database, grid modification counter, connection and its data version (None if not known).
+        Counters are incremented by GeoPackageUtils writes, data version changes with commits of other
+        connections (e.g. edits of QGIS layers), which are not counted.
+        """
+        database_id = self.gutils.database_id()
+        counter = self.gutils.table_change_counter("grid", ("geom",) if geom else None)
+        if database_id is None or counter is None:
+            return None
+        data_version = self.gutils.execute("PRAGMA data_version;").fetchone()[0]
+        return database_id, counter, self.gutils.con, data_version
+
+    def is_current(self):
+        return self.counter is not None and self.counter == self.snapshot()
+
+    def refresh(self):
+        """
+        Reloading the index if 'grid' table was modified. Only values are reloaded if geometries are unchanged.
+        Grid of GeoPackage without change tracking is always reloaded.
+        """
+        if self.is_current():
+            return self
+        if self.geom_counter is not None and self.geom_counter == self.snapshot(geom=True):
+            self.load_values()
+        else:
+            self.load()
+        return self
+
+    def load_values(self):
+        self.counter = self.snapshot()
+        data = np.array(self.gutils.execute("SELECT fid, elevation, n_value FROM grid;").fetchall(), dtype=float)
+        data = data.reshape(-1, 3)
+        fids = data[:, 0].astype(int)
+        self.elevations[:] = np.nan
+        self.n_values[:] = np.nan
+        self.elevations[fids] = data[:, 1]
+        self.n_values[fids] = data[:, 2]
+
+    def load(self):
+        self.counter = self.snapshot()
+        self.geom_counter = self.snapshot(geom=True)
+        self.cell_size = float(self.gutils.get_cont_par("CELLSIZE") or 0)
+        qry = """
+        SELECT fid, ST_X(c), ST_Y(c), elevation, n_value
+        FROM (SELECT fid, ST_Centroid(GeomFromGPB(geom)) AS c, elevation, n_value FROM grid);"""
+        data = np.array(self.gutils.execute(qry).fetchall(), dtype=float).reshape(-1, 5)
+        fids = data[:, 0].astype(int)
+        size = int(fids.max()) + 1 if fids.shape[0] > 0 else 1
+        self.xs = np.full(size, np.nan)
+        self.ys = np.full(size, np.nan)
+        self.elevations = np.full(size, np.nan)
+        self.n_values = np.full(size, np.nan)
+        self.xs[fids] = data[:, 1]
+        self.ys[fids] = data[:, 2]
+        self.elevations[fids] = data[:, 3]
+        self.n_values[fids] = data[:, 4]
+        self.cols = np.full(size, -1, dtype=int)
+        self.rows = np.full(size, -1, dtype=int)
+        if fids.shape[0] == 0 or self.cell_size <= 0:
+            self.raster = np.zeros((0, 0), dtype=int)
+            self.raster_rows, self.raster_cols = 0, 0
+            self.x0, self.y0 = 0.0, 0.0
+            return
+        self.x0 = float(data[:, 1].min())
+        self.y0 = float(data[:, 2].max())
+        cols = np.rint((data[:, 1] - self.x0) / self.cell_size).astype(int)
+        rows = np.rint((self.y0 - data[:, 2]) / self.cell_size).astype(int)
+        self.cols[fids] = cols
+        self.rows[fids] = rows
+        self.raster_rows = int(rows.max()) + 1
+        self.raster_cols = int(cols.max()) + 1
+        self.raster = np.zeros((self.raster_rows, self.raster_cols), dtype=int)
+        self.raster[rows, cols] = fids
+
+    def fids(self):
+        return np.nonzero(~np.isnan(self.xs))[0]
+
+    def has_cell(self, fid):
+        return 0 < fid < self.xs.shape[0] and not np.isnan(self.xs[fid])
+
+    def center(self, fid):
+        return float(self.xs[fid]), float(self.ys[fid])
+
+    def elevation(self, fid):
+        elev = self.elevations[fid]
+        return None if np.isnan(elev) else float(elev)
+
+    def cells_on_points(self, xs, ys):
+        """
+        Getting fids (0 if outside the grid) of cells which contain given points.
+        """
+        xs = np.asarray(xs, dtype=float)
+        ys = np.asarray(ys, dtype=float)
+        fids = np.zeros(xs.shape, dtype=int)
+        if self.raster.size == 0:
+            return fids
+        half_size = self.cell_size * 0.5
+        cols = np.floor((xs - (self.x0 - half_size)) / self.cell_size).astype(int)
+        rows = np.floor(((self.y0 + half_size) - ys) / self.cell_size).astype(int)
+        inside = (cols >= 0) & (cols < self.raster_cols) & (rows >= 0) & (rows < self.raster_rows)
+        fids[inside] = self.raster[rows[inside], cols[inside]]
+        return fids
+
+    def cell_on_point(self, x, y):
+        """
+        Getting fid of cell which contains given point (None if outside the grid).
+        """
+        fid = int(self.cells_on_points([x], [y])[0])
+        return fid if fid > 0 else None
+
+    def neighbour(self, fid, direction):
+        """
+        Getting neighbour fid of the cell in given direction ('N', 'NE', ... or FLO-2D direction number).
+        Returns None if there is no such cell.
+        """
+        name = FLO2D_DIRECTIONS.get(direction, direction)
+        drow, dcol = NEIGHBOUR_OFFSETS[NEIGHBOUR_POSITION[name]]
+        row, col = self.rows[fid] + drow, self.cols[fid] + dcol
+        if 0 <= row < self.raster_rows and 0 <= col < self.raster_cols:
+            neighbour = int(self.raster[row, col])
+            return neighbour if neighbour > 0 else None
+        return None
+
+    def neighbours(self, fid):
+        """
+        Getting list of neighbours fids in the order N, NE, E, SE, S, SW, W, NW (None for missing cells).
+        """
+        return [self.neighbour(fid, name) for name in NEIGHBOUR_NAMES]
+
+    def is_boundary_cell(self, fid):
+        return any(n is None for n in self.neighbours(fid))
+
+    def neighbours_np(self, fids, positions=None):
+        """
+        Getting neighbours fids of array of cells as (len(fids), 8) array in the order N, NE, E, SE, S, SW, W, NW.
+        If 'positions' (one NEIGHBOUR_NAMES index per cell) is given, only that neighbour is returned for each cell.
+        Missing neighbours (and cells which are not in the grid) are padded with NO_NEIGHBOUR.
+        """
+        fids = np.asarray(fids, dtype=int).ravel()
+        valid = self.has_cells_np(fids)
+        rows = np.full(fids.shape, -1, dtype=int)
+        cols = np.full(fids.shape, -1, dtype=int)
+        rows[valid] = self.rows[fids[valid]]
+        cols[valid] = self.cols[fids[valid]]
+        if positions is None:
+            offsets = NEIGHBOUR_OFFSETS[np.newaxis, :, :]
+            rows, cols, valid = rows[:, np.newaxis], cols[:, np.newaxis], valid[:, np.newaxis]
+        else:
+            positions = np.asarray(positions, dtype=int).ravel()
+            valid = valid & (positions >= 0) & (positions < len(NEIGHBOUR_NAMES))
+            offsets = NEIGHBOUR_OFFSETS[np.clip(positions, 0, len(NEIGHBOUR_NAMES) - 1)]
+        nrows = rows + offsets[..., 0]
+        ncols = cols + offsets[..., 1]
+        inside = valid & (nrows >= 0) & (nrows < self.raster_rows) & (ncols >= 0) & (ncols < self.raster_cols)
+        neighbours = np.full(nrows.shape, NO_NEIGHBOUR, dtype=int)
+        neighbours[inside] = self.raster[nrows[inside], ncols[inside]]
+        neighbours[neighbours == 0] = NO_NEIGHBOUR
+        return neighbours
+
+    def elevations_np(self, fids):
+        """
+        Getting elevations of array of fids, NO_NEIGHBOUR padded for missing cells and NULL elevations.
+        """
+        fids = np.asarray(fids, dtype=int)
+        elevs = np.full(fids.shape, float(NO_NEIGHBOUR))
+        valid = (fids > 0) & (fids < self.elevations.shape[0])
+        elevs[valid] = self.elevations[fids[valid]]
+        elevs[np.isnan(elevs)] = NO_NEIGHBOUR
+        return elevs
+
+    def neighbour_elevations_np(self, fids, positions=None):
+        """
+        Getting neighbours elevations of array of cells, with the same layout and padding as neighbours_np.
+        """
+        return self.elevations_np(self.neighbours_np(fids, positions))
+
+    def boundary_cells_np(self, fids):
+        """
+        Getting boolean array telling which of the cells have at least one missing neighbour (False for non-grid fids).
+        """
+        fids = np.asarray(fids, dtype=int).ravel()
+        return self.has_cells_np(fids) & np.any(self.neighbours_np(fids) == NO_NEIGHBOUR, axis=1)
+
+    def has_cells_np(self, fids):
+        fids = np.asarray(fids, dtype=int)
+        valid = (fids > 0) & (fids < self.xs.shape[0])
+        valid[valid] = ~np.isnan(self.xs[fids[valid]])
+        return valid
+
+
+def project_grid_index(gutils):
+    """
+    Getting GridIndex of the GeoPackage, rebuilt only when the 'grid' table was modified.
+    Indexes are shared by GeoPackage path and validated by database identity and grid modification counters.
+    """
+    with grid_indexes_lock:
+        key = gutils.get_gpkg_path()
+        index = grid_indexes.get(key)
+        if index is None:
+            index = GridIndex(gutils)
+            grid_indexes[key] = index
+        else:
+            index.gutils = gutils
+            index.refresh()
+        return index
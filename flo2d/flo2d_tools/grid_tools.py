@@ -43,6 +43,8 @@ from qgis.analysis import QgsInterpolator, QgsTinInterpolator, QgsZonalStatistic
 from ..gui.ui_utils import center_canvas, zoom_show_n_cells
 from ..utils import is_number, get_file_path, grid_index, get_grid_index, set_grid_index
 from ..errors import GeometryValidityErrors, Flo2dError
+from .grid_index import project_grid_index, FLO2D_DIRECTIONS, FLO2D_DIRECTION_POSITION, NEIGHBOUR_NAMES
+from .raster_sampling import raster2grid_np
 
 import numpy as np
 
@@ -190,8 +192,8 @@ class ZonalStatistics(object):
         return cmd, out
 
     def null_elevation(self):
-        req = QgsFeatureRequest().setFilterExpression('"elevation" IS NULL')
-        elev_fid = raster2grid(self.grid, self.filled_raster, request=req)
+        fids = [row[0] for row in self.gutils.execute("SELECT fid FROM grid WHERE elevation IS NULL;")]
+        elev_fid = raster2grid_np(self.gutils, self.filled_raster, fids)
         return elev_fid
 
     def set_elevation(self, elev_fid):
@@ -199,10 +201,7 @@ class ZonalStatistics(object):
         Setting elevation values inside 'grid' table.
         """
         set_qry = "UPDATE grid SET elevation = ? WHERE fid = ?;"
-        cur = self.gutils.con.cursor()
-        for el, fid in elev_fid:
-            cur.execute(set_qry, (el, fid))
-        self.gutils.con.commit()
+        self.gutils.execute_many(set_qry, elev_fid)
 
 
 class ZonalStatisticsOther(object):
@@ -325,8 +324,9 @@ class ZonalStatisticsOther(object):
         return cmd, out
 
     def null_elevation(self):
-        req = QgsFeatureRequest().setFilterExpression('"water_elevation" IS NULL')
-        elev_fid = raster2grid(self.grid, self.filled_raster, request=req)
+        qry = "SELECT fid FROM grid WHERE {0} IS NULL;".format(self.grid_field)
+        fids = [row[0] for row in self.gutils.execute(qry)]
+        elev_fid = raster2grid_np(self.gutils, self.filled_raster, fids)
         return elev_fid
 
     def set_other(self, elev_fid):
@@ -338,10 +338,7 @@ class ZonalStatisticsOther(object):
         elif self.grid_field == "flow_depth":
             set_qry = "UPDATE grid SET flow_depth = ? WHERE fid = ?;"
 
-        cur = self.gutils.con.cursor()
-        for el, fid in elev_fid:
-            cur.execute(set_qry, (el, fid))
-        self.gutils.con.commit()
+        self.gutils.execute_many(set_qry, elev_fid)
 
 
 def debugMsg(msg_string):
@@ -608,6 +605,85 @@ def build_grid_and_tableColRow(boundary, cell_size):
         x += cell_size
 
 
+def polygon_edges_np(geom):
+    """
+    Function for extracting all rings edges (exterior and holes) of the polygon geometry as NumPy arrays.
+    Returns (x1, y1, x2, y2) arrays of edges start and end points.
+    """
+    polygons = geom.asMultiPolygon() if geom.isMultipart() else [geom.asPolygon()]
+    starts, ends = [], []
+    for polygon in polygons:
+        for ring in polygon:
+            vertices = np.array([(pnt.x(), pnt.y()) for pnt in ring], dtype=float)
+            if vertices.shape[0] < 2:
+                continue
+            starts.append(vertices[:-1])
+            ends.append(vertices[1:])
+    if not starts:
+        empty = np.empty(0, dtype=float)
+        return empty, empty, empty, empty
+    starts = np.concatenate(starts)
+    ends = np.concatenate(ends)
+    return starts[:, 0], starts[:, 1], ends[:, 0], ends[:, 1]
+
+
+def points_in_polygon_mask_np(edges, xs, ys):
+    """
+    Function for testing all combinations of 'xs' and 'ys' cell centers against polygon edges.
+    Uses a scanline (even-odd rule) per 'ys' value and returns boolean mask with shape (len(ys), len(xs)).
+    """
+    x1, y1, x2, y2 = edges
+    mask = np.zeros((ys.shape[0], xs.shape[0]), dtype=bool)
+    # Sorting of 'xs' is needed for 'searchsorted'; reverse the permutation at the end.
+    order = np.argsort(xs, kind="stable")
+    sorted_xs = xs[order]
+    for i, y in enumerate(ys):
+        crossing = (y1 > y) != (y2 > y)
+        if not crossing.any():
+            continue
+        cx1, cy1, cx2, cy2 = x1[crossing], y1[crossing], x2[crossing], y2[crossing]
+        intersections = cx1 + (y - cy1) * (cx2 - cx1) / (cy2 - cy1)
+        intersections.sort()
+        inside = np.searchsorted(intersections, sorted_xs, side="right") % 2 == 1
+        mask[i, order] = inside
+    return mask
+
+
+def build_grid_np(boundary, cell_size, upper_left_coords=None):
+    """
+    Vectorized counterpart of 'build_grid' and 'build_grid_and_tableColRow'.
+    Returns NumPy arrays (x, y, col, row) of cells centers and indexes inside given boundary layer.
+    Cells are ordered exactly like in the generators (column by column, from top to bottom).
+    """
+    feature = next(boundary.getFeatures())
+    geom = feature.geometry()
+    bbox = geom.boundingBox()
+    xmin = bbox.xMinimum()
+    xmax = bbox.xMaximum()
+    ymax = bbox.yMaximum()
+    ymin = bbox.yMinimum()
+    if upper_left_coords:
+        xmin, ymax = upper_left_coords
+    cols = int(math.ceil(abs(xmax - xmin) / cell_size))
+    rows = int(math.ceil(abs(ymax - ymin) / cell_size))
+    half_size = cell_size * 0.5
+    # Centers are accumulated the same way as in 'build_grid' to get identical floating point values.
+    xs = np.cumsum(np.concatenate(([xmin + half_size], np.full(max(cols - 1, 0), cell_size))))[:cols]
+    ys = np.cumsum(np.concatenate(([ymax - half_size], np.full(max(rows - 1, 0), -cell_size))))[:rows]
+
+    mask = points_in_polygon_mask_np(polygon_edges_np(geom), xs, ys)
+    col_idx, row_idx = np.nonzero(mask.T)
+    return xs[col_idx], ys[row_idx], col_idx + 2, rows - row_idx + 1
+
+
+def grid_squares_np(xs, ys, cell_size):
+    """
+    Function for calculating square polygons (xmin, ymin, xmax, ymax) from cells centers arrays.
+    """
+    half_size = cell_size * 0.5
+    return xs - half_size, ys - half_size, xs + half_size, ys + half_size
+
+
 def assign_col_row_indexes_to_grid(grid, gutils):
     cell_size = float(gutils.get_cont_par("CELLSIZE"))
     ext = grid.extent()
@@ -622,9 +698,7 @@ def assign_col_row_indexes_to_grid(grid, gutils):
         row = int((yy - ymin)/cell_size) + 2 
         qry_values.append((col, row, i))
         
-    cur = gutils.con.cursor()
-    cur.executemany(qry, qry_values)
-    gutils.con.commit()      
+    gutils.execute_many(qry, qry_values)
 
 
 def poly2grid(grid, polygons, request, use_centroids, get_fid, get_grid_geom, threshold, *columns):
@@ -746,9 +820,16 @@ def poly2poly_geos_from_features(base_polygons, polygons_features, polygon_spati
 
     """
     base_features = base_polygons.getFeatures() if request is None else base_polygons.getFeatures(request)
-    for feat in base_features:
-        base_geom = feat.geometry()
-        base_fid = feat.id()
+    base_geometries = ((feat.id(), feat.geometry()) for feat in base_features)
+    return poly2poly_geos_from_geometries(base_geometries, polygons_features, polygon_spatial_index, *columns)
+
+
+def poly2poly_geos_from_geometries(base_geometries, polygons_features, polygon_spatial_index, *columns):
+    """
+    Generator which calculates intersections of (fid, geometry) base polygons with polygons features indexed in a spatial index.
+    Polygons features only need 'geometry()' and attributes access by column name.
+    """
+    for base_fid, base_geom in base_geometries:
         base_parts = []
         fids = polygon_spatial_index.intersects(base_geom.boundingBox())
         if fids:
@@ -1062,6 +1143,26 @@ def rasters2centroids(vlayer, request, *raster_paths):
 
 
 # Tools which use GeoPackageUtils instance
+def write_grid_np(gutils, boundary, cellsize, upper_left_coords=None, col_row=False, chunksize=100000):
+    """
+    Function for streaming vectorized grid cells into 'grid' table in large batches.
+    """
+    xs, ys, cols, rows = build_grid_np(boundary, cellsize, upper_left_coords)
+    if col_row is True:
+        qry = """INSERT INTO grid (geom, col, row) VALUES (?, ?, ?);"""
+    else:
+        qry = """INSERT INTO grid (geom) VALUES (?);"""
+    for start in range(0, xs.shape[0], chunksize):
+        chunk = slice(start, start + chunksize)
+        geoms = gutils.build_squares(xs[chunk], ys[chunk], cellsize)
+        if col_row is True:
+            data = zip(geoms, cols[chunk].tolist(), rows[chunk].tolist())
+        else:
+            data = ((g,) for g in geoms)
+        gutils.execute_many(qry, data)
+    return xs.shape[0]
+
+
 def square_grid(gutils, boundary, upper_left_coords=None):
     """
     Function for calculating and writing square grid into 'grid' table.
@@ -1070,56 +1171,21 @@ def square_grid(gutils, boundary, upper_left_coords=None):
     update_cellsize = "UPDATE user_model_boundary SET cell_size = ?;"
     gutils.execute(update_cellsize, (cellsize,))
     gutils.clear_tables("grid")
+    write_grid_np(gutils, boundary, cellsize, upper_left_coords)
 
-    polygons = ((gutils.build_square_from_polygon(poly),) for poly in build_grid(boundary, cellsize, upper_left_coords))
-    sql = ["""INSERT INTO grid (geom) VALUES""", 1]
-    for g_tuple in polygons:
-        sql.append(g_tuple)
-    if len(sql) > 2:
-        gutils.batch_execute(sql)
-    else:
-        pass
 
 def square_grid_with_col_and_row_fields(gutils, boundary, upper_left_coords=None):
-    
-    # """
-    # Function for calculating and writing square grid into 'grid' table.
-    # """
-    #
-    # cellsize = float(gutils.get_cont_par("CELLSIZE"))
-    # update_cellsize = "UPDATE user_model_boundary SET cell_size = ?;"
-    # gutils.execute(update_cellsize, (cellsize,))
-    # gutils.clear_tables("grid")
-    #
-    # sql = ["""INSERT INTO grid (geom, col, row) VALUES""", 3] 
-    # polygonsClRw  = ((gutils.build_square_from_polygon2(polyColRow), ) for polyColRow in build_grid_and_tableColRow(boundary, cellsize))
-    # for g_tuple in polygonsClRw:
-        # sql.append((g_tuple[0][0], g_tuple[0][1], g_tuple[0][2],))
-    # if len(sql) > 2:
-        # gutils.batch_execute(sql)
-    # else:
-        # pass    
-    
-    
-    
     """
     Function for calculating and writing square grid into 'grid' table.
+    The grid always starts in the upper left corner of the boundary, 'upper_left_coords' is ignored
+    (like in 'build_grid_and_tableColRow') to keep cells numbering of existing projects.
     """
     try:
         cellsize = float(gutils.get_cont_par("CELLSIZE"))
         update_cellsize = "UPDATE user_model_boundary SET cell_size = ?;"
         gutils.execute(update_cellsize, (cellsize,))
         gutils.clear_tables("grid")
-        
-        sql = ["""INSERT INTO grid (geom, col, row) VALUES""", 3] 
-        polygonsClRw  = ((gutils.build_square_from_polygon2(polyColRow), ) 
-                                for polyColRow in build_grid_and_tableColRow(boundary, cellsize))
-        for g_tuple in polygonsClRw:
-            sql.append((g_tuple[0][0], g_tuple[0][1], g_tuple[0][2],))
-        if len(sql) > 2:
-            gutils.batch_execute(sql)
-        else:
-            pass
+        write_grid_np(gutils, boundary, cellsize, col_row=True)
         return True
     except:
         QApplication.restoreOverrideCursor()
@@ -1171,8 +1237,7 @@ def evaluate_roughness(gutils, grid, roughness, column_name, method, reset=False
         #                 gutils.execute(qry,(manning, gid),)
         else:
             # Centroids
-            gutils.con.executemany(qry, poly2grid(grid, roughness, None, True, False, False, 1, column_name))
-            gutils.con.commit()
+            gutils.execute_many(qry, poly2grid(grid, roughness, None, True, False, False, 1, column_name))
             return True
 
     #     end_time = time.time()
@@ -1323,9 +1388,7 @@ def update_roughness(gutils, grid, roughness, column_name, reset=False):
                     writeVals.append((manning, gid))
                             
             if len(writeVals) > 0:
-                gutils.con.executemany(qry, writeVals)
-                #                 print ("committing to db")
-                gutils.con.commit()
+                gutils.execute_many(qry, writeVals)
 
         return True
     #     endTime = time.time()
@@ -1366,9 +1429,7 @@ def modify_elevation(gutils, grid, elev):
 
     for qry, vals in qry_dict.items():
         if vals:
-            cur = gutils.con.cursor()
-            cur.executemany(qry, vals)
-            gutils.con.commit()
+            gutils.execute_many(qry, vals)
 
 
 def evaluate_arfwrf(gutils, grid, areas):
@@ -1718,61 +1779,16 @@ def highlight_selected_xsection_b(layer, xs_id):
     layer.selectByIds(feat_selection)
 
 def buildCellIDNPArray(gutils):
-    # construct numpy arrays of key grid parameters such as cellid and elevation
-    starttime = datetime.datetime.now()
-    incTime = datetime.datetime.now()
-    
-    centroids = gutils.grid_centroids_all()
-    print ("Centroids pull time: %s sec" % (datetime.datetime.now() - incTime).total_seconds())
-    incTime = datetime.datetime.now()
-    # list in format [gid, [x, y]]
-    xVals = sorted(list(set([item[1][0] for item in centroids])))
-    yVals = sorted(list(set([item[1][1] for item in centroids])))
-    
-    centroids = sorted(centroids, key=lambda student: student[0])
-    
-    centroids = [(item[1][0], item[1][1], item[0]) for item in centroids] # flatten list
-    
-    centroids = np.array(centroids, dtype=float)
-    
-    #yVals = yVals.sort(reverse=True) # place in reverse order per raster orientation
-    xVals = np.array(xVals, dtype=float)
-    yVals = np.array(yVals, dtype=float)
-        
-    centroidsXInd = np.searchsorted(xVals, centroids[:,0], side='right')-1
-    centroidsYInd = np.searchsorted(yVals, centroids[:,1], side='right')
-
-    centroidsYInd = yVals.shape[0] - centroidsYInd # for reverse ordering
-    yVals = np.flip(yVals) # reverse order
-    
-    cellIDs = np.zeros((yVals.shape[0], xVals.shape[0]), dtype=int)
-    # populate cellIDs array
-    cellIDs[centroidsYInd, centroidsXInd] = centroids[:,2]
-    #for n in range(centroids.shape[0]):
-    #    cellIDs[centroidsYInd[n], centroidsXInd[n]] = n + 1
-        
-    del centroidsXInd, centroidsYInd, centroids
-    print ("Array creation time: %s sec" % (datetime.datetime.now() - incTime).total_seconds())
-    print ("Total CellID time: %s sec" % (datetime.datetime.now() - starttime).total_seconds())
-    return cellIDs, xVals, yVals
+    # dense raster of cell ids (0 outside the grid) with cell centers coordinates of its columns and rows
+    index = project_grid_index(gutils)
+    xVals = index.x0 + index.cell_size * np.arange(index.raster_cols, dtype=float)
+    yVals = index.y0 - index.cell_size * np.arange(index.raster_rows, dtype=float)
+    return index.raster, xVals, yVals
 
 def buildCellElevNPArray(gutils, cellIDArray):
-    starttime = datetime.datetime.now()
-    qry_elevs = (
-            """SELECT elevation FROM grid ORDER BY fid"""
-        )
-    elevs = gutils.execute(qry_elevs).fetchall()
-    print ("Elevs pull time: %s sec" % (datetime.datetime.now() - starttime).total_seconds())
-    incTime = datetime.datetime.now()
-    
-    elevs = np.array(elevs, dtype=float)
-    elevs = elevs[:,0]
+    index = project_grid_index(gutils)
     elevArray = np.zeros(cellIDArray.shape, dtype=float)
-
-    elevArray[cellIDArray != 0] = elevs[cellIDArray[cellIDArray != 0]-1]
-    print ("Elevs Array assignment time: %s sec" % (datetime.datetime.now() - incTime).total_seconds())
-    incTime = datetime.datetime.now()
-    print ("Total Elev Array Gen time: %s sec" % (datetime.datetime.now() - starttime).total_seconds())
+    elevArray[cellIDArray != 0] = index.elevations[cellIDArray[cellIDArray != 0]]
     return elevArray
 
 def adjacent_grid_elevations_np(cell, cellNPArray, elevNPArray):
@@ -1810,99 +1826,13 @@ def adjacent_grid_elevations_np(cell, cellNPArray, elevNPArray):
     return elevs
     
 def adjacent_grid_elevations(gutils, grid_lyr, cell, cell_size):
-    sel_elev_qry = """SELECT elevation FROM grid WHERE fid = ?;"""
+    # order is N, NE, E, SE, S, SW, W, NW
     if grid_lyr is not None:
         if cell != "":
             cell = int(cell)
-            grid_count = gutils.count("grid", field = "fid")                                                
-            #grid_count = len(list(grid_lyr.getFeatures()))
-            if grid_count >= cell and cell > 0:
-                currentCell = next(grid_lyr.getFeatures(QgsFeatureRequest(cell)))
-                xx, yy = currentCell.geometry().centroid().asPoint()
-
-                elevs = []
-                # North cell:
-                y = yy + cell_size
-                x = xx
-                grid = gutils.grid_on_point(x, y)
-                if grid is not None:
-                    N_elev = gutils.execute(sel_elev_qry, (grid,)).fetchone()[0]
-                else:
-                    N_elev = -999
-                elevs.append(N_elev)
-
-                # NorthEast cell
-                y = yy + cell_size
-                x = xx + cell_size
-                grid = gutils.grid_on_point(x, y)
-                if grid is not None:
-                    NE_elev = gutils.execute(sel_elev_qry, (grid,)).fetchone()[0]
-                else:
-                    NE_elev = -999
-                elevs.append(NE_elev)
-
-                # East cell:
-                x = xx + cell_size
-                y = yy
-                grid = gutils.grid_on_point(x, y)
-                if grid is not None:
-                    E_elev = gutils.execute(sel_elev_qry, (grid,)).fetchone()[0]
-                else:
-                    E_elev = -999
-                elevs.append(E_elev)
-
-                # SouthEast cell:
-                y = yy - cell_size
-                x = xx + cell_size
-                grid = gutils.grid_on_point(x, y)
-                if grid is not None:
-                    SE_elev = gutils.execute(sel_elev_qry, (grid,)).fetchone()[0]
-                else:
-                    SE_elev = -999
-                elevs.append(SE_elev)
-
-                # South cell:
-                y = yy - cell_size
-                x = xx
-                grid = gutils.grid_on_point(x, y)
-                if grid is not None:
-                    S_elev = gutils.execute(sel_elev_qry, (grid,)).fetchone()[0]
-                else:
-                    S_elev = -999
-                elevs.append(S_elev)
-
-                # SouthWest cell:
-                y = yy - cell_size
-                x = xx - cell_size
-                grid = gutils.grid_on_point(x, y)
-                if grid is not None:
-                    SW_elev = gutils.execute(sel_elev_qry, (grid,)).fetchone()[0]
-                else:
-                    SW_elev = -999
-                elevs.append(SW_elev)
-
-                # West cell:
-                y = yy
-                x = xx - cell_size
-                grid = gutils.grid_on_point(x, y)
-                if grid is not None:
-                    W_elev = gutils.execute(sel_elev_qry, (grid,)).fetchone()[0]
-                else:
-                    W_elev = -999
-                elevs.append(W_elev)
-
-                # NorthWest cell:
-                y = yy + cell_size
-                x = xx - cell_size
-                grid = gutils.grid_on_point(x, y)
-                if grid is not None:
-                    NW_elev = gutils.execute(sel_elev_qry, (grid,)).fetchone()[0]
-                else:
-                    NW_elev = -999
-                elevs.append(NW_elev)
-
-                return elevs
-
+            index = project_grid_index(gutils)
+            if index.has_cell(cell):
+                return [index.elevation(n) if n is not None else -999 for n in index.neighbours(cell)]
 
 def adjacent_average_elevation(gutils, grid_lyr, xx, yy, cell_size):
     # sel_elev_qry = "SELECT elevation FROM grid WHERE fid = ?;"
@@ -1981,433 +1911,84 @@ def adjacent_average_elevation(gutils, grid_lyr, xx, yy, cell_size):
 
 
 def three_adjacent_grid_elevations(gutils, grid_lyr, cell, direction, cell_size):
-
-    #     if grid_lyr is not None:
-    #         if cell != '':
-    #             cell = int(cell)
-    #             grid_count = len(list(grid_lyr.getFeatures()))
-    #             if grid_count >= cell and cell > 0:
-
+    three_adjacent = {
+        1: ("NW", "N", "NE"),  # North => NW, N, NE
+        2: ("NE", "E", "SE"),  # East => NE, E, SE
+        3: ("SE", "S", "SW"),  # South => SE, S, SW
+        4: ("SW", "W", "NW"),  # West => SW, W, NW
+        5: ("N", "NE", "E"),  # NorthEast => N, NE, E
+        6: ("E", "SE", "S"),  # SouthEast => E, SE, S
+        7: ("S", "SW", "W"),  # SouthWest => S, SW, W
+        8: ("W", "NW", "N"),  # NorthWest => W, NW, N
+    }
     try:
         # Expects a cell number inside the computational domain.
-        sel_elev_qry = """SELECT elevation FROM grid WHERE fid = ?;"""
-        currentCell = next(grid_lyr.getFeatures(QgsFeatureRequest(cell)))
-        xx, yy = currentCell.geometry().centroid().asPoint()
-
+        index = project_grid_index(gutils)
         elevs = []
-
-        if direction == 1:  # North => NW, N, NE
-            # NorthWest cell:
-            y = yy + cell_size
-            x = xx - cell_size
-            grid = gutils.grid_on_point(x, y)
-            if grid is not None:
-                elevs.append(gutils.execute(sel_elev_qry, (grid,)).fetchone()[0])
-            else:
-                elevs.append(-99999)
-
-            # North cell:
-            y = yy + cell_size
-            x = xx
-            grid = gutils.grid_on_point(x, y)
-            if grid is not None:
-                elevs.append(gutils.execute(sel_elev_qry, (grid,)).fetchone()[0])
-            else:
-                elevs.append(-99999)
-
-            # NorthEast cell:
-            y = yy + cell_size
-            x = xx + cell_size
-            grid = gutils.grid_on_point(x, y)
-            if grid is not None:
-                elevs.append(gutils.execute(sel_elev_qry, (grid,)).fetchone()[0])
-            else:
-                elevs.append(-99999)
-
-        elif direction == 2:  # East => NE, E, SE
-            # NorthEast cell:
-            y = yy + cell_size
-            x = xx + cell_size
-            grid = gutils.grid_on_point(x, y)
-            if grid is not None:
-                elevs.append(gutils.execute(sel_elev_qry, (grid,)).fetchone()[0])
-            else:
-                elevs.append(-99999)
-
-            # East cell:
-            x = xx + cell_size
-            y = yy
-            grid = gutils.grid_on_point(x, y)
-            if grid is not None:
-                elevs.append(gutils.execute(sel_elev_qry, (grid,)).fetchone()[0])
-            else:
-                elevs.append(-99999)
-
-            # SouthEast cell:
-            y = yy - cell_size
-            x = xx + cell_size
-            grid = gutils.grid_on_point(x, y)
-            if grid is not None:
-                elevs.append(gutils.execute(sel_elev_qry, (grid,)).fetchone()[0])
-            else:
-                elevs.append(-99999)
-
-        elif direction == 3:  # South => SE, S, SW
-            # SouthEast cell:
-            y = yy - cell_size
-            x = xx + cell_size
-            grid = gutils.grid_on_point(x, y)
-            if grid is not None:
-                elevs.append(gutils.execute(sel_elev_qry, (grid,)).fetchone()[0])
-            else:
-                elevs.append(-99999)
-
-            # South cell:
-            y = yy - cell_size
-            x = xx
-            grid = gutils.grid_on_point(x, y)
-            if grid is not None:
-                elevs.append(gutils.execute(sel_elev_qry, (grid,)).fetchone()[0])
-            else:
-                elevs.append(-99999)
-
-            # SouthWest cell:
-            y = yy - cell_size
-            x = xx - cell_size
-            grid = gutils.grid_on_point(x, y)
-            if grid is not None:
-                elevs.append(gutils.execute(sel_elev_qry, (grid,)).fetchone()[0])
-            else:
-                elevs.append(-99999)
-
-        elif direction == 4:  # West => SW, W, NW
-            # SouthWest cell:
-            y = yy - cell_size
-            x = xx - cell_size
-            grid = gutils.grid_on_point(x, y)
-            if grid is not None:
-                elevs.append(gutils.execute(sel_elev_qry, (grid,)).fetchone()[0])
-            else:
-                elevs.append(-99999)
-
-            # West cell:
-            y = yy
-            x = xx - cell_size
-            grid = gutils.grid_on_point(x, y)
-            if grid is not None:
-                elevs.append(gutils.execute(sel_elev_qry, (grid,)).fetchone()[0])
-            else:
-                elevs.append(-99999)
-
-            # NorthWest cell:
-            y = yy + cell_size
-            x = xx - cell_size
-            grid = gutils.grid_on_point(x, y)
-            if grid is not None:
-                elevs.append(gutils.execute(sel_elev_qry, (grid,)).fetchone()[0])
-            else:
-                elevs.append(-99999)
-
-        elif direction == 5:  # NorthEast => N, NE, E
-            # North cell:
-            y = yy + cell_size
-            x = xx
-            grid = gutils.grid_on_point(x, y)
-            if grid is not None:
-                elevs.append(gutils.execute(sel_elev_qry, (grid,)).fetchone()[0])
-            else:
-                elevs.append(-99999)
-
-            # NorthEast cell:
-            y = yy + cell_size
-            x = xx + cell_size
-            grid = gutils.grid_on_point(x, y)
-            if grid is not None:
-                elevs.append(gutils.execute(sel_elev_qry, (grid,)).fetchone()[0])
-            else:
-                elevs.append(-99999)
-
-            # East cell:
-            x = xx + cell_size
-            y = yy
-            grid = gutils.grid_on_point(x, y)
-            if grid is not None:
-                elevs.append(gutils.execute(sel_elev_qry, (grid,)).fetchone()[0])
-            else:
-                elevs.append(-99999)
-
-        elif direction == 6:  # SouthEast => E, SE, S
-            # East cell:
-            x = xx + cell_size
-            y = yy
-            grid = gutils.grid_on_point(x, y)
-            if grid is not None:
-                elevs.append(gutils.execute(sel_elev_qry, (grid,)).fetchone()[0])
-            else:
-                elevs.append(-99999)
-
-            # SouthEast cell:
-            y = yy - cell_size
-            x = xx + cell_size
-            grid = gutils.grid_on_point(x, y)
-            if grid is not None:
-                elevs.append(gutils.execute(sel_elev_qry, (grid,)).fetchone()[0])
-            else:
-                elevs.append(-99999)
-
-            # South cell:
-            y = yy - cell_size
-            x = xx
-            grid = gutils.grid_on_point(x, y)
-            if grid is not None:
-                elevs.append(gutils.execute(sel_elev_qry, (grid,)).fetchone()[0])
-            else:
-                elevs.append(-99999)
-
-        elif direction == 7:  # SouthWest => S, SW, W
-            # South cell:
-            y = yy - cell_size
-            x = xx
-            grid = gutils.grid_on_point(x, y)
-            if grid is not None:
-                elevs.append(gutils.execute(sel_elev_qry, (grid,)).fetchone()[0])
-            else:
-                elevs.append(-99999)
-
-            # SouthWest cell:
-            y = yy - cell_size
-            x = xx - cell_size
-            grid = gutils.grid_on_point(x, y)
-            if grid is not None:
-                elevs.append(gutils.execute(sel_elev_qry, (grid,)).fetchone()[0])
-            else:
-                elevs.append(-99999)
-
-            # West cell:
-            y = yy
-            x = xx - cell_size
-            grid = gutils.grid_on_point(x, y)
-            if grid is not None:
-                elevs.append(gutils.execute(sel_elev_qry, (grid,)).fetchone()[0])
-            else:
-                elevs.append(-99999)
-
-        elif direction == 8:  # NorthWest => W, NW, N
-            # West cell:
-            y = yy
-            x = xx - cell_size
-            grid = gutils.grid_on_point(x, y)
-            if grid is not None:
-                elevs.append(gutils.execute(sel_elev_qry, (grid,)).fetchone()[0])
-            else:
-                elevs.append(-99999)
-
-            # NorthWest cell:
-            y = yy + cell_size
-            x = xx - cell_size
-            grid = gutils.grid_on_point(x, y)
-            if grid is not None:
-                elevs.append(gutils.execute(sel_elev_qry, (grid,)).fetchone()[0])
-            else:
-                elevs.append(-99999)
-
-            # North cell:
-            y = yy + cell_size
-            x = xx
-            grid = gutils.grid_on_point(x, y)
-            if grid is not None:
-                elevs.append(gutils.execute(sel_elev_qry, (grid,)).fetchone()[0])
-            else:
-                elevs.append(-99999)
-
+        for name in three_adjacent.get(direction, ()):
+            grid = index.neighbour(int(cell), name)
+            elevs.append(index.elevation(grid) if grid is not None else -99999)
         return elevs
     except:
         show_error("ERROR 040420.1715: could not evaluate adjacent cell elevation!")
 
 def get_adjacent_cell_elevation(gutils, grid_lyr, cell, dir, cell_size):
     try:
-        sel_elev_qry = """SELECT elevation FROM grid WHERE fid = ?;"""
-        currentCell = next(grid_lyr.getFeatures(QgsFeatureRequest(cell)))
-        xx, yy = currentCell.geometry().centroid().asPoint()
-
-        elev = -999
-        if dir == 1:  # "N"
-            # North cell:
-            y = yy + cell_size
-            x = xx
-            grid = gutils.grid_on_point(x, y)
-            if grid is not None:
-                elev = gutils.execute(sel_elev_qry, (grid,)).fetchone()[0]
-
-        elif dir == 5:  # "NE"
-            # NorthEast cell:
-            y = yy + cell_size
-            x = xx + cell_size
-            grid = gutils.grid_on_point(x, y)
-            if grid is not None:
-                elev = gutils.execute(sel_elev_qry, (grid,)).fetchone()[0]
-
-        elif dir == 2:  # "E"
-            # East cell:
-            x = xx + cell_size
-            y = yy
-            grid = gutils.grid_on_point(x, y)
-            if grid is not None:
-                elev = gutils.execute(sel_elev_qry, (grid,)).fetchone()[0]
-
-        elif dir == 6:  # "SE"
-            # SouthEast cell:
-            y = yy - cell_size
-            x = xx + cell_size
-            grid = gutils.grid_on_point(x, y)
-            if grid is not None:
-                elev = gutils.execute(sel_elev_qry, (grid,)).fetchone()[0]
-
-        elif dir == 3:  # "S"
-            # South cell:
-            y = yy - cell_size
-            x = xx
-            grid = gutils.grid_on_point(x, y)
-            if grid is not None:
-                elev = gutils.execute(sel_elev_qry, (grid,)).fetchone()[0]
-
-        elif dir == 7:  # "SW"
-            # SouthWest cell:
-            y = yy - cell_size
-            x = xx - cell_size
-            grid = gutils.grid_on_point(x, y)
-            if grid is not None:
-                elev = gutils.execute(sel_elev_qry, (grid,)).fetchone()[0]
-
-        elif dir == 4:  # "W"
-            # West cell:
-            y = yy
-            x = xx - cell_size
-            grid = gutils.grid_on_point(x, y)
-            if grid is not None:
-                elev = gutils.execute(sel_elev_qry, (grid,)).fetchone()[0]
-
-        elif dir == 8:  # "NW"
-            # NorthWest cell:
-            y = yy + cell_size
-            x = xx - cell_size
-            grid = gutils.grid_on_point(x, y)
-            if grid is not None:
-                elev = gutils.execute(sel_elev_qry, (grid,)).fetchone()[0]
-
-        else:
+        if dir not in FLO2D_DIRECTIONS:
             show_error("ERROR 160520.1650: Invalid direction!")
-
+            return
+        index = project_grid_index(gutils)
+        grid = index.neighbour(int(cell), dir)
+        elev = index.elevation(grid) if grid is not None else -999
         return grid, elev
     except:
         show_error("ERROR 160520.1644: could not evaluate adjacent cell elevation!")
 
 def get_adjacent_cell(gutils, grid_lyr, cell, dir, cell_size):
     try:
-        currentCell = next(grid_lyr.getFeatures(QgsFeatureRequest(cell)))
-        xx, yy = currentCell.geometry().centroid().asPoint()
-
-        elev = -999
-        if dir == "N":
-            # North cell:
-            y = yy + cell_size
-            x = xx
-            grid = gutils.grid_on_point(x, y)
-
-
-        elif dir == "NE":
-            # NorthEast cell:
-            y = yy + cell_size
-            x = xx + cell_size
-            grid = gutils.grid_on_point(x, y)
-
-        elif dir == "E":
-            # East cell:
-            x = xx + cell_size
-            y = yy
-            grid = gutils.grid_on_point(x, y)
-
-        elif dir == "SE":
-            # SouthEast cell:
-            y = yy - cell_size
-            x = xx + cell_size
-            grid = gutils.grid_on_point(x, y)
-
-        elif dir == "S":
-            # South cell:
-            y = yy - cell_size
-            x = xx
-            grid = gutils.grid_on_point(x, y)
-
-        elif dir == "SW":
-            # SouthWest cell:
-            y = yy - cell_size
-            x = xx - cell_size
-            grid = gutils.grid_on_point(x, y)
-
-        elif dir == "W":
-            # West cell:
-            y = yy
-            x = xx - cell_size
-            grid = gutils.grid_on_point(x, y)
-
-        elif dir == "NW":
-            # NorthWest cell:
-            y = yy + cell_size
-            x = xx - cell_size
-            grid = gutils.grid_on_point(x, y)
-
-        else:
+        if dir not in NEIGHBOUR_NAMES:
             show_error("ERROR 090321.1623: Invalid direction!")
-
-        return grid
+            return
+        index = project_grid_index(gutils)
+        return index.neighbour(int(cell), dir)
     except:
         show_error("ERROR 090321.1624: could not evaluate adjacent cell!")
 
 def adjacent_grids(gutils, currentCell, cell_size):
-    xx, yy = currentCell.geometry().centroid().asPoint()
-
-    # North cell:
-    y = yy + cell_size
-    x = xx
-    n_grid = gutils.grid_on_point(x, y)
-
-    # NorthEast cell
-    y = yy + cell_size
-    x = xx + cell_size
-    ne_grid = gutils.grid_on_point(x, y)
-
-    # East cell:
-    x = xx + cell_size
-    y = yy
-    e_grid = gutils.grid_on_point(x, y)
-
-    # SouthEast cell:
-    y = yy - cell_size
-    x = xx + cell_size
-    se_grid = gutils.grid_on_point(x, y)
-
-    # South cell:
-    y = yy - cell_size
-    x = xx
-    s_grid = gutils.grid_on_point(x, y)
-
-    # SouthWest cell:
-    y = yy - cell_size
-    x = xx - cell_size
-    sw_grid = gutils.grid_on_point(x, y)
-
-    # West cell:
-    y = yy
-    x = xx - cell_size
-    w_grid = gutils.grid_on_point(x, y)
-
-    # NorthWest cell:
-    y = yy + cell_size
-    x = xx - cell_size
-    nw_grid = gutils.grid_on_point(x, y) 
-     
-    return  n_grid, ne_grid, e_grid, se_grid, s_grid, sw_grid, w_grid, nw_grid
+    # returns n_grid, ne_grid, e_grid, se_grid, s_grid, sw_grid, w_grid, nw_grid
+    index = project_grid_index(gutils)
+    return tuple(index.neighbours(currentCell.id()))
+
+
+def adjacent_grids_np(gutils, cells):
+    # (len(cells), 8) array of neighbours fids in the order N, NE, E, SE, S, SW, W, NW, -9999 for missing cells
+    return project_grid_index(gutils).neighbours_np(cells)
+
+
+def adjacent_grid_elevations_array(gutils, cells):
+    # (len(cells), 8) array of neighbours elevations in the order N, NE, E, SE, S, SW, W, NW, -9999 for missing cells
+    return project_grid_index(gutils).neighbour_elevations_np(cells)
+
+
+def adjacent_cells_elevations_np(gutils, cells, dirs):
+    """
+    Getting neighbour fids and elevations of each cell in its FLO-2D direction (1 = N, 2 = E, ..., 8 = NW).
+    Missing neighbours and invalid directions are padded with -9999.
+    """
+    index = project_grid_index(gutils)
+    dirs = np.asarray(dirs, dtype=int).ravel()
+    positions = np.full(dirs.shape, -1, dtype=int)
+    valid = (dirs >= 1) & (dirs <= 8)
+    positions[valid] = FLO2D_DIRECTION_POSITION[dirs[valid]]
+    grids = index.neighbours_np(cells, positions)
+    return grids, index.elevations_np(grids)
+
+
+def boundary_cells_np(gutils, cells):
+    # boolean array telling which cells have at least one missing neighbour
+    return project_grid_index(gutils).boundary_cells_np(cells)
+
+
 def dirID(dir):
     if dir == 1:  # "N"
         # North cell:
@@ -2450,68 +2031,10 @@ def dirID(dir):
 def is_boundary_cell(gutils, grid_lyr, cell, cell_size):
     if grid_lyr is not None:
         if cell:
-            n_cells = number_of_elements(gutils, grid_lyr)
-            if n_cells >= cell and cell > 0:
-
-                currentCell = next(grid_lyr.getFeatures(QgsFeatureRequest(cell)))
-                xx, yy = currentCell.geometry().centroid().asPoint()
-
-                # North cell:
-                y = yy + cell_size
-                x = xx
-                grid = gutils.grid_on_point(x, y)
-                if grid is None:
-                    return True
-
-                # NorthEast cell
-                y = yy + cell_size
-                x = xx + cell_size
-                grid = gutils.grid_on_point(x, y)
-                if grid is None:
-                    return True
-
-                # East cell:
-                y = yy
-                x = xx + cell_size
-                grid = gutils.grid_on_point(x, y)
-                if grid is None:
-                    return True
-
-                # SouthEast cell:
-                y = yy - cell_size
-                x = xx + cell_size
-                grid = gutils.grid_on_point(x, y)
-                if grid is None:
-                    return True
-
-                # South cell:
-                y = yy - cell_size
-                x = xx
-                grid = gutils.grid_on_point(x, y)
-                if grid is None:
-                    return True
-
-                # SouthWest cell:
-                y = yy - cell_size
-                x = xx - cell_size
-                grid = gutils.grid_on_point(x, y)
-                if grid is None:
-                    return True
-
-                # West cell:
-                y = yy
-                x = xx - cell_size
-                grid = gutils.grid_on_point(x, y)
-                if grid is None:
-                    return True
-
-                # NorthWest cell:
-                y = yy + cell_size
-                x = xx - cell_size
-                grid = gutils.grid_on_point(x, y)
-                if grid is None:
-                    return True
-
+            cell = int(cell)
+            index = project_grid_index(gutils)
+            if index.has_cell(cell):
+                return index.is_boundary_cell(cell)
     return False
 
 
@@ -7,10 +7,18 @@
 # modify it under the terms of the GNU General Public License
 # as published by the Free Software Foundation; either version 2
 # of the License, or (at your option) any later version
+import multiprocessing
+from collections import deque
 from math import log, exp, log10, sqrt
-from qgis.core import QgsGeometry, QgsSpatialIndex, QgsFeature, QgsField, QgsFields, QgsProject, QgsRectangle, QgsFeatureRequest
+from qgis.core import QgsGeometry, QgsSpatialIndex, QgsFeature, QgsField, QgsFields, QgsProject, QgsRectangle, QgsFeatureRequest, NULL
 from qgis.PyQt.QtWidgets import QApplication
-from .grid_tools import poly2poly_geos_from_features, intersection_spatial_index, centroids2poly_geos, gridRegionGenerator
+from .grid_tools import (
+    poly2poly_geos_from_geometries,
+    intersection_spatial_index,
+    centroids2poly_geos,
+    gridRegionGenerator,
+)
+from .workers import process_pool
 from ..user_communication import UserCommunication
 from qgis.utils import iface
 from qgis.PyQt.QtCore import QSettings
@@ -95,11 +103,35 @@ class InfiltrationCalculator(object):
         self.cd_fld = cd_fld
         self.imp_fld = imp_fld
 
-    def green_ampt_infiltration(self):
+    def green_ampt_region_data(self, request):
+        """
+        Picklable data of grid region: cells (fid, WKB) and soil and land use features clipped around them.
+        """
+        cells = []
+        grid_elem_extent = QgsRectangle()
+        grid_elem_extent.setMinimal()
+        for grid_elem in self.grid_lyr.getFeatures(request):
+            geom = grid_elem.geometry()
+            grid_elem_extent.combineExtentWith(geom.boundingBox())
+            cells.append((grid_elem.id(), bytes(geom.asWkb())))
+
+        grid_elem_extent.grow(grid_elem_extent.width() / 20.0)
+        soil_and_land_request = QgsFeatureRequest()
+        soil_and_land_request.setFilterRect(grid_elem_extent)
+
+        soil_features, soil_index = intersection_spatial_index(self.soil_lyr, soil_and_land_request, clip=True)
+        land_features, land_index = intersection_spatial_index(self.land_lyr, soil_and_land_request, clip=True)
+        soil_records = overlay_records(soil_features, self.xksat_fld, self.rtimps_fld, self.soil_depth_fld)
+        land_records = overlay_records(land_features, self.rtimpl_fld, self.saturation_fld, self.vc_fld, self.ia_fld)
+        return cells, soil_records, land_records
+
+    def green_ampt_infiltration(self, workers=1):
+        """
+        Calculating Green-Ampt parameters of grid cells region by region, in worker processes if 'workers' != 1.
+        """
         writeDiagnosticCSV = True  # flag to determine if a csv file should be written with computational values
         try:
             grid_params = {}
-            green_ampt = GreenAmpt()
 
             grid_element_count = self.grid_lyr.featureCount()
             if grid_element_count < 0:
@@ -107,129 +139,24 @@ class InfiltrationCalculator(object):
             else:
                 grid_span = int(max(sqrt(grid_element_count) /10,10))
 
-            for request in gridRegionGenerator(self.gutils, self.grid_lyr, gridSpan=grid_span, regionPadding=5, showProgress=True):
-
-                # calculate extent of concerned grid element
-                grid_elems = self.grid_lyr.getFeatures(request)
-                grid_elem_extent = QgsRectangle()
-                grid_elem_extent.setMinimal()
-                for grid_elem in grid_elems:
-                    grid_elem_extent.combineExtentWith(grid_elem.geometry().boundingBox())
-
-                grid_elem_extent.grow(grid_elem_extent.width()/20.0)
-                soil_and_land_request=QgsFeatureRequest()
-                soil_and_land_request.setFilterRect(grid_elem_extent)
-
-                soil_features, soil_index = intersection_spatial_index(self.soil_lyr, soil_and_land_request, clip=True)
-                land_features, land_index = intersection_spatial_index(self.land_lyr, soil_and_land_request, clip=True)
-
-                rtimp_features = {}
-                rtimp_index = QgsSpatialIndex()
-                rtimp_fields = QgsFields()
-                rtimp_fields.append(QgsField('rtimp'))
-
-                rtimp_fid = 0
-
-                for land_feat, engine in land_features.values():
-                    land_rtimp = land_feat[self.rtimpl_fld]
-                    land_geom = land_feat.geometry()
-
-                    soil_fids = soil_index.intersects(land_geom.boundingBox())
-                    for soil_fid in soil_fids:
-                        soil_feat, soil_engine = soil_features[soil_fid]
-                        soil_rtimp = soil_feat[self.rtimps_fld]
-                        rtimp_geom = land_geom.intersection(soil_feat.geometry())
-
-                        if rtimp_geom.isEmpty():
-                            continue
-
-                        rtimp_feat = QgsFeature(rtimp_fields, rtimp_fid)
-
-                        rtimp_feat.setGeometry(rtimp_geom)
-                        rtimp_feat[0] = max(land_rtimp, soil_rtimp)
-                        rtimp_features[rtimp_fid] = (rtimp_feat, QgsGeometry.createGeometryEngine(rtimp_geom.constGet()))
-                        rtimp_index.insertFeature(rtimp_feat)
-                        rtimp_fid = rtimp_fid + 1
-
-                try:
-                    soil_values = poly2poly_geos_from_features(
-                        self.grid_lyr,
-                        soil_features,
-                        soil_index,
-                        request,
-                        self.xksat_fld,
-                        self.soil_depth_fld,
-                    )
-                except Exception as e:
-                    self.uc.show_error(
-                        "ERROR 051218.2035: Green-Ampt infiltration failed\nwhile intersecting soil layer with grid."
-                        + "\n__________________________________________________",
-                        e,
-                    )
-                    return grid_params
-
-                for gid, values in soil_values:
-                    try:
-                        xksat_parts = [(row[0], row[-1]) for row in values]
-                        avg_soil_depth = sum(row[1] * row[-1] for row in values)
-                        avg_xksat = green_ampt.calculate_xksat(xksat_parts)
-
-                        psif = green_ampt.calculate_psif(avg_xksat)
-
-                        grid_params[gid] = {
-                            "soilParts": len(values),
-                            "soilhydc": avg_xksat,
-                            "hydc": avg_xksat,
-                            "soils": psif,
-                            "soil_depth": avg_soil_depth,
-                        }
-                    except Exception as e:
-                        self.uc.show_error(
-                            "ERROR 1401181951.2035: Green-Ampt infiltration failed"
-                            + "\nwhile intersecting soil layer with grid {}".format(gid)
-                            + "\n__________________________________________________",
-                            e,
-                        )
-                        return grid_params
-
-
-                land_values = poly2poly_geos_from_features(
-                    self.grid_lyr, land_features, land_index, request, self.saturation_fld, self.vc_fld, self.ia_fld)
-
-                for gid, values in land_values:
-                    try:
-                        params = grid_params[gid]
-                        avg_xksat = params["hydc"]
-
-                        vc_parts = [(row[1], row[-1]) for row in values]
-                        ia_parts = [(row[2], row[-1]) for row in values]
-
-                        dtheta = sum([green_ampt.calculate_dtheta(avg_xksat, row[0]) * row[-1] for row in values])
-                        if self.vcCheck == True:
-                            # perform vc adjusment
-                            xksatc = green_ampt.calculate_xksatc(avg_xksat, vc_parts)
-                        else:
-                            # don't perform vc adjusment
-                            xksatc = avg_xksat
-
-                        iabstr = green_ampt.calculate_iabstr(ia_parts)
-
-                        params["dtheta"] = dtheta
-                        params["hydc"] = xksatc
-                        params["abstrinf"] = iabstr
-                        params["luParts"] = len(values)
-
-
-
-                    except ValueError as e:
-                        raise ValueError("Calculation of land use variables failed for grid cell with fid: {}".format(gid))
-
-                rtimp_values = poly2poly_geos_from_features( self.grid_lyr, rtimp_features, rtimp_index, request, 'rtimp'  )
-
-                for gid, values in rtimp_values:
-                    params = grid_params[gid]
-                    rtimp_part = [(row[0]*0.01, row[-1]) for row in values]
-                    params["rtimpf"] = green_ampt.calculate_rtimp_n(rtimp_part)
+            fields = (
+                self.xksat_fld,
+                self.rtimps_fld,
+                self.soil_depth_fld,
+                self.saturation_fld,
+                self.vc_fld,
+                self.ia_fld,
+                self.rtimpl_fld,
+            )
+            regions = (
+                self.green_ampt_region_data(request)
+                for request in gridRegionGenerator(
+                    self.gutils, self.grid_lyr, gridSpan=grid_span, regionPadding=5, showProgress=True
+                )
+            )
+            # Regions overlap, so results are merged in regions order like in serial processing.
+            for region_params in green_ampt_regions(regions, fields, self.vcCheck, workers):
+                grid_params.update(region_params)
 
             if writeDiagnosticCSV == True:
                 # write a diagnostic CSV file with all fo the information for the calculations in it
@@ -247,11 +174,11 @@ class InfiltrationCalculator(object):
                         str(grid_params[gid]["soilhydc"]),
                         str(grid_params[gid]["rtimpf"]),
                         str(grid_params[gid]["soil_depth"]),
-                        str(grid_params[gid]["luParts"]),
+                        str(grid_params[gid].get("luParts", 0)),
                         str(round(grid_params[gid]["hydc"] / grid_params[gid]["soilhydc"], 5)),
                         str(grid_params[gid]["hydc"]),
-                        str(grid_params[gid]["dtheta"]),
-                        str(grid_params[gid]["abstrinf"]),
+                        str(grid_params[gid].get("dtheta", "")),
+                        str(grid_params[gid].get("abstrinf", "")),
                         str(grid_params[gid]["soils"]),
                     )
                     for gid in gids
@@ -313,6 +240,202 @@ class InfiltrationCalculator(object):
         return grid_params
 
 
+class OverlayFeature(object):
+    """
+    Feature rebuilt from WKB with the attributes needed by 'poly2poly_geos_from_geometries'.
+    """
+
+    def __init__(self, geom, attributes):
+        self.geom = geom
+        self.attributes = attributes
+
+    def geometry(self):
+        return self.geom
+
+    def __getitem__(self, column):
+        return self.attributes[column]
+
+
+def overlay_records(features, *columns):
+    """
+    Picklable (fid, WKB, attributes) records of features from 'intersection_spatial_index', in the index insertion order.
+    """
+    records = []
+    for fid, (feat, engine) in features.items():
+        attributes = {}
+        for col in columns:
+            value = feat[col]
+            attributes[col] = None if value == NULL else value
+        records.append((fid, bytes(feat.geometry().asWkb()), attributes))
+    return records
+
+
+def overlay_features(records):
+    """
+    Rebuilding features, prepared geometry engines and spatial index from 'overlay_records'.
+    """
+    features = {}
+    index = QgsSpatialIndex()
+    for fid, wkb, attributes in records:
+        geom = QgsGeometry()
+        geom.fromWkb(wkb)
+        engine = QgsGeometry.createGeometryEngine(geom.constGet())
+        engine.prepareGeometry()
+        features[fid] = (OverlayFeature(geom, attributes), engine)
+        index.addFeature(fid, geom.boundingBox())
+    return features, index
+
+
+def green_ampt_region(cells, soil_records, land_records, fields, vcCheck):
+    """
+    Green-Ampt parameters of region cells intersected with soil, land use and derived RTIMP polygons.
+    Runs in worker processes, so everything is passed as plain data. Returns dictionary {gid: parameters}.
+    """
+    xksat_fld, rtimps_fld, soil_depth_fld, saturation_fld, vc_fld, ia_fld, rtimpl_fld = fields
+    green_ampt = GreenAmpt()
+    grid_params = {}
+    base_geometries = []
+    for gid, wkb in cells:
+        geom = QgsGeometry()
+        geom.fromWkb(wkb)
+        base_geometries.append((gid, geom))
+
+    soil_features, soil_index = overlay_features(soil_records)
+    land_features, land_index = overlay_features(land_records)
+
+    rtimp_features = {}
+    rtimp_index = QgsSpatialIndex()
+    rtimp_fid = 0
+    for land_feat, engine in land_features.values():
+        land_rtimp = land_feat[rtimpl_fld]
+        land_geom = land_feat.geometry()
+
+        soil_fids = soil_index.intersects(land_geom.boundingBox())
+        for soil_fid in soil_fids:
+            soil_feat, soil_engine = soil_features[soil_fid]
+            soil_rtimp = soil_feat[rtimps_fld]
+            # NULL values are ignored, polygons without any RTIMP value are skipped.
+            rtimps = [rtimp for rtimp in (land_rtimp, soil_rtimp) if rtimp is not None]
+            if not rtimps:
+                continue
+            rtimp_geom = land_geom.intersection(soil_feat.geometry())
+
+            if rtimp_geom.isEmpty():
+                continue
+
+            rtimp_feat = OverlayFeature(rtimp_geom, {"rtimp": max(rtimps)})
+            rtimp_features[rtimp_fid] = (rtimp_feat, QgsGeometry.createGeometryEngine(rtimp_geom.constGet()))
+            rtimp_index.addFeature(rtimp_fid, rtimp_geom.boundingBox())
+            rtimp_fid = rtimp_fid + 1
+
+    soil_values = poly2poly_geos_from_geometries(
+        base_geometries, soil_features, soil_index, xksat_fld, soil_depth_fld
+    )
+    for gid, values in soil_values:
+        try:
+            xksat_parts = [(row[0], row[-1]) for row in values]
+            avg_soil_depth = sum(row[1] * row[-1] for row in values)
+            avg_xksat = green_ampt.calculate_xksat(xksat_parts)
+
+            psif = green_ampt.calculate_psif(avg_xksat)
+
+            grid_params[gid] = {
+                "soilParts": len(values),
+                "soilhydc": avg_xksat,
+                "hydc": avg_xksat,
+                "soils": psif,
+                "soil_depth": avg_soil_depth,
+            }
+        except Exception as e:
+            raise ValueError(
+                "ERROR 1401181951.2035: Green-Ampt infiltration failed"
+                + "\nwhile intersecting soil layer with grid {}: {}".format(gid, e)
+            )
+
+    land_values = poly2poly_geos_from_geometries(
+        base_geometries, land_features, land_index, saturation_fld, vc_fld, ia_fld
+    )
+    for gid, values in land_values:
+        params = grid_params.get(gid)
+        if params is None:
+            # Cells outside of the soil layer have no Green-Ampt parameters.
+            continue
+        try:
+            avg_xksat = params["hydc"]
+
+            vc_parts = [(row[1], row[-1]) for row in values]
+            ia_parts = [(row[2], row[-1]) for row in values]
+
+            dtheta = sum([green_ampt.calculate_dtheta(avg_xksat, row[0]) * row[-1] for row in values])
+            if vcCheck == True:
+                # perform vc adjusment
+                xksatc = green_ampt.calculate_xksatc(avg_xksat, vc_parts)
+            else:
+                # don't perform vc adjusment
+                xksatc = avg_xksat
+
+            iabstr = green_ampt.calculate_iabstr(ia_parts)
+
+            params["dtheta"] = dtheta
+            params["hydc"] = xksatc
+            params["abstrinf"] = iabstr
+            params["luParts"] = len(values)
+
+        except ValueError as e:
+            raise ValueError("Calculation of land use variables failed for grid cell with fid: {}".format(gid))
+
+    rtimp_values = poly2poly_geos_from_geometries(base_geometries, rtimp_features, rtimp_index, "rtimp")
+    for gid, values in rtimp_values:
+        params = grid_params.get(gid)
+        if params is None:
+            continue
+        rtimp_part = [(row[0] * 0.01, row[-1]) for row in values]
+        params["rtimpf"] = green_ampt.calculate_rtimp_n(rtimp_part)
+    # Cells not intersecting any RTIMP polygon get the global value.
+    for params in grid_params.values():
+        params.setdefault("rtimpf", green_ampt.calculate_rtimp_n([]))
+
+    return grid_params
+
+
+def green_ampt_regions(regions, fields, vcCheck, workers=1):
+    """
+    Generator of Green-Ampt parameters of regions given as 'green_ampt_region_data', in regions order.
+    With more than one worker (None for all CPUs but one) regions are calculated in worker processes,
+    at most two per worker are waiting.
+    """
+    if workers is None:
+        workers = max(1, multiprocessing.cpu_count() - 1)
+    regions = iter(regions)
+    pending = deque()
+    if workers > 1:
+        reading = False
+        try:
+            with process_pool(workers) as pool:
+                while True:
+                    reading = True
+                    region = next(regions, None)
+                    reading = False
+                    if region is None:
+                        break
+                    pending.append((region, pool.submit(green_ampt_region, *region, fields, vcCheck)))
+                    while pending and (len(pending) > 2 * workers or pending[0][1].done()):
+                        yield pending[0][1].result()
+                        pending.popleft()
+                while pending:
+                    yield pending[0][1].result()
+                    pending.popleft()
+        except Exception:
+            if reading:
+                raise
+            # Worker processes are not available or failed (e.g. embedded interpreter, broken pool),
+            # remaining regions are calculated here, so calculation errors are raised from this process.
+    for region, future in pending:
+        yield green_ampt_region(*region, fields, vcCheck)
+    for region in regions:
+        yield green_ampt_region(*region, fields, vcCheck)
+
+
 class GreenAmpt(object):
     def __init__(self):
         self.uc = UserCommunication(iface, "FLO-2D")
@@ -0,0 +1,232 @@
+# -*- coding: utf-8 -*-
+
+# FLO-2D Preprocessor tools for QGIS
+# Copyright © 2021 Lutra Consulting for FLO-2D
+
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version
+"""
+Streaming binning of LiDAR XYZ text files into grid cells.
+
+Files are read in blocks of lines which are parsed into NumPy arrays, points are located on the dense
+raster of the grid index and sum, count, min and max of Z are accumulated per cell fid with np.bincount.
+This module doesn't depend on QGIS, so files can be binned in worker processes.
+"""
+import warnings
+import multiprocessing
+from concurrent.futures import wait, FIRST_COMPLETED
+from itertools import islice
+import numpy as np
+
+from .workers import process_pool
+
+# Bytes of text parsed at once.
+BLOCK_SIZE = 64 * 1024 * 1024
+
+# Columns of X, Y and Z for supported number of columns in a line.
+XYZ_COLUMNS = {3: (0, 1, 2), 4: (0, 1, 2), 5: (1, 2, 3)}
+
+
+def lidar_file_format(path):
+    """
+    Function for detecting delimiter (',' or None for whitespace) and number of columns of LiDAR file.
+    Returns (None, 0) if the format is not supported.
+    """
+    with open(path, "r") as f:
+        for line in f:
+            line = line.replace("\t", " ")
+            if line.strip() != "":
+                n_commas = line.count(",")
+                if n_commas != 0:
+                    delimiter, n_columns = ",", n_commas + 1
+                else:
+                    delimiter, n_columns = None, len(line.split())
+                if n_columns in XYZ_COLUMNS:
+                    return delimiter, n_columns
+                break
+    return None, 0
+
+
+def bad_xyz_line(lines, delimiter, n_columns):
+    """
+    Function for finding index of the first line which hasn't 'n_columns' numbers (None if all lines are valid).
+    """
+    for i, line in enumerate(lines):
+        if not line.strip():
+            continue
+        values = line.split(delimiter)
+        if len(values) != n_columns:
+            return i
+        try:
+            [float(v) for v in values]
+        except ValueError:
+            return i
+    return None
+
+
+def read_xyz_blocks(path, delimiter, n_columns, block_size=BLOCK_SIZE):
+    """
+    Generator of (x, y, z) arrays read from LiDAR file in blocks of about 'block_size' bytes.
+    Raises ValueError with the number of the first line which hasn't 'n_columns' numbers.
+    """
+    xcol, ycol, zcol = XYZ_COLUMNS[n_columns]
+    first_line = 1
+    with open(path, "r") as f:
+        while True:
+            lines = f.readlines(block_size)
+            if not lines:
+                break
+            try:
+                with warnings.catch_warnings():
+                    # Block of empty lines only warns.
+                    warnings.simplefilter("ignore", UserWarning)
+                    values = np.loadtxt(lines, delimiter=delimiter, ndmin=2, comments=None)
+                values = values.reshape(-1, n_columns)
+            except ValueError:
+                bad_line = bad_xyz_line(lines, delimiter, n_columns)
+                raise ValueError("line {}".format(first_line + (bad_line or 0)))
+            first_line += len(lines)
+            yield values[:, xcol], values[:, ycol], values[:, zcol]
+
+
+class CellStatistics(object):
+    """
+    Per cell accumulator of Z values sum, count, min and max (arrays indexed by cell fid).
+    """
+
+    def __init__(self, size):
+        self.sum = np.zeros(size, dtype=float)
+        self.count = np.zeros(size, dtype=np.int64)
+        self.min = np.full(size, np.inf)
+        self.max = np.full(size, -np.inf)
+        self.outside = 0
+
+    def add(self, fids, zs):
+        inside = fids > 0
+        self.outside += int(fids.shape[0] - np.count_nonzero(inside))
+        fids, zs = fids[inside], zs[inside]
+        size = self.sum.shape[0]
+        self.sum += np.bincount(fids, weights=zs, minlength=size)
+        self.count += np.bincount(fids, minlength=size)
+        np.minimum.at(self.min, fids, zs)
+        np.maximum.at(self.max, fids, zs)
+
+    def merge(self, other):
+        self.sum += other.sum
+        self.count += other.count
+        np.minimum(self.min, other.min, out=self.min)
+        np.maximum(self.max, other.max, out=self.max)
+        self.outside += other.outside
+
+    @property
+    def inside(self):
+        return int(self.count.sum())
+
+    def mean(self):
+        """
+        Mean Z of cells (NaN for cells without points).
+        """
+        mean = np.full(self.sum.shape, np.nan)
+        has_points = self.count > 0
+        mean[has_points] = self.sum[has_points] / self.count[has_points]
+        return mean
+
+
+class GridBinner(object):
+    """
+    Picklable locator of points on the grid, built from dense raster of the GridIndex.
+    """
+
+    def __init__(self, raster, x0, y0, cell_size, size):
+        self.raster = raster
+        self.x0 = x0
+        self.y0 = y0
+        self.cell_size = cell_size
+        self.size = size
+
+    @classmethod
+    def from_index(cls, index):
+        return cls(index.raster, index.x0, index.y0, index.cell_size, index.xs.shape[0])
+
+    def cells_on_points(self, xs, ys):
+        fids = np.zeros(xs.shape, dtype=int)
+        rows_count, cols_count = self.raster.shape
+        half_size = self.cell_size * 0.5
+        cols = np.floor((xs - (self.x0 - half_size)) / self.cell_size)
+        rows = np.floor(((self.y0 + half_size) - ys) / self.cell_size)
+        inside = (cols >= 0) & (cols < cols_count) & (rows >= 0) & (rows < rows_count)
+        fids[inside] = self.raster[rows[inside].astype(int), cols[inside].astype(int)]
+        return fids
+
+    def bin_file(self, path, block_size=BLOCK_SIZE):
+        """
+        Binning single LiDAR file. Returns (path, CellStatistics or None, error message or None).
+        """
+        stats = CellStatistics(self.size)
+        delimiter, n_columns = lidar_file_format(path)
+        if n_columns == 0:
+            return path, None, "unsupported format"
+        try:
+            for xs, ys, zs in read_xyz_blocks(path, delimiter, n_columns, block_size):
+                stats.add(self.cells_on_points(xs, ys), zs)
+        except ValueError as e:
+            return path, stats, str(e)
+        return path, stats, None
+
+
+# Binner of the worker process, set once by the pool initializer.
+worker_binner = None
+
+
+def init_worker(binner):
+    global worker_binner
+    worker_binner = binner
+
+
+def bin_file_in_worker(path):
+    return worker_binner.bin_file(path)
+
+
+def bin_lidar_files(binner, files, workers=None, callback=None):
+    """
+    Binning LiDAR files into grid cells, in parallel worker processes when there are more files.
+    'callback(path, error)' is called after each file. Returns merged CellStatistics and list of (path, error).
+    """
+    if workers is None:
+        workers = max(1, min(len(files), multiprocessing.cpu_count() - 1))
+    total = CellStatistics(binner.size)
+    errors = []
+
+    def collect(result):
+        path, stats, error = result
+        if stats is not None:
+            total.merge(stats)
+        if error is not None:
+            errors.append((path, error))
+        if callback is not None:
+            callback(path, error)
+
+    binned = set()
+    if workers > 1 and len(files) > 1:
+        try:
+            with process_pool(workers, init_worker, (binner,)) as pool:
+                # At most 2 * workers files are submitted at once, each result holds statistics of the whole grid.
+                queue = iter(enumerate(files))
+                running = {pool.submit(bin_file_in_worker, path): i for i, path in islice(queue, 2 * workers)}
+                while running:
+                    finished, __ = wait(running, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        i = running.pop(future)
+                        collect(future.result())
+                        binned.add(i)
+                        for j, path in islice(queue, 1):
+                            running[pool.submit(bin_file_in_worker, path)] = j
+        except (OSError, RuntimeError, EOFError):
+            # Worker processes are not available (e.g. embedded interpreter), bin remaining files here.
+            pass
+    for i, path in enumerate(files):
+        if i not in binned:
+            collect(binner.bin_file(path))
+    return total, errors
@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+
+# FLO-2D Preprocessor tools for QGIS
+# Copyright © 2021 Lutra Consulting for FLO-2D
+
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version
+"""
+Snapping of storm drain links endpoints (conduits, pumps, orifices and weirs) to the closest storm drain nodes.
+
+Nodes coordinates are hashed into square buckets of the tolerance size held in NumPy arrays,
+so all endpoints are matched at once by scanning the 3 x 3 buckets around them.
+Assignments are written back to the user layer with a single executemany.
+"""
+import numpy as np
+
+SNAP_TOLERANCE = 5.0
+NO_NODE = -1
+
+# User layer table, link name, inlet and outlet columns of storm drain links.
+LINK_TABLES = {
+    "Conduits": ("user_swmm_conduits", "conduit_name", "conduit_inlet", "conduit_outlet"),
+    "Pumps": ("user_swmm_pumps", "pump_name", "pump_inlet", "pump_outlet"),
+    "Orifices": ("user_swmm_orifices", "orifice_name", "orifice_inlet", "orifice_outlet"),
+    "Weirs": ("user_swmm_weirs", "weir_name", "weir_inlet", "weir_outlet"),
+}
+
+
+def snap_tolerance(value):
+    """
+    Converting snapping tolerance setting into float. Returns None for invalid or not positive values.
+    """
+    try:
+        tolerance = float(value)
+    except (TypeError, ValueError):
+        return None
+    return tolerance if np.isfinite(tolerance) and tolerance > 0 else None
+
+
+class NodeSnapper(object):
+    """
+    Spatial hash of nodes points for nearest node queries within tolerance.
+    """
+
+    def __init__(self, xs, ys, tolerance=SNAP_TOLERANCE):
+        if tolerance <= 0:
+            raise ValueError("Snapping tolerance must be greater than 0.")
+        self.xs = np.asarray(xs, dtype=float)
+        self.ys = np.asarray(ys, dtype=float)
+        self.tolerance = float(tolerance)
+        valid = np.nonzero(np.isfinite(self.xs) & np.isfinite(self.ys))[0]
+        if valid.size:
+            self.x0 = self.xs[valid].min()
+            self.y0 = self.ys[valid].min()
+            cols, rows = self.buckets(self.xs[valid], self.ys[valid])
+            self.hash_cols = int(cols.max()) + 1
+            self.hash_rows = int(rows.max()) + 1
+        else:
+            self.x0 = self.y0 = 0.0
+            cols = rows = np.zeros(0, dtype=np.int64)
+            self.hash_cols = self.hash_rows = 0
+        keys = rows * self.hash_cols + cols
+        order = np.argsort(keys, kind="stable")
+        self.keys = keys[order]
+        self.nodes = valid[order]
+
+    def buckets(self, xs, ys):
+        """
+        Getting hash columns and rows of buckets containing given points.
+        """
+        cols = np.floor((xs - self.x0) / self.tolerance).astype(np.int64)
+        rows = np.floor((ys - self.y0) / self.tolerance).astype(np.int64)
+        return cols, rows
+
+    def snap(self, xs, ys):
+        """
+        Finding the closest node for each point within tolerance.
+        Returns (nodes indexes array with NO_NODE for unmatched points, array of numbers of nodes within tolerance).
+        Points at equal distance from several nodes are snapped to the first node.
+        """
+        xs = np.asarray(xs, dtype=float)
+        ys = np.asarray(ys, dtype=float)
+        nearest = np.full(xs.shape, NO_NODE, dtype=np.int64)
+        distances = np.full(xs.shape, np.inf)
+        counts = np.zeros(xs.shape, dtype=np.int64)
+        finite = np.isfinite(xs) & np.isfinite(ys)
+        if self.nodes.size == 0 or not finite.any():
+            return nearest, counts
+        points = np.nonzero(finite)[0]
+        cols, rows = self.buckets(xs[points], ys[points])
+        # Points sorted by bucket make all bucket lookups sorted (much faster searchsorted).
+        order = np.argsort(rows * self.hash_cols + cols, kind="stable")
+        points, cols, rows = points[order], cols[order], rows[order]
+        px, py = xs[points], ys[points]
+        limit = self.tolerance * self.tolerance
+        for dr in (-1, 0, 1):
+            for dc in (-1, 0, 1):
+                c, r = cols + dc, rows + dr
+                inside = (c >= 0) & (c < self.hash_cols) & (r >= 0) & (r < self.hash_rows)
+                keys = r[inside] * self.hash_cols + c[inside]
+                first = np.searchsorted(self.keys, keys, side="left")
+                last = np.searchsorted(self.keys, keys, side="right")
+                queries = np.nonzero(inside)[0]
+                # Scanning k-th node of all buckets at once, buckets hold few nodes.
+                for k in range(int((last - first).max(initial=0))):
+                    filled = first + k < last
+                    query = queries[filled]
+                    node = self.nodes[first[filled] + k]
+                    d2 = (self.xs[node] - px[query]) ** 2 + (self.ys[node] - py[query]) ** 2
+                    near = d2 <= limit
+                    query, node, d2 = query[near], node[near], d2[near]
+                    target = points[query]
+                    counts[target] += 1
+                    closer = (d2 < distances[target]) | ((d2 == distances[target]) & (node < nearest[target]))
+                    nearest[target[closer]] = node[closer]
+                    distances[target[closer]] = d2[closer]
+        return nearest, counts
+
+
+def link_endpoints(gutils, table):
+    """
+    Reading fids and endpoints coordinates of links (NaN for missing geometries).
+    """
+    qry = """
+        SELECT fid,
+        ST_X(ST_StartPoint(GeomFromGPB(geom))), ST_Y(ST_StartPoint(GeomFromGPB(geom))),
+        ST_X(ST_EndPoint(GeomFromGPB(geom))), ST_Y(ST_EndPoint(GeomFromGPB(geom)))
+        FROM "{}" ORDER BY fid;"""
+    rows = gutils.execute(qry.format(table)).fetchall()
+    fids = [row[0] for row in rows]
+    coords = np.array([row[1:] for row in rows], dtype=float).reshape(-1, 4)
+    return fids, coords[:, 0], coords[:, 1], coords[:, 2], coords[:, 3]
+
+
+def snap_link_nodes(gutils, link_type, tolerance=SNAP_TOLERANCE):
+    """
+    Assigning names of the closest storm drain nodes within tolerance to links inlets and outlets (NULL if none).
+    Returns (number of links, names of links with unmatched endpoints, names of links with ambiguous endpoints),
+    an endpoint is ambiguous if more than one node lies within tolerance.
+    """
+    table, name_column, inlet_column, outlet_column = LINK_TABLES[link_type]
+    nodes = gutils.execute(
+        """SELECT ST_X(GeomFromGPB(geom)), ST_Y(GeomFromGPB(geom)), name FROM user_swmm_nodes ORDER BY fid;"""
+    ).fetchall()
+    node_names = [node[2] for node in nodes] + [None]
+    coords = np.array([node[:2] for node in nodes], dtype=float).reshape(-1, 2)
+    snapper = NodeSnapper(coords[:, 0], coords[:, 1], tolerance)
+
+    fids, start_xs, start_ys, end_xs, end_ys = link_endpoints(gutils, table)
+    inlets, inlet_counts = snapper.snap(start_xs, start_ys)
+    outlets, outlet_counts = snapper.snap(end_xs, end_ys)
+
+    # NO_NODE indexes the trailing None of node names.
+    assignments = zip([node_names[i] for i in inlets.tolist()], [node_names[i] for i in outlets.tolist()], fids)
+    qry = """UPDATE "{0}" SET "{1}" = ?, "{2}" = ? WHERE fid = ?;"""
+    with gutils.unit_of_work():
+        gutils.execute_many(qry.format(table, inlet_column, outlet_column), assignments)
+
+    unmatched = np.nonzero((inlets == NO_NODE) | (outlets == NO_NODE))[0]
+    ambiguous = np.nonzero((inlet_counts > 1) | (outlet_counts > 1))[0]
+    if unmatched.size or ambiguous.size:
+        names = dict(gutils.execute("""SELECT fid, "{0}" FROM "{1}";""".format(name_column, table)).fetchall())
+        unmatched = [names[fids[i]] for i in unmatched.tolist()]
+        ambiguous = [names[fids[i]] for i in ambiguous.tolist()]
+    else:
+        unmatched, ambiguous = [], []
+    return len(fids), unmatched, ambiguous
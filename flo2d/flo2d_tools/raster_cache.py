@@ -0,0 +1,247 @@
+# -*- coding: utf-8 -*-
+
+# FLO-2D Preprocessor tools for QGIS
+# Copyright © 2021 Lutra Consulting for FLO-2D
+
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version
+"""
+Project level cache of grid aligned rasters.
+
+Source rasters warped at the grid cell size are kept as tiled GeoTIFFs next to the GeoPackage, so sampling the
+same raster again (another tool, next session, or after editing a few cells) only reads cells values.
+Entries are keyed by the source file (path, modification time and size), the warp settings and the lattice of
+the grid. Cached rasters cover the grid extent with a margin, so they are reused while edited cells stay within it.
+Least recently used entries are removed when the cache exceeds its size limit.
+"""
+import os
+import json
+import time
+import hashlib
+import numpy as np
+from osgeo import osr
+
+from .grid_index import project_grid_index
+from .raster_sampling import gdal, lattice_tiles, tile_bounds, warp_tiles, raster2grid_np, TILE_SIZE
+
+# Maximum size of the cache directory in bytes.
+MAX_CACHE_SIZE = 2 * 1024 ** 3
+
+# Cells added around the grid extent to the cached raster.
+CACHE_MARGIN = 64
+
+MANIFEST = "cache.json"
+
+
+class RasterCache(object):
+    """
+    Directory of grid aligned rasters described by a JSON manifest.
+    """
+
+    def __init__(self, cache_dir, max_size=MAX_CACHE_SIZE, margin=CACHE_MARGIN):
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self.margin = margin
+        self.entries = []
+        self.load()
+
+    @classmethod
+    def for_project(cls, gutils, **kwargs):
+        gpkg_path = gutils.get_gpkg_path()
+        return cls(os.path.splitext(gpkg_path)[0] + "_raster_cache", **kwargs)
+
+    @property
+    def manifest_path(self):
+        return os.path.join(self.cache_dir, MANIFEST)
+
+    def load(self):
+        self.entries = []
+        try:
+            with open(self.manifest_path, "r") as f:
+                entries = json.load(f)["entries"]
+        except (OSError, ValueError, KeyError, TypeError):
+            return
+        # Entries with removed rasters are forgotten.
+        self.entries = [e for e in entries if os.path.isfile(os.path.join(self.cache_dir, e["file"]))]
+
+    def save(self):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp_path = self.manifest_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"entries": self.entries}, f, indent=1)
+        os.replace(tmp_path, self.manifest_path)
+
+    @staticmethod
+    def source_key(settings):
+        """
+        Hash of the source raster state and warp settings.
+        """
+        src = os.path.abspath(settings.src_raster)
+        try:
+            stat = os.stat(src)
+            state = [stat.st_mtime, stat.st_size]
+        except OSError:
+            # Not a file (e.g. GDAL virtual path), only the path is used.
+            state = [None, None]
+        key = [
+            src,
+            state,
+            float(settings.cell_size),
+            settings.src_srs,
+            settings.dst_srs,
+            settings.resample_alg,
+            float(settings.nodata),
+            settings.output_type,
+            settings.overview,
+            settings.fill_distance,
+        ]
+        return hashlib.sha1(json.dumps(key).encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def grid_extent(index):
+        """
+        Upper left corner, rows and columns of the grid index raster.
+        """
+        half_size = index.cell_size * 0.5
+        return index.x0 - half_size, index.y0 + half_size, index.raster_rows, index.raster_cols
+
+    @staticmethod
+    def lattice(xmin, ymax, cell_size):
+        return [round(xmin % cell_size, 6) % cell_size, round(ymax % cell_size, 6) % cell_size]
+
+    def lookup(self, settings, index):
+        """
+        Path of cached raster of 'settings' source covering the grid, or None.
+        """
+        key = self.source_key(settings)
+        xmin, ymax, rows, cols = self.grid_extent(index)
+        cs = float(settings.cell_size)
+        lattice = self.lattice(xmin, ymax, cs)
+        eps = cs * 0.001
+        for entry in self.entries:
+            if entry["key"] != key or entry["lattice"] != lattice:
+                continue
+            if entry["xmin"] - eps > xmin or entry["ymax"] + eps < ymax:
+                continue
+            if entry["xmin"] + entry["cols"] * cs + eps < xmin + cols * cs:
+                continue
+            if entry["ymax"] - entry["rows"] * cs - eps > ymax - rows * cs:
+                continue
+            entry["last_used"] = time.time()
+            self.save()
+            return os.path.join(self.cache_dir, entry["file"])
+        return None
+
+    def build(self, settings, index, workers=None, callback=None):
+        """
+        Warping source raster tile by tile into new cached raster covering the grid with margin.
+        """
+        cs = float(settings.cell_size)
+        gxmin, gymax, grows, gcols = self.grid_extent(index)
+        xmin, ymax = gxmin - self.margin * cs, gymax + self.margin * cs
+        rows, cols = grows + 2 * self.margin, gcols + 2 * self.margin
+        key = self.source_key(settings)
+        os.makedirs(self.cache_dir, exist_ok=True)
+        name = "{}_{}.tif".format(key[:16], int(time.time() * 1000))
+        path = os.path.join(self.cache_dir, name)
+
+        driver = gdal.GetDriverByName("GTiff")
+        creation_options = ["TILED=YES", "COMPRESS=LZW", "BIGTIFF=IF_SAFER"]
+        data_type = gdal.GetDataTypeByName(settings.output_type)
+        ds = driver.Create(path, cols, rows, 1, data_type, options=creation_options)
+        ds.SetGeoTransform((xmin, cs, 0.0, ymax, 0.0, -cs))
+        if settings.dst_srs:
+            srs = osr.SpatialReference()
+            srs.SetFromUserInput(settings.dst_srs)
+            ds.SetProjection(srs.ExportToWkt())
+        band = ds.GetRasterBand(1)
+        band.SetNoDataValue(float(settings.nodata))
+        band.Fill(float(settings.nodata))
+
+        tasks = []
+        for r0, c0, trows, tcols in lattice_tiles(rows, cols, TILE_SIZE):
+            bounds = tile_bounds(xmin, ymax, cs, r0, c0, trows, tcols, settings.halo)
+            tasks.append(((r0, c0), bounds, (trows, tcols)))
+        try:
+            for (r0, c0), values in warp_tiles(settings, tasks, workers=workers, callback=callback):
+                values[np.isnan(values)] = settings.nodata
+                band.WriteArray(values, c0, r0)
+            band.FlushCache()
+        except Exception:
+            band = ds = None
+            os.remove(path)
+            raise
+        band = ds = None
+
+        entry = {
+            "file": name,
+            "key": key,
+            "src_raster": os.path.abspath(settings.src_raster),
+            "lattice": self.lattice(gxmin, gymax, cs),
+            "xmin": xmin,
+            "ymax": ymax,
+            "rows": rows,
+            "cols": cols,
+            "size": os.path.getsize(path),
+            "last_used": time.time(),
+        }
+        # Older raster of the same source with the same lattice is superseded.
+        self.entries = [e for e in self.entries if not self.supersedes(entry, e)]
+        self.entries.append(entry)
+        self.evict(keep=entry)
+        self.save()
+        return path
+
+    def supersedes(self, entry, other):
+        if other["key"] != entry["key"] or other["lattice"] != entry["lattice"]:
+            return False
+        self.remove_file(other)
+        return True
+
+    def remove_file(self, entry):
+        try:
+            os.remove(os.path.join(self.cache_dir, entry["file"]))
+        except OSError:
+            pass
+
+    def evict(self, keep=None):
+        """
+        Removing least recently used rasters until the cache fits its size limit.
+        """
+        total = sum(e["size"] for e in self.entries)
+        for entry in sorted(self.entries, key=lambda e: e["last_used"]):
+            if total <= self.max_size:
+                break
+            if entry is keep:
+                continue
+            self.remove_file(entry)
+            self.entries.remove(entry)
+            total -= entry["size"]
+
+    def aligned_raster(self, settings, index, workers=None, callback=None):
+        """
+        Path of grid aligned raster of 'settings' source, built when it isn't cached yet.
+        """
+        path = self.lookup(settings, index)
+        if path is None:
+            path = self.build(settings, index, workers=workers, callback=callback)
+        return path
+
+    def clear(self):
+        for entry in self.entries:
+            self.remove_file(entry)
+        self.entries = []
+        self.save()
+
+
+def cached_raster2grid(gutils, settings, workers=None, cache=None):
+    """
+    Generator of (value, fid) pairs of 'settings' source raster at cells centers.
+    Grid aligned raster is taken from the project raster cache and warped only if it isn't cached yet.
+    """
+    if cache is None:
+        cache = RasterCache.for_project(gutils)
+    raster = cache.aligned_raster(settings, project_grid_index(gutils), workers=workers)
+    return raster2grid_np(gutils, raster)
@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+
+# FLO-2D Preprocessor tools for QGIS
+# Copyright © 2021 Lutra Consulting for FLO-2D
+
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version
+"""
+Tiled sampling of rasters into grid cells.
+
+Instead of warping the whole source raster in one go, the grid aligned lattice is split into tiles of cells.
+Every tile is warped in memory at the cell size (GDAL resampling gives the per cell mean, min, max...) and optionally
+NODATA filled with a halo around the tile. Tiles are processed independently in worker processes and streamed back
+to the caller (see raster_cache.py). Cells values are then read at the grid index centers strip by strip.
+"""
+import math
+import warnings
+import multiprocessing
+from concurrent.futures import as_completed
+import numpy as np
+
+with warnings.catch_warnings():
+    warnings.filterwarnings("ignore", category=DeprecationWarning)
+    from osgeo import gdal
+
+    gdal.UseExceptions()
+
+from .grid_index import project_grid_index
+from .workers import process_pool
+
+# Grid cells per side of a tile.
+TILE_SIZE = 512
+
+# Rows of raster read at once by raster_values_on_points.
+STRIP_ROWS = 1024
+
+
+class WarpSettings(object):
+    """
+    Picklable GDAL Warp settings shared by all tiles.
+    """
+
+    def __init__(
+        self,
+        src_raster,
+        cell_size,
+        src_srs=None,
+        dst_srs=None,
+        resample_alg="near",
+        nodata=-9999,
+        output_type="Float32",
+        overview=None,
+        fill_distance=None,
+    ):
+        self.src_raster = src_raster
+        self.cell_size = cell_size
+        self.src_srs = src_srs
+        self.dst_srs = dst_srs
+        self.resample_alg = resample_alg
+        self.nodata = nodata
+        self.output_type = output_type
+        self.overview = overview
+        # Maximum NODATA fill search distance in cells (None for no filling).
+        self.fill_distance = fill_distance
+
+    @property
+    def halo(self):
+        """
+        Number of cells warped around the tile, so the NODATA filling doesn't depend on the tiling.
+        """
+        if self.fill_distance is None:
+            return 0
+        return int(math.ceil(self.fill_distance if self.fill_distance > 0 else 100))
+
+    def warp_options(self, bounds):
+        opts = ["-of", "MEM", "-ot", self.output_type, "-tr", self.cell_size, self.cell_size, "-te"]
+        opts += list(bounds)
+        opts += ["-r", self.resample_alg, "-dstnodata", self.nodata]
+        if self.src_srs:
+            opts += ["-s_srs", self.src_srs]
+        if self.dst_srs:
+            opts += ["-t_srs", self.dst_srs]
+        if self.overview:
+            opts += ["-ovr", self.overview]
+        return gdal.WarpOptions(options=[str(o) for o in opts])
+
+
+def lattice_tiles(rows, cols, tile_size=TILE_SIZE):
+    """
+    Generator of (row, col, rows, cols) tiles covering lattice of given number of rows and columns.
+    """
+    for r0 in range(0, rows, tile_size):
+        for c0 in range(0, cols, tile_size):
+            yield r0, c0, min(tile_size, rows - r0), min(tile_size, cols - c0)
+
+
+def tile_bounds(xmin, ymax, cell_size, r0, c0, rows, cols, halo=0):
+    """
+    Extent (xmin, ymin, xmax, ymax) of the tile of lattice with upper left corner (xmin, ymax), extended by 'halo' cells.
+    """
+    txmin = xmin + (c0 - halo) * cell_size
+    tymax = ymax - (r0 - halo) * cell_size
+    return txmin, tymax - (rows + 2 * halo) * cell_size, txmin + (cols + 2 * halo) * cell_size, tymax
+
+
+def warp_tile(settings, bounds, shape):
+    """
+    Warping single tile of (rows, cols) cells within 'bounds' extended by the halo. Returns values (NaN for NODATA).
+    """
+    ds = gdal.Warp("", settings.src_raster, options=settings.warp_options(bounds))
+    band = ds.GetRasterBand(1)
+    if settings.fill_distance is not None:
+        gdal.FillNodata(band, None, settings.halo, 0)
+    values = band.ReadAsArray().astype(float)
+    ds = None
+    values[values == float(settings.nodata)] = np.nan
+    halo = settings.halo
+    rows, cols = shape
+    return values[halo : halo + rows, halo : halo + cols]
+
+
+def warp_tiles(settings, tasks, workers=None, callback=None):
+    """
+    Generator of (key, values) for tasks given as (key, bounds, shape), warped in worker processes when
+    there are more tasks. 'callback(done, total)' reports progress.
+    """
+    if workers is None:
+        workers = max(1, min(len(tasks), multiprocessing.cpu_count() - 1))
+    done = 0
+    pending = list(range(len(tasks)))
+    if workers > 1 and len(tasks) > 1:
+        try:
+            with process_pool(workers) as pool:
+                futures = {pool.submit(warp_tile, settings, *tasks[i][1:]): i for i in pending}
+                for future in as_completed(futures):
+                    values = future.result()
+                    i = futures[future]
+                    pending.remove(i)
+                    done += 1
+                    if callback is not None:
+                        callback(done, len(tasks))
+                    yield tasks[i][0], values
+        except (OSError, RuntimeError, EOFError):
+            # Worker processes are not available (e.g. embedded interpreter), warp remaining tiles here.
+            pass
+    for i in pending:
+        values = warp_tile(settings, *tasks[i][1:])
+        done += 1
+        if callback is not None:
+            callback(done, len(tasks))
+        yield tasks[i][0], values
+
+
+def value_fid_pairs(fids, values):
+    return [(None if math.isnan(v) else v, f) for v, f in zip(values.tolist(), fids.tolist())]
+
+
+def raster_values_on_points(raster_path, xs, ys, strip_rows=STRIP_ROWS):
+    """
+    Reading values of the first raster band at points, strip by strip of raster rows.
+    Returns values (NaN for NODATA) and mask of points inside the raster.
+    """
+    xs = np.asarray(xs, dtype=float)
+    ys = np.asarray(ys, dtype=float)
+    ds = gdal.Open(raster_path)
+    gt = ds.GetGeoTransform()
+    band = ds.GetRasterBand(1)
+    nodata = band.GetNoDataValue()
+    cols = np.floor((xs - gt[0]) / gt[1])
+    rows = np.floor((ys - gt[3]) / gt[5])
+    inside = (cols >= 0) & (cols < ds.RasterXSize) & (rows >= 0) & (rows < ds.RasterYSize)
+    values = np.full(xs.shape, np.nan)
+    positions = np.nonzero(inside)[0]
+    positions = positions[np.argsort(rows[positions], kind="stable")]
+    prows = rows[positions].astype(int)
+    pcols = cols[positions].astype(int)
+    if positions.shape[0] > 0:
+        for r0 in range(prows[0], prows[-1] + 1, strip_rows):
+            start, end = np.searchsorted(prows, [r0, r0 + strip_rows])
+            if start == end:
+                continue
+            c0 = int(pcols[start:end].min())
+            width = int(pcols[start:end].max()) - c0 + 1
+            height = int(prows[end - 1]) - r0 + 1
+            strip = band.ReadAsArray(c0, r0, width, height).astype(float)
+            values[positions[start:end]] = strip[prows[start:end] - r0, pcols[start:end] - c0]
+    ds = None
+    if nodata is not None:
+        values[values == nodata] = np.nan
+    return values, inside
+
+
+def raster2grid_np(gutils, raster_path, fids=None):
+    """
+    Generator of (value, fid) pairs of raster values at cells centers (value None for NODATA).
+    Cells outside the raster are skipped, like in 'raster2grid'.
+    """
+    index = project_grid_index(gutils)
+    fids = index.fids() if fids is None else np.asarray(fids, dtype=int)
+    values, inside = raster_values_on_points(raster_path, index.xs[fids], index.ys[fids])
+    return iter(value_fid_pairs(fids[inside], np.round(values[inside], 4)))
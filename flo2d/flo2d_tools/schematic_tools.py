@@ -32,9 +32,13 @@ from .grid_tools import (
     adjacent_grid_elevations,
     three_adjacent_grid_elevations,
     get_adjacent_cell_elevation,
+    adjacent_cells_elevations_np,
     buildCellIDNPArray)
+from .grid_index import project_grid_index, NO_NEIGHBOUR
 from ..geopackage_utils import GeoPackageUtils
+from ..gpb_utils import linestring_gpb, multilinestring_gpb, points_gpb
 from ..user_communication import UserCommunication
+from ..utils import is_true
 from qgis.PyQt.QtWidgets import QApplication
 
 # Levees tools
@@ -158,8 +162,12 @@ def polys2levees(line_feature, poly_lyr, levees_lyr, value_col, correct_val, id_
 def levee_grid_isect_pts(levee_fid, grid_fid, levee_lyr, grid_lyr, with_centroid=True):
     lfeat = next(levee_lyr.getFeatures(QgsFeatureRequest(levee_fid)))
     gfeat = next(grid_lyr.getFeatures(QgsFeatureRequest(grid_fid)))
-    grid_centroid = gfeat.geometry().centroid().asPoint()
-    lg_isect = gfeat.geometry().intersection(lfeat.geometry())
+    return levee_grid_geoms_isect_pts(lfeat.geometry(), gfeat.geometry(), with_centroid)
+
+
+def levee_grid_geoms_isect_pts(levee_geom, grid_geom, with_centroid=True):
+    grid_centroid = grid_geom.centroid().asPoint()
+    lg_isect = grid_geom.intersection(levee_geom)
     pts = []
 
     if lg_isect is None:
@@ -182,6 +190,29 @@ def levee_grid_isect_pts(levee_fid, grid_fid, levee_lyr, grid_lyr, with_centroid
     else:
         return pts, None
 
+
+def user_levees_attributes(gutils):
+    """
+    Getting failure and crest attributes of all user levee lines as {fid: (failElev, ..., elev, correction)}.
+    """
+    qry = """SELECT fid, failElev, failDepth, failDuration, failBaseElev, failMaxWidth,
+                    failVRate, failHRate, elev, correction
+             FROM user_levee_lines;"""
+    return {row[0]: row[1:] for row in gutils.execute(qry)}
+
+
+def levee_sides_elevations(gutils, gids, ldirs, elevs):
+    """
+    Vectorized crest and failure elevations candidates of levee sides (cells and FLO-2D directions).
+    Returns arrays of max(adjacent, levee cell) elevations and max(adjacent, grid cell) elevations.
+    Adjacent elevation of missing neighbour is -999, like in 'get_adjacent_cell_elevation'.
+    """
+    adj_cells, adj_elevs = adjacent_cells_elevations_np(gutils, gids, ldirs)
+    adj_elevs[adj_cells == NO_NEIGHBOUR] = -999
+    grid_elevs = project_grid_index(gutils).elevations_np(gids)
+    return np.maximum(adj_elevs, np.asarray(elevs, dtype=float)), np.maximum(adj_elevs, grid_elevs)
+
+
 def generate_schematic_levees(gutils, levee_lyr, grid_lyr):
     try:
 
@@ -197,9 +228,7 @@ def generate_schematic_levees(gutils, levee_lyr, grid_lyr):
             7: (lambda x, y, square_half, octa_half: (x - octa_half, y - square_half, x - square_half, y - octa_half)),
             8: (lambda x, y, square_half, octa_half: (x - square_half, y + octa_half, x - octa_half, y + square_half)),
         }
-        
-        #lid_gid_elev = fid_from_grid(gutils, "user_levee_lines", None, False, False, "elevation")
-        #print (lid_gid_elev[0])
+
         # get user levee lines features
         print ("Deleting existing schematized levee and levee failure elements")
         del_levees_sql = """DELETE FROM levee_data  WHERE user_line_fid IS NOT NULL;"""
@@ -207,120 +236,77 @@ def generate_schematic_levees(gutils, levee_lyr, grid_lyr):
         gutils.con.execute(del_levees_sql)
         gutils.con.execute(del_levee_failures_sql)
         gutils.con.commit()
+
+        ins_levees_sql = """INSERT INTO levee_data (grid_fid, ldir, levcrest, user_line_fid, geom)
+                     VALUES (?,?,?,?,?);"""
+
+        ins_levees_failure_sql = """INSERT INTO levee_failure (grid_fid, lfaildir, failevel, failtime,
+                                                          levbase, failwidthmax, failrate, failwidrate)
+                                     VALUES (?,?,?,?,?,?,?,?);"""
+
+        cell_size = float(gutils.get_cont_par("CELLSIZE"))
+        scale = 0.9
+        # square half
+        sh = cell_size * 0.5 * scale
+        # octagon half
+        oh = sh / 2.414
+        # Attributes of all user levees are read once, instead of one query per levee side.
+        user_levees = user_levees_attributes(gutils)
         print ("Intersecting levee elements with grid")
-        
-        for lid_gid_elev, regionReq in fid_from_grid_features(gutils, grid_lyr, levee_lyr):#"user_levee_lines", None, False, False, "elevation")
-        #print (lid_gid_elev[0])
-            cell_size = float(gutils.get_cont_par("CELLSIZE"))
-            scale = 0.9
-            # square half
-            sh = cell_size * 0.5 * scale
-            # octagon half
-            oh = sh / 2.414
+
+        for lid_gid_elev, regionReq in fid_from_grid_features(gutils, grid_lyr, levee_lyr):
             schem_lines = levee_schematic(lid_gid_elev, levee_lyr, grid_lyr)
-    
-            
-            ins_levees_sql = """INSERT INTO levee_data (grid_fid, ldir, levcrest, user_line_fid, geom)
-                         VALUES (?,?,?,?, AsGPB(ST_GeomFromText(?)));"""
-            
-    
-            levee_failure_qry = """SELECT failevel, failtime, levbase, failwidthmax, failrate, failwidrate
-                                    FROM levee_failure 
-                                    WHERE grid_fid = ?"""
-    
-            ins_levees_failure_sql = """INSERT INTO levee_failure (grid_fid, lfaildir, failevel, failtime,
-                                                              levbase, failwidthmax, failrate, failwidrate)
-                                         VALUES (?,?,?,?,?,?,?,?);"""
-    
-            select_user_levees_qry = """SELECT failElev, failDepth, failDuration, failBaseElev, failMaxWidth, 
-                                                            failVRate, failHRate, elev, correction
-                                FROM user_levee_lines 
-                                WHERE fid = ?"""
-    
-            # Create levee segments for distinct levee directions in each grid element
-            grid_levee_seg = {}
-            data = []
-            fail_data = []
+
+            # Distinct levee directions in each grid element: (gid, ldir, elev, lid, centroid)
+            sides_data = []
             for gid, gdata in schem_lines.items():
-    
-                elev = gdata["elev"]
-                grid_levee_seg[gid] = {}
-                grid_levee_seg[gid]["sides"] = {}
-                grid_levee_seg[gid]["centroid"] = gdata["centroid"]
+                grid_sides = set()
                 for lid, sides in gdata["lines"].items():
-                    if sides:
-                        for side in sides:
-                            if side not in list(grid_levee_seg[gid]["sides"].keys()):
-
-                                side_elev=elev
-                                grid_levee_seg[gid]["sides"][side] = lid
-                                ldir = octagon_levee_dirs[side]
-                                c = gdata["centroid"]
-
-                                user_levees_data = gutils.con.execute(select_user_levees_qry, (lid,)).fetchone()
-                                if user_levees_data:
-                                    if not all(v == 0 for v in user_levees_data):
-                                        if not user_levees_data[0] == 0.0:
-                                            # failElev selected, use it.
-                                            fail_data.append(
-                                                (gid, ldir,
-                                                 user_levees_data[0],
-                                                 user_levees_data[2],
-                                                 user_levees_data[3],
-                                                 user_levees_data[4],
-                                                 user_levees_data[5],
-                                                 user_levees_data[6])
-                                            )
-                                        elif not user_levees_data[1] == 0.0:
-                                            # failDepth selected, use adjacent cell elevations to calculate fail elevation.
-    
-                                            adj_cell, adj_elev = get_adjacent_cell_elevation(
-                                                gutils, grid_lyr, gid, ldir, cell_size
-                                            )
-                                            grid_elev = gutils.grid_value(gid, "elevation")
-                                            max_elev = max(adj_elev, grid_elev)
-    
-                                            fail_data.append(
-                                                (gid, ldir, max_elev +
-                                                 user_levees_data[1],
-                                                 user_levees_data[2],
-                                                 user_levees_data[3],
-                                                 user_levees_data[4],
-                                                 user_levees_data[5],
-                                                 user_levees_data[6])
-                                            )
-                                        else:  # do not set failure data for this direction.
-                                            pass
-
-                                        if user_levees_data[7] is None: # crest elevation in user levees not defined
-                                            adj_cell, adj_elev = get_adjacent_cell_elevation(
-                                                gutils, grid_lyr, gid, ldir, cell_size
-                                            )
-                                            side_elev = max(adj_elev, elev)
-
-                                data.append(
-                                    (
-                                        gid,
-                                        ldir,
-                                        side_elev,
-                                        lid,
-                                        "LINESTRING({0} {1}, {2} {3})".format(
-                                            *levee_dir_pts[ldir](c.x(), c.y(), sh, oh)),
-                                    )
-                                )
+                    for side in sides:
+                        if side not in grid_sides:
+                            grid_sides.add(side)
+                            sides_data.append((gid, octagon_levee_dirs[side], gdata["elev"], lid, gdata["centroid"]))
+
+            gids = [row[0] for row in sides_data]
+            ldirs = [row[1] for row in sides_data]
+            side_elevs, fail_elevs = levee_sides_elevations(gutils, gids, ldirs, [row[2] for row in sides_data])
+            data = []
+            fail_data = []
+            for (gid, ldir, elev, lid, c), adj_elev, adj_grid_elev in zip(
+                sides_data, side_elevs.tolist(), fail_elevs.tolist()
+            ):
+                side_elev = elev
+                user_levees_data = user_levees.get(lid)
+                if user_levees_data:
+                    if not all(v == 0 for v in user_levees_data):
+                        if not user_levees_data[0] == 0.0:
+                            # failElev selected, use it.
+                            fail_data.append((gid, ldir, user_levees_data[0]) + tuple(user_levees_data[2:7]))
+                        elif not user_levees_data[1] == 0.0:
+                            # failDepth selected, use adjacent cell elevations to calculate fail elevation.
+                            fail_data.append(
+                                (gid, ldir, adj_grid_elev + user_levees_data[1]) + tuple(user_levees_data[2:7])
+                            )
+                        else:  # do not set failure data for this direction.
+                            pass
+
+                        if user_levees_data[7] is None:  # crest elevation in user levees not defined
+                            side_elev = adj_elev
+
+                x1, y1, x2, y2 = levee_dir_pts[ldir](c.x(), c.y(), sh, oh)
+                data.append((gid, ldir, side_elev, lid, linestring_gpb(((x1, y1), (x2, y2)))))
 
             gutils.con.executemany(ins_levees_sql, data)
-    
+
             gutils.con.executemany(ins_levees_failure_sql, fail_data)
-    
+
             gutils.con.commit()
             yield (len(schem_lines), len(data), len(fail_data), regionReq)
 
-        #return len(schem_lines), len(data), len(fail_data)
     except Exception as e:
         raise e
         # self.uc.show_error("ERROR 291219.0428: Error while creating schematic levees octagons!.\n", e)
-        
+
 def delete_redundant_levee_directions_np(gutils, cellIDNumpyArray = None):
     # create a numpy array of the levee segments with a float in each
     # to limit memory, do 2 (opposing directions) at a time
@@ -606,14 +592,22 @@ def delete_levee_directions_duplicates(gutils, levees, grid_lyr):
 
 # ....................................
 
+def features_geometries(layer, fids):
+    request = QgsFeatureRequest().setFilterFids(list(fids)).setNoAttributes()
+    return {feat.id(): feat.geometry() for feat in layer.getFeatures(request)}
+
+
 def levee_schematic(lid_gid_elev, levee_lyr, grid_lyr):
     try:
         schem_lines = {}
         gids = []
         nv = QgsVector(0, 1)
+        # Geometries of region levees and cells are fetched at once.
+        levee_geoms = features_geometries(levee_lyr, {lid for lid, gid, elev in lid_gid_elev})
+        grid_geoms = features_geometries(grid_lyr, {gid for lid, gid, elev in lid_gid_elev})
         # for each line crossing a grid element
         for lid, gid, elev in lid_gid_elev:
-            pts, c = levee_grid_isect_pts(lid, gid, levee_lyr, grid_lyr)
+            pts, c = levee_grid_geoms_isect_pts(levee_geoms[lid], grid_geoms[gid])
             if pts is None:
                 pass
             if gid not in gids:
@@ -734,6 +728,57 @@ def bresenham_line(x1, y1, x2, y2):
     return points
 
 
+def bresenham_lines_np(x1, y1, x2, y2):
+    """
+    Vectorized Bresenham's Line Algorithm giving the same points as 'bresenham_line' for arrays of integer segments.
+    Returns arrays of (segment index, x, y) of all segments points, ordered from start to end of each segment.
+    """
+    x1, y1, x2, y2 = (np.asarray(a, dtype=np.int64) for a in (x1, y1, x2, y2))
+    # Rotated (steep) and swapped coordinates like in 'bresenham_line'
+    is_steep = np.abs(y2 - y1) > np.abs(x2 - x1)
+    u1, v1 = np.where(is_steep, y1, x1), np.where(is_steep, x1, y1)
+    u2, v2 = np.where(is_steep, y2, x2), np.where(is_steep, x2, y2)
+    swapped = u1 > u2
+    su1 = np.where(swapped, u2, u1)
+    sv1, sv2 = np.where(swapped, v2, v1), np.where(swapped, v1, v2)
+    du = np.abs(u2 - u1)
+    dv = np.abs(v2 - v1)
+    vstep = np.where(sv1 < sv2, 1, -1)
+
+    counts = du + 1
+    segments = np.repeat(np.arange(counts.shape[0]), counts)
+    steps = np.arange(segments.shape[0]) - np.repeat(np.cumsum(counts) - counts, counts)
+    steps = np.where(swapped[segments], du[segments] - steps, steps)
+    # The error term stays within [0, du), so number of 'v' increments after k steps has a closed form.
+    increments = -((du[segments] // 2 - steps * dv[segments]) // np.maximum(du[segments], 1))
+    u = su1[segments] + steps
+    v = sv1[segments] + vstep[segments] * increments
+    steep = is_steep[segments]
+    return segments, np.where(steep, v, u), np.where(steep, u, v)
+
+
+def schematize_lines_np(vertex_lines, xs, ys, cell_size, offset_x, offset_y):
+    """
+    Vectorized 'schematize_lines' for vertices of all lines given as arrays (line index of vertex, x, y).
+    Vertices of each line have to be consecutive. Returns arrays of (line index, xt, yt) of snapped cells,
+    where integer lattice coordinates xt, yt give cells centers xt * cell_size - offset_x, yt * cell_size - offset_y.
+    """
+    vertex_lines = np.asarray(vertex_lines, dtype=np.int64)
+    cs = float(cell_size)
+    xt = np.round((np.asarray(xs, dtype=float) + offset_x) / cs).astype(np.int64)
+    yt = np.round((np.asarray(ys, dtype=float) + offset_y) / cs).astype(np.int64)
+    starts = np.nonzero(vertex_lines[1:] == vertex_lines[:-1])[0]
+    seg_lines = vertex_lines[starts]
+    segments, pxt, pyt = bresenham_lines_np(xt[starts], yt[starts], xt[starts + 1], yt[starts + 1])
+    # First point of a segment repeats the last point of the previous segment of the same line.
+    first_point = np.ones(segments.shape, dtype=bool)
+    first_point[1:] = segments[1:] != segments[:-1]
+    first_segment = np.ones(seg_lines.shape, dtype=bool)
+    first_segment[1:] = seg_lines[1:] != seg_lines[:-1]
+    keep = ~first_point | first_segment[segments]
+    return seg_lines[segments[keep]], pxt[keep], pyt[keep]
+
+
 def schematize_lines(lines, cell_size, offset_x, offset_y, feats_only=False, get_id=False):
     """
     Generator for finding grid centroids coordinates for each schematized line segment.
@@ -843,77 +888,97 @@ def populate_directions(coords, grids):
         return
 
 
+# Street directions of a move between cells, indexed by (sign(dx) + 1) * 3 + sign(dy) + 1.
+STREET_DIRECTIONS = np.array([7, 4, 8, 3, 0, 1, 6, 2, 5])
+
+
+def street_cells_np(point_lines, xt, yt):
+    """
+    Vectorized 'populate_directions' for cells of all schematized lines (see 'schematize_lines_np').
+    Returns arrays of (xt, yt, line index, directions bitmask) of cells with directions,
+    in order of their first appearance. Bit 'd' of the mask is set for street direction 'd'.
+    """
+    point_lines = np.asarray(point_lines, dtype=np.int64)
+    pairs = np.nonzero((point_lines[1:] == point_lines[:-1]) & ((xt[1:] != xt[:-1]) | (yt[1:] != yt[:-1])))[0]
+    idx = (np.sign(xt[pairs + 1] - xt[pairs]) + 1) * 3 + np.sign(yt[pairs + 1] - yt[pairs]) + 1
+    used = np.zeros(xt.shape, dtype=bool)
+    used[pairs] = True
+    used[pairs + 1] = True
+    positions = np.nonzero(used)[0]
+    if positions.shape[0] == 0:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty, empty, empty
+    xmin, ymin = xt[positions].min(), yt[positions].min()
+    height = yt[positions].max() - ymin + 1
+    keys = (xt - xmin) * height + (yt - ymin)
+    unique_keys, first, inverse = np.unique(keys[positions], return_index=True, return_inverse=True)
+    # Renumbering cells in order of first appearance
+    order = np.argsort(first)
+    ranks = np.empty(order.shape, dtype=np.int64)
+    ranks[order] = np.arange(order.shape[0])
+    cell_of_point = np.full(xt.shape, -1, dtype=np.int64)
+    cell_of_point[positions] = ranks[inverse.ravel()]
+    masks = np.zeros(order.shape[0], dtype=np.int64)
+    np.bitwise_or.at(masks, cell_of_point[pairs], 1 << STREET_DIRECTIONS[idx])
+    np.bitwise_or.at(masks, cell_of_point[pairs + 1], 1 << STREET_DIRECTIONS[8 - idx])
+    cells_first = positions[first[order]]
+    return xt[cells_first], yt[cells_first], point_lines[cells_first], masks
+
+
 def schematize_streets(gutils, line_layer, cell_size):
     """
     Calculating and writing schematized streets into the 'street_seg' table.
     """
-    streets_sql = """INSERT INTO streets (fid) VALUES (?);"""
-    seg_sql = """INSERT INTO street_seg (geom, str_fid) VALUES (AsGPB(ST_GeomFromText('MULTILINESTRING({0})')), ?)"""
-    elems_sql = """INSERT INTO street_elems (seg_fid, istdir) VALUES (?,?)"""
-    gpb_part = """({0} {1}, {2} {3})"""
+    streets_sql = """INSERT INTO streets (fid, stname, notes) VALUES (?,?,?);"""
+    seg_sql = """INSERT INTO street_seg (fid, geom, str_fid, igridn, depex, stman, elstr) VALUES (?,?,?,?,?,?,?);"""
+    elems_sql = """INSERT INTO street_elems (seg_fid, istdir, widr) VALUES (?,?,?);"""
     half_cell = cell_size * 0.5
     gutils.clear_tables("streets", "street_seg", "street_elems")
-    functions = {
-        1: (lambda x, y, shift: (x, y + shift)),
-        2: (lambda x, y, shift: (x + shift, y)),
-        3: (lambda x, y, shift: (x, y - shift)),
-        4: (lambda x, y, shift: (x - shift, y)),
-        5: (lambda x, y, shift: (x + shift, y + shift)),
-        6: (lambda x, y, shift: (x + shift, y - shift)),
-        7: (lambda x, y, shift: (x - shift, y - shift)),
-        8: (lambda x, y, shift: (x - shift, y + shift)),
+    shifts = {
+        1: (0, 1),
+        2: (1, 0),
+        3: (0, -1),
+        4: (-1, 0),
+        5: (1, 1),
+        6: (1, -1),
+        7: (-1, -1),
+        8: (-1, 1),
     }
     x_offset, y_offset = gutils.calculate_offset(cell_size)
-    fid_segments = schematize_lines(line_layer, cell_size, x_offset, y_offset, get_id=True)
+    line_fids, vertex_lines, vertices = [], [], []
+    for line in line_layer.getFeatures():
+        polyline = line.geometry().asPolyline()
+        vertex_lines += [len(line_fids)] * len(polyline)
+        vertices += [(pnt.x(), pnt.y()) for pnt in polyline]
+        line_fids.append(line.id())
+    vertices = np.array(vertices, dtype=float).reshape(-1, 2)
+    point_lines, xt, yt = schematize_lines_np(
+        vertex_lines, vertices[:, 0], vertices[:, 1], cell_size, x_offset, y_offset
+    )
+    cells_xt, cells_yt, cells_lines, masks = street_cells_np(point_lines, xt, yt)
+    xs = cells_xt * cell_size - x_offset
+    ys = cells_yt * cell_size - y_offset
+    # Cells centers outside the grid are skipped
+    grid_fids = project_grid_index(gutils).cells_on_points(xs, ys)
+
+    qry = """SELECT fid, name, notes, curb_height, n_value, elevation, street_width FROM user_streets;"""
+    user_streets = {row[0]: row[1:] for row in gutils.execute(qry)}
+    no_street = (None,) * 6
+    streets = [(fid,) + user_streets.get(fid, no_street)[:2] for fid in line_fids]
+    segments, elems = [], []
+    for i in np.nonzero(grid_fids)[0].tolist():
+        x, y, mask = float(xs[i]), float(ys[i]), int(masks[i])
+        str_fid = line_fids[cells_lines[i]]
+        name, notes, depex, stman, elstr, widr = user_streets.get(str_fid, no_street)
+        directions = [d for d in range(1, 9) if mask & (1 << d)]
+        parts = [((x, y), (x + dx * half_cell, y + dy * half_cell)) for dx, dy in (shifts[d] for d in directions)]
+        segments.append((i + 1, multilinestring_gpb(parts), str_fid, int(grid_fids[i]), depex, stman, elstr))
+        elems += [(i + 1, d, widr) for d in directions]
     cursor = gutils.con.cursor()
-    fid_coords = {}
-    coords = defaultdict(set)
-    # Populating directions within each grid cell
-    for fid, grids in fid_segments:
-        populate_directions(coords, grids)
-        # Assigning user line fid for each grid centroid coordinates
-        for xy in coords.keys():
-            if xy not in fid_coords:
-                fid_coords[xy] = fid
-            else:
-                continue
-        cursor.execute(streets_sql, (fid,))
-    for i, (xy, directions) in enumerate(iter(coords.items()), 1):
-        x1, y1 = xy
-        xy_dir = []
-        for d in directions:
-            cursor.execute(elems_sql, (i, d))
-            xy_dir.append(functions[d](x1, y1, half_cell))
-        multiline = ",".join((gpb_part.format(x1, y1, x2, y2) for x2, y2 in xy_dir))
-        gpb_insert = seg_sql.format(multiline)
-        cursor.execute(gpb_insert, (fid_coords[xy],))
+    cursor.executemany(streets_sql, streets)
+    cursor.executemany(seg_sql, segments)
+    cursor.executemany(elems_sql, elems)
     gutils.con.commit()
-    fid_grid = fid_from_grid(gutils, "street_seg", grid_center=True, switch=True)
-    grid_sql = """UPDATE street_seg SET igridn = ? WHERE fid = ?;"""
-    gutils.execute_many(grid_sql, fid_grid)
-    update_streets = """
-    UPDATE streets SET
-        stname = (SELECT name FROM user_streets WHERE fid = streets.fid),
-        notes = (SELECT notes FROM user_streets WHERE fid = streets.fid);"""
-    update_street_seg = """
-    UPDATE street_seg SET
-        depex = (SELECT curb_height FROM user_streets WHERE fid = street_seg.str_fid),
-        stman = (SELECT n_value FROM user_streets WHERE fid = street_seg.str_fid),
-        elstr = (SELECT elevation FROM user_streets WHERE fid = street_seg.str_fid);"""
-    update_street_elems = """
-        UPDATE street_elems SET
-            widr = (
-                    SELECT us.street_width
-                    FROM user_streets AS us, street_seg AS seg
-                    WHERE us.fid = seg.str_fid AND street_elems.seg_fid = seg.fid);
-                    """
-    crop_seg_sql = """DELETE FROM street_seg WHERE igridn IS NULL;"""
-    crop_elem_sql = """DELETE FROM street_elems WHERE seg_fid NOT IN (SELECT fid FROM street_seg);"""
-    gutils.execute(update_streets)
-    gutils.execute(update_street_seg)
-    gutils.execute(update_street_elems)
-    gutils.execute(crop_seg_sql)
-    gutils.execute(crop_elem_sql)
 
 
 def schematize_reservoirs(gutils):
@@ -929,6 +994,80 @@ def schematize_reservoirs(gutils):
     gutils.execute(ins_qry)
 
 
+# Attributes of user storm drain nodes written into 'swmmflo' table (after swmmchar, swmm_jt and swmm_iden).
+SWMM_INLET_COLUMNS = (
+    "intype",
+    "swmm_length",
+    "swmm_width",
+    "swmm_height",
+    "swmm_coeff",
+    "swmm_feature",
+    "flapgate",
+    "curbheight",
+)
+
+
+def schematize_storm_drain_nodes(gutils, inlet_columns=SWMM_INLET_COLUMNS):
+    """
+    Schematizing user storm drain nodes into inlets ('swmmflo'), outfalls ('swmmoutf') and rating tables links.
+
+    Grid cells of all nodes are found at once in the grid index, schematic points are cells centroids
+    taken from the index and all tables are written with executemany in a single transaction.
+    Nodes outside the grid get NULL cell and geometry, as with 'grid_on_point'.
+    Returns numbers of schematized inlets, outfalls and linked rating tables.
+    Raises ValueError for nodes without geometry or with unknown type.
+    """
+    insert_inlet = """
+        INSERT INTO swmmflo
+        (geom, swmmchar, swmm_jt, swmm_iden, intype, swmm_length, swmm_width, swmm_height, swmm_coeff, swmm_feature,
+        flapgate, curbheight) VALUES (?,?,?,?,?,?,?,?,?,?,?,?);"""
+    insert_outlet = """INSERT INTO swmmoutf (geom, grid_fid, name, outf_flo) VALUES (?,?,?,?);"""
+    link_rt = """UPDATE swmmflort SET grid_fid = ? WHERE name = ?;"""
+
+    qry = """
+        SELECT ST_X(GeomFromGPB(geom)), ST_Y(GeomFromGPB(geom)), sd_type, name, rt_name, swmm_allow_discharge, {0}
+        FROM user_swmm_nodes ORDER BY fid;"""
+    nodes = gutils.execute(qry.format(", ".join(inlet_columns))).fetchall()
+    if any(node[0] is None or node[1] is None for node in nodes):
+        raise ValueError("Geometry (inlet or outlet) missing.")
+    xs = np.array([node[0] for node in nodes], dtype=float)
+    ys = np.array([node[1] for node in nodes], dtype=float)
+    index = project_grid_index(gutils)
+    cells = index.cells_on_points(xs, ys)
+    srs_id = gutils.execute("""SELECT srs_id FROM gpkg_contents WHERE table_name='grid';""").fetchone()[0]
+    positions = np.nonzero(cells > 0)[0]
+    centroids = points_gpb(index.xs[cells[positions]], index.ys[cells[positions]], srs_id)
+    geoms = [None] * cells.shape[0]
+    for i, geom in zip(positions.tolist(), centroids):
+        geoms[i] = geom
+
+    inlets, outlets, rt_links = [], [], []
+    for geom, grid_fid, node in zip(geoms, cells.tolist(), nodes):
+        grid_fid = grid_fid if grid_fid > 0 else None
+        sd_type, name, rt_name, allow_discharge = node[2:6]
+        if sd_type in ("I", "J"):
+            row = ["D", grid_fid, name] + [0 if v is None else v for v in node[6:]]
+            row[9] = 1 if is_true(row[8]) else 0
+            inlets.append([geom] + row)
+            if row[3] == 4 and rt_name:
+                rt_links.append((grid_fid, rt_name))
+        elif sd_type == "O":
+            outlets.append((geom, grid_fid, name, 1 if is_true(allow_discharge) else 0))
+        else:
+            raise ValueError("Unknown storm drain node type: {}".format(sd_type))
+
+    with gutils.unit_of_work():
+        if inlets:
+            gutils.clear_tables("swmmflo")
+            gutils.execute_many(insert_inlet, inlets)
+        if outlets:
+            gutils.clear_tables("swmmoutf")
+            gutils.execute_many(insert_outlet, outlets)
+        if rt_links:
+            gutils.execute_many(link_rt, rt_links)
+    return len(inlets), len(outlets), len(rt_links)
+
+
 class ChannelsSchematizer(GeoPackageUtils):
     """
     Class for handling 1D Domain schematizing processes.
@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+
+# FLO-2D Preprocessor tools for QGIS
+# Copyright © 2021 Lutra Consulting for FLO-2D
+
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version
+"""
+Worker processes shared by the tools running heavy calculations in parallel (LiDAR binning, raster warping,
+Green-Ampt infiltration). This module doesn't depend on QGIS.
+"""
+import os
+import sys
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+
+def process_pool(workers, initializer=None, initargs=()):
+    """
+    Creating pool of worker processes. Inside QGIS sys.executable is the QGIS binary, so Python interpreter is used.
+    """
+    ctx = multiprocessing.get_context("spawn")
+    python = os.path.join(sys.exec_prefix, "python.exe" if os.name == "nt" else "bin/python3")
+    if os.path.isfile(python) and os.path.basename(sys.executable).lower().startswith("qgis"):
+        ctx.set_executable(python)
+    return ProcessPoolExecutor(max_workers=workers, mp_context=ctx, initializer=initializer, initargs=initargs)
@@ -8,11 +8,113 @@
 # as published by the Free Software Foundation; either version 2
 # of the License, or (at your option) any later version
 import os
+import re
+import sqlite3
+import weakref
 import traceback
+from contextlib import contextmanager
 from functools import wraps
 from collections import defaultdict
+import numpy as np
 from .user_communication import UserCommunication
-from qgis.core import QgsGeometry
+from .gpb_utils import (
+    linestring_gpb,
+    multilinestring_gpb,
+    polygon_gpb,
+    square_gpb,
+    centered_squares_gpb,
+    points_gpb,
+)
+from .flo2d_tools.grid_index import project_grid_index
+from qgis.core import Qgis, QgsGeometry, QgsMessageLog
+
+# SQLite limit of host parameters in a single statement.
+MAX_SQL_VARIABLES = 999
+
+# Version of the plugin schema written by db_structure.sql, older GeoPackages are upgraded by 'GeoPackageUtils.migrate'.
+SCHEMA_VERSION = 5
+
+# Schema upgrades: (schema version, description shown to the user, GeoPackageUtils method name).
+SCHEMA_MIGRATIONS = (
+    (1, "Grid change tracking for cached grid indexes", "migrate_metadata"),
+    (2, "Faster cell triggers of spatial components with deferred mode", "migrate_cell_triggers"),
+    (3, "Table of realtime rainfall compressed blocks (raincell_blocks)", "migrate_raincell_store"),
+    (4, "Grid change counters without row triggers (faster grid writes)", "migrate_grid_counters"),
+    (5, "Table of imported DEBUG and diagnostics issues (debug_issues)", "migrate_debug_issues"),
+)
+
+# Modification counters incremented once per write statement by 'execute' and 'execute_many' instead of row
+# triggers (counter name -> (table, columns of counted updates or None for any column)).
+STATEMENT_COUNTERS = {
+    "grid": ("grid", None),
+    "grid_geom": ("grid", ("geom",)),
+    "raincell_blocks": ("raincell_blocks", None),
+}
+
+# Target table of INSERT, REPLACE, UPDATE and DELETE statements.
+WRITE_STATEMENT = re.compile(
+    r'^\s*(INSERT|REPLACE|UPDATE|DELETE)(?:\s+OR\s+\w+)?\s+(?:INTO\s+|FROM\s+)?"?(\w+)"?', re.IGNORECASE
+)
+
+DB_STRUCTURE = os.path.join(os.path.dirname(__file__), "db_structure.sql")
+
+# Triggers resolving grid cells of spatial components, defined in db_structure.sql:
+# (triggers names prefix, source table, cells table, source fid column in cells table, spatial predicate,
+# source columns copied into cells table, trigger events).
+CELL_TRIGGERS = (
+    ("find_cells_mult", "mult_areas", "mult_cells", "area_fid", "ST_Intersects", ("wdr", "dm", "nodchns", "xnmult"),
+     ("insert", "update")),
+    ("find_cells_mult_line", "mult_lines", "mult_cells", "line_fid", "ST_Crosses", ("wdr", "dm", "nodchns", "xnmult"),
+     ("insert", "update")),
+    ("find_cells_simple_mult_line", "simple_mult_lines", "simple_mult_cells", "line_fid", "ST_Crosses", (),
+     ("insert", "update")),
+    ("find_breach_cells", "breach", "breach_cells", "breach_fid", "ST_Intersects", (), ("insert", "update")),
+    ("find_cells_sed_areas", "sed_group_areas", "sed_group_cells", "area_fid", "ST_Intersects", (),
+     ("insert", "update")),
+    ("find_sed_rigid_cells", "sed_rigid_areas", "sed_rigid_cells", "area_fid", "ST_Intersects", (), ("insert",)),
+    ("find_cells_sed_supply_areas", "sed_supply_areas", "sed_supply_cells", "area_fid", "ST_Intersects", (),
+     ("insert", "update")),
+)
+
+# Name of 'trigger_control' row switching cell triggers into deferred mode.
+DEFER_CELLS = "defer_cells"
+
+# Connection tuning profile of the plugin GeoPackage connection (see 'tune_connection').
+# Only per connection settings, the GeoPackage file itself is left unchanged.
+CONNECTION_PRAGMAS = (
+    ("cache_size", -262144),  # Page cache size in KiB (256 MiB).
+    ("mmap_size", 1073741824),
+    ("temp_store", "MEMORY"),
+)
+
+# Opt-in WAL journal (QSettings 'FLO-2D/wal_journal'). WAL mode is stored in the file, the previous mode is
+# restored by 'database_disconnect', so the GeoPackage is still readable by tools without WAL support.
+WAL_PRAGMAS = (
+    ("journal_mode", "WAL"),
+    ("synchronous", "NORMAL"),
+)
+
+# Connections switched into WAL journal (con -> previous journal mode).
+wal_connections = weakref.WeakKeyDictionary()
+
+# Connections with open unit of work (con -> number of nested units), commits are postponed within units.
+units_of_work = weakref.WeakKeyDictionary()
+
+
+class Connection(sqlite3.Connection):
+    """
+    SQLite connection which can be weakly referenced (key of 'wal_connections' and 'units_of_work').
+    """
+
+
+def grid_rtree_filter(geom):
+    """
+    SQL condition selecting grid cells which bounding boxes intersect bounding box of 'geom' (from grid R-tree).
+    """
+    return """g.ROWID IN (
+                SELECT id FROM rtree_grid_geom
+                WHERE ST_MinX(CastAutomagic({0})) <= maxx AND ST_MaxX(CastAutomagic({0})) >= minx
+                AND ST_MinY(CastAutomagic({0})) <= maxy AND ST_MaxY(CastAutomagic({0})) >= miny)""".format(geom)
 
 
 def connection_required(fn):
@@ -33,8 +135,7 @@ def spatialite_connect(*args, **kwargs):
     try:
         from pyspatialite import dbapi2
     except ImportError:
-        import sqlite3
-
+        kwargs.setdefault("factory", Connection)
         con = sqlite3.dbapi2.connect(*args, **kwargs)
         con.enable_load_extension(True)
         cur = con.cursor()
@@ -63,6 +164,71 @@ def spatialite_connect(*args, **kwargs):
     return dbapi2.connect(*args, **kwargs)
 
 
+def tune_connection(con, pragmas=CONNECTION_PRAGMAS, wal=False):
+    """
+    Setting connection pragmas, plus WAL journal if 'wal' is set.
+    Pragmas not supported by the database are logged and skipped.
+    """
+    if wal:
+        try:
+            journal_mode = con.execute("PRAGMA journal_mode;").fetchone()[0]
+        except Exception as e:
+            journal_mode = None
+        if journal_mode is not None and journal_mode.lower() != "wal":
+            pragmas = tuple(pragmas) + WAL_PRAGMAS
+            wal_connections[con] = journal_mode
+    for name, value in pragmas:
+        try:
+            con.execute("PRAGMA {0} = {1};".format(name, value)).fetchall()
+        except Exception as e:
+            msg = "WARNING 181026.1130: Setting of PRAGMA {0} = {1} failed: {2}".format(name, value, e)
+            QgsMessageLog.logMessage(msg, "FLO-2D", Qgis.Warning)
+
+
+def statement_counters(statement):
+    """
+    Names of STATEMENT_COUNTERS changed by the SQL statement.
+    """
+    match = WRITE_STATEMENT.match(statement)
+    if match is None:
+        return []
+    kind, table = match.group(1).upper(), match.group(2).lower()
+    names = []
+    for name, (counter_table, columns) in STATEMENT_COUNTERS.items():
+        if counter_table != table:
+            continue
+        if kind == "UPDATE" and columns is not None:
+            assignments = re.split(r"\bWHERE\b", statement[match.end() :], maxsplit=1, flags=re.IGNORECASE)[0]
+            if not any(re.search(r'\b{}"?\s*='.format(c), assignments, re.IGNORECASE) for c in columns):
+                continue
+        names.append(name)
+    return names
+
+
+def db_structure_statement(name):
+    """
+    Getting statement of db_structure.sql creating table or trigger 'name', so migrations reuse the schema script.
+    """
+    with open(DB_STRUCTURE, "r") as f:
+        script = f.read()
+    pattern = r'^CREATE (?:TABLE|TRIGGER IF NOT EXISTS) "{}"\s.*?^(?:\);|    END;)$'.format(re.escape(name))
+    match = re.search(pattern, script, re.MULTILINE | re.DOTALL)
+    if match is None:
+        raise ValueError("{} is not defined in db_structure.sql".format(name))
+    return match.group(0)
+
+
+def database_backup(con, path):
+    """
+    Copying the database of the connection into 'path' (SQLite online backup, committed changes only).
+    """
+    target = sqlite3.connect(path)
+    try:
+        con.backup(target)
+    finally:
+        target.close()
+
+
 def database_create(path):
     """
     Create geopackage with SpatiaLite functions.
@@ -77,9 +243,7 @@ def database_create(path):
         return False
 
     con = database_connect(path)
-    plugin_dir = os.path.dirname(__file__)
-    script = os.path.join(plugin_dir, "db_structure.sql")
-    qry = open(script, "r").read()
+    qry = open(DB_STRUCTURE, "r").read()
     c = con.cursor()
     c.executescript(qry)
     con.commit()
@@ -87,12 +251,13 @@ def database_create(path):
     return con
 
 
-def database_connect(path):
+def database_connect(path, wal=False):
     """
     Connect database with sqlite3.
     """
     try:
         con = spatialite_connect(path)
+        tune_connection(con, wal=wal)
         return con
     except Exception as e:
         # Couldn't connect to GeoPackage
@@ -103,6 +268,14 @@ def database_disconnect(con):
     """
     Disconnect from database.
     """
+    journal_mode = wal_connections.pop(con, None)
+    if journal_mode is not None:
+        try:
+            con.commit()
+            con.execute("PRAGMA journal_mode = {};".format(journal_mode)).fetchall()
+        except Exception as e:
+            msg = "WARNING 181026.1131: Restoring of journal mode {0} failed: {1}".format(journal_mode, e)
+            QgsMessageLog.logMessage(msg, "FLO-2D", Qgis.Warning)
     try:
         con.close()
     except Exception as e:
@@ -238,14 +411,15 @@ class GeoPackageUtils(object):
             else:
                 result_cursor = cursor.execute(statement)
             rowid = cursor.lastrowid
-            self.con.commit()
+            self.count_changes(statement)
+            self.commit()
             if get_rowid:
                 return rowid
             else:
                 return result_cursor
 
         except Exception as e:
-            self.con.rollback()
+            self.rollback()
             raise
 
     def execute_many(self, sql, data):
@@ -255,10 +429,76 @@ class GeoPackageUtils(object):
                 cursor.executemany(sql, data)
             else:
                 return
-            self.con.commit()
+            self.count_changes(sql)
+            self.commit()
+        except Exception as e:
+            self.rollback()
+            raise
+
+    def count_changes(self, statement):
+        """
+        Incrementing STATEMENT_COUNTERS changed by the executed statement (in its transaction).
+        Statements executed directly on the connection are not counted, unless the caller counts them here.
+        """
+        names = statement_counters(statement)
+        if not names:
+            return
+        qry = """UPDATE "table_changes" SET counter = counter + 1 WHERE name IN ({});"""
+        try:
+            self.con.execute(qry.format(",".join("?" * len(names))), names)
         except Exception as e:
+            # GeoPackage without counters (not migrated yet), its grid indexes are not cached.
+            pass
+
+    def in_unit_of_work(self):
+        return self.con in units_of_work
+
+    def commit(self):
+        """
+        Committing changes, unless they are part of a unit of work.
+        """
+        if not self.in_unit_of_work():
+            self.con.commit()
+
+    def rollback(self):
+        """
+        Rolling back changes. Within a unit of work the failed statement is undone by SQLite
+        and the rest is left to the unit of work.
+        """
+        if not self.in_unit_of_work():
             self.con.rollback()
+
+    @contextmanager
+    def unit_of_work(self):
+        """
+        Context manager grouping all statements executed on the connection into one transaction.
+        Changes are committed on exit and rolled back on exception. Nested units are savepoints,
+        so failed nested unit is rolled back alone.
+        """
+        key = self.con
+        depth = units_of_work.get(key, 0)
+        savepoint = "unit_of_work_{}".format(depth)
+        if depth == 0:
+            self.con.commit()
+        self.con.execute('SAVEPOINT "{}";'.format(savepoint))
+        units_of_work[key] = depth + 1
+        try:
+            yield self
+        except BaseException:
+            # Savepoints don't exist anymore if something committed the transaction directly.
+            if self.con.in_transaction:
+                self.con.execute('ROLLBACK TO "{}";'.format(savepoint))
+                self.con.execute('RELEASE "{}";'.format(savepoint))
             raise
+        else:
+            if self.con.in_transaction:
+                self.con.execute('RELEASE "{}";'.format(savepoint))
+        finally:
+            if depth == 0:
+                del units_of_work[key]
+                self.con.commit()
+            else:
+                units_of_work[key] = depth
 
     def batch_execute(self, *sqls):
         for sql in sqls:
@@ -272,13 +512,12 @@ class GeoPackageUtils(object):
                 row_len = sql.pop(0)
                 qry_part = " (" + ",".join(["?"] * row_len) + ")"
                 qry_all = qry + qry_part
-                cur = self.con.cursor()
-                cur.executemany(qry_all, sql)
-                self.con.commit()
+                with self.unit_of_work():
+                    cur = self.con.cursor()
+                    cur.executemany(qry_all, sql)
                 del sql[:]
                 sql += [qry, row_len]
             except Exception as e:
-                self.con.rollback()
                 self.uc.log_info(qry)
                 self.uc.log_info(traceback.format_exc())
 
@@ -323,9 +562,12 @@ class GeoPackageUtils(object):
 
     def set_cont_par(self, name, value):
         """
-        Set a parameter value in cont table.
+        Set a parameter value in cont table. Unchanged values are not rewritten (see 'table_change_counter').
         """
         description = self.PARAMETER_DESCRIPTION[name]
+        row = self.execute("""SELECT value, note FROM cont WHERE name = ?;""", (name,)).fetchone()
+        if row is not None and str(row[0]) == str(value) and row[1] == description:
+            return
         sql = """INSERT OR REPLACE INTO cont (name, value, note) VALUES (?,?,?);"""
         self.execute(sql, (name, value, description))
 
@@ -355,17 +597,216 @@ class GeoPackageUtils(object):
         geom = self.execute(sql.format(table, field), (gid,)).fetchone()[0]
         return geom
 
+    def create_table_counters(self, *names):
+        """
+        Creating 'table_changes' counters (starting from 0) of given names.
+        """
+        self.execute(
+            """CREATE TABLE IF NOT EXISTS "table_changes" (
+                "name" TEXT PRIMARY KEY NOT NULL,
+                "counter" INTEGER NOT NULL DEFAULT 0
+            );"""
+        )
+        qry = """INSERT OR IGNORE INTO "table_changes" (name, counter) VALUES (?, 0);"""
+        self.execute_many(qry, [(name,) for name in names])
+
+    def track_table_changes(self, table, columns=None):
+        """
+        Creating triggers which increment 'table_changes' counter on every modification of the table.
+        If 'columns' are given, only updates of these columns (plus inserts and deletes) are counted.
+        Schema change, only used by tools which explicitly set up tracking of their tables
+        (row triggers slow down bulk writes, STATEMENT_COUNTERS are preferred for large tables).
+        """
+        name = table if columns is None else "_".join((table,) + tuple(columns))
+        self.create_table_counters(name)
+        trigger_sql = """
+        CREATE TRIGGER IF NOT EXISTS "track_{0}_{1}"
+            AFTER {2} ON "{3}"
+            BEGIN
+                UPDATE "table_changes" SET counter = counter + 1 WHERE name = '{0}';
+            END;"""
+        update = "UPDATE" if columns is None else "UPDATE OF " + ", ".join('"{}"'.format(c) for c in columns)
+        events = (("insert", "INSERT"), ("update", update), ("delete", "DELETE"))
+        for suffix, event in events:
+            self.execute(trigger_sql.format(name, suffix, event, table))
+
+    def table_change_counter(self, table, columns=None):
+        """
+        Getting modification counter of the table (None if changes of the table are not tracked).
+        """
+        name = table if columns is None else "_".join((table,) + tuple(columns))
+        try:
+            row = self.execute("""SELECT counter FROM "table_changes" WHERE name = ?;""", (name,)).fetchone()
+        except Exception as e:
+            return None
+        return row[0] if row is not None else None
+
+    def metadata(self, name):
+        """
+        Getting value from 'flo2d_metadata' table (None in GeoPackages without the table or the value).
+        """
+        try:
+            row = self.execute("""SELECT value FROM flo2d_metadata WHERE name = ?;""", (name,)).fetchone()
+        except Exception as e:
+            return None
+        return row[0] if row is not None else None
+
+    def set_metadata(self, name, value):
+        self.execute("""INSERT OR REPLACE INTO flo2d_metadata (name, value) VALUES (?, ?);""", (name, value))
+
+    def schema_version(self):
+        return int(self.metadata("schema_version") or 0)
+
+    def database_id(self):
+        """
+        Random identity of the GeoPackage, new for every created (or recreated) database.
+        """
+        return self.metadata("database_id")
+
+    def migrate_metadata(self):
+        self.execute(
+            """CREATE TABLE IF NOT EXISTS "flo2d_metadata" (
+                "name" TEXT PRIMARY KEY NOT NULL,
+                "value" TEXT
+            );"""
+        )
+        self.execute(
+            """INSERT INTO gpkg_contents (table_name, data_type)
+            SELECT 'flo2d_metadata', 'aspatial' WHERE NOT EXISTS
+            (SELECT 1 FROM gpkg_contents WHERE table_name = 'flo2d_metadata');"""
+        )
+        self.execute(
+            """INSERT OR IGNORE INTO flo2d_metadata (name, value) VALUES ('database_id', lower(hex(randomblob(16))));"""
+        )
+        self.create_table_counters(*STATEMENT_COUNTERS)
+
+    def migrate_grid_counters(self):
+        """
+        Dropping row triggers of grid counters (GeoPackages of former plugin versions), grid counters are
+        incremented per statement (STATEMENT_COUNTERS).
+        """
+        for name in ("grid", "grid_geom"):
+            for suffix in ("insert", "update", "delete"):
+                self.execute("""DROP TRIGGER IF EXISTS "track_{0}_{1}";""".format(name, suffix))
+        self.create_table_counters(*STATEMENT_COUNTERS)
+
+    def migrate_cell_triggers(self):
+        """
+        Recreating insert and update triggers of CELL_TRIGGERS (R-tree pre-filtered cells, deferred mode)
+        from db_structure.sql.
+        """
+        tables = {row[0] for row in self.execute("SELECT name FROM sqlite_master WHERE type = 'table';")}
+        if "deferred_cells" not in tables:
+            self.execute(db_structure_statement("deferred_cells"))
+        if self.execute("SELECT 1 FROM trigger_control WHERE name = ?;", (DEFER_CELLS,)).fetchone() is None:
+            self.execute("INSERT INTO trigger_control (name, enabled) VALUES (?, 0);", (DEFER_CELLS,))
+        for prefix, source, cells, fid_col, predicate, columns, events in CELL_TRIGGERS:
+            if source not in tables or cells not in tables:
+                # Component missing in older GeoPackages.
+                continue
+            for event in events:
+                for name in ("{}_{}".format(prefix, event), "{}_deferred_{}".format(prefix, event)):
+                    self.execute("""DROP TRIGGER IF EXISTS "{}";""".format(name))
+                    self.execute(db_structure_statement(name))
+
+    def migrate_raincell_store(self):
+        """
+        Creating the blocks table, rows of 'raincell_data' are moved only on request (RaincellStore.migrate).
+        """
+        from .flo2d_ie.rainfall_io import RaincellStore
+
+        RaincellStore(self).create()
+        self.create_table_counters(*STATEMENT_COUNTERS)
+
+    def migrate_debug_issues(self):
+        """
+        Creating the indexed 'debug_issues' points table of db_structure.sql in the grid coordinate system.
+        """
+        if self.execute("SELECT 1 FROM gpkg_contents WHERE table_name = 'debug_issues';").fetchone() is not None:
+            return
+        srs_id = self.execute("SELECT srs_id FROM gpkg_contents WHERE table_name = 'grid';").fetchone()
+        srs_id = srs_id[0] if srs_id else 0
+        self.execute(db_structure_statement("debug_issues"))
+        self.execute("""CREATE INDEX IF NOT EXISTS "debug_issues_grid_fid" ON "debug_issues" ("grid_fid");""")
+        self.execute("""CREATE INDEX IF NOT EXISTS "debug_issues_code" ON "debug_issues" ("code");""")
+        self.execute(
+            "INSERT INTO gpkg_contents (table_name, data_type, srs_id) VALUES ('debug_issues', 'features', ?);",
+            (srs_id,),
+        )
+        self.execute("SELECT gpkgAddGeometryColumn('debug_issues', 'geom', 'POINT', 0, 0, ?);", (srs_id,))
+        self.execute("SELECT gpkgAddGeometryTriggers('debug_issues', 'geom');")
+
+    def migrate(self):
+        """
+        Upgrading GeoPackage created by older plugin to SCHEMA_VERSION, each step runs once.
+        Returns descriptions of applied upgrades.
+        """
+        version = self.schema_version()
+        applied = []
+        for step_version, description, method in SCHEMA_MIGRATIONS:
+            if step_version <= version:
+                continue
+            with self.unit_of_work():
+                getattr(self, method)()
+                self.set_metadata("schema_version", str(step_version))
+            applied.append(description)
+        return applied
+
+    def grid_centers(self):
+        """
+        Getting cached NumPy arrays (xs, ys) of cell centers indexed by grid fid (NaN for missing cells).
+        """
+        index = project_grid_index(self)
+        return index.xs, index.ys
+
     def grid_centroids(self, gids, table="grid", field="fid", buffers=False):
+        """
+        Getting centroids (WKT or GPB) of all given cells in a single call.
+        """
+        gids = list(gids)
+        if table != "grid" or field != "fid":
+            return self.table_centroids(gids, table, field, buffers)
         cells = {}
+        if not gids:
+            return cells
+        xs, ys = self.grid_centers()
+        fids = np.array([int(g) for g in gids], dtype=int)
+        valid = (fids >= 0) & (fids < xs.shape[0])
+        valid[valid] = ~np.isnan(xs[fids[valid]])
+        cx = np.zeros(fids.shape[0])
+        cy = np.zeros(fids.shape[0])
+        cx[valid] = xs[fids[valid]]
+        cy[valid] = ys[fids[valid]]
         if buffers is False:
-            sql = """SELECT ST_AsText(ST_Centroid(GeomFromGPB(geom))) FROM "{0}" WHERE "{1}" = ?;"""
+            geoms = ["POINT({0} {1})".format(x, y) for x, y in zip(cx.tolist(), cy.tolist())]
         else:
-            sql = """SELECT AsGPB(ST_Centroid(GeomFromGPB(geom))) FROM "{0}" WHERE "{1}" = ?;"""
+            geoms = points_gpb(cx, cy)
+        for g, is_valid, geom in zip(gids, valid.tolist(), geoms):
+            cells[g] = geom if is_valid else None
+        return cells
+
+    def table_centroids(self, gids, table="grid", field="fid", buffers=False):
+        """
+        Set-based centroids query for any table (one query per 'MAX_SQL_VARIABLES' ids).
+        """
+        cells = {}
+        if buffers is False:
+            sql = """SELECT "{1}", ST_AsText(ST_Centroid(GeomFromGPB(geom))) FROM "{0}" WHERE "{1}" IN ({2});"""
+        else:
+            sql = """SELECT "{1}", AsGPB(ST_Centroid(GeomFromGPB(geom))) FROM "{0}" WHERE "{1}" IN ({2});"""
+        keys = defaultdict(list)
         for g in gids:
-            geom = self.execute(sql.format(table, field), (g,)).fetchone()[0]
-            cells[g] = geom
+            keys[str(g)].append(g)
+            cells[g] = None
+        unique = list(keys)
+        for i in range(0, len(unique), MAX_SQL_VARIABLES):
+            chunk = unique[i : i + MAX_SQL_VARIABLES]
+            qry = sql.format(table, field, ",".join(["?"] * len(chunk)))
+            for value, geom in self.execute(qry, chunk):
+                for g in keys.get(str(value), []):
+                    cells[g] = geom
         return cells
-    
+
     def grid_centroids_all(self, table="grid", field="fid", buffers=False):
         cells = []
         if buffers is False:
@@ -386,16 +827,18 @@ class GeoPackageUtils(object):
         return geom
 
     def build_linestring(self, gids, table="grid", field="fid"):
-        gpb = """SELECT AsGPB(ST_GeomFromText('LINESTRING("""
+        if table == "grid" and field == "fid":
+            xs, ys = self.grid_centers()
+            points = [(xs[int(g)], ys[int(g)]) for g in gids]
+            return linestring_gpb(points)
         points = []
         for g in gids:
             qry = """SELECT ST_AsText(ST_Centroid(GeomFromGPB(geom))) FROM "{0}" WHERE "{1}" = ?;""".format(
                 table, field
             )
             wkt_geom = self.execute(qry, (g,)).fetchone()[0]
-            points.append(wkt_geom.strip("POINT()"))
-        gpb = gpb + ",".join(points) + ")'))"
-        gpb_buff = self.execute(gpb).fetchone()[0]
+            points.append([float(i) for i in wkt_geom.strip("POINT()").split()])
+        gpb_buff = linestring_gpb(points)
         return gpb_buff
 
     def build_multilinestring(self, gid, directions, cellsize, table="grid", field="fid"):
@@ -409,8 +852,6 @@ class GeoPackageUtils(object):
             "7": (lambda x, y, shift: (x - shift, y - shift)),
             "8": (lambda x, y, shift: (x - shift, y + shift)),
         }
-        gpb = """SELECT AsGPB(ST_GeomFromText('MULTILINESTRING("""
-        gpb_part = """({0} {1}, {2} {3})"""
         qry = """SELECT ST_AsText(ST_Centroid(GeomFromGPB(geom))) FROM "{0}" WHERE "{1}" = ?;""".format(table, field)
         wkt_geom = self.execute(qry, (gid,)).fetchone()[0]  # "wkt_geom" is POINT. Centroid of cell "gid"
         x1, y1 = [float(i) for i in wkt_geom.strip("POINT()").split()]  # Coordinates x1, y1 of centriod of cell "gid".
@@ -420,9 +861,8 @@ class GeoPackageUtils(object):
             x2, y2 = functions[d](
                 x1, y1, half_cell
             )  # Coords x2,y2 of end point of subline,  half_cell apart from x1,y1, in direction.
-            parts.append(gpb_part.format(x1, y1, x2, y2))
-        gpb = gpb + ",".join(parts) + ")'))"
-        gpb_buff = self.execute(gpb).fetchone()[0]
+            parts.append(((x1, y1), (x2, y2)))
+        gpb_buff = multilinestring_gpb(parts)
         return gpb_buff
 
     def build_levee(self, gid, direction, cellsize, table="grid", field="fid"):
@@ -450,10 +890,7 @@ class GeoPackageUtils(object):
             xc, yc, cellsize * 0.45
         )  # Get 2 points of a line from "functions" dictionary.
 
-        gpb = """SELECT AsGPB(ST_GeomFromText('LINESTRING({0} {1}, {2} {3})'))""".format(x1, y1, x2, y2)
-        # "gpb" gets a value with actual points, e.g.
-        # SELECT AsGPB(ST_GeomFromText('LINESTRING(366961.647995 1185707.0, 366981.532005 1185707.0)'))
-        gpb_buff = self.execute(gpb).fetchone()[0]
+        gpb_buff = linestring_gpb(((x1, y1), (x2, y2)))
         return gpb_buff
 
     def build_buffer(self, wkt_geom, distance, quadrantsegments=3):
@@ -464,52 +901,31 @@ class GeoPackageUtils(object):
 
     def build_square_xy(self, x, y, size):
         half_size = size * 0.5
-        gpb = """SELECT AsGPB(ST_GeomFromText('POLYGON(({} {}, {} {}, {} {}, {} {}, {} {}))'))""".format(
-            x - half_size,
-            y - half_size,
-            x + half_size,
-            y - half_size,
-            x + half_size,
-            y + half_size,
-            x - half_size,
-            y + half_size,
-            x - half_size,
-            y - half_size,
-        )
-        gpb_buff = self.execute(gpb).fetchone()[0]
+        gpb_buff = square_gpb(x - half_size, y - half_size, x + half_size, y + half_size)
         return gpb_buff
 
     def build_square(self, wkt_geom, size):
         x, y = [float(x) for x in wkt_geom.strip("POINT()").split()]
         half_size = float(size) * 0.5
-        gpb = """SELECT AsGPB(ST_GeomFromText('POLYGON(({} {}, {} {}, {} {}, {} {}, {} {}))'))""".format(
-            x - half_size,
-            y - half_size,
-            x + half_size,
-            y - half_size,
-            x + half_size,
-            y + half_size,
-            x - half_size,
-            y + half_size,
-            x - half_size,
-            y - half_size,
-        )
-        gpb_buff = self.execute(gpb).fetchone()[0]
+        gpb_buff = square_gpb(x - half_size, y - half_size, x + half_size, y + half_size)
         return gpb_buff
 
+    def build_squares(self, xs, ys, size):
+        """
+        Bulk version of 'build_square' for arrays of squares centers.
+        """
+        gpb_buffs = centered_squares_gpb(xs, ys, size)
+        return gpb_buffs
+
     def build_square_from_polygon(self, polygon_coordinates):
-        gpb = """SELECT AsGPB(ST_GeomFromText('POLYGON(({} {}, {} {}, {} {}, {} {}, {} {}))'))""".format(
-            *polygon_coordinates
-        )
-        gpb_buff = self.execute(gpb).fetchone()[0]
+        coords = list(zip(polygon_coordinates[0::2], polygon_coordinates[1::2]))
+        gpb_buff = polygon_gpb(coords)
         return gpb_buff
 
     def build_square_from_polygon2(self, polyColRow):
-        gpb = """SELECT AsGPB(ST_GeomFromText('POLYGON(({} {}, {} {}, {} {}, {} {}, {} {}))'))""".format(
-            *polyColRow[0]
-        )
-        gpb_buff = self.execute(gpb).fetchone()[0]
-        return (gpb_buff, polyColRow[1], polyColRow[2])                                                     
+        gpb_buff = self.build_square_from_polygon(polyColRow[0])
+        return (gpb_buff, polyColRow[1], polyColRow[2])
+
     def get_max(self, table, field="fid"):
         sql = """SELECT MAX("{0}") FROM "{1}";""".format(field, table)
         max_val = self.execute(sql).fetchone()[0]
@@ -652,12 +1068,54 @@ class GeoPackageUtils(object):
         return self.execute(qry).fetchall()
 
     def disable_geom_triggers(self):
-        qry = "UPDATE trigger_control SET enabled = 0;"
-        self.execute(qry)
+        qry = "UPDATE trigger_control SET enabled = 0 WHERE name IS NOT ?;"
+        self.execute(qry, (DEFER_CELLS,))
 
     def enable_geom_triggers(self):
-        qry = "UPDATE trigger_control SET enabled = 1;"
-        self.execute(qry)
+        qry = "UPDATE trigger_control SET enabled = 1 WHERE name IS NOT ?;"
+        self.execute(qry, (DEFER_CELLS,))
+
+    def resolve_deferred_cells(self):
+        """
+        Resolving cells of all source rows queued in deferred mode, in one set-based query per source table.
+        """
+        delete_qry = """DELETE FROM "{cells}" WHERE {fid_col} IN (SELECT fid FROM deferred_cells WHERE source = ?);"""
+        insert_qry = """
+        INSERT INTO "{cells}" ({fid_col}, grid_fid{columns})
+        SELECT s.fid, g.fid{values} FROM "{source}" AS s, grid AS g
+        WHERE s.fid IN (SELECT fid FROM deferred_cells WHERE source = ?)
+        AND s.geom NOT NULL AND NOT ST_IsEmpty(s.geom)
+        AND {rtree}
+        AND {predicate}(CastAutomagic(g.geom), CastAutomagic(s.geom))
+        ORDER BY s.fid, g.fid;"""
+        for prefix, source, cells, fid_col, predicate, columns, events in CELL_TRIGGERS:
+            if self.execute("SELECT 1 FROM deferred_cells WHERE source = ? LIMIT 1;", (source,)).fetchone() is None:
+                continue
+            self.execute(delete_qry.format(cells=cells, fid_col=fid_col), (source,))
+            qry = insert_qry.format(
+                cells=cells,
+                fid_col=fid_col,
+                columns="".join(", " + c for c in columns),
+                values="".join(", s." + c for c in columns),
+                source=source,
+                rtree=grid_rtree_filter("s.geom"),
+                predicate=predicate,
+            )
+            self.execute(qry, (source,))
+            self.execute("DELETE FROM deferred_cells WHERE source = ?;", (source,))
+
+    @contextmanager
+    def deferred_cell_triggers(self):
+        """
+        Context manager for bulk edits of CELL_TRIGGERS sources. Changed rows are only queued by triggers
+        and their cells are resolved all at once on exit.
+        """
+        self.execute("UPDATE trigger_control SET enabled = 1 WHERE name = ?;", (DEFER_CELLS,))
+        try:
+            yield
+        finally:
+            self.execute("UPDATE trigger_control SET enabled = 0 WHERE name = ?;", (DEFER_CELLS,))
+            self.resolve_deferred_cells()
 
     def calculate_offset(self, cell_size):
         """
@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+
+# FLO-2D Preprocessor tools for QGIS
+# Copyright © 2021 Lutra Consulting for FLO-2D
+
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version
+"""
+Pure Python/NumPy writer of GeoPackage binary (GPB) geometries.
+
+Geometries are packed directly into bytes (GPB header, optional envelope and little endian WKB),
+so there is no need for the SpatiaLite 'AsGPB(ST_GeomFromText(...))' round-trip per geometry.
+"""
+import struct
+import numpy as np
+
+WKB_POINT = 1
+WKB_LINESTRING = 2
+WKB_POLYGON = 3
+WKB_MULTILINESTRING = 5
+
+# Flags byte: little endian (bit 0) and envelope [minx, maxx, miny, maxy] (bits 1-3).
+FLAGS_NO_ENVELOPE = 0b00000001
+FLAGS_XY_ENVELOPE = 0b00000011
+
+HEADER = struct.Struct("<2sBBi")
+ENVELOPE = struct.Struct("<4d")
+
+POINT_DTYPE = np.dtype(
+    [
+        ("magic", "S2"),
+        ("version", "u1"),
+        ("flags", "u1"),
+        ("srs_id", "<i4"),
+        ("byte_order", "u1"),
+        ("wkb_type", "<u4"),
+        ("xy", "<f8", (2,)),
+    ]
+)
+
+SQUARE_DTYPE = np.dtype(
+    [
+        ("magic", "S2"),
+        ("version", "u1"),
+        ("flags", "u1"),
+        ("srs_id", "<i4"),
+        ("envelope", "<f8", (4,)),
+        ("byte_order", "u1"),
+        ("wkb_type", "<u4"),
+        ("num_rings", "<u4"),
+        ("num_points", "<u4"),
+        ("xy", "<f8", (10,)),
+    ]
+)
+
+
+def gpb_header(srs_id=0, envelope=None):
+    """
+    Function for packing GPB header with optional (minx, maxx, miny, maxy) envelope.
+    """
+    if envelope is None:
+        return HEADER.pack(b"GP", 0, FLAGS_NO_ENVELOPE, srs_id)
+    return HEADER.pack(b"GP", 0, FLAGS_XY_ENVELOPE, srs_id) + ENVELOPE.pack(*envelope)
+
+
+def coords_envelope(coords):
+    xs = [x for x, y in coords]
+    ys = [y for x, y in coords]
+    return min(xs), max(xs), min(ys), max(ys)
+
+
+def wkb_linestring(coords):
+    wkb = struct.pack("<BII", 1, WKB_LINESTRING, len(coords))
+    return wkb + struct.pack("<{}d".format(len(coords) * 2), *[c for xy in coords for c in xy])
+
+
+def point_gpb(x, y, srs_id=0):
+    """
+    Function for encoding single point as GPB.
+    """
+    return gpb_header(srs_id) + struct.pack("<BI2d", 1, WKB_POINT, x, y)
+
+
+def linestring_gpb(coords, srs_id=0):
+    """
+    Function for encoding linestring given as sequence of (x, y) as GPB.
+    """
+    return gpb_header(srs_id, coords_envelope(coords)) + wkb_linestring(coords)
+
+
+def multilinestring_gpb(lines, srs_id=0):
+    """
+    Function for encoding multilinestring given as sequence of lines of (x, y) as GPB.
+    """
+    envelope = coords_envelope([xy for coords in lines for xy in coords])
+    wkb = struct.pack("<BII", 1, WKB_MULTILINESTRING, len(lines))
+    wkb += b"".join(wkb_linestring(coords) for coords in lines)
+    return gpb_header(srs_id, envelope) + wkb
+
+
+def polygon_gpb(coords, srs_id=0):
+    """
+    Function for encoding single ring polygon given as closed sequence of (x, y) as GPB.
+    """
+    wkb = struct.pack("<BIII", 1, WKB_POLYGON, 1, len(coords))
+    wkb += struct.pack("<{}d".format(len(coords) * 2), *[c for xy in coords for c in xy])
+    return gpb_header(srs_id, coords_envelope(coords)) + wkb
+
+
+def square_gpb(xmin, ymin, xmax, ymax, srs_id=0):
+    """
+    Function for encoding square polygon with the same vertex order as the grid cells.
+    """
+    coords = ((xmin, ymin), (xmax, ymin), (xmax, ymax), (xmin, ymax), (xmin, ymin))
+    return polygon_gpb(coords, srs_id)
+
+
+def split_records(array):
+    """
+    Function for splitting packed structured array into list of bytes objects (one per record).
+    """
+    size = array.dtype.itemsize
+    buff = array.tobytes()
+    return [buff[i : i + size] for i in range(0, len(buff), size)]
+
+
+def points_gpb(xs, ys, srs_id=0):
+    """
+    Function for encoding arrays of points coordinates as list of GPB blobs.
+    """
+    xs = np.asarray(xs, dtype=float)
+    ys = np.asarray(ys, dtype=float)
+    records = np.zeros(xs.shape[0], dtype=POINT_DTYPE)
+    records["magic"] = b"GP"
+    records["flags"] = FLAGS_NO_ENVELOPE
+    records["srs_id"] = srs_id
+    records["byte_order"] = 1
+    records["wkb_type"] = WKB_POINT
+    records["xy"][:, 0] = xs
+    records["xy"][:, 1] = ys
+    return split_records(records)
+
+
+def squares_gpb(xmins, ymins, xmaxs, ymaxs, srs_id=0):
+    """
+    Function for encoding arrays of squares extents as list of GPB blobs.
+    """
+    xmins = np.asarray(xmins, dtype=float)
+    ymins = np.asarray(ymins, dtype=float)
+    xmaxs = np.asarray(xmaxs, dtype=float)
+    ymaxs = np.asarray(ymaxs, dtype=float)
+    records = np.zeros(xmins.shape[0], dtype=SQUARE_DTYPE)
+    records["magic"] = b"GP"
+    records["flags"] = FLAGS_XY_ENVELOPE
+    records["srs_id"] = srs_id
+    records["envelope"] = np.column_stack((xmins, xmaxs, ymins, ymaxs))
+    records["byte_order"] = 1
+    records["wkb_type"] = WKB_POLYGON
+    records["num_rings"] = 1
+    records["num_points"] = 5
+    records["xy"] = np.column_stack((xmins, ymins, xmaxs, ymins, xmaxs, ymaxs, xmins, ymaxs, xmins, ymins))
+    return split_records(records)
+
+
+def centered_squares_gpb(xs, ys, size, srs_id=0):
+    """
+    Function for encoding squares of given size around arrays of centers as list of GPB blobs.
+    """
+    half_size = float(size) * 0.5
+    xs = np.asarray(xs, dtype=float)
+    ys = np.asarray(ys, dtype=float)
+    return squares_gpb(xs - half_size, ys - half_size, xs + half_size, ys + half_size, srs_id)
@@ -17,7 +17,7 @@ from qgis.gui import QgsRubberBand
 from .ui_utils import load_ui, center_canvas, try_disconnect, set_icon
 from ..geopackage_utils import GeoPackageUtils
 from ..flo2dobjects import Inflow, Outflow
-from ..flo2d_tools.grid_tools import is_boundary_cell, get_adjacent_cell
+from ..flo2d_tools.grid_tools import adjacent_grids_np, boundary_cells_np, get_adjacent_cell
 from ..user_communication import UserCommunication
 from .table_editor_widget import StandardItemModel, StandardItem, CommandItemEdit
 from math import isnan
@@ -974,7 +974,10 @@ class BCEditorWidget(qtBaseClass, uiDialog):
                     grid_lyr = self.lyrs.data["grid"]["qlyr"]
                     cells = self.gutils.execute("SELECT grid_fid, outflow_fid, geom_type FROM outflow_cells").fetchall()
                     if cells:
-                        for cell in cells:
+                        # Neighbours of all outflow cells in one go, in the order N, NE, E, SE, S, SW, W, NW:
+                        neighbours = adjacent_grids_np(self.gutils, [cell[0] for cell in cells])
+                        boundary = boundary_cells_np(self.gutils, [cell[0] for cell in cells])
+                        for i, cell in enumerate(cells):
                             grid_fid, outflow_fid, geom_type = cell
                             if geom_type == "polygon":
         
@@ -985,11 +988,12 @@ class BCEditorWidget(qtBaseClass, uiDialog):
                                     if row[0] == 0: # Outflow type selected as 'No Outflow'. Tag it to remove it,
                                         no_outflow.append(grid_fid)
                                     elif row[0] in [0, 1, 4, 5, 7]:
-                                        if is_boundary_cell(self.gutils, grid_lyr, grid_fid, cell_size):
+                                        if boundary[i]:
                                             # Remove diagonals:
         
-                                            currentCell = next(grid_lyr.getFeatures(QgsFeatureRequest(grid_fid)))
-                                            n_grid, ne_grid, e_grid, se_grid, s_grid, sw_grid, w_grid, nw_grid = self.adjacent_grids(currentCell, cell_size)
+                                            n_grid, ne_grid, e_grid, se_grid, s_grid, sw_grid, w_grid, nw_grid = [
+                                                int(n) if n != -9999 else None for n in neighbours[i]
+                                            ]
                                         
                                             a = nw_grid is None and n_grid and w_grid
                                             b = sw_grid is None and w_grid and s_grid
@@ -1083,51 +1087,6 @@ class BCEditorWidget(qtBaseClass, uiDialog):
         finally:
             return len(no_outflow), list(set(time_stage_1 + time_stage_2)), [], border        
 
-    def adjacent_grids(self, currentCell, cell_size):
-        xx, yy = currentCell.geometry().centroid().asPoint()
-
-        # North cell:
-        y = yy + cell_size
-        x = xx
-        n_grid = self.gutils.grid_on_point(x, y)
-
-        # NorthEast cell
-        y = yy + cell_size
-        x = xx + cell_size
-        ne_grid = self.gutils.grid_on_point(x, y)
-
-        # East cell:
-        x = xx + cell_size
-        y = yy
-        e_grid = self.gutils.grid_on_point(x, y)
-
-        # SouthEast cell:
-        y = yy - cell_size
-        x = xx + cell_size
-        se_grid = self.gutils.grid_on_point(x, y)
-
-        # South cell:
-        y = yy - cell_size
-        x = xx
-        s_grid = self.gutils.grid_on_point(x, y)
-
-        # SouthWest cell:
-        y = yy - cell_size
-        x = xx - cell_size
-        sw_grid = self.gutils.grid_on_point(x, y)
-
-        # West cell:
-        y = yy
-        x = xx - cell_size
-        w_grid = self.gutils.grid_on_point(x, y)
-
-        # NorthWest cell:
-        y = yy + cell_size
-        x = xx - cell_size
-        nw_grid = self.gutils.grid_on_point(x, y) 
-         
-        return  n_grid, ne_grid, e_grid, se_grid, s_grid, sw_grid, w_grid, nw_grid
-
     def define_outflow_types(self):
         self.outflow_types = {
             0: {"name": "No outflow", "wids": [], "data_label": "", "tab_head": None},
@@ -650,10 +650,9 @@ class IndividualLeveesDialog(qtBaseClass, uiDialog_individual_levees):
         
         global cellIDNumpyArray
         global cellElevNumpyArray
-        if cellIDNumpyArray is None:
-            cellIDNumpyArray, xvalsNumpyArray, yvalsNumpyArray = buildCellIDNPArray(self.gutils)
-        if cellElevNumpyArray is None:
-            cellElevNumpyArray = buildCellElevNPArray(self.gutils, cellIDNumpyArray)
+        # The arrays come from the project grid index, so they are rebuilt only if 'grid' table was modified.
+        cellIDNumpyArray, xvalsNumpyArray, yvalsNumpyArray = buildCellIDNPArray(self.gutils)
+        cellElevNumpyArray = buildCellElevNPArray(self.gutils, cellIDNumpyArray)
 
         # Allow only integers:
         validator = QIntValidator()
@@ -8,6 +8,7 @@
 # of the License, or (at your option) any later version
 
 import os, time
+import numpy as np
 from qgis.core import *
 from qgis.PyQt.QtCore import Qt, QSettings, QVariant, QModelIndex
 from qgis.core import QgsFeature, QgsGeometry, QgsPointXY
@@ -33,12 +34,13 @@ from ..geopackage_utils import GeoPackageUtils
 from ..user_communication import UserCommunication
 from ..gui.dlg_sampling_elev import SamplingElevDialog
 from ..gui.dlg_sampling_buildings_elevations import SamplingBuildingsElevationsDialog
-from ..flo2d_tools.grid_tools import grid_has_empty_elev, get_adjacent_cell_elevation
+from ..flo2d_tools.grid_tools import grid_has_empty_elev, adjacent_cells_elevations_np
+from ..flo2d_tools.grid_index import project_grid_index
+from ..flo2d_tools.conflicts import Conflicts
+from ..flo2d_tools.debug_issues import DebugIssues, ISSUES_TABLE, read_debug_file
 from qgis.PyQt.QtGui import QColor
 
 
-# from ..flo2d_tools.conflicts import Conflicts
-
 uiDialog, qtBaseClass = load_ui("errors_2")
 
 
@@ -132,8 +134,7 @@ class IssuesFromDEBUGDialog(qtBaseClass, uiDialog):
         self.gutils = None
         self.ext = self.iface.mapCanvas().extent()
         self.n_grid_issues = 1000
-        self.errors = []
-        self.cells = []
+        self.issues = None
         self.currentCell = None
         self.debug_directory = ""
         set_icon(self.find_cell_btn, "eye-svgrepo-com.svg")
@@ -145,6 +146,7 @@ class IssuesFromDEBUGDialog(qtBaseClass, uiDialog):
         self.next_grid_issues_lbl.setText("Next " + str(self.n_grid_issues))
 
         self.setup_connection()
+        self.issues = DebugIssues(self.gutils)
         self.issues_codes_cbo.activated.connect(self.codes_cbo_activated)
         self.errors_cbo.activated.connect(self.errors_cbo_activated)
         self.elements_cbo.activated.connect(self.elements_cbo_activated)
@@ -222,8 +224,6 @@ class IssuesFromDEBUGDialog(qtBaseClass, uiDialog):
             else:
                 QApplication.setOverrideCursor(Qt.WaitCursor)
                 qApp.processEvents()
-                features = []
-                grid = self.lyrs.data["grid"]["qlyr"]
                 s.setValue("FLO-2D/lastDEBUGDir", debug_file)
                 self.debug_directory = os.path.dirname(debug_file)
 
@@ -233,48 +233,32 @@ class IssuesFromDEBUGDialog(qtBaseClass, uiDialog):
                 self.errors_cbo.clear()
                 self.errors_cbo.addItem(" ")
 
-                seen = set(self.cells)
-                with open(debug_file, "r") as f1:
-                    for line in f1:
-                        row = line.split(",")
-                        if len(row) >= 3:
-                            cell = row[0].strip()
-                            iCell = int(cell)
-                            if iCell <= 0:
-                                iCell = 1
-                                cell = "1"
-                            if len(grid) >= iCell and iCell > 0:
-
-                                description = ", ".join(row[2:]).strip()
-                                self.errors.append([cell, row[1].strip(), description])
-                                #                                 self.errors.append([cell, row[1].strip(), row[2].strip()])
-                                # Create points for issues layer:
-                                if cell not in seen:
-                                    seen.add(cell)
-                                    self.cells.append(iCell)
-                                    feat = next(grid.getFeatures(QgsFeatureRequest(iCell)))
-                                    x, y = feat.geometry().centroid().asPoint()
-                                    features.append([x, y, iCell, description])  # x, y, cell, description
-                #                                     features.append( [x, y, iCell, row[2].strip()] ) # x, y, cell, description
-
-                shapefile = self.debug_directory + "/DEBUG.shp"
-                name = "DEBUG"
-                fields = [["cell", "I"], ["description", "S"]]
-                if self.create_points_shapefile(shapefile, name, fields, features):
-                    vlayer = self.iface.addVectorLayer(shapefile, "", "ogr")
-
-                self.cells.sort()
-                for cell in self.cells:
+                cells, codes, descriptions, skipped = read_debug_file(debug_file)
+                if skipped:
+                    self.uc.log_info(
+                        "WARNING 181026.1012: {} lines with invalid cell or code were skipped in {}.".format(
+                            skipped, debug_file
+                        )
+                    )
+                # Issues in cells missing in the grid are skipped.
+                self.issues.clear()
+                if len(cells) > 0:
+                    self.issues.insert(cells, codes, descriptions, os.path.basename(debug_file))
+
+                cells = self.issues.cells()
+                for cell in cells:
                     self.elements_cbo.addItem(str(cell))
 
-                if self.errors:
+                n_issues = self.issues.count()
+                if n_issues:
+                    self.load_issues_layer("DEBUG")
                     QApplication.restoreOverrideCursor()
                     self.setWindowTitle(
-                        str(len(self.errors))
+                        str(n_issues)
                         + " Errors and Warnings in "
                         + os.path.basename(debug_file)
                         + " for "
-                        + str(len(self.cells))
+                        + str(len(cells))
                         + " cells"
                     )
                     return True
@@ -313,20 +297,14 @@ class IssuesFromDEBUGDialog(qtBaseClass, uiDialog):
                             QApplication.setOverrideCursor(Qt.WaitCursor)
                             qApp.processEvents()
                             features = []
+                            descriptions = []
                             with open(file, "r") as f:
                                 for _ in range(4):
                                     next(f)
                                 for row in f:
                                     values = row.split()
                                     if values:
-                                        self.errors.append(
-                                            [
-                                                values[0],
-                                                "9001",
-                                                "DEPRESSED_ELEMENTS.OUT : Depressed Element by " + values[3],
-                                            ]
-                                        )
-
+                                        descriptions.append("DEPRESSED_ELEMENTS.OUT : Depressed Element by " + values[3])
                                         features.append(
                                             [values[1], values[2], values[0], values[3]]
                                         )  # x, y, cell, elev
@@ -337,6 +315,7 @@ class IssuesFromDEBUGDialog(qtBaseClass, uiDialog):
 
                         finally:
                             if features:
+                                self.insert_file_issues(features, 9001, descriptions, file)
                                 shapefile = self.debug_directory + "/Depressed Elements.shp"
                                 name = "Depressed Elements"
                                 fields = [["cell", "I"], ["min_elev", "D"]]
@@ -360,16 +339,14 @@ class IssuesFromDEBUGDialog(qtBaseClass, uiDialog):
                             QApplication.setOverrideCursor(Qt.WaitCursor)
                             qApp.processEvents()
                             features = []
+                            descriptions = []
                             with open(file, "r") as f:
                                 for _ in range(6):
                                     next(f)
                                 for row in f:
                                     values = row.split()
                                     if values:
-                                        self.errors.append(
-                                            [values[0], "9002", "CHANBANKEL.CHK : Bank - Floodplain = " + values[5]]
-                                        )
-
+                                        descriptions.append("CHANBANKEL.CHK : Bank - Floodplain = " + values[5])
                                         features.append(
                                             [
                                                 values[1],
@@ -389,6 +366,7 @@ class IssuesFromDEBUGDialog(qtBaseClass, uiDialog):
 
                         finally:
                             if features:
+                                self.insert_file_issues(features, 9002, descriptions, file)
                                 shapefile = self.debug_directory + "/Channel Bank Elev Differences.shp"
                                 name = "Channel Bank Elev Differences"
                                 fields = [
@@ -417,8 +395,9 @@ class IssuesFromDEBUGDialog(qtBaseClass, uiDialog):
                         try:
                             QApplication.setOverrideCursor(Qt.WaitCursor)
                             qApp.processEvents()
-                            grid = self.lyrs.data["grid"]["qlyr"]
+                            index = project_grid_index(self.gutils)
                             features = []
+                            descriptions = []
                             with open(file, "r") as f:
                                 for _ in range(1):
                                     next(f)
@@ -426,12 +405,8 @@ class IssuesFromDEBUGDialog(qtBaseClass, uiDialog):
                                     values = row.split()
                                     if values:
                                         if values[0] != "GRID":
-                                            self.errors.append(
-                                                [values[0], "9003", "FPRIMELEV.OUT : Floodplain - Rim = " + values[3]]
-                                            )
-                                            cell = int(values[0])
-                                            feat = next(grid.getFeatures(QgsFeatureRequest(cell)))
-                                            x, y = feat.geometry().centroid().asPoint()
+                                            descriptions.append("FPRIMELEV.OUT : Floodplain - Rim = " + values[3])
+                                            x, y = index.center(int(values[0]))
 
                                             features.append(
                                                 [x, y, values[0], values[1], values[2], values[3], values[4]]
@@ -444,6 +419,7 @@ class IssuesFromDEBUGDialog(qtBaseClass, uiDialog):
 
                         finally:
                             if features:
+                                self.insert_file_issues(features, 9003, descriptions, file)
                                 shapefile = self.debug_directory + "/Flooplain Rim Differences.shp"
                                 name = "Flooplain Rim Differences"
                                 fields = [
@@ -457,13 +433,39 @@ class IssuesFromDEBUGDialog(qtBaseClass, uiDialog):
                                     vlayer = self.iface.addVectorLayer(shapefile, "", "ogr")
                                 QApplication.restoreOverrideCursor()
 
+    def insert_file_issues(self, features, code, descriptions, file):
+        """
+        Writing issues of diagnostics file features [x, y, cell, ...] into the issues table.
+        """
+        xs = [f[0] for f in features]
+        ys = [f[1] for f in features]
+        cells = [f[2] for f in features]
+        self.issues.insert(cells, code, descriptions, os.path.basename(file), xs, ys)
+
+    def load_issues_layer(self, name):
+        lyr = QgsProject.instance().mapLayersByName(name)
+        if lyr:
+            QgsProject.instance().removeMapLayers([lyr[0].id()])
+        uri = "{}|layername={}".format(self.gutils.get_gpkg_path(), ISSUES_TABLE)
+        self.iface.addVectorLayer(uri, name, "ogr")
+
+    def show_issues(self, issues):
+        """
+        Filling description table with (cell, code, description) rows.
+        """
+        self.description_tblw.setRowCount(len(issues))
+        for row, (cell, code, description) in enumerate(issues):
+            for column, value in ((0, str(cell)), (1, str(code)), (2, description)):
+                itm = QTableWidgetItem()
+                itm.setData(Qt.EditRole, value)
+                self.description_tblw.setItem(row, column, itm)
+
     def populate_elements_cbo(self):
 
         self.elements_cbo.clear()
         self.elements_cbo.addItem(" ")
-        for x in self.errors:
-            if self.elements_cbo.findText(x[0].strip()) == -1:
-                self.elements_cbo.addItem(x[0].strip())
+        for cell in self.issues.cells():
+            self.elements_cbo.addItem(str(cell))
 
     #         self.elements_cbo.model().sort(0)
 
@@ -473,14 +475,7 @@ class IssuesFromDEBUGDialog(qtBaseClass, uiDialog):
     def populate_errors_cbo(self):
         #         QApplication.setOverrideCursor(Qt.WaitCursor)
 
-        singleErrors = []
-        for x in self.errors:
-            err = int(x[1].strip())
-            if err not in singleErrors:
-                singleErrors.append(err)
-
-        singleErrors.sort()
-        for error in singleErrors:
+        for error in self.issues.codes():
             self.errors_cbo.addItem(str(error))
 
     #         self.errors_cbo.clear()
@@ -532,44 +527,10 @@ class IssuesFromDEBUGDialog(qtBaseClass, uiDialog):
                 second = codes[1]
 
             if first.isdigit():
-                for item in self.errors:
-                    if second == "" and int(item[1]) == int(first):
-                        rowPosition = self.description_tblw.rowCount()
-                        self.description_tblw.insertRow(rowPosition)
-                        itm = QTableWidgetItem()
-                        itm.setData(Qt.EditRole, item[0].strip())
-                        self.description_tblw.setItem(rowPosition, 0, itm)
-                        itm = QTableWidgetItem()
-                        itm.setData(Qt.EditRole, item[1].strip())
-                        self.description_tblw.setItem(rowPosition, 1, itm)
-                        itm = QTableWidgetItem()
-                        itm.setData(Qt.EditRole, item[2])
-                        self.description_tblw.setItem(rowPosition, 2, itm)
-                    elif second != "" and int(item[1]) >= int(first) and int(item[1]) <= int(second):
-                        rowPosition = self.description_tblw.rowCount()
-                        self.description_tblw.insertRow(rowPosition)
-                        itm = QTableWidgetItem()
-                        itm.setData(Qt.EditRole, item[0].strip())
-                        self.description_tblw.setItem(rowPosition, 0, itm)
-                        itm = QTableWidgetItem()
-                        itm.setData(Qt.EditRole, item[1].strip())
-                        self.description_tblw.setItem(rowPosition, 1, itm)
-                        itm = QTableWidgetItem()
-                        itm.setData(Qt.EditRole, item[2])
-                        self.description_tblw.setItem(rowPosition, 2, itm)
+                last = int(second) if second != "" else None
+                self.show_issues(self.issues.issues(first_code=int(first), last_code=last))
             elif first == "All":
-                for item in self.errors:
-                    rowPosition = self.description_tblw.rowCount()
-                    self.description_tblw.insertRow(rowPosition)
-                    itm = QTableWidgetItem()
-                    itm.setData(Qt.EditRole, item[0].strip())
-                    self.description_tblw.setItem(rowPosition, 0, itm)
-                    itm = QTableWidgetItem()
-                    itm.setData(Qt.EditRole, item[1].strip())
-                    self.description_tblw.setItem(rowPosition, 1, itm)
-                    itm = QTableWidgetItem()
-                    itm.setData(Qt.EditRole, item[2])
-                    self.description_tblw.setItem(rowPosition, 2, itm)
+                self.show_issues(self.issues.issues())
 
             if self.description_tblw.rowCount() > 0:
 
@@ -593,19 +554,8 @@ class IssuesFromDEBUGDialog(qtBaseClass, uiDialog):
         nElems = self.elements_cbo.count()
         if nElems > 0:
             cell = self.elements_cbo.currentText().strip()
-            for item in self.errors:
-                if item[0].strip() == cell:
-                    rowPosition = self.description_tblw.rowCount()
-                    self.description_tblw.insertRow(rowPosition)
-                    itm = QTableWidgetItem()
-                    itm.setData(Qt.EditRole, item[0].strip())
-                    self.description_tblw.setItem(rowPosition, 0, itm)
-                    itm = QTableWidgetItem()
-                    itm.setData(Qt.EditRole, item[1].strip())
-                    self.description_tblw.setItem(rowPosition, 1, itm)
-                    itm = QTableWidgetItem()
-                    itm.setData(Qt.EditRole, item[2])
-                    self.description_tblw.setItem(rowPosition, 2, itm)
+            if cell.isdigit():
+                self.show_issues(self.issues.issues(cell=int(cell)))
 
             self.find_cell(cell)
             self.errors_cbo.setCurrentIndex(0)
@@ -615,19 +565,9 @@ class IssuesFromDEBUGDialog(qtBaseClass, uiDialog):
         self.description_tblw.setRowCount(0)
         nElems = self.errors_cbo.count()
         if nElems > 0:
-            for item in self.errors:
-                if item[1].strip() == self.errors_cbo.currentText().strip():
-                    rowPosition = self.description_tblw.rowCount()
-                    self.description_tblw.insertRow(rowPosition)
-                    itm = QTableWidgetItem()
-                    itm.setData(Qt.EditRole, item[0].strip())
-                    self.description_tblw.setItem(rowPosition, 0, itm)
-                    itm = QTableWidgetItem()
-                    itm.setData(Qt.EditRole, item[1].strip())
-                    self.description_tblw.setItem(rowPosition, 1, itm)
-                    itm = QTableWidgetItem()
-                    itm.setData(Qt.EditRole, item[2])
-                    self.description_tblw.setItem(rowPosition, 2, itm)
+            code = self.errors_cbo.currentText().strip()
+            if code.lstrip("-").isdigit():
+                self.show_issues(self.issues.issues(first_code=int(code)))
             self.elements_cbo.setCurrentIndex(0)
             self.issues_codes_cbo.setCurrentIndex(0)
 
@@ -898,678 +838,7 @@ class CurrentConflictsDialog(qtBaseClass, uiDialog):
             self.gutils = GeoPackageUtils(self.con, self.iface)
 
     def populate_issues(self):
-
-        # Inflow conflicts:
-
-        self.conflict4(
-            "Inflows", "inflow_cells", "grid_fid", "Inflows", "inflow_cells", "grid_fid", "2 or more inflows"
-        )
-
-        self.conflict4(
-            "Inflows",
-            "inflow_cells",
-            "grid_fid",
-            "Outflows",
-            "outflow_cells",
-            "grid_fid",
-            "Inflow and outflow in same cell",
-        )
-
-        self.conflict4(
-            "Inflows",
-            "inflow_cells",
-            "grid_fid",
-            "Reduction Factors",
-            "blocked_cells",
-            "grid_fid",
-            "Inflow and Reduction Factors in same cell (check partial ARF, full ARF, or WRF)",
-        )
-
-        self.conflict4(
-            "Inflows",
-            "inflow_cells",
-            "grid_fid",
-            "Hydr. Structures",
-            "struct",
-            "inflonod",
-            "Inflow and Hyd. Struct in-cell in same cell",
-        )
-
-        self.conflict4(
-            "Inflows",
-            "inflow_cells",
-            "grid_fid",
-            "Hydr. Structures",
-            "struct",
-            "outflonod",
-            "Inflow and Hyd. Struct out-cell in same cell",
-        )
-
-        self.conflict4(
-            "Inflows",
-            "inflow_cells",
-            "grid_fid",
-            "Channels (Left Bank)",
-            "chan_elems",
-            "fid",
-            "Inflow and Channel Left Bank in same cell",
-        )
-
-        self.conflict4(
-            "Inflows",
-            "inflow_cells",
-            "grid_fid",
-            "Channels (Right Bank)",
-            "chan_elems",
-            "rbankgrid",
-            "Inflow and Channel Right Bank in same cell",
-        )
-
-        self.conflict4(
-            "Inflows", "inflow_cells", "grid_fid", "Levees", "levee_data", "grid_fid", "Inflow and levee in same cell"
-        )
-
-        self.conflict4(
-            "Inflows",
-            "inflow_cells",
-            "grid_fid",
-            "Mult. Channels",
-            "mult_cells",
-            "grid_fid",
-            "Inflow and Multiple Channels in same cell",
-        )
-
-        self.conflict4(
-            "Inflows",
-            "inflow_cells",
-            "grid_fid",
-            "Storm Drain Inlets",
-            "swmmflo",
-            "swmm_jt",
-            "Inflow and Storm Drain Inlet in same cell",
-        )
-
-        self.conflict4(
-            "Inflows",
-            "inflow_cells",
-            "grid_fid",
-            "Storm Drain Outfalls",
-            "swmmoutf",
-            "grid_fid",
-            "Inflow and Storm Drain Outfall in same cell",
-        )
-
-        # Outflow conflicts:
-        self.conflict4(
-            "Outflows", "outflow_cells", "grid_fid", "Outflows", "outflow_cells", "grid_fid", "2 or more outflows"
-        )
-
-        self.conflict4(
-            "Outflows",
-            "outflow_cells",
-            "grid_fid",
-            "Reduction Factors",
-            "blocked_cells",
-            "grid_fid",
-            "Outflow and Reduction Factors in same cell (check partial ARF, full ARF, or WRF)",
-        )
-
-        self.conflict4(
-            "Outflows",
-            "outflow_cells",
-            "grid_fid",
-            "Hydr. Structures",
-            "struct",
-            "inflonod",
-            "Outflow and Hyd. Struct in-cell in same cell",
-        )
-
-        self.conflict4(
-            "Outflows",
-            "outflow_cells",
-            "grid_fid",
-            "Hydr. Structures",
-            "struct",
-            "outflonod",
-            "Outflow and Hyd. Struct out-cell in same cell",
-        )
-
-        self.conflict4(
-            "Outflows",
-            "outflow_cells",
-            "grid_fid",
-            "Channels (Left Bank)",
-            "chan_elems",
-            "fid",
-            "Outflow and Channel Left Bank in same cell",
-        )
-
-        self.conflict4(
-            "Outflows",
-            "outflow_cells",
-            "grid_fid",
-            "Channels (Right Bank)",
-            "chan_elems",
-            "rbankgrid",
-            "Outflow and Channel Right Bank in same cell",
-        )
-
-        self.conflict4(
-            "Outflows",
-            "outflow_cells",
-            "grid_fid",
-            "Levees",
-            "levee_data",
-            "grid_fid",
-            "Outflow and levee in same cell",
-        )
-
-        self.conflict4(
-            "Outflows",
-            "outflow_cells",
-            "grid_fid",
-            "Mult. Channels",
-            "mult_cells",
-            "grid_fid",
-            "Outflow and Multiple Channels in same cell",
-        )
-
-        self.conflict4(
-            "Outflows",
-            "outflow_cells",
-            "grid_fid",
-            "Storm Drain Inlets",
-            "swmmflo",
-            "swmm_jt",
-            "Outflow and Storm Drain Inlet in same cell",
-        )
-
-        self.conflict4(
-            "Outflows",
-            "outflow_cells",
-            "grid_fid",
-            "Storm Drain Outfalls",
-            "swmmoutf",
-            "grid_fid",
-            "Outflow and Storm Drain Outfall in same cell",
-        )
-
-        self.conflict4(
-            "Outflows",
-            "outflow_cells",
-            "grid_fid",
-            "Streets",
-            "street_seg",
-            "igridn",
-            "Outflow and Street in same cell",
-        )
-
-        # Reduction Factors conflicts:
-
-        self.conflict4(
-            "Reduction Factors",
-            "blocked_cells",
-            "grid_fid",
-            "Reduction Factors",
-            "blocked_cells",
-            "grid_fid",
-            "Duplicate Reduction Factors in same cell (check partial ARF, full ARF, or WRF)",
-        )
-
-        self.conflict4(
-            "Reduction Factors",
-            "blocked_cells",
-            "grid_fid",
-            "Hydr. Structures",
-            "struct",
-            "inflonod",
-            "Reduction Factors and Hyd. Struct in-cell in same cell (not recomended)",
-        )
-
-        self.conflict4(
-            "Reduction Factors",
-            "blocked_cells",
-            "grid_fid",
-            "Hydr. Structures",
-            "struct",
-            "outflonod",
-            "Reduction Factors and Hyd. Struc out-cell in same cell (not recomended)",
-        )
-
-        self.conflict4(
-            "Reduction Factors",
-            "blocked_cells",
-            "grid_fid",
-            "Channels (Left Bank)",
-            "chan_elems",
-            "fid",
-            "Reduction Factors and Channel Left Bank in same cell",
-        )
-
-        self.conflict4(
-            "Reduction Factors",
-            "blocked_cells",
-            "grid_fid",
-            "Channels (Right Bank)",
-            "chan_elems",
-            "rbankgrid",
-            "Reduction Factors and Channel Right Bank in same cell",
-        )
-
-        self.conflict4(
-            "Reduction Factors",
-            "blocked_cells",
-            "grid_fid",
-            "Levees",
-            "levee_data",
-            "grid_fid",
-            "Reduction Factors and Levees in same cell (not recomended)",
-        )
-
-        self.conflict4(
-            "Reduction Factors",
-            "blocked_cells",
-            "grid_fid",
-            "Mult. Channels",
-            "mult_cells",
-            "grid_fid",
-            "Reduction Factors and Multiple Channels in same cell (not recomended)",
-        )
-
-        self.conflict4(
-            "Reduction Factors",
-            "blocked_cells",
-            "grid_fid",
-            "Storm Drain Inlets",
-            "swmmflo",
-            "swmm_jt",
-            "Reduction Factors and Storm Drain Inlet in same cell (not recomended)",
-        )
-
-        self.conflict4(
-            "Reduction Factors",
-            "blocked_cells",
-            "grid_fid",
-            "Storm Drain Outfalls",
-            "swmmoutf",
-            "grid_fid",
-            "Reduction Factors and Storm Drain Outfall in same cell (not recomended)",
-        )
-
-        # Full ARF conflicts:
-        # Partial ARF conflicts:
-        # WRF conflicts:
-
-        # Hydraulic Structures conflicts:
-
-        self.conflict4(
-            "Hydr. Structures",
-            "struct",
-            "inflonod",
-            "Hydr. Structures",
-            "struct",
-            "inflonod",
-            "More than one Hyd. Struct in-cell in same element",
-        )
-
-        self.conflict4(
-            "Hydr. Structures",
-            "struct",
-            "outflonod",
-            "Hydr. Structures",
-            "struct",
-            "outflonod",
-            "More than one Hyd. Struc out-cell in same element",
-        )
-
-        self.conflict4(
-            "Hydr. Structures",
-            "struct",
-            "inflonod",
-            "Hydr. Structures",
-            "struct",
-            "outflonod",
-            "Hyd. Struct in-cell and Hyd. Struct out-cell in same element",
-        )
-
-        self.conflict4(
-            "Hydr. Structures",
-            "struct",
-            "inflonod",
-            "Channels (Right Bank)",
-            "chan_elems",
-            "rbankgrid",
-            "Hyd. Struc in-cell and Channel Right Bank in same cell",
-        )
-
-        self.conflict4(
-            "Hydr. Structures",
-            "struct",
-            "outflonod",
-            "Channels (Right Bank)",
-            "chan_elems",
-            "rbankgrid",
-            "Hyd. Struc out-cell and Channel Right Bank in same cell",
-        )
-
-        self.conflict4(
-            "Hydr. Structures",
-            "struct",
-            "inflonod",
-            "Levees",
-            "levee_data",
-            "grid_fid",
-            "Hyd. Struc in-cell and Levee in same element (not recomended)",
-        )
-
-        self.conflict4(
-            "Hydr. Structures",
-            "struct",
-            "outflonod",
-            "Levees",
-            "levee_data",
-            "grid_fid",
-            "Hyd. Struct out-cell and Levee in same element (not recomended)",
-        )
-
-        self.conflict4(
-            "Hydr. Structures",
-            "struct",
-            "inflonod",
-            "Mult. Channels",
-            "mult_cells",
-            "grid_fid",
-            "Hyd. Struc in-cell and Multiple Channel in same cell",
-        )
-
-        self.conflict4(
-            "Hydr. Structures",
-            "struct",
-            "outflonod",
-            "Mult. Channels",
-            "mult_cells",
-            "grid_fid",
-            "Hyd. Struct out-cell and Multiple Channel in same cell",
-        )
-
-        self.conflict4(
-            "Hydr. Structures",
-            "struct",
-            "inflonod",
-            "Storm Drain Inlets",
-            "swmmflo",
-            "swmm_jt",
-            "Hyd. Struc in-cell and Storm Drain Inlet in same cell",
-        )
-
-        self.conflict4(
-            "Hydr. Structures",
-            "struct",
-            "outflonod",
-            "Storm Drain Outfalls",
-            "swmmoutf",
-            "grid_fid",
-            "Hyd. Struct out-cell and Storm Drain Outlet in same cell (not recomended)",
-        )
-
-        self.conflict4(
-            "Hydr. Structures",
-            "struct",
-            "inflonod",
-            "Streets",
-            "street_seg",
-            "igridn",
-            "Hyd. Struc in-cell and Street in same cell",
-        )
-
-        self.conflict4(
-            "Hydr. Structures",
-            "struct",
-            "outflonod",
-            "Streets",
-            "street_seg",
-            "igridn",
-            "Hyd. Struct out-cell and Streett in same cell",
-        )
-
-        # Channels conflicts:
-
-        self.conflict4(
-            "Channels (Left Bank)",
-            "chan_elems",
-            "fid",
-            "Channels (Left Bank)",
-            "chan_elems",
-            "fid",
-            "2 or more Channel Left Banks in same cell",
-        )
-
-        self.conflict4(
-            "Channels (Left Bank)",
-            "chan_elems",
-            "fid",
-            "Channels (Right Bank)",
-            "chan_elems",
-            "rbankgrid",
-            "Channel Left Bank and Channel Right Bank in same cell",
-        )
-
-        # TODO: left bank and right bank are in same attribute, this is wrong!!
-        self.conflict4(
-            "Channels (Right Bank)",
-            "chan_elems",
-            "rbankgrid",
-            "Channels (Right Bank)",
-            "chan_elems",
-            "rbankgrid",
-            "2 or more Channel Right Banks in same cell",
-        )
-
-        self.conflict4(
-            "Channels (Left Bank)",
-            "chan_elems",
-            "fid",
-            "Levees",
-            "levee_data",
-            "grid_fid",
-            "Channel Left Bank and Levee in same cell",
-        )
-
-        self.conflict4(
-            "Channels (Right Bank)",
-            "chan_elems",
-            "rbankgrid",
-            "Levees",
-            "levee_data",
-            "grid_fid",
-            "Channel Right Bank and Levee in same cell",
-        )
-
-        self.conflict4(
-            "Channels (Left Bank)",
-            "chan_elems",
-            "fid",
-            "Mult. Channels",
-            "mult_cells",
-            "grid_fid",
-            "Channel Left Bank and Multiple Channel in same cell",
-        )
-
-        self.conflict4(
-            "Channels (Right Bank)",
-            "chan_elems",
-            "rbankgrid",
-            "Mult. Channels",
-            "mult_cells",
-            "grid_fid",
-            "Channel Right Bank and Multiple Channel same cell",
-        )
-
-        self.conflict4(
-            "Channels (Right Bank)",
-            "chan_elems",
-            "rbankgrid",
-            "Storm Drain Inlets",
-            "swmmflo",
-            "swmm_jt",
-            "Channel Right Bank and Storm Drain Inlet same cell",
-        )
-
-        self.conflict4(
-            "Channels (Right Bank)",
-            "chan_elems",
-            "rbankgrid",
-            "Storm Drain Outfalls",
-            "swmmoutf",
-            "grid_fid",
-            "Channel Right Bank and Storm Drain Outfall same cell",
-        )
-
-        self.conflict4(
-            "Channels (Left Bank)",
-            "chan_elems",
-            "fid",
-            "Streets",
-            "street_seg",
-            "igridn",
-            "Channel Left Bank and Street in same cell",
-        )
-
-        self.conflict4(
-            "Channels (Right Bank)",
-            "chan_elems",
-            "rbankgrid",
-            "Streets",
-            "street_seg",
-            "igridn",
-            "Channel Right Bank and Street in same cell",
-        )
-
-        # Right bank Channels conflicts:
-
-        # Levee conflicts:
-
-        self.conflict4(
-            "Levees",
-            "levee_data",
-            "grid_fid",
-            "Levees",
-            "levee_data",
-            "grid_fid",
-            "2 or more Levees in same cell (review)",
-        )
-
-        self.conflict4(
-            "Levees",
-            "levee_data",
-            "grid_fid",
-            "Mult. Channels",
-            "mult_cells",
-            "grid_fid",
-            "Levee and Multiple Channels in same cell",
-        )
-
-        self.conflict4(
-            "Levees",
-            "levee_data",
-            "grid_fid",
-            "Storm Drain Inlets",
-            "swmmflo",
-            "swmm_jt",
-            "Levee and Storm Drain Inlet in same cell",
-        )
-
-        self.conflict4(
-            "Levees",
-            "levee_data",
-            "grid_fid",
-            "Storm Drain Outfalls",
-            "swmmoutf",
-            "grid_fid",
-            "Levee and Storm Drain Outfall in same cell",
-        )
-
-        # Multiple Channels conflicts:
-
-        self.conflict4(
-            "Mult. Channels",
-            "mult_cells",
-            "grid_fid",
-            "Mult. Channels",
-            "mult_cells",
-            "grid_fid",
-            "2 or more Multiple Channels in same cell",
-        )
-
-        self.conflict4(
-            "Mult. Channels",
-            "mult_cells",
-            "grid_fid",
-            "Storm Drain Inlets",
-            "swmmflo",
-            "swmm_jt",
-            "Multiple Channels and Storm Drain Inlet in same cell",
-        )
-
-        self.conflict4(
-            "Mult. Channels",
-            "mult_cells",
-            "grid_fid",
-            "Storm Drain Outfalls",
-            "swmmoutf",
-            "grid_fid",
-            "Multiple Channels and Storm Drain Outfall in same cell",
-        )
-
-        self.conflict4(
-            "Mult. Channels",
-            "mult_cells",
-            "grid_fid",
-            "Streets",
-            "street_seg",
-            "igridn",
-            "Multiple Channels and Street in same cell",
-        )
-
-        # Storm Drain inlets conflicts:
-
-        self.conflict4(
-            "Storm Drain Inlets",
-            "swmmflo",
-            "swmm_jt",
-            "Storm Drain Inlets",
-            "swmmflo",
-            "swmm_jt",
-            "2 or more Storm Drain Inlets in same cell",
-        )
-
-        self.conflict4(
-            "Storm Drain Inlets",
-            "swmmflo",
-            "swmm_jt",
-            "Storm Drain Outfalls",
-            "swmmoutf",
-            "grid_fid",
-            "Storm Drain Inlet and Storm Drain Outfall in same cell",
-        )
-
-        # Storm Drain outfalls conflicts:
-
-        self.conflict4(
-            "Storm Drain Outfalls",
-            "swmmoutf",
-            "grid_fid",
-            "Storm Drain Outfalls",
-            "swmmoutf",
-            "grid_fid",
-            "2 or more Storm Drain Outfalls in same cell",
-        )
-
-        # Street conflicts:
-
-        self.conflict4(
-            "Streets", "street_seg", "igridn", "Streets", "street_seg", "igridn", "2 or more Streets in same cell"
-        )
+        self.errors.extend(Conflicts(self.gutils).errors(self.issue1, self.issue2))
 
         self.setWindowTitle("Errors and Warnings for: " + self.issue1 + " with " + self.issue2)
 
@@ -1582,11 +851,12 @@ class CurrentConflictsDialog(qtBaseClass, uiDialog):
         lastDir = s.value("FLO-2D/lastGdsDir", "")
         qApp.processEvents()
         features = []
+        index = project_grid_index(self.gutils)
         for e in self.errors:
-            if int(e[0]) > 1:
-                pnt = self.gutils.single_centroid(e[0])
-                pt = QgsGeometry().fromWkt(pnt).asPoint()
-                features.append([pt.x(), pt.y(), e[0], e[3]])
+            cell = int(e[0])
+            if index.has_cell(cell):
+                x, y = index.center(cell)
+                features.append([x, y, e[0], e[3]])
 
         shapefile = lastDir + "/Current Conflicts.shp"
         name = "Current Conflicts"
@@ -1809,325 +1079,6 @@ class CurrentConflictsDialog(qtBaseClass, uiDialog):
     def copy_to_clipboard(self):
         copy_tablewidget_selection(self.description_tblw)
 
-    def conflict(self, comp1, table1, cell_1, comp2, table2, cell_2, description):
-        cells1 = []
-        cells2 = []
-        repeated = []
-        sqr1 = "SELECT {0} FROM {1}".format(cell_1, table1)
-        sqr2 = "SELECT {0} FROM {1}".format(cell_2, table2)
-        rows1 = self.gutils.execute(sqr1).fetchall()
-        rows2 = self.gutils.execute(sqr2).fetchall()
-        if not rows1 or not rows2:
-            pass
-        else:
-            for row in rows1:
-                cells1.append(row)
-            for row in rows2:
-                cells2.append(row)
-            size1 = len(cells1)
-            size2 = len(cells2)
-
-            if comp1 == comp2:
-                for i in range(size1):
-                    k = i + 1
-                    for j in range(k, size1):
-                        if cells1[i][0] == cells1[j][0] and cells1[i][0] not in repeated:
-                            repeated.append(cells1[i][0])
-                            break
-            else:
-                for i in range(size1):
-                    for j in range(size2):
-                        if cells1[i][0] == cells2[j][0] and cells1[i][0] not in repeated:
-                            repeated.append(cells1[i][0])
-                            break
-        if repeated:
-            for r in repeated:
-                self.errors.append([str(r), comp1, comp2, description])
-
-    def conflict2(self, comp1, table1, cell_1, comp2, table2, cell_2, description):
-
-        repeated = []
-        rows1 = []
-        rows2 = []
-
-        sqr1 = "SELECT {0} FROM {1} ORDER BY {0} LIMIT {2}".format(cell_1, table1, self.numErrors.text())
-        sqr2 = "SELECT {0} FROM {1} ORDER BY {0} LIMIT {2}".format(cell_2, table2, self.numErrors.text())
-
-        rows1 = self.gutils.execute(sqr1).fetchall()
-        rows2 = self.gutils.execute(sqr2).fetchall()
-
-        size1 = len(rows1)
-        size2 = len(rows2)
-
-        if not rows1 or not rows2:
-            pass
-        else:
-            if comp1 == comp2:
-                for i in range(size1 - 2):
-                    if rows1[i][0] == rows1[i + 1][0]:
-                        if rows1[i][0] not in repeated:
-                            repeated.append(rows1[i][0])
-            else:
-                try:
-                    k = 0
-                    for i in range(size1):
-                        while True:
-                            if rows2[k][0] < rows1[i][0]:
-                                if k < size2 - 1:
-                                    k += 1
-                                    continue
-                                else:
-                                    k = 0
-                                    break
-                            elif rows2[k][0] > rows1[i][0]:
-                                break
-                            elif rows1[i][0] not in repeated:
-                                repeated.append(rows1[i][0])
-                            if k < size2 - 1:
-                                k += 1
-                            else:
-                                k = 0
-                                break
-
-                except ValueError:
-                    pass
-
-        if repeated:
-            for r in repeated:
-                self.errors.append([str(r), comp1, comp2, description])
-
-    def conflict3(self, comp1, rows1, comp2, rows2, description):
-
-        repeated = []
-
-        size1 = len(rows1)
-        size2 = len(rows2)
-
-        if not rows1 or not rows2:
-            return 0
-        else:
-            if comp1 == comp2:
-                for i in range(size1 - 2):
-                    if rows1[i][0] == rows1[i + 1][0]:
-                        if rows1[i][0] not in repeated:
-                            repeated.append(rows1[i][0])
-            else:
-                try:
-                    k = 0
-                    for i in range(size1):
-                        while True:
-                            if rows2[k][0] < rows1[i][0]:
-                                if k < size2 - 1:
-                                    k += 1
-                                    continue
-                                else:
-                                    k = 0
-                                    break
-                            elif rows2[k][0] > rows1[i][0]:
-                                break
-                            elif rows1[i][0] not in repeated:
-                                repeated.append(rows1[i][0])
-                            if k < size2 - 1:
-                                k += 1
-                            else:
-                                k = 0
-                                break
-
-                except ValueError:
-                    pass
-
-        if repeated:
-            for r in repeated:
-                self.errors.append([str(r), comp1, comp2, description])
-        return len(repeated)
-
-    def conflict4(self, comp1, table1, cell_1, comp2, table2, cell_2, description):
-
-        cond1 = self.issue1 == "All" and self.issue2 == "All"
-        cond2 = self.issue1 == "All" and self.issue2 == ""
-        cond3 = self.issue1 == "" and self.issue2 == "All"
-        cond4 = self.issue1 == "All" and (comp1 == self.issue2 or comp2 == self.issue2)
-        cond5 = self.issue2 == "All" and (comp1 == self.issue1 or comp2 == self.issue1)
-        cond6 = (comp1 == self.issue1 and comp2 in self.issue2) or (comp2 == self.issue1 and comp1 in self.issue2)
-
-        if cond1 or cond2 or cond3 or cond4 or cond5 or cond6:
-            repeated = []
-
-            if table1 == table2 and cell_1 == cell_2:
-                sql = """SELECT {0}, COUNT(*) 
-                        FROM {1} 
-                        GROUP BY {0}
-                        HAVING COUNT(*) > 1 ORDER BY {0}
-                    """.format(
-                    cell_1, table1
-                )
-
-            else:
-                sql = """SELECT {0} FROM {1} 
-                WHERE {0} IN 
-                (
-                    SELECT {0}
-                    FROM {1}
-                    INTERSECT
-                    SELECT {2}
-                    FROM {3}
-                ) ORDER BY {0}""".format(
-                    cell_1, table1, cell_2, table2
-                )
-
-            rows = self.gutils.execute(sql).fetchall()
-
-            if not rows:
-                pass
-            else:
-                size = len(rows)
-                for i in range(size):
-                    if rows[i][0] not in repeated:
-                        repeated.append(rows[i][0])
-            if repeated:
-                for r in repeated:
-                    self.errors.append([str(r), comp1, comp2, description])
-
-    def conflict_inflow_partialARF(self):
-        in_cells = []
-        ARF_cells = []
-        repeated = []
-        inf = "SELECT grid_fid FROM inflow_cells"
-        ARF = "SELECT grid_fid, arf FROM blocked_cells"
-        in_rows = self.gutils.execute(inf).fetchall()
-        ARF_rows = self.gutils.execute(ARF).fetchall()
-        if not in_rows or not ARF_rows:
-            return repeated
-        else:
-            for row in in_rows:
-                in_cells.append(row)
-            for row in ARF_rows:
-                ARF_cells.append(row)
-            in_size = len(in_cells)
-            ARF_size = len(ARF_cells)
-            for i in range(in_size):
-                for j in range(ARF_size):
-                    if (
-                        in_cells[i][0] == ARF_cells[j][0]
-                        and float(ARF_cells[j][1]) < 1.0
-                        and in_cells[i][0] not in repeated
-                    ):
-                        repeated.append(in_cells[i][0])
-                        break
-            return repeated
-
-    def conflict_outflow_partialARF(self):
-        out_cells = []
-        ARF_cells = []
-        repeated = []
-        outf = "SELECT grid_fid FROM outflow_cells"
-        ARF = "SELECT grid_fid, arf FROM blocked_cells"
-        out_rows = self.gutils.execute(outf).fetchall()
-        ARF_rows = self.gutils.execute(ARF).fetchall()
-        if not out_rows or not ARF_rows:
-            return repeated
-        else:
-            for row in out_rows:
-                out_cells.append(row)
-            for row in ARF_rows:
-                ARF_cells.append(row)
-            in_size = len(out_cells)
-            ARF_size = len(ARF_cells)
-            for i in range(in_size):
-                for j in range(ARF_size):
-                    if (
-                        out_cells[i][0] == ARF_cells[j][0]
-                        and float(ARF_cells[j][1]) < 1.0
-                        and out_cells[i][0] not in repeated
-                    ):
-                        repeated.append(out_cells[i][0])
-                        break
-            return repeated
-
-    def conflict_outfall_partialARF(self):
-        out_cells = []
-        ARF_cells = []
-        repeated = []
-        outf = "SELECT grid_fid FROM swmmoutf"
-        ARF = "SELECT grid_fid, arf FROM blocked_cells"
-        out_rows = self.gutils.execute(outf).fetchall()
-        ARF_rows = self.gutils.execute(ARF).fetchall()
-        if not out_rows or not ARF_rows:
-            return repeated
-        else:
-            for row in out_rows:
-                out_cells.append(row)
-            for row in ARF_rows:
-                ARF_cells.append(row)
-            in_size = len(out_cells)
-            ARF_size = len(ARF_cells)
-            for i in range(in_size):
-                for j in range(ARF_size):
-                    if (
-                        out_cells[i][0] == ARF_cells[j][0]
-                        and float(ARF_cells[j][1]) < 1.0
-                        and out_cells[i][0] not in repeated
-                    ):
-                        repeated.append(out_cells[i][0])
-                        break
-            return repeated
-
-    def conflict_inlet_partialARF(self):
-        out_cells = []
-        ARF_cells = []
-        repeated = []
-        outf = "SELECT swmm_jt FROM swmmflo"
-        ARF = "SELECT grid_fid, arf FROM blocked_cells"
-        out_rows = self.gutils.execute(outf).fetchall()
-        ARF_rows = self.gutils.execute(ARF).fetchall()
-        if not out_rows or not ARF_rows:
-            return repeated
-        else:
-            for row in out_rows:
-                out_cells.append(row)
-            for row in ARF_rows:
-                ARF_cells.append(row)
-            in_size = len(out_cells)
-            ARF_size = len(ARF_cells)
-            for i in range(in_size):
-                for j in range(ARF_size):
-                    if (
-                        out_cells[i][0] == ARF_cells[j][0]
-                        and float(ARF_cells[j][1]) < 1.0
-                        and out_cells[i][0] not in repeated
-                    ):
-                        repeated.append(out_cells[i][0])
-                        break
-            return repeated
-
-    def conflict_outflow_fullARF(self):
-        out_cells = []
-        ARF_cells = []
-        repeated = []
-        outf = "SELECT grid_fid FROM outflow_cells"
-        ARF = "SELECT grid_fid, arf FROM blocked_cells"
-        out_rows = self.gutils.execute(outf).fetchall()
-        ARF_rows = self.gutils.execute(ARF).fetchall()
-        if not out_rows or not ARF_rows:
-            return repeated
-        else:
-            for row in out_rows:
-                out_cells.append(row)
-            for row in ARF_rows:
-                ARF_cells.append(row)
-            in_size = len(out_cells)
-            ARF_size = len(ARF_cells)
-            for i in range(in_size):
-                for j in range(ARF_size):
-                    if (
-                        out_cells[i][0] == ARF_cells[j][0]
-                        and float(ARF_cells[j][1]) == 1.0
-                        and out_cells[i][0] not in repeated
-                    ):
-                        repeated.append(out_cells[i][0])
-                        break
-            return repeated
-
 
 uiDialog, qtBaseClass = load_ui("levee_crests")
 
@@ -2189,20 +1140,18 @@ class LeveeCrestsDialog(qtBaseClass, uiDialog):
         if not levees:
             pass
         else:
-            grid_lyr = self.lyrs.data["grid"]["qlyr"]
-            cellsize = float(self.gutils.get_cont_par("CELLSIZE"))
-
-            for i in range(len(levees)):
-                cell = levees[i][0]
-                dir = levees[i][1]
-                crest = levees[i][2]
+            cells = np.array([lev[0] for lev in levees], dtype=int)
+            dirs = np.array([lev[1] for lev in levees], dtype=int)
+            crests = np.array([lev[2] if lev[2] is not None else np.nan for lev in levees], dtype=float)
 
-                elev = self.gutils.grid_value(cell, "elevation")
+            elevs = project_grid_index(self.gutils).elevations_np(cells)
+            adj_cells, adj_elevs = adjacent_cells_elevations_np(self.gutils, cells, dirs)
+            conflicts = (adj_cells != -9999) & (adj_elevs != -9999) & ((crests < elevs) | (crests < adj_elevs))
 
-                adj_cell, adj_elev = get_adjacent_cell_elevation(self.gutils, grid_lyr, cell, dir, cellsize)
-                if adj_cell is not None and adj_elev != -999:
-                    if crest < elev or crest < adj_cell:
-                        self.levee_crests.append([str(i), cell, dir, crest, elev, adj_cell, adj_elev])
+            for i in np.nonzero(conflicts)[0]:
+                self.levee_crests.append(
+                    [str(i), int(cells[i]), int(dirs[i]), float(crests[i]), float(elevs[i]), int(adj_cells[i]), float(adj_elevs[i])]
+                )
 
         self.setWindowTitle("Levee Crests lower than cell elevations")
 
@@ -52,7 +52,6 @@ class SamplingPointElevDialog(qtBaseClass, uiDialog):
         self.max_radius_lab.setHidden(True)
         self.resampling_url_id = 0
         self.configure_gdal_sliders()
-        self.configure_dask_options()
         self.populate_alg_cbo()
 
         # Redirects gdal prints to GUI
@@ -67,8 +66,6 @@ class SamplingPointElevDialog(qtBaseClass, uiDialog):
         self.closeBtn.clicked.connect(lambda x: self.reject())
         self.thread_count_slider.valueChanged.connect(self.gdal_slider_changed)
         self.cache_slider.valueChanged.connect(self.gdal_slider_changed)
-        self.nproc_slider.valueChanged.connect(self.dask_options_changed)
-        self.nthread_slider.valueChanged.connect(self.dask_options_changed)
 
     def browse_src_file(self):
         """
@@ -95,7 +92,8 @@ class SamplingPointElevDialog(qtBaseClass, uiDialog):
         """
         for m in point_elev.GDALGRID_METHOD_DESC:
             self.algCbo.addItem(m)
-        self.algCbo.addItem('Average GDS') # additional method not using GDAL_Grid
+        for m in point_elev.GDS_STATISTICS:
+            self.algCbo.addItem(m) # additional methods not using GDAL_Grid
         self.algCbo.setCurrentIndex(0)
         self.resampling_method_changed(0) 
         self.default_resampling_options()   
@@ -129,41 +127,10 @@ class SamplingPointElevDialog(qtBaseClass, uiDialog):
         self.thread_count_slider.setToolTip(thread_count)
         self.cache_slider.setToolTip(cache_value)
 
-    def configure_dask_options(self):
-        from distributed.deploy.utils import nprocesses_nthreads
-        max_procs, thread_per_proc = nprocesses_nthreads() 
-
-        self.nproc_slider.setRange(1,max_procs)
-        self.nproc_slider.setSingleStep(1)
-        self.nproc_slider.setPageStep(1)
-        self.nproc_slider.setTickInterval(1)
-        self.nproc_slider.setValue(max_procs)
-
-        self.nthread_slider.setRange(1,5)
-        self.nthread_slider.setSingleStep(1)
-        self.nthread_slider.setPageStep(1)
-        self.nthread_slider.setTickInterval(1)
-        if max_procs == 1:
-            self.nthread_slider.setValue(thread_per_proc)
-        else:    
-            self.nthread_slider.setValue(1)
-
-    def dask_options_changed(self,value=None):
-        nproc = '{0:d} '.format(self.nproc_slider.value()) 
-        nthread = '{0:d}'.format(self.nthread_slider.value()) 
-        self.log_message('Processes count = %s'%nproc)
-        self.log_message('Threads per process = %s'%nthread)
-        self.nproc_slider.setToolTip(nproc)
-        self.nthread_slider.setToolTip(nthread)
-        self.log_message('Maximum memory limit option is not implemented')
-    
     def compute_options_visibility(self):
-        if self.algCbo.currentText() == 'Average GDS':
-            self.dask_gbox.setHidden(False)
+        if self.algCbo.currentText() in point_elev.GDS_STATISTICS:
             self.gdal_gbox.setHidden(True)
-            self.dask_options_changed()    
         else:    
-            self.dask_gbox.setHidden(True)
             self.gdal_gbox.setHidden(False)
             self.gdal_slider_changed()
 
@@ -183,7 +150,7 @@ class SamplingPointElevDialog(qtBaseClass, uiDialog):
         for param in point_elev.GDALGRID_METHOD_PARAMS:
             _param =  param.replace(' ','_')
             widget = getattr(self,_param)
-            if method == 'Average GDS':
+            if method in point_elev.GDS_STATISTICS:
                 if param == 'nodata':
                     widget.setEnabled(True)
                 else:    
@@ -272,8 +239,8 @@ class SamplingPointElevDialog(qtBaseClass, uiDialog):
             profile = self.get_raster_info()
             src_point_file = src_file
 
-            if src_file.endswith('.tif') and self.algCbo.currentText() == 'Average GDS':
-                self.log_message('The data source must be CSV for Average GDS method')
+            if src_file.endswith('.tif') and self.algCbo.currentText() in point_elev.GDS_STATISTICS:
+                self.log_message('The data source must be CSV for %s method'%self.algCbo.currentText())
                 return
 
             # GDAL_Grid applied for following
@@ -295,15 +262,8 @@ class SamplingPointElevDialog(qtBaseClass, uiDialog):
                                          False,
                                          remove_nodata = self.fillNoDataChBox.isChecked())
             # Process the XYZ point file
-            if self.algCbo.currentText() == 'Average GDS':
-                # GDS Average Approach
-                self.log_message('Dashboard address: http://127.0.0.1:8787/status')
-                self.log_message('Different port number may be used if port 8787 is busy')
-                nproc = self.nproc_slider.value()
-                nthread = self.nthread_slider.value()
-                open_dashboard = False
-                if self.dashboard_cbox.isChecked():
-                    open_dashboard = True
+            if self.algCbo.currentText() in point_elev.GDS_STATISTICS:
+                # GDS in-process gridding
                 nodata = None
                 if self.fillNoDataChBox.isChecked():
                     nodata = profile['nodata']    
@@ -311,10 +271,8 @@ class SamplingPointElevDialog(qtBaseClass, uiDialog):
                                                                       extents = profile['extents'],
                                                                       shape = profile['shape'],
                                                                       srs = profile['srs'],
-                                                                      open_dashboard = open_dashboard,
-                                                                      procs = nproc,
-                                                                      threads = nthread,
-                                                                      nodata = nodata
+                                                                      nodata = nodata,
+                                                                      statistic = point_elev.GDS_STATISTICS[self.algCbo.currentText()]
                                                                       )
                 if raster_outpath is None:
                     self.log_message('failed')
@@ -343,8 +301,7 @@ class SamplingPointElevDialog(qtBaseClass, uiDialog):
             # print ("Writing elevs to geopackage")
 
             qry = "UPDATE grid SET elevation=? WHERE fid=?;"
-            self.con.executemany(qry, sampler)
-            self.con.commit()
+            self.gutils.execute_many(qry, sampler)
             
             # print ("Done Writing elevs to geopackage")
             qryIndex = """DROP INDEX if exists grid_FIDTemp;"""
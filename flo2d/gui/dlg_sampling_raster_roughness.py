@@ -9,13 +9,14 @@
 # of the License, or (at your option) any later version
 
 import os
-from subprocess import Popen, PIPE, STDOUT
 
 from qgis.PyQt.QtCore import QSettings
 from qgis.PyQt.QtWidgets import QFileDialog
 from qgis.core import QgsRasterLayer
 
-from ..flo2d_tools.grid_tools import raster2grid, grid_has_empty_n_value
+from ..flo2d_tools.grid_tools import grid_has_empty_n_value
+from ..flo2d_tools.raster_cache import cached_raster2grid
+from ..flo2d_tools.raster_sampling import WarpSettings
 from .ui_utils import load_ui
 from ..geopackage_utils import GeoPackageUtils
 from ..user_communication import UserCommunication
@@ -140,72 +141,24 @@ class SamplingRoughnessDialog(qtBaseClass, uiDialog):
         Resample raster to be aligned with the grid, then probe values and update elements n_value attr.
         """
         self.src_raster = self.srcRasterCbo.itemData(self.srcRasterCbo.currentIndex())
-        self.out_raster = "{}_interp_n.tif".format(self.src_raster[:-4])  # Raster name with suffix '_interp_n.tif'
-        try:
-            if os.path.isfile(self.out_raster):
-                os.remove(self.out_raster)
-        except OSError:
-            msg = "WARNING 060319.1651: Couldn't remove existing raster:\n{}\nChoose another filename.".format(
-                self.out_raster
-            )
-            self.uc.show_warn(msg)
-            return False
         self.get_worp_opts_data()
-        opts = [
-            "-of GTiff",
-            "-ot {}".format(self.RTYPE[self.raster_type]),
-            "-tr {0} {0}".format(self.cell_size),
-            '-s_srs "{}"'.format(self.src_srs),
-            '-t_srs "{}"'.format(self.out_srs),
-            "-te {}".format(" ".join([str(c) for c in self.output_bounds])),
-            '-te_srs "{}"'.format(self.out_srs),
-            "-ovr {}".format(self.ovrCbo.itemData(self.ovrCbo.currentIndex())),
-            "-dstnodata {}".format(self.src_nodata),
-            "-r {}".format(self.algCbo.itemData(self.algCbo.currentIndex())),
-            "-co COMPRESS=LZW",
-            "-wo OPTIMIZE_SIZE=TRUE",
-        ]
-        if self.multiThreadChBox.isChecked():
-            opts.append("-multi -wo NUM_THREADS=ALL_CPUS")
-        else:
-            pass
-        cmd = 'gdalwarp {} "{}" "{}"'.format(" ".join([opt for opt in opts]), self.src_raster, self.out_raster)
-        print(cmd)
-        proc = Popen(cmd, shell=True, stdin=open(os.devnull), stdout=PIPE, stderr=STDOUT, universal_newlines=True)
-        out = proc.communicate()
-        for line in out:
-            self.uc.log_info(line)
-        # Fill NODATA raster cells if desired
-        if self.fillNoDataChBox.isChecked():
-            self.fill_nodata()
-        else:
-            pass
-        sampler = raster2grid(self.grid, self.out_raster)
-        
-        # qryIndex = """CREATE INDEX if not exists grid_FIDTemp ON grid (fid);"""
-        # self.con.execute(qryIndex)
-        # self.con.commit()
-        #
-        # print ("Writing n values to geopackage")
-        
+        settings = WarpSettings(
+            self.src_raster,
+            self.cell_size,
+            src_srs=self.src_srs,
+            dst_srs=self.out_srs,
+            resample_alg=self.algCbo.itemData(self.algCbo.currentIndex()),
+            nodata=self.src_nodata,
+            output_type=self.RTYPE[self.raster_type],
+            overview=self.ovrCbo.itemData(self.ovrCbo.currentIndex()),
+            fill_distance=self.radiusSBox.value() if self.fillNoDataChBox.isChecked() else None,
+        )
+        workers = None if self.multiThreadChBox.isChecked() else 1
+        # Grid aligned raster is warped tile by tile once and reused from the project raster cache.
         qry = "UPDATE grid SET n_value=? WHERE fid=?;"
-        self.con.executemany(qry, sampler)
-        self.con.commit()
-        
-        # print ("Done Writing n values to geopackage")
-        # qryIndex = """DROP INDEX if exists grid_FIDTemp;"""
-        # self.con.execute(qryIndex)
-        # self.con.commit()        
-        
-        return True
+        self.gutils.execute_many(qry, cached_raster2grid(self.gutils, settings, workers=workers))
 
-    def fill_nodata(self):
-        opts = ["-md {}".format(self.radiusSBox.value())]
-        cmd = 'gdal_fillnodata {} "{}"'.format(" ".join([opt for opt in opts]), self.out_raster)
-        proc = Popen(cmd, shell=True, stdin=open(os.devnull), stdout=PIPE, stderr=STDOUT, universal_newlines=True)
-        out = proc.communicate()
-        for line in out:
-            self.uc.log_info(line)
+        return True
 
     def show_probing_result_info(self):
         null_nr = grid_has_empty_n_value(self.gutils)
@@ -13,6 +13,7 @@ import os
 import stat
 import time
 import traceback
+import numpy as np
 
 from qgis.core import (
         QgsWkbTypes, 
@@ -59,6 +60,8 @@ from ..flo2d_tools.grid_tools import (
         cell_elevation,
         ZonalStatistics
     )
+from ..flo2d_tools.grid_index import project_grid_index
+from ..flo2d_tools.lidar_tools import GridBinner, bin_lidar_files
 from pickle import TRUE
 # from flo2d.__init__ import classFactory
 # from ..flo2d import xxx
@@ -140,127 +143,46 @@ class SamplingXYZDialog(qtBaseClass, uiDialog):
             read_error = "Error reading files:\n\n"
             outside_grid, inside_grid = 0, 0
    
-            gid_indx = {}
-            cells = self.gutils.execute("SELECT fid, col, row FROM grid").fetchall()
-            for cell in cells:
-                    gid_indx[cell[1], cell[2]] = [cell[0], 0.0, 0]
+            index = project_grid_index(self.gutils)
+            binner = GridBinner.from_index(index)
+            fids = index.fids()
 
             start_time = time.time()
 
-            statBar = self.iface.mainWindow().statusBar()
-            statusLabel = QLabel()
-            statBar.addWidget(statusLabel,5)   
-            advanceBar = QProgressBar()
-            advanceBar.setStyleSheet("QProgressBar::chunk { background-color: lightskyblue}")
-            advanceBar.setAlignment(Qt.AlignCenter | Qt.AlignVCenter) 
-            advanceBar.setMinimum(0)
-            statBar.addWidget(advanceBar,2) 
-
-            size = 0
-            lines = 0
-            for file in lidar_files: 
-                file_size = os.path.getsize(file)
-                with open(file, "r") as f:
-                    line = f.readline()
-                    
-                    line_size = len(line) + 1
-                size += file_size / line_size
+            progress = self.uc.progress_bar2("Binning " + str(len(lidar_files)) + " LIDAR files...", 0, len(lidar_files), 0)
+            done = []
 
-            progress = self.uc.progress_bar2("Reading " + "{:,}".format(int(size)) + " lines from " + str(len(lidar_files)) + " files...", 0, len(lidar_files), 0)
-            step = 50000   
-            for i, file in enumerate(lidar_files,1):
-            
-                progress.setValue(i)
-                n_commas =  0
-                n_spaces = 0             
- 
-                # See if comma or space delimited:
-                with open(file, "r") as f:
-                    while True:    
-                        line = f.readline()
-                        line = line.replace('\t', '') 
-                        if line.strip() != "": 
-                            n_commas = line.count(",")
-                            if n_commas == 0:
-                                n_spaces = len(line.split())
-                            break
+            def file_binned(file, error):
+                done.append(file)
+                progress.setValue(len(done))
+                qApp.processEvents()
 
-                if n_commas != 0 or n_spaces != 0:
-                    # Read file: 
-                    with open(file, "r") as f1:
-                        try:
-                            lines = f1.readlines()
-                            n_lines = len(lines)     
-                            statusLabel.setText('Reading  ' +  "{:,}".format(n_lines) + '  lines from ' +  '<FONT COLOR=blue>' + os.path.basename(file) + '</FONT>')     
-                            advanceBar.setMaximum(n_lines)
-                            
-                            step = int(n_lines/ 20)
+            stats, errors = bin_lidar_files(binner, lidar_files, callback=file_binned)
+            for file, error in errors:
+                read_error += os.path.basename(file) + " at " + error + "\n\n"
+            inside_grid, outside_grid = stats.inside, stats.outside
 
-                            if n_lines > step:
-                                advanceBar.setValue(int(step/2)) 
-                                # self.iface.mainWindow().repaint()   
-                                       
-                            for i, line in enumerate(lines, 1): 
-                            
-                                if (int(i%step) == 0):                            
-                                    advanceBar.setValue(i) 
-                                    qApp.processEvents()
-                                
-                                line = line.replace('\t', '')                            
-                                if n_commas == 0: # No commas, values separated by spaces.
-                                    values = line.split()   
-                                    n_values = len(values)
-                                    if n_values == 3:
-                                        xpp, ypp, zpp  = values
-                                    elif n_values == 4:
-                                        xpp, ypp, zpp, dummy  = values  
-                                    elif n_values == 5:
-                                        dummy1, xpp, ypp, zpp, dummy2  = values  
-                                    else:
-                                        break          
-                                elif n_commas == 2:  # 3 columns.
-                                    xpp, ypp, zpp  = line.split(",") 
-                                elif n_commas == 3:  # 4 columns.
-                                    xpp, ypp, zpp, dummy  = line.split(",") 
-                                elif n_commas == 4:  # 5 columns.
-                                    dummy1, xpp, ypp, zpp, dummy2  = line.split(",")  
-                                else:
-                                    break  
-                                                               
-                                col = int((float(xpp) - self.xMinimum)/self.cell_size) + 2
-                                row = int((float(ypp) - self.yMinimum)/self.cell_size) + 2                                    
-                                if (col, row) in gid_indx:
-                                    gid_indx[col, row][1] += float(zpp)
-                                    gid_indx[col, row][2] += 1
-                                    inside_grid += 1   
-                                else:
-                                    outside_grid += 1    
-                                    
-                        except ValueError:
-                            read_error += os.path.basename(file) + " at line " + str(i) + "\n\n" 
-
-            self.uc.clear_bar_messages()    
-            statBar.removeWidget(statusLabel)
-            statBar.removeWidget(advanceBar)    
-            qApp.processEvents()   
-            self.uc.bar_info("Updating grid elevations...")   
-                                                           
-            # Assign -9999 to all cell elevations prior to the assignment from LIDAR points: 
-            self.gutils.execute("UPDATE grid SET elevation = -9999;")
-            
-            # Update cell elevations from LIDAR points:
+            self.uc.clear_bar_messages()
+            qApp.processEvents()
+            self.uc.bar_info("Updating grid elevations...")
+
+            # Update cell elevations from LIDAR points, -9999 for cells without points:
             nope = []
-            cell_elev = [] 
-            
+            cell_elev = []
+
             if inside_grid > 0:
+                elevations = np.round(stats.mean()[fids], 4)
+                assigned = ~np.isnan(elevations)
+                cell_elev = list(zip(elevations[assigned].tolist(), fids[assigned].tolist()))
+                missing = fids[~assigned]
+                cols = index.cols[missing] + 2
+                rows = index.raster_rows - index.rows[missing] + 1
+                nope = list(zip(missing.tolist(), cols.tolist(), rows.tolist()))  # element, col, row
+                elevations[~assigned] = -9999
                 qry = "UPDATE grid SET elevation = ? WHERE fid = ?;"
-                for gi in gid_indx.items():
-                    if gi[1][2] != 0:
-                        elevation = round(gi[1][1]/gi[1][2],4)
-                        cell_elev.append((elevation, gi[1][0]))       
-                    else:
-                        nope.append((gi[1][0],gi[0][0], gi[0][1]))   # element, col, row
-                self.gutils.execute_many(qry, cell_elev)                                
+                self.gutils.execute_many(qry, zip(elevations.tolist(), fids.tolist()))
+            else:
+                self.gutils.execute("UPDATE grid SET elevation = -9999;")
 
             self.uc.clear_bar_messages()       
             QApplication.restoreOverrideCursor()    
@@ -462,9 +384,7 @@ class SamplingXYZDialog(qtBaseClass, uiDialog):
                         for this_cell in nope:
                             qry_values.append((value, this_cell[0]))
                          
-                        cur = self.gutils.con.cursor()    
-                        cur.executemany(update_qry, qry_values) 
-                        self.gutils.con.commit() 
+                        self.gutils.execute_many(update_qry, qry_values)
 
                         elevs = [x[0]  for x in self.gutils.execute("SELECT elevation FROM grid").fetchall()]
                         mini = min(elevs)
@@ -9,6 +9,7 @@
 # of the License, or (at your option) any later version
 import os
 import time
+import traceback
 from itertools import chain
 
 from qgis.PyQt.QtCore import Qt, QSettings
@@ -17,9 +18,16 @@ from qgis.core import QgsCoordinateReferenceSystem, QgsUnitTypes
 from qgis.gui import QgsProjectionSelectionWidget
 
 from ..flo2d_ie.flo2d_parser import ParseDAT
+from ..flo2d_ie.rainfall_io import RaincellStore
 from .ui_utils import load_ui
 from ..errors import Flo2dQueryResultNull
-from ..geopackage_utils import GeoPackageUtils, database_disconnect, database_connect, database_create
+from ..geopackage_utils import (
+    GeoPackageUtils,
+    database_backup,
+    database_disconnect,
+    database_connect,
+    database_create,
+)
 from ..user_communication import UserCommunication
 from ..utils import is_number
 
@@ -270,13 +278,14 @@ class SettingsDialog(qtBaseClass, uiDialog):
         self.gpkg_path = gpkg_path
         s.setValue("FLO-2D/lastGpkgDir", os.path.dirname(self.gpkg_path))
         start_time = time.time()
-        self.con = database_connect(self.gpkg_path)
+        self.con = database_connect(self.gpkg_path, wal=s.value("FLO-2D/wal_journal", False, type=bool))
         self.uc.log_info("Connected to {}".format(self.gpkg_path))
         self.uc.log_info("{0:.3f} seconds => connecting".format(time.time() - start_time))
         QApplication.setOverrideCursor(Qt.WaitCursor)
         self.gutils = GeoPackageUtils(self.con, self.iface)
         if self.gutils.check_gpkg():
             self.gutils.path = self.gpkg_path
+            self.migrate_gpkg()
             self.uc.bar_info("GeoPackage {} is OK".format(self.gutils.path))
             sql = """SELECT srs_id FROM gpkg_contents WHERE table_name='grid';"""
             rc = self.gutils.execute(sql)
@@ -292,6 +301,77 @@ class SettingsDialog(qtBaseClass, uiDialog):
         self.read()
         QApplication.restoreOverrideCursor()
 
+    def migrate_gpkg(self):
+        """
+        Upgrading GeoPackage created by older version of the plugin.
+        """
+        try:
+            applied = self.gutils.migrate()
+        except Exception as e:
+            QApplication.restoreOverrideCursor()
+            self.uc.log_info(traceback.format_exc())
+            self.uc.show_warn(
+                "WARNING 181026.0905: Upgrade of GeoPackage {} failed!\n\n".format(self.gpkg_path)
+                + "Some tools may be slower or unavailable. Please check if the file is not read-only."
+            )
+            QApplication.setOverrideCursor(Qt.WaitCursor)
+            return
+        if applied:
+            QApplication.restoreOverrideCursor()
+            self.uc.show_info(
+                "GeoPackage {} was upgraded to the current version of the plugin:\n\n".format(self.gpkg_path)
+                + "\n".join("* " + step for step in applied)
+            )
+            QApplication.setOverrideCursor(Qt.WaitCursor)
+        self.migrate_raincell()
+
+    def migrate_raincell(self):
+        """
+        Moving realtime rainfall of former plugin versions into compressed blocks, if the user agrees.
+        Former plugin versions don't see the moved rainfall, so backup copy of the GeoPackage is offered.
+        """
+        store = RaincellStore(self.gutils)
+        try:
+            if not store.has_legacy_data():
+                return
+        except Exception as e:
+            return
+        QApplication.restoreOverrideCursor()
+        try:
+            if not self.uc.question(
+                "GeoPackage {} contains realtime rainfall of former plugin version.\n\n".format(self.gpkg_path)
+                + "Do you want to convert it into compressed blocks? Realtime rainfall can't be shown or exported "
+                + "until it is converted, but former plugin versions won't see the converted realtime rainfall."
+            ):
+                return
+            if self.uc.question("Do you want to save a backup copy of the GeoPackage before the conversion?"):
+                backup_path, __ = QFileDialog.getSaveFileName(
+                    None,
+                    "Save backup copy of the GeoPackage as",
+                    directory=os.path.splitext(self.gpkg_path)[0] + "_backup.gpkg",
+                    filter="*.gpkg",
+                )
+                if not backup_path:
+                    return
+                database_backup(self.con, backup_path)
+                self.uc.log_info("Backup copy of {} saved to {}".format(self.gpkg_path, backup_path))
+            QApplication.setOverrideCursor(Qt.WaitCursor)
+            try:
+                with self.gutils.unit_of_work():
+                    store.migrate()
+            finally:
+                QApplication.restoreOverrideCursor()
+        except Exception as e:
+            self.uc.log_info(traceback.format_exc())
+            self.uc.show_warn(
+                "WARNING 181026.1415: Conversion of realtime rainfall of GeoPackage {} failed!\n\n".format(
+                    self.gpkg_path
+                )
+                + "Realtime rainfall was left in the former format."
+            )
+        finally:
+            QApplication.setOverrideCursor(Qt.WaitCursor)
+
     def set_other_global_defaults(self, con):
         qry = """INSERT INTO mult (wmc, wdrall, dmall, nodchansall, xnmultall, sslopemin, sslopemax, avuld50, simple_n) VALUES (?,?,?,?,?,?,?,?,?);"""
         con.execute(qry, ("0", "3", "1", "1", "0.04", "1", "0", "0", "0.04",),)
@@ -9,7 +9,7 @@
 # of the License, or (at your option) any later version
 
 
-from math import sqrt
+from math import sqrt, isnan
 from qgis.core import QgsFeatureRequest
 from qgis.PyQt.QtGui import QStandardItemModel, QStandardItem, QColor, QIntValidator
 from qgis.PyQt.QtWidgets import QApplication
@@ -19,6 +19,7 @@ from .ui_utils import load_ui, center_canvas, set_icon, zoom
 from ..utils import m_fdata, is_number, get_min_max_elevs, set_min_max_elevs, second_smallest
 from ..user_communication import UserCommunication
 from ..geopackage_utils import GeoPackageUtils
+from ..flo2d_ie.rainfall_io import RaincellStore
 from ..flo2d_tools.grid_tools import number_of_elements, render_grid_elevations2
 
 uiDialog, qtBaseClass = load_ui("grid_info_widget")
@@ -38,6 +39,7 @@ class GridInfoWidget(qtBaseClass, uiDialog):
         self.setupUi(self)
         self.setEnabled(True)
         self.gutils = None
+        self.raincell = None
         self.grid = None
         self.mann_default = None
         self.cell_Edit = None
@@ -154,9 +156,12 @@ class GridInfoWidget(qtBaseClass, uiDialog):
                   
     def plot_grid_rainfall(self, feat):
         si = "inches" if self.gutils.get_cont_par("METRIC") == "0" else "mm"
-        qry = "SELECT time_interval, iraindum FROM raincell_data WHERE rrgrid=? ORDER BY time_interval;"
         fid = feat["fid"]
-        rainfall = self.gutils.execute(qry, (fid,))
+        if self.raincell is None or self.raincell.gutils is not self.gutils:
+            # Store kept between plots, so decoded blocks are shared by neighbouring cells.
+            self.raincell = RaincellStore(self.gutils)
+        times, values = self.raincell.cell_series(fid)
+        rainfall = zip(times.tolist(), [None if isnan(v) else v for v in values.tolist()])
         self.create_plot()
         self.tview.setModel(self.data_model)
         self.data_model.clear()
@@ -479,7 +479,7 @@ class InfilEditorWidget(qtBaseClass, uiDialog):
             soil_lyr, land_lyr, fields, vcCheck = dlg.green_ampt_parameters()
             inf_calc = InfiltrationCalculator(self.grid_lyr, self.iface, self.gutils)
             inf_calc.setup_green_ampt(soil_lyr, land_lyr, vcCheck, *fields)
-            grid_params = inf_calc.green_ampt_infiltration()
+            grid_params = inf_calc.green_ampt_infiltration(dlg.green_ampt_workers())
 
             if grid_params:
 
@@ -849,9 +849,17 @@ class GreenAmptDialog(uiDialog_green, qtBaseClass_green):
         vcCheck = self.veg_cover_chBox.isChecked()
         return soil_lyr, land_lyr, fields, vcCheck
 
+    def green_ampt_workers(self):
+        """
+        Number of worker processes, None for all CPUs but one (worker processes are opt-in).
+        """
+        return None if self.worker_processes_chbox.isChecked() else 1
+
     def save_green_ampt_shapefile_fields(self):
         s = QSettings()
 
+        s.setValue("ga_worker_processes", self.worker_processes_chbox.isChecked())
+
         s.setValue("ga_soil_layer_name", self.soil_cbo.currentText())
         s.setValue("ga_soil_XKSAT", self.xksat_cbo.currentIndex())
         s.setValue("ga_soil_rtimps", self.rtimps_cbo.currentIndex())
@@ -866,6 +874,8 @@ class GreenAmptDialog(uiDialog_green, qtBaseClass_green):
     def restore_green_ampt_shapefile_fields(self):
         s = QSettings()
 
+        self.worker_processes_chbox.setChecked(s.value("ga_worker_processes", False, type=bool))
+
         name = "" if s.value("ga_soil_layer_name") is None else s.value("ga_soil_layer_name")
         if name == self.soil_cbo.currentText():
             val = int(-1 if s.value("ga_soil_XKSAT") is None else s.value("ga_soil_XKSAT"))
@@ -10,12 +10,13 @@
 
 import os
 import traceback
+import numpy as np
 from qgis.PyQt.QtCore import Qt, QSettings
 from qgis.PyQt.QtGui import QColor
 from qgis.core import QgsProject
 from qgis.PyQt.QtWidgets import QInputDialog, QFileDialog, QApplication, QMessageBox
 from .ui_utils import load_ui, try_disconnect, set_icon
-from ..flo2d_ie.rainfall_io import ASCProcessor, HDFProcessor
+from ..flo2d_ie.rainfall_io import ASCProcessor, HDFProcessor, RaincellStore
 from ..flo2d_ie.flo2dgeopackage import Flo2dGeoPackage
 from ..utils import is_number, m_fdata
 from ..geopackage_utils import GeoPackageUtils
@@ -152,19 +153,9 @@ class RainEditorWidget(qtBaseClass, uiDialog):
                 grid_lyr = self.lyrs.data["grid"]["qlyr"]
                 QApplication.setOverrideCursor(Qt.WaitCursor)
                 asc_processor = ASCProcessor(grid_lyr, asc_dir)  # as_processor, an instance of the ASCProcessor class,
-                head_qry = "INSERT INTO raincell (rainintime, irinters, timestamp) VALUES(?,?,?);"
-                data_qry = "INSERT INTO raincell_data (time_interval, rrgrid, iraindum) VALUES (?,?,?);"
-                self.gutils.clear_tables("raincell", "raincell_data")
                 header = asc_processor.parse_rfc()
-                time_step = float(header[0])
-                self.gutils.execute(head_qry, header)
-                time_interval = 0
-                for rain_series in asc_processor.rainfall_sampling():
-                    cur = self.gutils.con.cursor()
-                    for val, gid in rain_series:
-                        cur.execute(data_qry, (time_interval, gid, val))
-                    self.gutils.con.commit()
-                    time_interval += time_step
+                cells = np.array([row[0] for row in self.gutils.execute("SELECT fid FROM grid ORDER BY fid;")])
+                RaincellStore(self.gutils).import_intervals(header, cells, asc_processor.rainfall_arrays(self.gutils))
                 QApplication.restoreOverrideCursor()
                 self.uc.show_info("Importing Rainfall Data finished!")
             except Exception as e:
@@ -224,16 +215,10 @@ class RainEditorWidget(qtBaseClass, uiDialog):
             # s.setValue("FLO-2D/lastHDF", hdf_file)
             try:
                 QApplication.setOverrideCursor(Qt.WaitCursor)
-                qry_header = "SELECT rainintime, irinters, timestamp FROM raincell LIMIT 1;"
-                header = self.gutils.execute(qry_header).fetchone()
-                if header:
-                    rainintime, irinters, timestamp = header
-                    header_data = [rainintime, irinters, timestamp]
-                    qry_data = "SELECT iraindum FROM raincell_data ORDER BY rrgrid, time_interval;"
-                    data = self.gutils.execute(qry_data).fetchall()
-                    data = [data[i : i + irinters] for i in range(0, len(data), irinters)]
+                store = RaincellStore(self.gutils)
+                if store.header():
                     hdf_processor = HDFProcessor(hdf_file)
-                    hdf_processor.export_rainfall_to_binary_hdf5(header_data, data)
+                    hdf_processor.export_raincell_store_to_binary_hdf5(store)
                     QApplication.restoreOverrideCursor()
                     self.uc.show_info("Exporting Rainfall Data finished!")
                 else:
@@ -53,9 +53,10 @@ from qgis.core import (
 from .ui_utils import load_ui, try_disconnect, set_icon
 from ..geopackage_utils import GeoPackageUtils
 from ..user_communication import UserCommunication, ScrollMessageBox, ScrollMessageBox2
-from ..flo2d_ie.swmm_io import StormDrainProject
+from ..flo2d_ie.swmm_io import StormDrainProject, INPGroups, INPWriter, read_INP_groups, INP_BUFFER_SIZE
 from ..flo2d_tools.schema2user_tools import remove_features
-from ..flo2d_tools.grid_tools import spatial_index
+from ..flo2d_tools.schematic_tools import schematize_storm_drain_nodes
+from ..flo2d_tools.node_snapping import snap_link_nodes, snap_tolerance, SNAP_TOLERANCE
 from ..flo2dobjects import InletRatingTable, PumpCurves
 from ..utils import is_number, m_fdata, is_true, float_or_zero, int_or_zero
 from .table_editor_widget import StandardItemModel, StandardItem, CommandItemEdit
@@ -306,31 +307,7 @@ class StormDrainEditorWidget(qtBaseClass, uiDialog):
             etc.
 
         """
-        INP_groups = OrderedDict()  # ".INP_groups" will contain all groups [xxxx] in .INP file,
-        # ordered as entered.
-
-        with open(inp_file) as swmm_inp:  # open(file, mode='r',...) defaults to mode 'r' read.
-            for chunk in swmm_inp.read().split(
-                "["
-            ):  #  chunk gets all text (including newlines) until next '[' (may be empty)
-                try:
-                    key, value = chunk.split("]")  # divide chunk into:
-                    # key = name of group (e.g. JUNCTIONS) and
-                    # value = rest of text until ']'
-                    INP_groups[key] = value.split(
-                        "\n"
-                    )  # add new item {key, value.split('\n')} to dictionary INP_groups.
-                    # E.g.:
-                    #   key:
-                    #     JUNCTIONS
-                    #   value.split('\n') is list of strings:
-                    #    I1  4685.00    6.00000    0.00       0.00       0.00
-                    #    I2  4684.95    6.00000    0.00       0.00       0.00
-                    #    I3  4688.87    6.00000    0.00       0.00       0.00
-                except ValueError:
-                    continue
-
-            return INP_groups
+        return read_INP_groups(inp_file)
 
     def select_this_INP_group(self, INP_groups, chars):
         """Returns the whole .INP group [´chars'xxx]
@@ -339,20 +316,9 @@ class StormDrainEditorWidget(qtBaseClass, uiDialog):
         Returns a list of strings of the whole group, one list item for each line of the original .INP file.
 
         """
-        part = None
         if INP_groups is None:
-            return part
-        else:
-            for tag in list(INP_groups.keys()):
-                low_tag = tag.lower()
-                if low_tag.startswith(chars):
-                    part = INP_groups[tag]
-                    break
-                else:
-                    continue
-            return (
-                part  # List of strings in .INT_groups dictionary item keyed by 'chars' (e.e.´junc', 'cond', 'outf',...)
-            )
+            return None
+        return INP_groups.select(chars)
 
     def repaint_schema(self):
         for lyr in self.all_schema:
@@ -478,19 +444,6 @@ class StormDrainEditorWidget(qtBaseClass, uiDialog):
     #                                   "'SD Conduits' layer was created.")
 
     def schematize_inlets_and_outfalls(self):
-        insert_inlet = """
-        INSERT INTO swmmflo
-        (geom, swmmchar, swmm_jt, swmm_iden, intype, swmm_length, swmm_width, swmm_height, swmm_coeff, swmm_feature, flapgate, curbheight)
-        VALUES ((SELECT AsGPB(ST_Centroid(GeomFromGPB(geom))) FROM grid WHERE fid=?),?,?,?,?,?,?,?,?,?,?,?);"""
-
-        insert_outlet = """
-        INSERT INTO swmmoutf
-        (geom, grid_fid, name, outf_flo)
-        VALUES ((SELECT AsGPB(ST_Centroid(GeomFromGPB(geom))) FROM grid WHERE fid=?),?,?,?);"""
-
-        update_rt = "UPDATE swmmflort SET grid_fid = ? WHERE fid = ?;"
-        delete_rt = "DELETE FROM swmmflort WHERE fid = ?;"
-
         try:
 
             if self.gutils.is_table_empty("user_swmm_nodes"):
@@ -502,94 +455,23 @@ class StormDrainEditorWidget(qtBaseClass, uiDialog):
 
             QApplication.setOverrideCursor(Qt.WaitCursor)
 
-            inlets = []
-            outlets = []
-            rt_inserts = []
-            rt_updates = []
-            rt_deletes = []
-            user_nodes = self.user_swmm_nodes_lyr.getFeatures()
-            for this_user_node in user_nodes:
-                geom = this_user_node.geometry()
-                if geom is None:
-                    QApplication.restoreOverrideCursor()
-                    self.uc.show_critical(
-                        "ERROR 060319.1831: Schematizing of Storm Drains failed!\n\n"
-                        + "Geometry (inlet or outlet) missing.\n\n"
-                        + "Please check user Storm Drain Nodes layer."
-                    )
-                    return False
-                point = geom.asPoint()
-                grid_fid = self.gutils.grid_on_point(point.x(), point.y())
-                sd_type = this_user_node["sd_type"]
-                name = this_user_node["name"]
-                rt_fid = this_user_node["rt_fid"]
-                rt_name = this_user_node["rt_name"]
-                if sd_type == "I" or sd_type == "J":
-                    # Insert inlet:
-                    row = [grid_fid, "D", grid_fid, name] + [this_user_node[col] for col in self.inlet_columns]
-                    row[10] = int("1" if is_true(row[9]) else "0")
-                    row = [0 if v == NULL else v for v in row]
-                    inlets.append(row)
-
-                    # Manage Rating Table:
-                #                     intype = this_user_node['intype']
-                #                     if intype == 4:
-                #                         if rt_name is not None and rt_name != "":
-                #                             row = self.gutils.execute("SELECT * WHERE grid_fid = ? AND name = ?;", (grid_fid, rt_name,))
-                #                             if not row or row[0] is None or row[1] is None or row[1] == "":
-                #                                 # There is no entry for this inlet in rating table. Add it.
-                #                                 # See if rating table has an item with the RT name:
-                #                                 row = self.gutils.execute("SELECT * FROM swmmflort WHERE name = ?;", (rt_name,))
-                #                                 if row:
-                #                                    rt_inserts.append([grid_fid, rt_name])
-                #
-                #
-                #
-                #
-                #
-                #                                 rt_inserts.append([grid_fid, rt_name])
-                #                     else:
-                #                         # See if it in Rating Table. If so, assign NULL to grid_fid but keep reference of RT name to RT data:
-                #                         row = self.gutils.execute("SELECT * FROM swmmflort WHERE grid_fid = ? AND name = ?;", (this_user_node['grid'], this_user_node['rt_name'],))
-                #                         if row:
-                #                             if row[1] == grid_fid:
-                #                                 self.gutils.execute("UPDATE swmmflort SET grid_fid = NULL WHERE fid = ?;", (row[0],))
-
-                elif sd_type == "O":
-                    outf_flo = 1 if is_true(this_user_node["swmm_allow_discharge"]) else 0
-                    #                     outf_flo = 1 if is_true([this_user_node[col] for col in self.outlet_columns]) else 0
-                    row = [grid_fid, grid_fid, name, outf_flo]
-                    outlets.append(row)
-                else:
-                    raise ValueError
+            try:
+                inlets, outlets, rating_tables = schematize_storm_drain_nodes(self.gutils, self.inlet_columns)
+            except ValueError as e:
+                QApplication.restoreOverrideCursor()
+                self.uc.show_critical(
+                    "ERROR 060319.1831: Schematizing of Storm Drains failed!\n\n"
+                    + "{}\n\n".format(e)
+                    + "Please check user Storm Drain Nodes layer."
+                )
+                return False
 
             msg1, msg2, msg3 = "", "", ""
-            if inlets or outlets or rt_updates:
-                cur = self.con.cursor()
-                if inlets:
-                    self.gutils.clear_tables("swmmflo")
-                    cur.executemany(insert_inlet, inlets)
-                else:
+            if inlets or outlets:
+                if not inlets:
                     msg1 = "No inlets were schematized!\n"
-
-                if outlets:
-                    self.gutils.clear_tables("swmmoutf")
-                    cur.executemany(insert_outlet, outlets)
-                else:
+                if not outlets:
                     msg2 = "No outfalls were schematized!\n"
-
-                #                 if rt_deletes:
-                #                     cur.executemany("DELETE FROM swmmflort WHERE grid_fid = ? AND name = ?;", rt_deletes)
-                #
-                #                 if rt_updates:
-                #                     cur.executemany("UPDATE swmmflort SET grid_fid = ? WHERE fid = ?;", rt_updates)
-                #
-                #                 if rt_inserts:
-                #                    cur.executemany("INSERT INTO swmmflort (grid_fid, name);", rt_inserts)
-                #                 else:
-                #                     msg3 = "No Rating Tables were schematized!\n"
-
-                self.con.commit()
                 self.repaint_schema()
                 QApplication.restoreOverrideCursor()
                 msg = msg1 + msg2 + msg3
@@ -1772,7 +1654,7 @@ class StormDrainEditorWidget(qtBaseClass, uiDialog):
                 )
                 return
 
-            INP_groups = OrderedDict()
+            INP_groups = INPGroups()
 
             s = QSettings()
             last_dir = s.value("FLO-2D/lastGdsDir", "")
@@ -1799,7 +1681,8 @@ class StormDrainEditorWidget(qtBaseClass, uiDialog):
             ok = dlg_INP_groups.exec_()
             if ok:
 
-                with open(swmm_file, "w") as swmm_inp_file:
+                with open(swmm_file, "w", buffering=INP_BUFFER_SIZE) as swmm_inp_file:
+                    writer = INPWriter(swmm_inp_file)
                     no_in_out_conduits = 0
                     no_in_out_pumps = 0
                     no_in_out_orifices = 0
@@ -1807,65 +1690,65 @@ class StormDrainEditorWidget(qtBaseClass, uiDialog):
                                        
                     # TITLE ##################################################
                     items = self.select_this_INP_group(INP_groups, "title")
-                    swmm_inp_file.write("[TITLE]")
+                    writer.write("[TITLE]")
                     #                     if items is not None:
                     #                         for line in items[1:]:
                     #                             swmm_inp_file.write("\n" + line)
                     #                     else:
-                    swmm_inp_file.write("\n" + dlg_INP_groups.titleTextEdit.toPlainText() + "\n")
+                    writer.write("\n" + dlg_INP_groups.titleTextEdit.toPlainText() + "\n")
 
                     # OPTIONS ##################################################
                     items = self.select_this_INP_group(INP_groups, "options")
-                    swmm_inp_file.write("\n[OPTIONS]")
+                    writer.write("\n[OPTIONS]")
                     #                     if items is not None:
                     #                         for line in items[1:]:
                     #                             swmm_inp_file.write("\n" + line)
                     #                     else:
                     #                         swmm_inp_file.write('\n')
-                    swmm_inp_file.write("\nFLOW_UNITS           " + dlg_INP_groups.flow_units_cbo.currentText())
-                    swmm_inp_file.write("\nINFILTRATION         HORTON")
-                    swmm_inp_file.write("\nFLOW_ROUTING         " + dlg_INP_groups.flow_routing_cbo.currentText())
-                    swmm_inp_file.write(
+                    writer.write("\nFLOW_UNITS           " + dlg_INP_groups.flow_units_cbo.currentText())
+                    writer.write("\nINFILTRATION         HORTON")
+                    writer.write("\nFLOW_ROUTING         " + dlg_INP_groups.flow_routing_cbo.currentText())
+                    writer.write(
                         "\nSTART_DATE           " + dlg_INP_groups.start_date.date().toString("MM/dd/yyyy")
                     )
-                    swmm_inp_file.write(
+                    writer.write(
                         "\nSTART_TIME           " + dlg_INP_groups.start_time.time().toString("hh:mm:ss")
                     )
-                    swmm_inp_file.write(
+                    writer.write(
                         "\nREPORT_START_DATE    " + dlg_INP_groups.report_start_date.date().toString("MM/dd/yyyy")
                     )
-                    swmm_inp_file.write(
+                    writer.write(
                         "\nREPORT_START_TIME    " + dlg_INP_groups.report_start_time.time().toString("hh:mm:ss")
                     )
-                    swmm_inp_file.write(
+                    writer.write(
                         "\nEND_DATE             " + dlg_INP_groups.end_date.date().toString("MM/dd/yyyy")
                     )
-                    swmm_inp_file.write("\nEND_TIME             " + dlg_INP_groups.end_time.time().toString("hh:mm:ss"))
-                    swmm_inp_file.write("\nSWEEP_START          01/01")
-                    swmm_inp_file.write("\nSWEEP_END            12/31")
-                    swmm_inp_file.write("\nDRY_DAYS             0")
-                    swmm_inp_file.write(
+                    writer.write("\nEND_TIME             " + dlg_INP_groups.end_time.time().toString("hh:mm:ss"))
+                    writer.write("\nSWEEP_START          01/01")
+                    writer.write("\nSWEEP_END            12/31")
+                    writer.write("\nDRY_DAYS             0")
+                    writer.write(
                         "\nREPORT_STEP          " + dlg_INP_groups.report_stp_time.time().toString("hh:mm:ss")
                     )
-                    swmm_inp_file.write("\nWET_STEP             00:05:00")
-                    swmm_inp_file.write("\nDRY_STEP             01:00:00")
-                    swmm_inp_file.write("\nROUTING_STEP         00:01:00")
-                    swmm_inp_file.write("\nALLOW_PONDING        NO")
-                    swmm_inp_file.write("\nINERTIAL_DAMPING     " + dlg_INP_groups.inertial_damping_cbo.currentText())
-                    swmm_inp_file.write("\nVARIABLE_STEP        0.75")
-                    swmm_inp_file.write("\nLENGTHENING_STEP     0")
-                    swmm_inp_file.write("\nMIN_SURFAREA         0")
-                    swmm_inp_file.write(
+                    writer.write("\nWET_STEP             00:05:00")
+                    writer.write("\nDRY_STEP             01:00:00")
+                    writer.write("\nROUTING_STEP         00:01:00")
+                    writer.write("\nALLOW_PONDING        NO")
+                    writer.write("\nINERTIAL_DAMPING     " + dlg_INP_groups.inertial_damping_cbo.currentText())
+                    writer.write("\nVARIABLE_STEP        0.75")
+                    writer.write("\nLENGTHENING_STEP     0")
+                    writer.write("\nMIN_SURFAREA         0")
+                    writer.write(
                         "\nNORMAL_FLOW_LIMITED  " + dlg_INP_groups.normal_flow_limited_cbo.currentText()
                     )
-                    swmm_inp_file.write("\nSKIP_STEADY_STATE    " + dlg_INP_groups.skip_steady_state_cbo.currentText())
+                    writer.write("\nSKIP_STEADY_STATE    " + dlg_INP_groups.skip_steady_state_cbo.currentText())
                     if dlg_INP_groups.force_main_equation_cbo.currentIndex() == 0:
                         equation = "H-W"
                     else:
                         equation = "D-W"
-                    swmm_inp_file.write("\nFORCE_MAIN_EQUATION  " + equation)
-                    swmm_inp_file.write("\nLINK_OFFSETS         " + dlg_INP_groups.link_offsets_cbo.currentText())
-                    swmm_inp_file.write("\nMIN_SLOPE            " + str(dlg_INP_groups.min_slop_dbox.value()))
+                    writer.write("\nFORCE_MAIN_EQUATION  " + equation)
+                    writer.write("\nLINK_OFFSETS         " + dlg_INP_groups.link_offsets_cbo.currentText())
+                    writer.write("\nMIN_SLOPE            " + str(dlg_INP_groups.min_slop_dbox.value()))
 
                     # JUNCTIONS ##################################################
                     try:
@@ -1876,24 +1759,18 @@ class StormDrainEditorWidget(qtBaseClass, uiDialog):
                         if not junctions_rows:
                             pass
                         else:
-                            swmm_inp_file.write("\n")
-                            swmm_inp_file.write("\n[JUNCTIONS]")
-                            swmm_inp_file.write("\n;;               Invert     Max.       Init.      Surcharge  Ponded")
-                            swmm_inp_file.write("\n;;Name           Elev.      Depth      Depth      Depth      Area")
-                            swmm_inp_file.write("\n;;-------------- ---------- ---------- ---------- ---------- ----------")
+                            writer.write_section(
+                                "JUNCTIONS",
+                                ";;               Invert     Max.       Init.      Surcharge  Ponded",
+                                ";;Name           Elev.      Depth      Depth      Depth      Area",
+                                ";;-------------- ---------- ---------- ---------- ---------- ----------",
+                            )
                             
                             line = "\n{0:16} {1:<10.2f} {2:<10.2f} {3:<10.2f} {4:<10.2f} {5:<10.2f}"                            
                             
-                            for row in junctions_rows:
-                                row = (
-                                    row[0],
-                                    0 if row[1] is None else row[1],
-                                    0 if row[2] is None else row[2],
-                                    0 if row[3] is None else row[3],
-                                    0 if row[4] is None else row[4],
-                                    0 if row[5] is None else row[5],
-                                )
-                                swmm_inp_file.write(line.format(*row))
+                            writer.write_rows(
+                                line, ([row[0]] + [0 if v is None else v for v in row[1:]] for row in junctions_rows)
+                            )
                     except Exception as e:
                         QApplication.restoreOverrideCursor()
                         self.uc.show_error("ERROR 070618.0851: error while exporting [JUNCTIONS] to .INP file!", e)
@@ -1908,14 +1785,16 @@ class StormDrainEditorWidget(qtBaseClass, uiDialog):
                         if not outfalls_rows:
                             pass
                         else:
-                            swmm_inp_file.write("\n")
-                            swmm_inp_file.write("\n[OUTFALLS]")
-                            swmm_inp_file.write("\n;;               Invert     Outfall      Stage/Table       Tide")
-                            swmm_inp_file.write("\n;;Name           Elev.      Type         Time Series       Gate")
-                            swmm_inp_file.write("\n;;-------------- ---------- ------------ ----------------  ----")
+                            writer.write_section(
+                                "OUTFALLS",
+                                ";;               Invert     Outfall      Stage/Table       Tide",
+                                ";;Name           Elev.      Type         Time Series       Gate",
+                                ";;-------------- ---------- ------------ ----------------  ----",
+                            )
 
                             line = "\n{0:16} {1:<10.2f} {2:<11} {3:<18} {4:<16}"
                             
+                            rows = []
                             for row in outfalls_rows:
                                 lrow = list(row)
                                 lrow = [
@@ -1937,7 +1816,8 @@ class StormDrainEditorWidget(qtBaseClass, uiDialog):
                                 if lrow[2] == "FIXED":
                                     lrow[3] = lrow[6]                                    
                                 lrow[5] = "YES" if lrow[5] in ("True", "true", "Yes", "yes", "1") else "NO"
-                                swmm_inp_file.write(line.format(lrow[0], lrow[1], lrow[2], lrow[3], lrow[5]))
+                                rows.append((lrow[0], lrow[1], lrow[2], lrow[3], lrow[5]))
+                            writer.write_rows(line, rows)
 
                     except Exception as e:
                         QApplication.restoreOverrideCursor()
@@ -1955,20 +1835,16 @@ class StormDrainEditorWidget(qtBaseClass, uiDialog):
                         if not conduits_rows:
                             pass
                         else:
-                            swmm_inp_file.write("\n")
-                            swmm_inp_file.write("\n[CONDUITS]")
-                            swmm_inp_file.write(
-                                "\n;;               Inlet            Outlet                      Manning    Inlet      Outlet     Init.      Max."
+                            writer.write_section(
+                                "CONDUITS",
+                                ";;               Inlet            Outlet                      Manning    Inlet      Outlet     Init.      Max.",
+                                ";;Name           Node             Node             Length     N          Offset     Offset     Flow       Flow",
+                                ";;-------------- ---------------- ---------------- ---------- ---------- ---------- ---------- ---------- ----------",
                             )
-                            swmm_inp_file.write(
-                                "\n;;Name           Node             Node             Length     N          Offset     Offset     Flow       Flow"
-                            )
-                            swmm_inp_file.write(
-                                "\n;;-------------- ---------------- ---------------- ---------- ---------- ---------- ---------- ---------- ----------"
-                            )                            
                             
                             line = ("\n{0:16} {1:<16} {2:<16} {3:<10.2f} {4:<10.3f} {5:<10.2f} {6:<10.2f} {7:<10.2f} {8:<10.2f}") 
                             
+                            rows = []
                             for row in conduits_rows:
                                 row = (
                                     row[0],
@@ -1982,8 +1858,9 @@ class StormDrainEditorWidget(qtBaseClass, uiDialog):
                                     0 if row[8] is None else row[8],
                                 )
                                 if row[1] == "?" or row[2] == "?":
-                                    no_in_out_conduits += 1  
-                                swmm_inp_file.write(line.format(*row))
+                                    no_in_out_conduits += 1
+                                rows.append(row)
+                            writer.write_rows(line, rows)
                     except Exception as e:
                         QApplication.restoreOverrideCursor()
                         self.uc.show_error("ERROR 070618.1620: error while exporting [CONDUITS] to .INP file!", e)
@@ -2000,20 +1877,16 @@ class StormDrainEditorWidget(qtBaseClass, uiDialog):
                         if not pumps_rows:
                             pass
                         else:
-                            swmm_inp_file.write("\n")
-                            swmm_inp_file.write("\n[PUMPS]")
-                            swmm_inp_file.write(
-                                "\n;;               Inlet            Outlet           Pump             Init.      Startup    Shutup"
-                            )
-                            swmm_inp_file.write(
-                                "\n;;Name           Node             Node             Curve            Status     Depth      Depth"
+                            writer.write_section(
+                                "PUMPS",
+                                ";;               Inlet            Outlet           Pump             Init.      Startup    Shutup",
+                                ";;Name           Node             Node             Curve            Status     Depth      Depth",
+                                ";;-------------- ---------------- ---------------- ---------------- ---------- ---------- -------",
                             )
-                            swmm_inp_file.write(
-                                "\n;;-------------- ---------------- ---------------- ---------------- ---------- ---------- -------"
-                            )                            
                             
                             line = ("\n{0:16} {1:<16} {2:<16} {3:<16} {4:<10} {5:<10.2f} {6:<10.2f}")
                             
+                            rows = []
                             for row in pumps_rows:
                                 row = (
                                     row[0],
@@ -2026,7 +1899,8 @@ class StormDrainEditorWidget(qtBaseClass, uiDialog):
                                 )
                                 if row[1] == "?" or row[2] == "?":
                                     no_in_out_pumps += 1
-                                swmm_inp_file.write(line.format(*row))
+                                rows.append(row)
+                            writer.write_rows(line, rows)
                     except Exception as e:
                         QApplication.restoreOverrideCursor()
                         self.uc.show_error("ERROR 271121.0515: error while exporting [PUMPS] to .INP file!", e)
@@ -2043,20 +1917,16 @@ class StormDrainEditorWidget(qtBaseClass, uiDialog):
                         if not orifices_rows:
                             pass
                         else:
-                            swmm_inp_file.write("\n")
-                            swmm_inp_file.write("\n[ORIFICES]")
-                            swmm_inp_file.write(
-                                "\n;;               Inlet            Outlet           Orifice      Crest      Disch.      Flap      Open/Close"
+                            writer.write_section(
+                                "ORIFICES",
+                                ";;               Inlet            Outlet           Orifice      Crest      Disch.      Flap      Open/Close",
+                                ";;Name           Node             Node             Type         Height     Coeff.      Gate      Time",
+                                ";;-------------- ---------------- ---------------- ------------ ---------- ----------- --------- -----------",
                             )
-                            swmm_inp_file.write(
-                                "\n;;Name           Node             Node             Type         Height     Coeff.      Gate      Time"
-                            )
-                            swmm_inp_file.write(
-                                "\n;;-------------- ---------------- ---------------- ------------ ---------- ----------- --------- -----------"
-                            )                            
 
                             line = ("\n{0:16} {1:<16} {2:<16} {3:<12} {4:<10.2f} {5:<11.2f} {6:<9} {7:<9.2f}")
                             
+                            rows = []
                             for row in orifices_rows:
                                 row = (
                                     row[0],
@@ -2070,7 +1940,8 @@ class StormDrainEditorWidget(qtBaseClass, uiDialog):
                                 )
                                 if row[1] == "?" or row[2] == "?":
                                     no_in_out_orifices += 1
-                                swmm_inp_file.write(line.format(*row))
+                                rows.append(row)
+                            writer.write_rows(line, rows)
                     except Exception as e:
                         QApplication.restoreOverrideCursor()
                         self.uc.show_error("ERROR 310322.1548: error while exporting [ORIFICES] to .INP file!", e)
@@ -2086,20 +1957,16 @@ class StormDrainEditorWidget(qtBaseClass, uiDialog):
                         if not weirs_rows:
                             pass
                         else:
-                            swmm_inp_file.write("\n")
-                            swmm_inp_file.write("\n[WEIRS]")
-                            swmm_inp_file.write(
-                                "\n;;               Inlet            Outlet           Weir         Crest      Disch.      Flap      End      End"
-                            )
-                            swmm_inp_file.write(
-                                "\n;;Name           Node             Node             Type         Height     Coeff.      Gate      Con.     Coeff."
+                            writer.write_section(
+                                "WEIRS",
+                                ";;               Inlet            Outlet           Weir         Crest      Disch.      Flap      End      End",
+                                ";;Name           Node             Node             Type         Height     Coeff.      Gate      Con.     Coeff.",
+                                ";;-------------- ---------------- ---------------- ------------ ---------- ----------- --------- -------  ---------",
                             )
-                            swmm_inp_file.write(
-                                "\n;;-------------- ---------------- ---------------- ------------ ---------- ----------- --------- -------  ---------"
-                            )                            
 
                             line = ("\n{0:16} {1:<16} {2:<16} {3:<12} {4:<10.2f} {5:<11.2f} {6:<9} {7:<8} {8:<9.2f}")
                             
+                            rows = []
                             for row in weirs_rows:
                                 row = (
                                     row[0],
@@ -2114,7 +1981,8 @@ class StormDrainEditorWidget(qtBaseClass, uiDialog):
                                 )
                                 if row[1] == "?" or row[2] == "?":
                                     no_in_out_weirs += 1
-                                swmm_inp_file.write(line.format(*row))
+                                rows.append(row)
+                            writer.write_rows(line, rows)
                     except Exception as e:
                         QApplication.restoreOverrideCursor()
                         self.uc.show_error("ERROR 090422.0557: error while exporting [WEIRS] to .INP file!", e)
@@ -2122,13 +1990,10 @@ class StormDrainEditorWidget(qtBaseClass, uiDialog):
                     
                     # XSECTIONS ###################################################
                     try:
-                        swmm_inp_file.write("\n")
-                        swmm_inp_file.write("\n[XSECTIONS]")
-                        swmm_inp_file.write(
-                            "\n;;Link           Shape        Geom1      Geom2      Geom3      Geom4      Barrels"
-                        )
-                        swmm_inp_file.write(
-                            "\n;;-------------- ------------ ---------- ---------- ---------- ---------- ----------"
+                        writer.write_section(
+                            "XSECTIONS",
+                            ";;Link           Shape        Geom1      Geom2      Geom3      Geom4      Barrels",
+                            ";;-------------- ------------ ---------- ---------- ---------- ---------- ----------",
                         )
 
                         # XSections from user conduits:
@@ -2142,6 +2007,7 @@ class StormDrainEditorWidget(qtBaseClass, uiDialog):
                             pass
                         else:
                             no_xs = 0
+                            rows = []
 
                             for row in xsections_rows_1:
                                 lrow = list(row)
@@ -2165,8 +2031,8 @@ class StormDrainEditorWidget(qtBaseClass, uiDialog):
                                     0.0 if lrow[5] == "?" else lrow[5],
                                     0.0 if lrow[6] == "?" else lrow[6],
                                 )
-                                row = tuple(lrow)
-                                swmm_inp_file.write(line.format(*row))
+                                rows.append(tuple(lrow))
+                            writer.write_rows(line, rows)
                               
                         # XSections from user orifices:
                         SD_xsections_2_sql = """SELECT orifice_name, orifice_shape, orifice_height, orifice_width
@@ -2178,6 +2044,7 @@ class StormDrainEditorWidget(qtBaseClass, uiDialog):
                             pass
                         else:
                             no_xs = 0
+                            rows = []
 
                             for row in xsections_rows_2:
                                 lrow = list(row)
@@ -2201,8 +2068,8 @@ class StormDrainEditorWidget(qtBaseClass, uiDialog):
                                     0.0,
                                     0,                                    
                                 )
-                                row = tuple(lrow)
-                                swmm_inp_file.write(line.format(*row))
+                                rows.append(tuple(lrow))
+                            writer.write_rows(line, rows)
  
                         # XSections from user weirs:
                         SD_xsections_3_sql = """SELECT weir_name, weir_shape, weir_height, weir_length, weir_side_slope, weir_side_slope
@@ -2214,6 +2081,7 @@ class StormDrainEditorWidget(qtBaseClass, uiDialog):
                             pass
                         else:
                             no_xs = 0
+                            rows = []
 
                             for row in xsections_rows_3:
                                 lrow = list(row)
@@ -2237,8 +2105,8 @@ class StormDrainEditorWidget(qtBaseClass, uiDialog):
                                     0.0 if lrow[5] == "?" else lrow[5],
                                     0,                                    
                                 )
-                                row = tuple(lrow)
-                                swmm_inp_file.write(line.format(*row))
+                                rows.append(tuple(lrow))
+                            writer.write_rows(line, rows)
 
                     except Exception as e:
                         QApplication.restoreOverrideCursor()
@@ -2254,18 +2122,17 @@ class StormDrainEditorWidget(qtBaseClass, uiDialog):
                         if not losses_rows:
                             pass
                         else:
-                            swmm_inp_file.write("\n")
-                            swmm_inp_file.write("\n[LOSSES]")
-                            swmm_inp_file.write("\n;;Link           Inlet      Outlet     Average    Flap Gate")
-                            swmm_inp_file.write("\n;;-------------- ---------- ---------- ---------- ----------")                           
+                            writer.write_section(
+                                "LOSSES",
+                                ";;Link           Inlet      Outlet     Average    Flap Gate",
+                                ";;-------------- ---------- ---------- ---------- ----------",
+                            )
                             
                             
                             line = "\n{0:16} {1:<10} {2:<10} {3:<10.2f} {4:<10}"
                             
-                            for row in losses_rows:
-                                lrow = list(row)
-                                lrow[4] = "YES" if lrow[4] in ("True", "true", "Yes", "yes", "1") else "NO"
-                                swmm_inp_file.write(line.format(*lrow))
+                            yes = ("True", "true", "Yes", "yes", "1")
+                            writer.write_rows(line, (row[:4] + ("YES" if row[4] in yes else "NO",) for row in losses_rows))
                     except Exception as e:
                         QApplication.restoreOverrideCursor()
                         self.uc.show_error("ERROR 070618.1622: error while exporting [LOSSES] to .INP file!", e)
@@ -2281,21 +2148,24 @@ class StormDrainEditorWidget(qtBaseClass, uiDialog):
                         if not curves_rows:
                             pass
                         else:
-                            swmm_inp_file.write("\n")
-                            swmm_inp_file.write("\n[CURVES]")
-                            swmm_inp_file.write("\n;;Name           Type       X-Value    Y-Value")
-                            swmm_inp_file.write("\n;;-------------- ---------- ---------- ----------")                            
+                            writer.write_section(
+                                "CURVES",
+                                ";;Name           Type       X-Value    Y-Value",
+                                ";;-------------- ---------- ---------- ----------",
+                            )
                             
                             line = "\n{0:16} {1:<10} {2:<10.2f} {3:<10.2f}"
                             
                             name = ""
+                            rows = []
                             for row in curves_rows:
                                 lrow = list(row)
                                 if lrow[0] == name:
                                     lrow[1]= "     "  
                                 else:
                                     name = lrow[0]
-                                swmm_inp_file.write(line.format(*lrow))
+                                rows.append(lrow)
+                            writer.write_rows(line, rows)
                                                             
                             # typ = ""
                             # for row in curves_rows:
@@ -2313,24 +2183,25 @@ class StormDrainEditorWidget(qtBaseClass, uiDialog):
 
                     # REPORT ##################################################
                     items = self.select_this_INP_group(INP_groups, "report")
-                    swmm_inp_file.write("\n\n[REPORT]")
+                    writer.write("\n\n[REPORT]")
                     #                     if items is not None:
                     #                         for line in items[1:]:
                     #                             swmm_inp_file.write("\n" + line)
                     #                     else:
                     #                         swmm_inp_file.write('\n')
-                    swmm_inp_file.write("\nINPUT           " + dlg_INP_groups.input_cbo.currentText())
-                    swmm_inp_file.write("\nCONTROLS        " + dlg_INP_groups.controls_cbo.currentText())
-                    swmm_inp_file.write("\nSUBCATCHMENTS   NONE")
-                    swmm_inp_file.write("\nNODES           " + dlg_INP_groups.nodes_cbo.currentText())
-                    swmm_inp_file.write("\nLINKS           " + dlg_INP_groups.links_cbo.currentText())
+                    writer.write("\nINPUT           " + dlg_INP_groups.input_cbo.currentText())
+                    writer.write("\nCONTROLS        " + dlg_INP_groups.controls_cbo.currentText())
+                    writer.write("\nSUBCATCHMENTS   NONE")
+                    writer.write("\nNODES           " + dlg_INP_groups.nodes_cbo.currentText())
+                    writer.write("\nLINKS           " + dlg_INP_groups.links_cbo.currentText())
 
                     # COORDINATES ###################################################
                     try:
-                        swmm_inp_file.write("\n")
-                        swmm_inp_file.write("\n[COORDINATES]")
-                        swmm_inp_file.write("\n;;Node           X-Coord            Y-Coord ")
-                        swmm_inp_file.write("\n;;-------------- ------------------ ------------------")
+                        writer.write_section(
+                            "COORDINATES",
+                            ";;Node           X-Coord            Y-Coord ",
+                            ";;-------------- ------------------ ------------------",
+                        )
 
                         SD_coordinates_sql = """SELECT name, ST_AsText(ST_Centroid(GeomFromGPB(geom)))
                                           FROM user_swmm_nodes ORDER BY fid;"""
@@ -2340,10 +2211,9 @@ class StormDrainEditorWidget(qtBaseClass, uiDialog):
                         if not coordinates_rows:
                             pass
                         else:
-                            for row in coordinates_rows:
-                                x = row[:2][1].strip("POINT()").split()[0]
-                                y = row[:2][1].strip("POINT()").split()[1]
-                                swmm_inp_file.write(line.format(row[0], x, y))
+                            writer.write_rows(
+                                line, ([row[0]] + row[1].strip("POINT()").split()[:2] for row in coordinates_rows)
+                            )
                     except Exception as e:
                         QApplication.restoreOverrideCursor()
                         self.uc.show_error("ERROR 070618.1623: error while exporting [COORDINATES] to .INP file!", e)
@@ -2351,16 +2221,11 @@ class StormDrainEditorWidget(qtBaseClass, uiDialog):
 
                     # INFLOWS ###################################################
                     try:
-                        swmm_inp_file.write("\n")
-                        swmm_inp_file.write("\n[INFLOWS]")
-                        swmm_inp_file.write(
-                            "\n;;                                                 Param    Units    Scale    Baseline Baseline"
-                        )
-                        swmm_inp_file.write(
-                            "\n;;Node           Parameter        Time Series      Type     Factor   Factor   Value    Pattern "
-                        )
-                        swmm_inp_file.write(
-                            "\n;;-------------- ---------------- ---------------- -------- -------- -------- -------- --------"
+                        writer.write_section(
+                            "INFLOWS",
+                            ";;                                                 Param    Units    Scale    Baseline Baseline",
+                            ";;Node           Parameter        Time Series      Type     Factor   Factor   Value    Pattern ",
+                            ";;-------------- ---------------- ---------------- -------- -------- -------- -------- --------",
                         )
 
                         SD_inflows_sql = """SELECT node_name, constituent, baseline, pattern_name, time_series_name, scale_factor
@@ -2371,6 +2236,7 @@ class StormDrainEditorWidget(qtBaseClass, uiDialog):
                         if not inflows_rows:
                             pass
                         else:
+                            rows = []
                             for row in inflows_rows:
                                 lrow = [
                                     row[0],
@@ -2382,7 +2248,8 @@ class StormDrainEditorWidget(qtBaseClass, uiDialog):
                                     row[2],
                                     row[3] if row[3] is not None else "?",
                                 ]
-                                swmm_inp_file.write(line.format(*lrow))
+                                rows.append(lrow)
+                            writer.write_rows(line, rows)
                     except Exception as e:
                         QApplication.restoreOverrideCursor()
                         self.uc.show_error("ERROR 230220.0751.1622: error while exporting [INFLOWS] to .INP file!", e)
@@ -2390,28 +2257,27 @@ class StormDrainEditorWidget(qtBaseClass, uiDialog):
 
                     # TIMESERIES ###################################################
                     try:
-                        swmm_inp_file.write("\n")
-                        swmm_inp_file.write("\n[TIMESERIES]")
-                        swmm_inp_file.write("\n;;Name           Date       Time       Value     ")
-                        swmm_inp_file.write("\n;;-------------- ---------- ---------- ----------")
+                        writer.write_section(
+                            "TIMESERIES",
+                            ";;Name           Date       Time       Value     ",
+                            ";;-------------- ---------- ---------- ----------",
+                        )
 
                         SD_inflow_time_series_sql = """SELECT time_series_name, time_series_description, time_series_file
                                           FROM swmm_inflow_time_series ORDER BY fid;"""
 
-                        line1 = "\n;{0:16}"
-                        line2 = "\n{0:16} {1:<10} {2:<50}"
+                        # Description comment, FILE line and empty line.
+                        line = "\n;{0:16}\n{1:16} {2:<10} {3:<50}\n"
                         time_series_rows = self.gutils.execute(SD_inflow_time_series_sql).fetchall()
                         if not time_series_rows:
                             pass
                         else:
+                            rows = []
                             for row in time_series_rows:
-                                lrow1 = [row[1]]
-                                swmm_inp_file.write(line1.format(*lrow1))
                                 fileName = os.path.basename(row[2].strip())
                                 file = '"' + last_dir + "/" + fileName + '"'
-                                lrow2 = [row[0], "FILE", file]
-                                swmm_inp_file.write(line2.format(*lrow2))
-                                swmm_inp_file.write("\n")
+                                rows.append((row[1], row[0], "FILE", file))
+                            writer.write_rows(line, rows)
                     except Exception as e:
                         QApplication.restoreOverrideCursor()
                         self.uc.show_error("ERROR 230220.1005: error while exporting [TIMESERIES] to .INP file!", e)
@@ -2419,10 +2285,11 @@ class StormDrainEditorWidget(qtBaseClass, uiDialog):
 
                     # PATTERNS ###################################################
                     try:
-                        swmm_inp_file.write("\n")
-                        swmm_inp_file.write("\n[PATTERNS]")
-                        swmm_inp_file.write("\n;;Name           Type       Multipliers")
-                        swmm_inp_file.write("\n;;-------------- ---------- -----------")
+                        writer.write_section(
+                            "PATTERNS",
+                            ";;Name           Type       Multipliers",
+                            ";;-------------- ---------- -----------",
+                        )
 
                         SD_inflow_patterns_sql = """SELECT pattern_name, pattern_description, hour, multiplier
                                           FROM swmm_inflow_patterns ORDER BY fid;"""
@@ -2433,19 +2300,20 @@ class StormDrainEditorWidget(qtBaseClass, uiDialog):
                         if not pattern_rows:
                             pass
                         else:
+                            lines = []
                             i = 1
                             for row in pattern_rows:
                                 # First line:
                                 if i == 1:  # Beginning of first line:
                                     lrow0 = [row[1]]
-                                    swmm_inp_file.write(line0.format(*lrow0))
+                                    lines.append(line0.format(*lrow0))
                                     lrow1 = [row[0], "HOURLY", row[3]]
                                     i += 1
                                 elif i < 7:  # Rest of first line:
                                     lrow1.append(row[3])
                                     i += 1
                                 elif i == 7:
-                                    swmm_inp_file.write(line1.format(*lrow1))
+                                    lines.append(line1.format(*lrow1))
                                     lrow1 = [row[0], "   ", row[3]]
                                     i += 1
 
@@ -2454,7 +2322,7 @@ class StormDrainEditorWidget(qtBaseClass, uiDialog):
                                     lrow1.append(row[3])
                                     i += 1
                                 elif i == 13:
-                                    swmm_inp_file.write(line1.format(*lrow1))
+                                    lines.append(line1.format(*lrow1))
                                     lrow1 = [row[0], "   ", row[3]]
                                     i += 1
 
@@ -2463,7 +2331,7 @@ class StormDrainEditorWidget(qtBaseClass, uiDialog):
                                     lrow1.append(row[3])
                                     i += 1
                                 elif i == 19:
-                                    swmm_inp_file.write(line1.format(*lrow1))
+                                    lines.append(line1.format(*lrow1))
                                     lrow1 = [row[0], "   ", row[3]]
                                     i += 1
 
@@ -2472,11 +2340,12 @@ class StormDrainEditorWidget(qtBaseClass, uiDialog):
                                     lrow1.append(row[3])
                                     i += 1
                                 elif i == 24:
-                                    swmm_inp_file.write(line1.format(*lrow1))
+                                    lines.append(line1.format(*lrow1))
                                     lrow1 = [row[0], "   ", row[3]]
                                     i = 1
 
-                                    swmm_inp_file.write("\n")
+                                    lines.append("\n")
+                            writer.write_lines(lines)
 
                     except Exception as e:
                         QApplication.restoreOverrideCursor()
@@ -2485,13 +2354,11 @@ class StormDrainEditorWidget(qtBaseClass, uiDialog):
 
                     # CONTROLS ##################################################
                     items = self.select_this_INP_group(INP_groups, "controls")
-                    swmm_inp_file.write("\n\n[CONTROLS]")
+                    writer.write("\n\n")
                     if items is not None:
-                        for line in items[1:]:
-                            if line != "":
-                                swmm_inp_file.write("\n" + line)
+                        writer.write_group("CONTROLS", items, skip_empty=True)
                     else:
-                        swmm_inp_file.write("\n")
+                        writer.write("[CONTROLS]\n")
 
                     # FUTURE GROUPS ##################################################
                     future_groups = [
@@ -2529,10 +2396,8 @@ class StormDrainEditorWidget(qtBaseClass, uiDialog):
                     for group in future_groups:
                         items = self.select_this_INP_group(INP_groups, group.lower())
                         if items is not None:
-                            swmm_inp_file.write("\n\n[" + group + "]")
-                            for line in items[1:]:
-                                if line != "":
-                                    swmm_inp_file.write("\n" + line)
+                            writer.write("\n\n")
+                            writer.write_group(group, items, skip_empty=True)
 
                     file = last_dir + "/SWMM.INI"
                     with open(file, "w") as ini_file:
@@ -2836,6 +2701,17 @@ class StormDrainEditorWidget(qtBaseClass, uiDialog):
                 )   
                 return             
 
+            # Names are written directly into the GeoPackage, pending edits of the layers must be saved first.
+            if self.lyrs.any_lyr_in_edit(layer_name, "user_swmm_nodes"):
+                q = link_name + " or Storm Drain Nodes layer is in edit mode. Save changes and proceed?"
+                if not self.uc.question(q):
+                    self.uc.bar_info("Action cancelled", dur=3)
+                    return
+                self.lyrs.save_lyrs_edits(layer_name, "user_swmm_nodes")
+                if self.lyrs.any_lyr_in_edit(layer_name, "user_swmm_nodes"):
+                    self.uc.bar_warn("Could not save edits of " + link_name + " or Storm Drain Nodes layer!")
+                    return
+
             proceed = self.uc.question("Do you want to overwrite " + link_name + " Inlet and Outlet nodes names?")
             if not proceed:
                 return    
@@ -2846,61 +2722,29 @@ class StormDrainEditorWidget(qtBaseClass, uiDialog):
             self.user_swmm_orifices_lyr if link_name == "Orifices" else  
             self.user_swmm_weirs_lyr if link_name == "Weirs" else  
             self.user_swmm_conduits_lyr)                                                    
-              
-            link_fields = layer.fields()
-        
-            link_inlet_fld_idx = link_fields.lookupField(link_inlet)
-            link_outlet_fld_idx = link_fields.lookupField(link_outlet)
-            nodes_features, nodes_index = spatial_index(self.user_swmm_nodes_lyr)
-            buffer_distance, segments = 5.0, 5
-            link_nodes = {}
-            for feat in layer.getFeatures():
-                fid = feat.id()
-                geom = feat.geometry()
-                geom_poly = geom.asPolyline()
-                start_pnt, end_pnt = geom_poly[0], geom_poly[-1]
-                start_geom = QgsGeometry.fromPointXY(start_pnt)
-                end_geom = QgsGeometry.fromPointXY(end_pnt)
-                start_buffer = start_geom.buffer(buffer_distance, segments)
-                end_buffer = end_geom.buffer(buffer_distance, segments)
-                start_nodes, end_nodes = [], []
-
-                start_nodes_ids = nodes_index.intersects(start_buffer.boundingBox())
-                for node_id in start_nodes_ids:
-                    node_feat = nodes_features[node_id]
-                    if node_feat.geometry().within(start_buffer):
-                        start_nodes.append(node_feat)
-
-                end_nodes_ids = nodes_index.intersects(end_buffer.boundingBox())
-                for node_id in end_nodes_ids:
-                    node_feat = nodes_features[node_id]
-                    if node_feat.geometry().within(end_buffer):
-                        end_nodes.append(node_feat)
-
-                start_nodes.sort(key=lambda f: f.geometry().distance(start_geom))
-                end_nodes.sort(key=lambda f: f.geometry().distance(end_geom))
-                closest_inlet_feat = start_nodes[0] if start_nodes else None
-                closest_outlet_feat = end_nodes[0] if end_nodes else None
-                if closest_inlet_feat is not None:
-                    inlet_name = closest_inlet_feat["name"]
-                else:
-                    inlet_name = None
-                if closest_outlet_feat is not None:
-                    outlet_name = closest_outlet_feat["name"]
-                else:
-                    outlet_name = None
-                link_nodes[fid] = inlet_name, outlet_name
-
-            layer.startEditing()
-            for fid, (inlet_name, outlet_name) in link_nodes.items():
-                layer.changeAttributeValue(fid, link_inlet_fld_idx, inlet_name)
-                layer.changeAttributeValue(fid, link_outlet_fld_idx, outlet_name)
-            layer.commitChanges()
+
+            tolerance = snap_tolerance(QSettings().value("FLO-2D/SD_snap_tolerance", SNAP_TOLERANCE))
+            if tolerance is None:
+                tolerance = SNAP_TOLERANCE
+                self.uc.bar_warn("Invalid snapping tolerance setting, default " + str(SNAP_TOLERANCE) + " used.")
+            n_links, unmatched, ambiguous = snap_link_nodes(self.gutils, link_name, tolerance)
+            layer.reload()
             layer.triggerRepaint()
             QApplication.restoreOverrideCursor()
-            self.uc.show_info(
-                "Inlet and Outlet node names successfully assigned to " + str(len(link_nodes)) + " " + link_name + "!"
-            )
+            msg = "Inlet and Outlet node names successfully assigned to " + str(n_links) + " " + link_name + "!"
+            if unmatched:
+                msg += (
+                    "\n\n" + str(len(unmatched)) + " " + link_name + " without node within "
+                    + str(tolerance) + " of an endpoint:\n" + ", ".join(str(n) for n in unmatched[:50])
+                    + (", ..." if len(unmatched) > 50 else "")
+                )
+            if ambiguous:
+                msg += (
+                    "\n\n" + str(len(ambiguous)) + " " + link_name + " with several nodes within "
+                    + str(tolerance) + " of an endpoint (closest assigned):\n"
+                    + ", ".join(str(n) for n in ambiguous[:50]) + (", ..." if len(ambiguous) > 50 else "")
+                )
+            self.uc.show_info(msg)
         except Exception as e:
             QApplication.restoreOverrideCursor()
             self.uc.show_error("ERROR 210322.0429: Couldn't assign " + link_name + " nodes!", e)
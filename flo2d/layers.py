@@ -959,16 +959,6 @@ class Layers(object):
                         "readonly": True,
                     },
                 ),
-                (
-                    "raincell_data",
-                    {
-                        "name": "Realtime Rainfall Data",
-                        "sgroup": "Rain Tables",
-                        "styles": None,
-                        "attrs_edit_widgets": {},
-                        "readonly": True,
-                    },
-                ),
                 # Calibration Data:
                 (
                     "wstime",
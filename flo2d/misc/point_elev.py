@@ -15,13 +15,11 @@ import tempfile
 import time
 import timeit
 import traceback
-import subprocess
-from subprocess import Popen, PIPE, STDOUT
 import numpy as np
 
 sys.path.append(os.path.dirname(__file__))
-from pip_install import pip_install
 from affine import Affine
+from xyz_gridding import grid_xyz, read_xyz_csv
 
 with warnings.catch_warnings():
     warnings.filterwarnings("ignore", category=DeprecationWarning)
@@ -40,23 +38,6 @@ def print_line(message,*arg,**kwargs):
     else:
         GUI_STDIO.logMessage.emit(message,False)
 
-def install_dask():
-    available = True
-    try:
-        import dask
-        from dask.distributed import Client
-    except:
-        print_line('Missing dask dependencies.')
-        print_line('Trying to install dask library ...\n')
-        pip_install('dask[complete],dask[distributed],pandas',pipe=print_line)
-        try:
-            import dask
-        except:
-            print_line('Problem with dask library\n')
-            print_line(traceback.format_exc()+'\n')
-            available = False
-    return available        
-
 def gdal_progress_callback(complete,message,data):
     value = complete * 100
     if len(data) == 1:
@@ -97,6 +78,14 @@ GDALGRID_METHOD_PARAM_DICT = { 'Average': ('radius1','radius2','angle','min poin
                                'Linear': ('radius','nodata'),
                              }
 
+# In-process gridding methods (see xyz_gridding.py) and their statistic.
+GDS_STATISTICS = {'Average GDS': 'mean',
+                  'Median GDS': 'median',
+                  'Minimum GDS': 'min',
+                  'Maximum GDS': 'max',
+                  'Count GDS': 'count',
+                 }
+
 class ResamplingOption:
     def __init__(self,method,**kwargs):
         if method == 'Inverse Distance':
@@ -290,24 +279,11 @@ def raster_to_xyz(raster_inpath, xyz_outpath, set_integer_nodata = False, remove
 
     @timer
     def _remove_xyz_nodata():
-        if not install_dask():
-            gdal_callback_data = ['XYZ file--Remove Nodata']
-            ogr_opt = gdal.VectorTranslateOptions(format = 'CSV',
-                                                  accessMode = 'overwrite',
-                                                  SQLStatement = "SELECT CAST(X as float),CAST(Y as float),CAST(Z as float) FROM {0:s} WHERE Z > '{1:f}'".format(os.path.basename(xyz_outpath)[:-4], src_nodata),
-                                                  options = ['SEPARATOR=COMMA'], # 'STRING_QUOTING=IF_NEEDED'],
-                                                  callback = gdal_progress_callback,
-                                                  callback_data = gdal_callback_data,
-                                                  )
-            gdal.VectorTranslate(xyz_temp_outpath, xyz_outpath, options = ogr_opt)
-        else:
-            print_line('>>> Using dask to remove nodata from XYZ file.\n')
-            import dask.dataframe as dd
-            df = dd.read_csv(xyz_outpath)
-            df_revised = df[df.Z > src_nodata]
-            df_revised.to_csv(xyz_temp_outpath,
-                              single_file = True,
-                              index = False)
+        with open(xyz_temp_outpath, 'w') as out:
+            out.write('X,Y,Z\n')
+            for xs, ys, zs in read_xyz_csv(xyz_outpath):
+                valid = zs > src_nodata
+                np.savetxt(out, np.column_stack((xs[valid], ys[valid], zs[valid])), fmt = '%.4f', delimiter = ',')
     if remove_nodata:        
         _remove_xyz_nodata()        
         if os.path.exists(xyz_temp_outpath):
@@ -359,40 +335,45 @@ def xyz_to_raster(xyz_inpath, extents, shape, resampling_option, srs, layername=
     return raster_outpath
 
 @timer
-def xyz_to_raster_gds_average(csv_file,extents,shape,srs,open_dashboard, procs, threads, nodata = None):
-    print_line('XYZ-to-Raster-Average\n')
-    if install_dask():
-        base_path, ext = os.path.splitext(csv_file)
-        raster_outpath = '{}_gdsgrid.tif'.format(base_path) # hard-coded path
-        py_script = os.path.join(os.path.dirname(__file__),'calc_average_elev.py')
-        xmin,ymin,xmax,ymax = [str(x) for x in extents]
-        rows,cols = [str(x) for x in shape]
-        try:
-            result = subprocess.run(['python3',py_script,
-                                      csv_file,
-                                      xmin,ymin,xmax,ymax,
-                                      rows,cols,
-                                      srs,
-                                      str(open_dashboard),
-                                      str(procs),
-                                      str(threads),
-                                      str(nodata)
-                                    ],
-                                      capture_output = True,
-                                      check = True,
-                                      #stdout = PIPE,
-                                      #stderr= STDOUT,
-                                      text = True,
-                                      env = os.environ
-                                  )
-        except subprocess.CalledProcessError as e:
-            print_line('Subprocess output: %s'%e.output)
-            print_line('Subprocess STDError: %s'%e.stderr)
-            raise Exception('xyz to raster failed. Check the printed error message.')
+def xyz_to_raster_gds_average(csv_file, extents, shape, srs, nodata = None, statistic = 'mean'):
+    print_line('XYZ-to-Raster-{}\n'.format(statistic.capitalize()))
+    base_path, ext = os.path.splitext(csv_file)
+    raster_outpath = '{}_gdsgrid.tif'.format(base_path) # hard-coded path
+    grid_nodata = -9999
+    xmin,ymin,xmax,ymax = extents
+    cellsize = (ymax - ymin)*1.0/shape[0]
+    transform = Affine(cellsize,0,xmin,0,-cellsize,ymax)
+    raster_array, inside, outside = grid_xyz(csv_file, transform, shape,
+                                             statistic = statistic,
+                                             nodata = nodata,
+                                             grid_nodata = grid_nodata)
+    print_line('{0:,d} points inside and {1:,d} points outside the raster.\n'.format(inside, outside))
+    write_geotiff(raster_outpath, raster_array, transform, srs, grid_nodata)
+    return raster_outpath
 
-        else:
-            print_line('Subprocess STDOUT: %s'%result.stdout)
-            return raster_outpath
+def write_geotiff(raster_outpath, raster_array, transform, srs, nodata):
+    if os.path.exists(raster_outpath):
+        os.unlink(raster_outpath)
+    rows, cols = raster_array.shape
+    driver = gdal.GetDriverByName('GTiff')
+    ds = driver.Create(raster_outpath, cols, rows, 1, gdal.GDT_Float32)
+    crs = osr.SpatialReference()
+    wkt = srs
+    try:
+        # check if srs is Proj4
+        crs.ImportFromProj4(srs)
+        wkt = crs.ExportToWkt()
+    except:
+        pass
+
+    ds.SetProjection(wkt)
+    ds.SetGeoTransform(transform.to_gdal())
+    band = ds.GetRasterBand(1)
+    band.WriteArray(raster_array)
+    band.SetNoDataValue(float(nodata))
+    band.FlushCache()
+    ds = None
+    return raster_outpath
 
 
 if __name__ == '__main__':
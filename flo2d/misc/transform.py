@@ -11,9 +11,11 @@
 """
 from __future__ import division
 
-import collections
+import collections.abc
 import math
 
+import numpy as np
+
 from affine import Affine
 
 
@@ -150,10 +152,10 @@ def xy(transform, rows, cols, offset='center'):
 
     single_col = False
     single_row = False
-    if not isinstance(cols, collections.Iterable):
+    if not isinstance(cols, collections.abc.Iterable):
         cols = [cols]
         single_col = True
-    if not isinstance(rows, collections.Iterable):
+    if not isinstance(rows, collections.abc.Iterable):
         rows = [rows]
         single_row = True
 
@@ -196,9 +198,9 @@ def rowcol(transform, xs, ys, op=math.floor, precision=None):
     ----------
     transform : Affine
         Coefficients mapping pixel coordinates to coordinate reference system.
-    xs : list or float
+    xs : list, float or numpy array
         x values in coordinate reference system
-    ys : list or float
+    ys : list, float or numpy array
         y values in coordinate reference system
     op : function
         Function to convert fractional pixels to whole numbers (floor, ceiling,
@@ -207,21 +209,12 @@ def rowcol(transform, xs, ys, op=math.floor, precision=None):
         Decimal places of precision in indexing, as in `round()`.
     Returns
     -------
-    rows : list of ints
+    rows : list of ints (int64 array for array input)
         list of row indices
-    cols : list of ints
+    cols : list of ints (int64 array for array input)
         list of column indices
     """
 
-    single_x = False
-    single_y = False
-    if not isinstance(xs, collections.Iterable):
-        xs = [xs]
-        single_x = True
-    if not isinstance(ys, collections.Iterable):
-        ys = [ys]
-        single_y = True
-
     if precision is None:
         eps = 0.0
     else:
@@ -229,6 +222,21 @@ def rowcol(transform, xs, ys, op=math.floor, precision=None):
 
     invtransform = ~transform
 
+    if isinstance(xs, np.ndarray) or isinstance(ys, np.ndarray):
+        # Vectorized form, returning integer arrays.
+        vop = {math.floor: np.floor, math.ceil: np.ceil, round: np.rint}.get(op, op)
+        fcol, frow = invtransform * (np.asarray(xs, dtype=float) + eps, np.asarray(ys, dtype=float) - eps)
+        return vop(frow).astype(np.int64), vop(fcol).astype(np.int64)
+
+    single_x = False
+    single_y = False
+    if not isinstance(xs, collections.abc.Iterable):
+        xs = [xs]
+        single_x = True
+    if not isinstance(ys, collections.abc.Iterable):
+        ys = [ys]
+        single_y = True
+
     rows = []
     cols = []
     for x, y in zip(xs, ys):
@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+
+# FLO-2D Preprocessor tools for QGIS
+# Copyright © 2021 Lutra Consulting for FLO-2D
+
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version
+"""
+In-process gridding of XYZ CSV points into raster arrays.
+
+The CSV file is streamed in blocks, pixel rows and columns of the points are computed with vectorized 'rowcol'
+and the Z values are reduced per flat pixel index with np.bincount (mean, count), ufunc.at (min, max)
+or a single sort (median).
+
+Median is not streamed: Z values and pixel indexes of all points inside the raster are kept in memory
+(12 bytes per point, e.g. 1.2 GB for 100 million points) and sorted at once. Other statistics only need
+arrays of the raster size.
+"""
+import os
+import sys
+import warnings
+import numpy as np
+
+sys.path.append(os.path.dirname(__file__))
+from transform import rowcol
+
+STATISTICS = ("mean", "min", "max", "count", "median")
+
+# Bytes of CSV text parsed at once.
+BLOCK_SIZE = 64 * 1024 * 1024
+
+
+def csv_xyz_columns(header):
+    """
+    Positions of X, Y and Z columns in CSV header line (first three columns if they are not named).
+    """
+    names = [n.strip().strip('"').upper() for n in header.split(",")]
+    if all(n in names for n in ("X", "Y", "Z")):
+        return len(names), (names.index("X"), names.index("Y"), names.index("Z"))
+    return len(names), (0, 1, 2)
+
+
+def read_xyz_csv(csv_file, block_size=BLOCK_SIZE):
+    """
+    Generator of (x, y, z) arrays read from comma separated file with header in blocks of about 'block_size' bytes.
+    """
+    with open(csv_file, "r") as f:
+        n_columns, (xcol, ycol, zcol) = csv_xyz_columns(f.readline())
+        first_line = 2
+        while True:
+            lines = f.readlines(block_size)
+            if not lines:
+                break
+            try:
+                with warnings.catch_warnings():
+                    # Block of empty lines only warns.
+                    warnings.simplefilter("ignore", UserWarning)
+                    values = np.loadtxt(lines, delimiter=",", ndmin=2, comments=None).reshape(-1, n_columns)
+            except ValueError:
+                raise ValueError("Invalid XYZ data in {} after line {}".format(os.path.basename(csv_file), first_line))
+            first_line += len(lines)
+            yield values[:, xcol], values[:, ycol], values[:, zcol]
+
+
+class PixelReducer(object):
+    """
+    Accumulator of Z values per flat pixel index for one of the STATISTICS.
+    Median buffers all added points (see module docstring).
+    """
+
+    def __init__(self, size, statistic="mean"):
+        if statistic not in STATISTICS:
+            raise ValueError("Unknown statistic '{}'".format(statistic))
+        self.size = size
+        self.statistic = statistic
+        self.count = np.zeros(size, dtype=np.int64)
+        if statistic == "mean":
+            self.sum = np.zeros(size, dtype=float)
+        elif statistic == "min":
+            self.value = np.full(size, np.inf)
+        elif statistic == "max":
+            self.value = np.full(size, -np.inf)
+        elif statistic == "median":
+            self.pixels = []
+            self.values = []
+
+    def add(self, pixels, zs):
+        self.count += np.bincount(pixels, minlength=self.size)
+        if self.statistic == "mean":
+            self.sum += np.bincount(pixels, weights=zs, minlength=self.size)
+        elif self.statistic == "min":
+            np.minimum.at(self.value, pixels, zs)
+        elif self.statistic == "max":
+            np.maximum.at(self.value, pixels, zs)
+        elif self.statistic == "median":
+            # Pixel indexes of the buffered points are stored in 4 bytes where possible.
+            self.pixels.append(pixels.astype(np.int32 if self.size < 2 ** 31 else np.int64))
+            self.values.append(zs.copy())
+
+    def result(self, nodata):
+        out = np.full(self.size, float(nodata))
+        has_points = self.count > 0
+        if self.statistic == "mean":
+            out[has_points] = self.sum[has_points] / self.count[has_points]
+        elif self.statistic in ("min", "max"):
+            out[has_points] = self.value[has_points]
+        elif self.statistic == "count":
+            out[has_points] = self.count[has_points]
+        elif self.statistic == "median" and self.pixels:
+            pixels = np.concatenate(self.pixels)
+            values = np.concatenate(self.values)
+            values = values[np.lexsort((values, pixels))]
+            counts = self.count[has_points]
+            starts = np.cumsum(counts) - counts
+            out[has_points] = 0.5 * (values[starts + (counts - 1) // 2] + values[starts + counts // 2])
+        return out
+
+
+def grid_xyz(csv_file, transform, shape, statistic="mean", nodata=None, grid_nodata=-9999, block_size=BLOCK_SIZE):
+    """
+    Gridding XYZ CSV points into raster array of given (rows, cols) shape with 'grid_nodata' for empty pixels.
+    Points with Z not greater than 'nodata' + 0.1 are skipped. Returns (float32 array, points inside, points outside).
+    """
+    rows, cols = shape
+    reducer = PixelReducer(rows * cols, statistic)
+    inside_count, outside_count = 0, 0
+    for xs, ys, zs in read_xyz_csv(csv_file, block_size):
+        if nodata is not None:
+            valid = zs > float(nodata) + 0.1  # assuming elevation smaller than nodata is nodata too
+            xs, ys, zs = xs[valid], ys[valid], zs[valid]
+        r, c = rowcol(transform, xs, ys)
+        inside = (r >= 0) & (r < rows) & (c >= 0) & (c < cols)
+        n_inside = int(np.count_nonzero(inside))
+        inside_count += n_inside
+        outside_count += zs.shape[0] - n_inside
+        reducer.add(r[inside] * cols + c[inside], zs[inside])
+    array = reducer.result(grid_nodata).reshape(rows, cols).astype(np.float32)
+    return array, inside_count, outside_count
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+
+# FLO-2D Preprocessor tools for QGIS
+# Copyright © 2021 Lutra Consulting for FLO-2D
+
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version
+
+import sqlite3
+import time
+import unittest
+import numpy as np
+
+from flo2d.flo2d_tools.conflicts import Conflicts, COMPONENT_CELLS, CONFLICT_RULES, rule_selected
+
+
+def legacy_errors(con):
+    # One SQL query per rule, as in the former CurrentConflictsDialog.conflict4.
+    sources = {key: (comp, table, column) for key, comp, table, column in COMPONENT_CELLS}
+    errors = []
+    for key1, key2, description in CONFLICT_RULES:
+        comp1, table1, cell_1 = sources[key1]
+        comp2, table2, cell_2 = sources[key2]
+        if key1 == key2:
+            sql = "SELECT {0} FROM {1} WHERE {0} IS NOT NULL GROUP BY {0} HAVING COUNT(*) > 1 ORDER BY {0}".format(
+                cell_1, table1
+            )
+        else:
+            sql = """SELECT DISTINCT {0} FROM {1} WHERE {0} IN
+                     (SELECT {0} FROM {1} INTERSECT SELECT {2} FROM {3}) ORDER BY {0}""".format(
+                cell_1, table1, cell_2, table2
+            )
+        for row in con.execute(sql).fetchall():
+            errors.append([str(row[0]), comp1, comp2, description])
+    return errors
+
+
+class TestConflicts(unittest.TestCase):
+    def setUp(self):
+        self.con = sqlite3.connect(":memory:")
+        columns = {}
+        for key, comp, table, column in COMPONENT_CELLS:
+            columns.setdefault(table, []).append(column)
+        for table, cols in columns.items():
+            self.con.execute("CREATE TABLE {} ({});".format(table, ", ".join(cols)))
+
+    def tearDown(self):
+        self.con.close()
+
+    def insert(self, table, column, cells):
+        self.con.executemany("INSERT INTO {} ({}) VALUES (?);".format(table, column), [(c,) for c in cells])
+
+    def test_errors(self):
+        self.insert("inflow_cells", "grid_fid", [5, 7, 5])
+        self.insert("outflow_cells", "grid_fid", [7, 9])
+        self.insert("swmmflo", "swmm_jt", [9, 9, 12])
+        self.con.executemany("INSERT INTO struct (inflonod, outflonod) VALUES (?, ?);", [(12, 3), (None, 3)])
+        errors = Conflicts(self.con).errors()
+        self.assertIn(["5", "Inflows", "Inflows", "2 or more inflows"], errors)
+        self.assertIn(["7", "Inflows", "Outflows", "Inflow and outflow in same cell"], errors)
+        self.assertIn(["9", "Storm Drain Inlets", "Storm Drain Inlets", "2 or more Storm Drain Inlets in same cell"], errors)
+        self.assertIn(["3", "Hydr. Structures", "Hydr. Structures", "More than one Hyd. Struc out-cell in same element"], errors)
+        self.assertEqual(len(errors), 6)
+        filtered = Conflicts(self.con).errors("Inflows", "Outflows")
+        self.assertListEqual(filtered, [["7", "Inflows", "Outflows", "Inflow and outflow in same cell"]])
+
+    def test_errors_match_legacy(self):
+        rng = np.random.default_rng(0)
+        for key, comp, table, column in COMPONENT_CELLS:
+            if column in ("inflonod", "outflonod"):
+                continue
+            self.insert(table, column, rng.integers(1, 200, 20).tolist())
+        self.con.executemany(
+            "INSERT INTO struct (inflonod, outflonod) VALUES (?, ?);", rng.integers(1, 200, (20, 2)).tolist()
+        )
+        self.assertListEqual(Conflicts(self.con).errors(), legacy_errors(self.con))
+
+    def test_rule_selected(self):
+        self.assertTrue(rule_selected("Inflows", "Levees", "All", "All"))
+        self.assertTrue(rule_selected("Inflows", "Levees", "Levees", "All"))
+        self.assertTrue(rule_selected("Inflows", "Levees", "Levees", "Inflows"))
+        self.assertFalse(rule_selected("Inflows", "Levees", "Streets", "All"))
+
+    @unittest.skip("Skipping test due to long run.")
+    def test_errors_benchmark(self):
+        rng = np.random.default_rng(0)
+        n_cells = 3000000
+        for key, comp, table, column in COMPONENT_CELLS:
+            if column in ("inflonod", "outflonod"):
+                continue
+            self.insert(table, column, rng.integers(1, n_cells, 40000).tolist())
+        start = time.time()
+        errors = Conflicts(self.con).errors()
+        engine = time.time() - start
+        start = time.time()
+        legacy_errors(self.con)
+        legacy = time.time() - start
+        print("{0:,d} conflicts: engine {1:.2f} s, legacy SQL {2:.2f} s".format(len(errors), engine, legacy))
+
+
+# Running tests:
+if __name__ == "__main__":
+    cases = [TestConflicts]
+    suite = unittest.TestSuite()
+    for t in cases:
+        tests = unittest.TestLoader().loadTestsFromTestCase(t)
+        suite.addTest(tests)
+    unittest.TextTestRunner(verbosity=2).run(suite)
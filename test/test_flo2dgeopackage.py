@@ -9,7 +9,13 @@
 # of the License, or (at your option) any later version
 
 import os
+import shutil
+import sqlite3
+import tempfile
+import time
 import unittest
+from unittest import mock
+import numpy as np
 from .utilities import get_qgis_app
 
 QGIS_APP = get_qgis_app()
@@ -19,8 +25,27 @@ VECTOR_PATH = os.path.join(THIS_DIR, "data", "vector")
 EXPORT_DATA_DIR = os.path.join(THIS_DIR, "data")
 CONT = os.path.join(IMPORT_DATA_DIR, "CONT.DAT")
 
-from flo2d.geopackage_utils import database_create
+from flo2d.user_communication import UserCommunication
+from flo2d.geopackage_utils import (
+    Connection,
+    database_create,
+    database_disconnect,
+    GeoPackageUtils,
+    statement_counters,
+    tune_connection,
+    SCHEMA_VERSION,
+)
+from flo2d.gpb_utils import centered_squares_gpb, points_gpb
 from flo2d.flo2d_ie.flo2dgeopackage import Flo2dGeoPackage
+from flo2d.flo2d_ie.export_scheduler import ExportScheduler, DeferredCommunication, export_chains, MANIFEST
+from flo2d.flo2d_tools.grid_index import project_grid_index
+from flo2d.flo2d_tools.grid_tools import three_adjacent_grid_elevations
+from flo2d.flo2d_tools.schematic_tools import schematize_storm_drain_nodes
+from flo2d.flo2d_tools.debug_issues import DebugIssues, read_debug_file
+from flo2d.flo2d_ie.rainfall_io import RaincellStore, RasterSampler, MISSING
+from flo2d.flo2d_tools.raster_cache import RasterCache, cached_raster2grid
+from flo2d.flo2d_tools.raster_sampling import WarpSettings, raster2grid_np
+from osgeo import gdal
 
 
 def file_len(fname):
@@ -40,6 +65,46 @@ def export_paths(*inpaths):
     return paths
 
 
+def legacy_mannings_n_topo(gutils, outdir):
+    # Former export_mannings_n_topo, with cells centers parsed from WKT.
+    sql = """SELECT fid, n_value, elevation, ST_AsText(ST_Centroid(GeomFromGPB(geom))) FROM grid ORDER BY fid;"""
+    mline = "{0: >10} {1: >10}\n"
+    tline = "{0: >15} {1: >15} {2: >10}\n"
+    with open(os.path.join(outdir, "MANNINGS_N.DAT"), "w") as m, open(os.path.join(outdir, "TOPO.DAT"), "w") as t:
+        for fid, man, elev, geom in gutils.execute(sql):
+            x, y = geom.strip("POINT()").split()
+            m.write(mline.format(fid, "{0:.3f}".format(man)))
+            t.write(tline.format("{0:.4f}".format(float(x)), "{0:.4f}".format(float(y)), "{0:.4f}".format(elev)))
+
+
+def legacy_three_adjacent_grid_elevations(gutils, cell, direction, cell_size):
+    # Former three_adjacent_grid_elevations, with one grid_on_point and elevation query per adjacent cell.
+    offsets = {
+        1: ((-1, 1), (0, 1), (1, 1)),
+        2: ((1, 1), (1, 0), (1, -1)),
+        3: ((1, -1), (0, -1), (-1, -1)),
+        4: ((-1, -1), (-1, 0), (-1, 1)),
+        5: ((0, 1), (1, 1), (1, 0)),
+        6: ((1, 0), (1, -1), (0, -1)),
+        7: ((0, -1), (-1, -1), (-1, 0)),
+        8: ((-1, 0), (-1, 1), (0, 1)),
+    }
+    xx, yy = [float(i) for i in gutils.single_centroid(cell).strip("POINT()").split()]
+    elevs = []
+    for dx, dy in offsets[direction]:
+        grid = gutils.grid_on_point(xx + dx * cell_size, yy + dy * cell_size)
+        if grid is not None:
+            elevs.append(gutils.execute("""SELECT elevation FROM grid WHERE fid = ?;""", (grid,)).fetchone()[0])
+        else:
+            elevs.append(-99999)
+    return elevs
+
+
+def read_bytes(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
 class TestFlo2dGeoPackage(unittest.TestCase):
     con = database_create(":memory:")
 
@@ -81,6 +146,375 @@ class TestFlo2dGeoPackage(unittest.TestCase):
         elevation = self.f2g.execute("""SELECT fid FROM grid WHERE elevation IS NULL;""").fetchone()
         self.assertIsNone(elevation)
 
+    def test_build_square_gpb(self):
+        geom = self.f2g.build_square("POINT(100.5 200.5)", 10)
+        wkt = self.f2g.execute("""SELECT ST_AsText(GeomFromGPB(?));""", (geom,)).fetchone()[0]
+        self.assertEqual(wkt, "POLYGON((95.5 195.5, 105.5 195.5, 105.5 205.5, 95.5 205.5, 95.5 195.5))")
+        geoms = self.f2g.build_squares([100.5, 300.5], [200.5, 400.5], 10)
+        self.assertEqual(geoms[0], geom)
+        self.assertEqual(len(geoms), 2)
+
+    def test_grid_centroids(self):
+        gids = ["1", 2, 9205]
+        cells = self.f2g.grid_centroids(gids)
+        for gid in gids:
+            x, y = [float(i) for i in cells[gid].strip("POINT()").split()]
+            sx, sy = [float(i) for i in self.f2g.single_centroid(gid).strip("POINT()").split()]
+            self.assertAlmostEqual(x, sx)
+            self.assertAlmostEqual(y, sy)
+        self.assertIsNone(self.f2g.grid_centroids([9206])[9206])
+
+    def test_grid_index(self):
+        self.f2g.import_cont_toler()
+        index = project_grid_index(self.f2g)
+        x, y = index.center(100)
+        self.assertEqual(index.cell_on_point(x, y), 100)
+        self.assertEqual(self.f2g.grid_on_point(x, y), 100)
+        for name, dx, dy in (("N", 0, 1), ("E", 1, 0), ("SW", -1, -1)):
+            expected = self.f2g.grid_on_point(x + dx * index.cell_size, y + dy * index.cell_size)
+            self.assertEqual(index.neighbour(100, name), expected)
+        elevation = self.f2g.execute("""SELECT elevation FROM grid WHERE fid = 100;""").fetchone()[0]
+        self.assertAlmostEqual(index.elevation(100), elevation)
+
+    def test_three_adjacent_grid_elevations(self):
+        self.f2g.import_cont_toler()
+        index = project_grid_index(self.f2g)
+        fids = index.fids()
+        boundary = fids[index.boundary_cells_np(fids)]
+        for cell in (100, int(fids[len(fids) // 2]), int(boundary[0]), int(boundary[-1])):
+            for direction in range(1, 9):
+                expected = legacy_three_adjacent_grid_elevations(self.f2g, cell, direction, index.cell_size)
+                elevs = three_adjacent_grid_elevations(self.f2g, None, cell, direction, index.cell_size)
+                self.assertEqual(len(elevs), 3)
+                for elev, legacy in zip(elevs, expected):
+                    self.assertAlmostEqual(elev, legacy)
+
+    def test_grid_index_cache(self):
+        index = project_grid_index(self.f2g)
+        self.assertIs(project_grid_index(self.f2g), index)
+        # Other database with the same path (here in memory) gets its own index.
+        con = database_create(":memory:")
+        try:
+            gutils = GeoPackageUtils(con, None)
+            self.assertEqual(project_grid_index(gutils).fids().shape[0], 0)
+            self.assertGreater(project_grid_index(self.f2g).fids().shape[0], 0)
+        finally:
+            con.close()
+
+    def test_migrate(self):
+        con = database_create(":memory:")
+        try:
+            gutils = GeoPackageUtils(con, None)
+            self.assertEqual(gutils.schema_version(), SCHEMA_VERSION)
+            self.assertEqual(len(gutils.database_id()), 32)
+            self.assertListEqual(gutils.migrate(), [])
+            self.assertEqual(gutils.table_change_counter("grid"), 0)
+            # GeoPackage of older plugin without change tracking.
+            gutils.execute("""DELETE FROM table_changes;""")
+            gutils.execute("""DROP TABLE flo2d_metadata;""")
+            gutils.execute("""DROP TRIGGER "find_breach_cells_deferred_insert";""")
+            gutils.execute("""DROP TABLE debug_issues;""")
+            gutils.execute("""DELETE FROM gpkg_geometry_columns WHERE table_name = 'debug_issues';""")
+            gutils.execute("""DELETE FROM gpkg_contents WHERE table_name = 'debug_issues';""")
+            gutils.execute("""INSERT INTO raincell (rainintime, irinters, timestamp) VALUES (15, 2, '');""")
+            rows = [(3, 0, 0.5), (1, 0, 0.25), (3, 15, 1.5)]
+            gutils.execute_many("""INSERT INTO raincell_data (rrgrid, time_interval, iraindum) VALUES (?,?,?);""", rows)
+            schema = gutils.execute("""SELECT COUNT(*) FROM sqlite_master;""").fetchone()[0]
+            # Reading counters doesn't change the schema.
+            self.assertIsNone(gutils.table_change_counter("grid"))
+            self.assertIsNone(gutils.database_id())
+            self.assertEqual(gutils.execute("""SELECT COUNT(*) FROM sqlite_master;""").fetchone()[0], schema)
+            self.assertEqual(len(gutils.migrate()), SCHEMA_VERSION)
+            self.assertEqual(gutils.schema_version(), SCHEMA_VERSION)
+            self.assertIsNotNone(gutils.database_id())
+            qry = """SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name = 'find_breach_cells_deferred_insert';"""
+            self.assertIsNotNone(gutils.execute(qry).fetchone())
+            qry = """SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = 'debug_issues_code';"""
+            self.assertIsNotNone(gutils.execute(qry).fetchone())
+            # Realtime rainfall of former plugin versions is moved only on request.
+            store = RaincellStore(gutils)
+            self.assertTrue(store.has_legacy_data())
+            self.assertEqual(store.cells().shape[0], 0)
+            store.migrate()
+            self.assertFalse(store.has_legacy_data())
+            self.assertListEqual(store.cells().tolist(), [1, 3])
+            self.assertListEqual(store.interval(1).tolist(), [MISSING, 1.5])
+            self.assertIsNone(gutils.execute("""SELECT 1 FROM raincell_data;""").fetchone())
+            gutils.execute("""INSERT INTO grid (elevation) VALUES (1.0);""")
+            self.assertEqual(gutils.table_change_counter("grid"), 1)
+            self.assertEqual(gutils.table_change_counter("grid", ("geom",)), 1)
+            gutils.execute("""UPDATE grid SET elevation = 2.0;""")
+            self.assertEqual(gutils.table_change_counter("grid"), 2)
+            self.assertEqual(gutils.table_change_counter("grid", ("geom",)), 1)
+            # Row triggers of grid counters of former plugin versions are dropped.
+            gutils.track_table_changes("grid")
+            gutils.set_metadata("schema_version", "3")
+            self.assertEqual(len(gutils.migrate()), 1)
+            qry = """SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name LIKE 'track_grid%';"""
+            self.assertIsNone(gutils.execute(qry).fetchone())
+        finally:
+            con.close()
+
+    def test_statement_counters(self):
+        self.assertListEqual(statement_counters("""INSERT INTO grid (geom) VALUES (?);"""), ["grid", "grid_geom"])
+        self.assertListEqual(statement_counters("""\n UPDATE grid SET elevation = ? WHERE fid = ?;"""), ["grid"])
+        self.assertListEqual(statement_counters("""UPDATE "grid" SET "geom" = ? WHERE fid = ?;"""), ["grid", "grid_geom"])
+        self.assertListEqual(statement_counters("""delete from grid;"""), ["grid", "grid_geom"])
+        self.assertListEqual(statement_counters("""UPDATE grid_x SET geom = ?;"""), [])
+        self.assertListEqual(statement_counters("""SELECT * FROM grid;"""), [])
+
+    def test_grid_index_neighbours_np(self):
+        self.f2g.import_cont_toler()
+        index = project_grid_index(self.f2g)
+        fids = index.fids()
+        neighbours = index.neighbours_np(fids)
+        self.assertEqual(neighbours.shape, (len(fids), 8))
+        for i in (0, len(fids) // 2, len(fids) - 1):
+            expected = [n if n is not None else -9999 for n in index.neighbours(fids[i])]
+            self.assertListEqual(list(neighbours[i]), expected)
+        boundary = index.boundary_cells_np(fids)
+        self.assertEqual(bool(boundary[0]), index.is_boundary_cell(fids[0]))
+        self.assertFalse(index.boundary_cells_np([0])[0])
+
+    def test_schematize_storm_drain_nodes(self):
+        self.f2g.import_cont_toler()
+        index = project_grid_index(self.f2g)
+        x, y = index.center(100)
+        nodes = [
+            (x + 1, y - 1, "I", "I1", 4, "RT1", "False"),
+            (x, y + index.cell_size, "J", "J1", 1, None, "False"),
+            (x - index.cell_size, y, "O", "O1", 0, None, "True"),
+            (-1e9, -1e9, "O", "O2", 0, None, "False"),
+        ]
+        geoms = points_gpb([n[0] for n in nodes], [n[1] for n in nodes], 0)
+        self.f2g.execute_many(
+            """INSERT INTO user_swmm_nodes (geom, sd_type, name, intype, rt_name, swmm_allow_discharge)
+            VALUES (?, ?, ?, ?, ?, ?);""",
+            [(geom,) + n[2:] for geom, n in zip(geoms, nodes)],
+        )
+        self.f2g.execute("""INSERT INTO swmmflort (name) VALUES ('RT1');""")
+        self.assertTupleEqual(schematize_storm_drain_nodes(self.f2g), (2, 2, 1))
+        inlets = self.f2g.execute("""SELECT swmm_jt, swmm_iden, intype FROM swmmflo ORDER BY fid;""").fetchall()
+        self.assertListEqual(inlets, [(100, "I1", 4), (index.neighbour(100, "N"), "J1", 1)])
+        outlets = self.f2g.execute("""SELECT grid_fid, name, outf_flo FROM swmmoutf ORDER BY fid;""").fetchall()
+        self.assertListEqual(outlets, [(index.neighbour(100, "W"), "O1", 1), (None, "O2", 0)])
+        self.assertEqual(self.f2g.execute("""SELECT grid_fid FROM swmmflort;""").fetchone()[0], 100)
+        centroid = self.f2g.execute(
+            """SELECT ST_X(GeomFromGPB(geom)), ST_Y(GeomFromGPB(geom)) FROM swmmflo WHERE swmm_jt = 100;"""
+        ).fetchone()
+        self.assertAlmostEqual(centroid[0], x)
+        self.assertAlmostEqual(centroid[1], y)
+
+    def test_debug_issues(self):
+        debug_file = os.path.join(EXPORT_DATA_DIR, "DEBUG")
+        with open(debug_file, "w") as f:
+            f.write("  5, 1002, Velocity, check\n 0, 1002, Volume\n 5, 3001, Slope\nCOMMENT\n99999999, 1002, Missing\n")
+            f.write("CELL, CODE, Header\n 7, 10.5, Bad code\n")
+        cells, codes, descriptions, skipped = read_debug_file(debug_file)
+        self.assertEqual(skipped, 2)
+        self.assertListEqual(cells.tolist(), [5, 1, 5, 99999999])
+        self.assertListEqual(descriptions[:2], ["Velocity,  check", "Volume"])
+        issues = DebugIssues(self.f2g)
+        issues.clear()
+        written = issues.insert(cells, codes, descriptions, "DEBUG")
+        self.assertListEqual(written.tolist(), [True, True, True, False])
+        self.assertEqual(issues.count(), 3)
+        self.assertListEqual(issues.cells(), [1, 5])
+        self.assertListEqual(issues.codes(), [1002, 3001])
+        self.assertListEqual(issues.issues(cell=5, first_code=3001), [(5, 3001, "Slope")])
+        self.assertEqual(len(issues.issues(first_code=1000, last_code=2000)), 2)
+
+    def test_deferred_cell_triggers(self):
+        self.f2g.clear_tables("sed_group_areas", "sed_group_cells")
+        cell_size = float(self.f2g.get_cont_par("CELLSIZE"))
+        squares = [(self.f2g.build_square(self.f2g.single_centroid(gid), cell_size * 0.5),) for gid in (10, 20)]
+        self.f2g.enable_geom_triggers()
+        try:
+            qry = """INSERT INTO sed_group_areas (geom) VALUES (?);"""
+            self.f2g.execute(qry, squares[0])
+            with self.f2g.deferred_cell_triggers():
+                self.f2g.execute_many(qry, squares[1:])
+                queued = self.f2g.execute("""SELECT COUNT(*) FROM deferred_cells;""").fetchone()[0]
+                self.assertEqual(queued, 1)
+            rows = self.f2g.execute("""SELECT area_fid, grid_fid FROM sed_group_cells ORDER BY area_fid;""").fetchall()
+        finally:
+            self.f2g.disable_geom_triggers()
+        self.assertListEqual(rows, [(1, 10), (2, 20)])
+        self.assertEqual(self.f2g.execute("""SELECT COUNT(*) FROM deferred_cells;""").fetchone()[0], 0)
+
+    def test_cell_triggers_control(self):
+        self.f2g.clear_tables("breach", "breach_cells", "sed_group_areas", "sed_group_cells")
+        cell_size = float(self.f2g.get_cont_par("CELLSIZE"))
+        square = self.f2g.build_square(self.f2g.single_centroid(10), cell_size * 0.5)
+        # Breach cells triggers are not switched by trigger_control.
+        self.f2g.disable_geom_triggers()
+        self.f2g.execute("""INSERT INTO breach (geom) VALUES (?);""", (square,))
+        self.assertEqual(self.f2g.execute("""SELECT COUNT(*) FROM breach_cells;""").fetchone()[0], 1)
+        # Triggers without trigger_control row are disabled.
+        self.f2g.enable_geom_triggers()
+        self.f2g.execute("""DELETE FROM trigger_control WHERE name = 'find_cells_sed_areas_insert';""")
+        try:
+            self.f2g.execute("""INSERT INTO sed_group_areas (geom) VALUES (?);""", (square,))
+        finally:
+            self.f2g.execute("""INSERT INTO trigger_control (name, enabled) VALUES ('find_cells_sed_areas_insert', 0);""")
+            self.f2g.disable_geom_triggers()
+        self.assertEqual(self.f2g.execute("""SELECT COUNT(*) FROM sed_group_cells;""").fetchone()[0], 0)
+
+    def test_unit_of_work(self):
+        con = sqlite3.connect(":memory:", factory=Connection)
+        gutils, other = GeoPackageUtils(con, None), GeoPackageUtils(con, None)
+        gutils.execute("""CREATE TABLE uow (a INTEGER UNIQUE);""")
+        with gutils.unit_of_work():
+            gutils.execute("""INSERT INTO uow VALUES (1);""")
+            with self.assertRaises(sqlite3.IntegrityError):
+                with other.unit_of_work():
+                    other.execute("""INSERT INTO uow VALUES (2);""")
+                    other.execute("""INSERT INTO uow VALUES (1);""")
+            other.execute_many("""INSERT INTO uow VALUES (?);""", [(3,), (4,)])
+            self.assertTrue(con.in_transaction)
+        self.assertFalse(con.in_transaction)
+        with self.assertRaises(ValueError):
+            with gutils.unit_of_work():
+                gutils.execute("""INSERT INTO uow VALUES (5);""")
+                raise ValueError
+        rows = gutils.execute("""SELECT a FROM uow ORDER BY a;""").fetchall()
+        self.assertListEqual(rows, [(1,), (3,), (4,)])
+        con.close()
+
+    def test_raincell_store(self):
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        raincell_file = os.path.join(tmp_dir, "RAINCELL_IN.DAT")
+        lines = ["15 3 03/15/2019 12:00 03/15/2019 12:45\n"]
+        for interval_nr in range(3):
+            lines += ["{0} {1:.4f}\n".format(cell, cell * 0.01 + interval_nr) for cell in (2, 5, 7, 9)]
+        with open(raincell_file, "w") as f:
+            f.writelines(lines)
+        store = RaincellStore(self.f2g, block_cells=3)
+        store.import_dat(raincell_file)
+        self.assertListEqual(store.cells().tolist(), [2, 5, 7, 9])
+        self.assertEqual(store.intervals_number(), 3)
+        self.assertAlmostEqual(float(store.interval(1)[3]), 1.09, places=5)
+        times, values = store.cell_series(7)
+        self.assertListEqual(times.tolist(), [0.0, 15.0, 30.0])
+        self.assertEqual(store.cell_series(3)[0].shape[0], 0)
+        self.f2g.export_raincell(tmp_dir)
+        self.assertEqual(read_bytes(raincell_file), read_bytes(os.path.join(tmp_dir, "RAINCELL.DAT")))
+        # Cached blocks are dropped after writes of another store.
+        other = RaincellStore(self.f2g, block_cells=3)
+        other.import_intervals(("15", "1", ""), np.array([7]), [(np.array([7]), np.array([2.5]))])
+        self.assertListEqual(store.cell_series(7)[1].tolist(), [2.5])
+
+    def test_raster_sampler(self):
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        # 3 x 4 raster of 10 m pixels with upper left corner in (100, 200).
+        array = np.arange(12, dtype=float).reshape(3, 4)
+        array[1, 1] = -9999
+        geotransform = (100.0, 10.0, 0.0, 200.0, 0.0, -10.0)
+        sampler = RasterSampler([1, 2, 3, 4], [105.0, 115.0, 139.0, 95.0], [195.0, 185.0, 171.0, 195.0])
+        cells, values = sampler.sample_array(array, geotransform, -9999)
+        self.assertListEqual(cells.tolist(), [1, 2, 3])
+        self.assertEqual(values[0], 0)
+        self.assertTrue(np.isnan(values[1]))
+        self.assertEqual(values[2], 11)
+        paths = []
+        for i in range(3):
+            path = os.path.join(tmp_dir, "rain_{}.asc".format(i))
+            with open(path, "w") as f:
+                f.write("ncols 4\nnrows 3\nxllcorner 100\nyllcorner 170\ncellsize 10\nNODATA_value -9999\n")
+                f.write("\n".join(" ".join(str(v + i) for v in row) for row in array.tolist()))
+            paths.append(path)
+        samples = list(sampler.sample_files(paths, workers=2))
+        self.assertListEqual([values[2] for cells, values in samples], [11, 12, 13])
+
+    def test_cached_raster2grid(self):
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        index = project_grid_index(self.f2g)
+        cs = index.cell_size
+        raster = os.path.join(tmp_dir, "source.tif")
+        ds = gdal.GetDriverByName("GTiff").Create(raster, index.raster_cols, index.raster_rows, 1, gdal.GDT_Float32)
+        ds.SetGeoTransform((index.x0 - cs * 0.5, cs, 0.0, index.y0 + cs * 0.5, 0.0, -cs))
+        band = ds.GetRasterBand(1)
+        band.SetNoDataValue(-9999)
+        band.WriteArray(np.arange(index.raster_rows * index.raster_cols, dtype=float).reshape(index.raster_rows, -1))
+        ds = band = None
+        expected = list(raster2grid_np(self.f2g, raster))
+        cache = RasterCache(os.path.join(tmp_dir, "raster_cache"), margin=1)
+        settings = WarpSettings(raster, cs)
+        # Cache miss warps the source raster into the cache.
+        self.assertListEqual(list(cached_raster2grid(self.f2g, settings, workers=1, cache=cache)), expected)
+        self.assertEqual(len(cache.entries), 1)
+        # Cache hit only reads the cached raster.
+        cache = RasterCache(cache.cache_dir, margin=1)
+        with mock.patch.object(RasterCache, "build", side_effect=AssertionError("cache miss")):
+            self.assertListEqual(list(cached_raster2grid(self.f2g, settings, workers=1, cache=cache)), expected)
+        self.assertEqual(len(cache.entries), 1)
+
+    def test_wal_journal(self):
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmp_dir, "wal.gpkg")
+            con = sqlite3.connect(path, factory=Connection)
+            tune_connection(con)
+            self.assertEqual(con.execute("PRAGMA journal_mode;").fetchone()[0], "delete")
+            tune_connection(con, wal=True)
+            self.assertEqual(con.execute("PRAGMA journal_mode;").fetchone()[0], "wal")
+            database_disconnect(con)
+            con = sqlite3.connect(path)
+            self.assertEqual(con.execute("PRAGMA journal_mode;").fetchone()[0], "delete")
+            con.close()
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    @unittest.skip("Skipping test due to long run.")
+    def test_commit_benchmark(self):
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            for tuned in (False, True):
+                path = os.path.join(tmp_dir, "commits_{}.gpkg".format(int(tuned)))
+                con = sqlite3.connect(path, factory=Connection)
+                if tuned:
+                    tune_connection(con)
+                gutils = GeoPackageUtils(con, None)
+                gutils.execute("""CREATE TABLE uow (fid INTEGER PRIMARY KEY, elevation REAL);""")
+                n = 5000
+                start = time.time()
+                for i in range(n):
+                    gutils.execute("""INSERT INTO uow (elevation) VALUES (?);""", (i,))
+                per_row = time.time() - start
+                start = time.time()
+                with gutils.unit_of_work():
+                    for i in range(n):
+                        gutils.execute("""INSERT INTO uow (elevation) VALUES (?);""", (i,))
+                unit = time.time() - start
+                print(
+                    "{0}: {1:,d} rows, commit per row {2:.3f} s, unit of work {3:.3f} s".format(
+                        "tuned" if tuned else "default", n, per_row, unit
+                    )
+                )
+                con.close()
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    @unittest.skip("Skipping test due to long run.")
+    def test_cell_triggers_benchmark(self):
+        # Single feature edit latency of cell triggers on growing grids.
+        for n in (100, 300, 1000):
+            con = database_create(":memory:")
+            f2g = Flo2dGeoPackage(con, None)
+            f2g.execute_many(
+                """INSERT INTO grid (geom) VALUES (?);""",
+                ((f2g.build_square_xy(c + 0.5, r + 0.5, 1.0),) for r in range(n) for c in range(n)),
+            )
+            square = f2g.build_square_xy(n * 0.5, n * 0.5, 0.5)
+            start = time.time()
+            for i in range(10):
+                f2g.execute("""INSERT INTO sed_group_areas (geom) VALUES (?);""", (square,))
+            print("{0:,d} cells: {1:.4f} s per edit".format(n * n, (time.time() - start) / 10))
+            con.close()
+
     def test_import_inflow(self):
         self.f2g.clear_tables("inflow")
         self.f2g.import_inflow()
@@ -261,6 +695,48 @@ class TestFlo2dGeoPackage(unittest.TestCase):
         self.assertEqual(itopo, etopo)
         self.assertEqual(eman, etopo)
 
+    def test_export_mannings_n_topo_legacy(self):
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            self.f2g.export_mannings_n_topo(EXPORT_DATA_DIR)
+            legacy_mannings_n_topo(self.f2g, tmp_dir)
+            for name in ("MANNINGS_N.DAT", "TOPO.DAT"):
+                exported = read_bytes(os.path.join(EXPORT_DATA_DIR, name))
+                self.assertEqual(exported, read_bytes(os.path.join(tmp_dir, name)))
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    @unittest.skip("Skipping test due to long run.")
+    def test_export_mannings_n_topo_benchmark(self):
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            for n in (1000000, 5000000):
+                con = database_create(":memory:")
+                f2g = Flo2dGeoPackage(con, None)
+                f2g.disable_geom_triggers()
+                f2g.set_cont_par("CELLSIZE", 10)
+                side = int(n ** 0.5) + 1
+                fids = np.arange(n)
+                xs = 500000.0 + (fids % side) * 10 + 5
+                ys = 4000000.0 + (fids // side) * 10 + 5
+                rng = np.random.default_rng(0)
+                data = zip(
+                    centered_squares_gpb(xs, ys, 10),
+                    rng.uniform(0.02, 0.2, n).round(3).tolist(),
+                    rng.uniform(100, 2000, n).round(4).tolist(),
+                )
+                f2g.execute_many("""INSERT INTO grid (geom, n_value, elevation) VALUES (?, ?, ?);""", data)
+                start = time.time()
+                legacy_mannings_n_topo(f2g, tmp_dir)
+                legacy = time.time() - start
+                start = time.time()
+                f2g.export_mannings_n_topo(tmp_dir)
+                fast = time.time() - start
+                print("{0:,d} cells: writer {1:.2f} s, legacy {2:.2f} s".format(n, fast, legacy))
+                con.close()
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
     def test_export_inflow(self):
         self.f2g.import_inflow()
         self.f2g.export_inflow(EXPORT_DATA_DIR)
@@ -301,6 +777,92 @@ class TestFlo2dGeoPackage(unittest.TestCase):
         in_len, out_len = file_len(infile), file_len(outfile)
         self.assertEqual(in_len, out_len)
 
+    def test_deferred_communication(self):
+        uc = mock.Mock(spec=UserCommunication)
+        deferred = DeferredCommunication(uc)
+        deferred.bar_info("Exported", dur=3)
+        self.assertFalse(deferred.question("Overwrite?"))
+        try:
+            raise ValueError("bad value")
+        except ValueError as e:
+            deferred.show_error("ERROR: export failed", e)
+        with self.assertRaises(AttributeError):
+            deferred.show_nothing("?")
+        self.assertListEqual(uc.method_calls, [])
+        with mock.patch("flo2d.flo2d_ie.export_scheduler.QApplication") as app:
+            deferred.replay()
+        app.restoreOverrideCursor.assert_called_once_with()
+        uc.bar_info.assert_called_once_with("Exported", dur=3)
+        uc.question.assert_not_called()
+        self.assertIn("bad value", uc.show_critical.call_args[0][0])
+        self.assertListEqual(deferred.messages, [])
+
+    def test_export_chains(self):
+        calls = ["export_chan", "export_swmmflo", "export_xsec", "export_sed", "export_swmmflort", "export_swmmoutf"]
+        chains = export_chains(calls)
+        self.assertListEqual(
+            chains,
+            [["export_chan", "export_xsec"], ["export_swmmflo", "export_swmmflort", "export_swmmoutf"], ["export_sed"]],
+        )
+        self.assertListEqual(export_chains(["export_xsec", "export_rain"]), [["export_xsec"], ["export_rain"]])
+
+    def test_export_scheduler(self):
+        self.f2g.import_inflow()
+        self.f2g.import_outflow()
+        self.f2g.import_rain()
+        calls = ["export_mannings_n_topo", "export_inflow", "export_outflow", "export_rain"]
+        serial = ExportScheduler(self.f2g, EXPORT_DATA_DIR).run(calls)
+        self.assertListEqual([r.call for r in serial], calls)
+        for r in serial:
+            self.assertTrue(r.exported)
+            for name, size in r.files:
+                self.assertEqual(size, os.path.getsize(os.path.join(EXPORT_DATA_DIR, name)))
+        # Concurrent export from GeoPackage file writes the same files.
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            gpkg_path = os.path.join(tmp_dir, "export.gpkg")
+            con = database_create(gpkg_path)
+            f2g = Flo2dGeoPackage(con, None)
+            f2g.disable_geom_triggers()
+            f2g.set_parser(CONT)
+            for call in calls:
+                getattr(f2g, call.replace("export", "import"))()
+            results = ExportScheduler(f2g, tmp_dir, workers=2).run(calls)
+            self.assertListEqual([r.files for r in results], [r.files for r in serial])
+            con.close()
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    def test_incremental_export(self):
+        self.f2g.import_inflow()
+        self.f2g.import_rain()
+        calls = ["export_inflow", "export_rain"]
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            ExportScheduler(self.f2g, tmp_dir).run(calls)
+            self.assertTrue(os.path.isfile(os.path.join(tmp_dir, MANIFEST)))
+            # Full export doesn't set up changes tracking (row triggers) unless opted in.
+            self.assertIsNone(self.f2g.table_change_counter("inflow"))
+            # Counters of tables tracked by the first incremental export are unknown.
+            results = ExportScheduler(self.f2g, tmp_dir, incremental=True).run(calls)
+            self.assertListEqual([r.skipped for r in results], [False, False])
+            results = ExportScheduler(self.f2g, tmp_dir, incremental=True).run(calls)
+            self.assertListEqual([r.skipped for r in results], [True, True])
+            self.assertTrue(results[0].exported)
+            self.f2g.execute("""UPDATE inflow SET name = 'Changed' WHERE fid = 1;""")
+            with open(os.path.join(tmp_dir, "RAIN.DAT"), "a") as f:
+                f.write("\n")
+            results = ExportScheduler(self.f2g, tmp_dir, incremental=True).run(calls)
+            self.assertListEqual([r.skipped for r in results], [False, False])
+            results = ExportScheduler(self.f2g, tmp_dir, incremental=True).run(calls)
+            self.assertListEqual([r.skipped for r in results], [True, True])
+            # Another GeoPackage with the same counters.
+            self.f2g.set_metadata("database_id", "another")
+            results = ExportScheduler(self.f2g, tmp_dir, incremental=True).run(calls)
+            self.assertListEqual([r.skipped for r in results], [False, False])
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
     @unittest.skip("Test need to be updated due to logic changes.")
     def test_export_chan(self):
         self.f2g.import_chan()
@@ -9,7 +9,12 @@
 # of the License, or (at your option) any later version
 
 import os
+import time
+import shutil
+import tempfile
 import unittest
+from types import SimpleNamespace
+import numpy as np
 from .utilities import get_qgis_app
 
 QGIS_APP = get_qgis_app()
@@ -18,7 +23,18 @@ VECTOR_PATH = os.path.join(THIS_DIR, "data", "vector")
 EXPORT_DATA_DIR = os.path.join(THIS_DIR, "data")
 
 from qgis.core import QgsVectorLayer
-from flo2d.flo2d_tools.grid_tools import build_grid, poly2grid, calculate_arfwrf
+from flo2d.flo2d_tools.grid_tools import (
+    build_grid,
+    build_grid_and_tableColRow,
+    build_grid_np,
+    grid_squares_np,
+    square_grid_with_col_and_row_fields,
+    poly2grid,
+    calculate_arfwrf,
+)
+from flo2d.flo2d_tools.raster_sampling import raster_values_on_points, WarpSettings
+from flo2d.flo2d_tools.raster_cache import RasterCache
+from osgeo import gdal
 
 
 class TestGridTools(unittest.TestCase):
@@ -38,6 +54,98 @@ class TestGridTools(unittest.TestCase):
         polygons = list(build_grid(vlayer, 500))
         self.assertEqual(len(polygons), 494)
 
+    def test_build_grid_np(self):
+        boundary = os.path.join(VECTOR_PATH, "boundary.geojson")
+        vlayer = QgsVectorLayer(boundary, "bl", "ogr")
+        expected = list(build_grid_and_tableColRow(vlayer, 500))
+        xs, ys, cols, rows = build_grid_np(vlayer, 500)
+        xmins, ymins, xmaxs, ymaxs = grid_squares_np(xs, ys, 500)
+        self.assertEqual(len(xs), len(expected))
+        for i, (poly, col, row) in enumerate(expected):
+            self.assertTupleEqual((xmins[i], ymins[i], xmaxs[i], ymaxs[i]), (poly[0], poly[1], poly[4], poly[5]))
+            self.assertTupleEqual((cols[i], rows[i]), (col, row))
+
+    def test_square_grid_with_col_and_row_fields(self):
+        boundary = os.path.join(VECTOR_PATH, "boundary.geojson")
+        vlayer = QgsVectorLayer(boundary, "bl", "ogr")
+        extent = vlayer.extent()
+        grids = []
+        for upper_left_coords in (None, (extent.xMinimum() - 250, extent.yMaximum() + 250)):
+            rows = []
+            gutils = SimpleNamespace(
+                get_cont_par=lambda name: 500,
+                execute=lambda *args: None,
+                clear_tables=lambda *tables: None,
+                execute_many=lambda qry, data: rows.extend(data),
+            )
+            self.assertTrue(square_grid_with_col_and_row_fields(gutils, vlayer, upper_left_coords))
+            grids.append(rows)
+        # Upper left coordinates don't shift the grid origin nor the cells numbering.
+        self.assertListEqual(grids[0], grids[1])
+        expected = [
+            (poly[0], poly[1], poly[4], poly[5], col, row) for poly, col, row in build_grid_and_tableColRow(vlayer, 500)
+        ]
+        self.assertListEqual(grids[0], expected)
+
+    @unittest.skip("Skipping benchmark due to long run.")
+    def test_build_grid_np_benchmark(self):
+        boundary = os.path.join(VECTOR_PATH, "boundary.geojson")
+        vlayer = QgsVectorLayer(boundary, "bl", "ogr")
+        extent = vlayer.extent()
+        area = extent.width() * extent.height()
+        for cells in (100000, 1000000, 5000000):
+            cell_size = (area / cells) ** 0.5
+            start = time.time()
+            count = sum(1 for _ in build_grid(vlayer, cell_size))
+            generator_time = time.time() - start
+            start = time.time()
+            xs, ys, cols, rows = build_grid_np(vlayer, cell_size)
+            vectorized_time = time.time() - start
+            self.assertEqual(count, len(xs))
+            print("{0} cells: build_grid {1:.2f} s, build_grid_np {2:.2f} s".format(cells, generator_time, vectorized_time))
+
+    def test_raster_values_on_points(self):
+        raster = os.path.join(EXPORT_DATA_DIR, "values.tif")
+        ds = gdal.GetDriverByName("GTiff").Create(raster, 3, 2, 1, gdal.GDT_Float32)
+        ds.SetGeoTransform((0.0, 10.0, 0.0, 20.0, 0.0, -10.0))
+        band = ds.GetRasterBand(1)
+        band.SetNoDataValue(-9999)
+        band.WriteArray(np.array([[1.0, 2.0, 3.0], [4.0, -9999, 6.0]]))
+        ds = None
+        xs = np.array([5.0, 25.0, 15.0, 35.0, 5.0])
+        ys = np.array([15.0, 5.0, 5.0, 5.0, 5.0])
+        values, inside = raster_values_on_points(raster, xs, ys, strip_rows=1)
+        self.assertListEqual(inside.tolist(), [True, True, True, False, True])
+        self.assertListEqual(values[[0, 1, 4]].tolist(), [1.0, 6.0, 4.0])
+        self.assertTrue(np.isnan(values[2]))
+
+    def test_raster_cache(self):
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        raster = os.path.join(tmp_dir, "cache_source.tif")
+        ds = gdal.GetDriverByName("GTiff").Create(raster, 3, 2, 1, gdal.GDT_Float32)
+        ds.SetGeoTransform((0.0, 10.0, 0.0, 20.0, 0.0, -10.0))
+        band = ds.GetRasterBand(1)
+        band.SetNoDataValue(-9999)
+        band.WriteArray(np.array([[1.0, 2.0, 3.0], [4.0, 5.0, 6.0]]))
+        ds = None
+        index = SimpleNamespace(x0=5.0, y0=15.0, cell_size=10.0, raster_rows=2, raster_cols=3)
+        cache_dir = os.path.join(tmp_dir, "raster_cache")
+        cache = RasterCache(cache_dir, margin=1)
+        settings = WarpSettings(raster, 10.0)
+        cached = cache.aligned_raster(settings, index, workers=1)
+        values, inside = raster_values_on_points(cached, np.array([5.0, 25.0]), np.array([15.0, 5.0]))
+        self.assertListEqual(values.tolist(), [1.0, 6.0])
+        # Grid shrunk by one column is still covered by the cached raster.
+        index.raster_cols = 2
+        self.assertEqual(RasterCache(cache_dir, margin=1).lookup(settings, index), cached)
+        # Only the most recent raster is kept when the cache is full.
+        small_cache = RasterCache(cache_dir, max_size=0, margin=1)
+        other = small_cache.aligned_raster(WarpSettings(raster, 10.0, resample_alg="average"), index, workers=1)
+        self.assertFalse(os.path.isfile(cached))
+        self.assertEqual(len(RasterCache(cache_dir).entries), 1)
+        self.assertTrue(os.path.isfile(other))
+
     def test_poly2grid(self):
         grid = os.path.join(VECTOR_PATH, "grid.geojson")
         roughness = os.path.join(VECTOR_PATH, "roughness.geojson")
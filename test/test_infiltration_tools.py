@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+
+# FLO-2D Preprocessor tools for QGIS
+# Copyright © 2021 Lutra Consulting for FLO-2D
+
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version
+
+import unittest
+from .utilities import get_qgis_app
+
+QGIS_APP = get_qgis_app()
+
+from qgis.core import QgsGeometry, QgsRectangle
+from flo2d.flo2d_tools.infiltration_tools import green_ampt_regions
+
+FIELDS = ("XKSAT", "RTIMPS", "SOIL_DEPTH", "SATURATION", "VC", "IA", "RTIMPL")
+
+
+def square_wkb(xmin, ymin, xmax, ymax):
+    return bytes(QgsGeometry.fromRect(QgsRectangle(xmin, ymin, xmax, ymax)).asWkb())
+
+
+def green_ampt_test_regions():
+    """
+    Regions of 3 cells in a row. Soil covers the first two cells only and land use RTIMP is NULL.
+    """
+    regions = []
+    for r in range(4):
+        x0 = r * 30.0
+        cells = [(r * 3 + i + 1, square_wkb(x0 + i * 10, 0, x0 + i * 10 + 10, 10)) for i in range(3)]
+        soil = [(1, square_wkb(x0, 0, x0 + 20, 10), {"XKSAT": 0.1 + 0.05 * r, "RTIMPS": 10, "SOIL_DEPTH": 2.0})]
+        land = [(1, square_wkb(x0, 0, x0 + 30, 10), {"RTIMPL": None, "SATURATION": "normal", "VC": 50, "IA": 0.1})]
+        regions.append((cells, soil, land))
+    return regions
+
+
+class TestInfiltrationTools(unittest.TestCase):
+    def test_green_ampt_regions(self):
+        regions = green_ampt_test_regions()
+        serial = list(green_ampt_regions(regions, FIELDS, True, workers=1))
+        self.assertEqual(len(serial), len(regions))
+        self.assertListEqual(sorted(serial[1]), [4, 5])
+        self.assertAlmostEqual(serial[1][4]["rtimpf"], 0.1)
+        parallel = list(green_ampt_regions(iter(regions), FIELDS, True, workers=2))
+        self.assertListEqual(parallel, serial)
+
+
+# Running tests:
+if __name__ == "__main__":
+    cases = [TestInfiltrationTools]
+    suite = unittest.TestSuite()
+    for t in cases:
+        tests = unittest.TestLoader().loadTestsFromTestCase(t)
+        suite.addTest(tests)
+    unittest.TextTestRunner(verbosity=2).run(suite)
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+
+# FLO-2D Preprocessor tools for QGIS
+# Copyright © 2021 Lutra Consulting for FLO-2D
+
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version
+
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+
+from flo2d.flo2d_tools.lidar_tools import GridBinner, lidar_file_format, bin_lidar_files, read_xyz_blocks
+
+
+class TestLidarTools(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        # 2 x 3 grid of 10 ft cells, centers from (5, 15) to (25, 5), cell (row 1, col 1) missing.
+        raster = np.array([[1, 2, 3], [4, 0, 5]])
+        self.binner = GridBinner(raster, 5.0, 15.0, 10.0, 6)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def write_file(self, name, text):
+        path = os.path.join(self.tmp_dir, name)
+        with open(path, "w") as f:
+            f.write(text)
+        return path
+
+    def test_lidar_file_format(self):
+        self.assertEqual(lidar_file_format(self.write_file("a.txt", "\n1,2,3\n")), (",", 3))
+        self.assertEqual(lidar_file_format(self.write_file("b.txt", "1 1 2 3 9\n")), (None, 5))
+        self.assertEqual(lidar_file_format(self.write_file("c.txt", "1\t2\n")), (None, 0))
+
+    def test_bin_lidar_files(self):
+        comma = self.write_file("a.txt", "1,19,10.0\n9,11,20.0\n15,15,5.0\n-1,15,100.0\n")
+        spaces = self.write_file("b.txt", "7 25 5 1.5 0\n7 28 2 7.0 0\n7 12 6 100.0 0\n")
+        stats, errors = bin_lidar_files(self.binner, [comma, spaces], workers=1)
+        self.assertListEqual(errors, [])
+        self.assertEqual(stats.inside, 5)
+        self.assertEqual(stats.outside, 2)
+        self.assertListEqual(stats.count.tolist(), [0, 2, 1, 0, 0, 2])
+        self.assertAlmostEqual(stats.mean()[1], 15.0)
+        self.assertAlmostEqual(stats.min[5], 1.5)
+        self.assertAlmostEqual(stats.max[5], 7.0)
+        self.assertTrue(np.isnan(stats.mean()[3]))
+
+    def test_bin_lidar_files_workers(self):
+        files = [self.write_file("{}.txt".format(i), "1,19,{0}.0\n9,11,{0}.5\n".format(i)) for i in range(7)]
+        serial, __ = bin_lidar_files(self.binner, files, workers=1)
+        parallel, errors = bin_lidar_files(self.binner, files, workers=2)
+        self.assertListEqual(errors, [])
+        self.assertListEqual(parallel.count.tolist(), serial.count.tolist())
+        self.assertListEqual(parallel.max.tolist(), serial.max.tolist())
+
+    def test_bin_lidar_file_error(self):
+        path = self.write_file("a.txt", "1,19,10.0\n9,11,x\n")
+        stats, errors = bin_lidar_files(self.binner, [path], workers=1)
+        self.assertEqual(len(errors), 1)
+
+
+    def test_read_xyz_blocks(self):
+        path = self.write_file("a.txt", "1 2 3\n\n4 5 6\n7 8 9\n")
+        blocks = list(read_xyz_blocks(path, None, 3, block_size=8))
+        self.assertListEqual(np.concatenate([zs for xs, ys, zs in blocks]).tolist(), [3.0, 6.0, 9.0])
+        # Line with missing column is reported, instead of shifting values of the following points.
+        path = self.write_file("b.txt", "1,2,3\n4,5,6\n7,8\n10,11,12,13\n")
+        with self.assertRaisesRegex(ValueError, "line 3"):
+            list(read_xyz_blocks(path, ",", 3))
+        with self.assertRaisesRegex(ValueError, "line 3"):
+            list(read_xyz_blocks(path, ",", 3, block_size=8))
+
+# Running tests:
+if __name__ == "__main__":
+    cases = [TestLidarTools]
+    suite = unittest.TestSuite()
+    for t in cases:
+        tests = unittest.TestLoader().loadTestsFromTestCase(t)
+        suite.addTest(tests)
+    unittest.TextTestRunner(verbosity=2).run(suite)
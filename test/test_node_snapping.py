@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+
+# FLO-2D Preprocessor tools for QGIS
+# Copyright © 2021 Lutra Consulting for FLO-2D
+
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version
+
+import time
+import unittest
+import numpy as np
+from flo2d.flo2d_tools.node_snapping import NodeSnapper, NO_NODE, snap_tolerance
+
+
+def brute_force_snap(node_xs, node_ys, xs, ys, tolerance):
+    nearest, counts = [], []
+    for x, y in zip(xs, ys):
+        d = np.hypot(node_xs - x, node_ys - y)
+        near = np.nonzero(d <= tolerance)[0]
+        nearest.append(near[np.argmin(d[near])] if near.size else NO_NODE)
+        counts.append(near.size)
+    return nearest, counts
+
+
+class TestNodeSnapping(unittest.TestCase):
+    def test_snap(self):
+        snapper = NodeSnapper([0.0, 10.0, 13.0, np.nan], [0.0, 0.0, 0.0, 5.0], 5.0)
+        nearest, counts = snapper.snap([1.0, 11.0, 12.0, 100.0, np.nan, 6.0], [1.0, 0.0, 0.0, 0.0, 0.0, 3.0])
+        self.assertListEqual(nearest.tolist(), [0, 1, 2, NO_NODE, NO_NODE, 1])
+        self.assertListEqual(counts.tolist(), [1, 2, 2, 0, 0, 1])
+
+    def test_snap_tie(self):
+        snapper = NodeSnapper([2.0, -2.0], [0.0, 0.0], 5.0)
+        nearest, counts = snapper.snap([0.0], [0.0])
+        self.assertEqual(nearest[0], 0)
+        self.assertEqual(counts[0], 2)
+
+    def test_snap_random(self):
+        rng = np.random.RandomState(0)
+        node_xs, node_ys = rng.uniform(0, 200, 500), rng.uniform(0, 200, 500)
+        xs, ys = rng.uniform(-10, 210, 2000), rng.uniform(-10, 210, 2000)
+        nearest, counts = NodeSnapper(node_xs, node_ys, 7.5).snap(xs, ys)
+        expected_nearest, expected_counts = brute_force_snap(node_xs, node_ys, xs, ys, 7.5)
+        self.assertListEqual(nearest.tolist(), expected_nearest)
+        self.assertListEqual(counts.tolist(), expected_counts)
+
+    def test_empty(self):
+        nearest, counts = NodeSnapper([], [], 5.0).snap([1.0], [1.0])
+        self.assertEqual(nearest[0], NO_NODE)
+        self.assertEqual(counts[0], 0)
+        self.assertRaises(ValueError, NodeSnapper, [0.0], [0.0], 0)
+
+    def test_snap_tolerance(self):
+        self.assertEqual(snap_tolerance("2.5"), 2.5)
+        self.assertEqual(snap_tolerance(5), 5.0)
+        for value in ("", "abc", None, 0, -1, "nan"):
+            self.assertIsNone(snap_tolerance(value))
+
+    @unittest.skip("Skipping test due to long run.")
+    def test_snap_benchmark(self):
+        rng = np.random.RandomState(0)
+        n_links = 300000
+        node_xs, node_ys = rng.uniform(0, 1e5, n_links), rng.uniform(0, 1e5, n_links)
+        jitter = rng.uniform(-3, 3, (4, n_links))
+        start = time.time()
+        snapper = NodeSnapper(node_xs, node_ys, 5.0)
+        inlets, __ = snapper.snap(node_xs + jitter[0], node_ys + jitter[1])
+        outlets, __ = snapper.snap(np.roll(node_xs, 1) + jitter[2], np.roll(node_ys, 1) + jitter[3])
+        print("{0:,} links endpoints snapped in {1:.2f} s".format(n_links, time.time() - start))
+        self.assertGreater((inlets != NO_NODE).mean(), 0.99)
+
+
+# Running tests:
+if __name__ == "__main__":
+    cases = [TestNodeSnapping]
+    suite = unittest.TestSuite()
+    for t in cases:
+        tests = unittest.TestLoader().loadTestsFromTestCase(t)
+        suite.addTest(tests)
+    unittest.TextTestRunner(verbosity=2).run(suite)
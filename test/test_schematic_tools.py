@@ -24,6 +24,10 @@ from flo2d.flo2d_tools.schematic_tools import (
     interpolate_along_line,
     schematize_lines,
     populate_directions,
+    bresenham_line,
+    bresenham_lines_np,
+    schematize_lines_np,
+    street_cells_np,
 )
 
 
@@ -96,6 +100,35 @@ class TestSchematicTools(unittest.TestCase):
             directions = (True if 0 < d < 9 else False for d in s)
             self.assertTrue(all(directions))
 
+    def test_bresenham_lines_np(self):
+        segments = [(0, 0, 5, 2), (3, 7, 1, -4), (2, 2, 2, 2), (-3, 1, 4, -6), (6, 0, -2, 3)]
+        seg_idx, xs, ys = bresenham_lines_np(*zip(*segments))
+        expected = [(i, x, y) for i, seg in enumerate(segments) for x, y in bresenham_line(*seg)]
+        self.assertListEqual(list(zip(seg_idx.tolist(), xs.tolist(), ys.tolist())), expected)
+
+    def test_street_cells_np(self):
+        user_lines = os.path.join(VECTOR_PATH, "channels_streets.geojson")
+        cell_size = 500
+        offset_x, offset_y = (2.5, -8.94999999999709)
+        line_layer = QgsVectorLayer(user_lines, "lines", "ogr")
+        coords = defaultdict(set)
+        for grids in schematize_lines(line_layer, cell_size, offset_x, offset_y):
+            populate_directions(coords, grids)
+        vertex_lines, xs, ys = [], [], []
+        for i, feat in enumerate(line_layer.getFeatures()):
+            for pnt in feat.geometry().asPolyline():
+                vertex_lines.append(i)
+                xs.append(pnt.x())
+                ys.append(pnt.y())
+        lines, xt, yt = schematize_lines_np(vertex_lines, xs, ys, cell_size, offset_x, offset_y)
+        cells_xt, cells_yt, cells_lines, masks = street_cells_np(lines, xt, yt)
+        cells = {}
+        for x, y, mask in zip(cells_xt.tolist(), cells_yt.tolist(), masks.tolist()):
+            xy = (round(x * cell_size - offset_x, 2), round(y * cell_size - offset_y, 2))
+            cells[xy] = {d for d in range(1, 9) if mask & (1 << d)}
+        expected = {(round(x, 2), round(y, 2)): d for (x, y), d in coords.items()}
+        self.assertDictEqual(cells, expected)
+
 
 # Running tests:
 if __name__ == "__main__":
@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+
+# FLO-2D Preprocessor tools for QGIS
+# Copyright © 2021 Lutra Consulting for FLO-2D
+
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version
+
+import os
+import time
+import shutil
+import tempfile
+import unittest
+from collections import OrderedDict
+from .utilities import get_qgis_app
+
+QGIS_APP = get_qgis_app()
+
+from flo2d.flo2d_ie.swmm_io import StormDrainProject, INPWriter, read_INP_groups
+
+
+def legacy_INP_groups(inp_file):
+    # Former StormDrainProject.split_INP_groups_dictionary_by_tags.
+    groups = OrderedDict()
+    with open(inp_file) as swmm_inp:
+        for chunk in swmm_inp.read().split("["):
+            try:
+                key, value = chunk.split("]")
+                groups[key] = value.split("\n")
+            except ValueError:
+                continue
+    return groups
+
+
+def synthetic_INP(inp_file, n_links):
+    with open(inp_file, "w") as f:
+        f.write("[TITLE]\nSynthetic network\n\n[JUNCTIONS]\n;;Name Elev MaxDepth InitDepth SurDepth Aponded\n")
+        f.writelines("J{0} {1:.2f} 6.00 0.00 0.00 0.00\n".format(i, 100 + i * 0.01) for i in range(n_links + 1))
+        f.write("\n[CONDUITS]\n;;Name From To Length N\n")
+        f.writelines("C{0} J{0} J{1} 100.00 0.013 0 0 0 0\n".format(i, i + 1) for i in range(n_links))
+        f.write("\n[XSECTIONS]\n")
+        f.writelines("C{0} CIRCULAR 1.5 0 0 0 1\n".format(i) for i in range(n_links))
+        f.write("\n[LOSSES]\n")
+        f.writelines("C{0} 0.5 0.5 0 NO\n".format(i) for i in range(n_links))
+        f.write("\n[CURVES]\nP1 Pump1 0 1\nP1 1 2\nP1 2 3\n")
+        f.write("\n[TIMESERIES]\nTS1 0:00 0\nTS1 01/01/2020 1:00 2.5\n")
+        f.write("\n[COORDINATES]\n;;Node X Y\n")
+        f.writelines("J{0} {1:.3f} {2:.3f}\n".format(i, i * 10.0, i * 5.0) for i in range(n_links + 1))
+        f.write("\n[VERTICES]\n")
+        f.writelines("C{0} {1:.3f} {2:.3f}\n".format(i, i * 10.0 + 5, i * 5.0 + 2) for i in range(n_links))
+
+
+class TestSWMMIO(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.inp_file = os.path.join(self.tmp_dir, "SWMM.INP")
+        synthetic_INP(self.inp_file, 10)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def test_read_INP_groups(self):
+        groups = read_INP_groups(self.inp_file)
+        self.assertEqual(groups, legacy_INP_groups(self.inp_file))
+        self.assertEqual(groups.tag("cond"), "CONDUITS")
+        self.assertEqual(groups.tag("junc"), "JUNCTIONS")
+        self.assertIsNone(groups.select("outf"))
+        self.assertEqual(len(list(groups.rows("xsections"))), 10)
+        groups["OUTFALLS"] = ["", "O1 90.0 FREE NO"]
+        self.assertEqual(next(groups.rows("outf"))[1], ["O1", "90.0", "FREE", "NO"])
+
+    def test_table(self):
+        groups = read_INP_groups(self.inp_file)
+        conduits = groups.table("CONDUITS")
+        self.assertListEqual(conduits["name"][:2], ["C0", "C1"])
+        self.assertEqual(conduits["length"].shape[0], 10)
+        self.assertAlmostEqual(conduits["manning"][3], 0.013)
+        self.assertIs(groups.table("CONDUITS"), conduits)
+        curves = groups.table("CURVES")
+        self.assertListEqual(curves["type"], ["Pump1"] * 3)
+        self.assertListEqual(curves["y"].tolist(), [1.0, 2.0, 3.0])
+        series = groups.table("TIMESERIES")
+        self.assertListEqual(series["date"], [None, "01/01/2020"])
+        self.assertListEqual(series["value"].tolist(), [0.0, 2.5])
+        vertices = groups.table("VERTICES")
+        self.assertEqual(vertices["x"][1], 15.0)
+
+    def test_write_INP(self):
+        project = StormDrainProject(None, self.inp_file)
+        project.split_INP_groups_dictionary_by_tags()
+        with open(self.inp_file) as f:
+            original = f.read()
+        project.write_INP()
+        with open(self.inp_file) as f:
+            self.assertEqual(f.read(), original)
+
+    def test_write_rows(self):
+        out_file = os.path.join(self.tmp_dir, "ROWS.INP")
+        with open(out_file, "w") as f:
+            writer = INPWriter(f, lines=3)
+            count = writer.write_rows("\n{0:16} {1:<10.2f}", (("J{}".format(i), i) for i in range(7)))
+        self.assertEqual(count, 7)
+        with open(out_file) as f:
+            self.assertEqual(f.read().count("\n"), 7)
+
+    def test_write_section(self):
+        out_file = os.path.join(self.tmp_dir, "SECTION.INP")
+        with open(out_file, "w") as f:
+            writer = INPWriter(f, lines=2)
+            writer.write_section("PATTERNS", ";;Name Type Multipliers", ";;----")
+            writer.write_lines(["P{} HOURLY 1.0\n".format(i) for i in range(5)])
+        with open(out_file) as f:
+            self.assertEqual(
+                f.read(),
+                "\n\n[PATTERNS]\n;;Name Type Multipliers\n;;----"
+                + "".join("P{} HOURLY 1.0\n".format(i) for i in range(5)),
+            )
+
+    def test_storm_drain_project(self):
+        project = StormDrainProject(None, self.inp_file)
+        project.split_INP_groups_dictionary_by_tags()
+        self.assertGreater(project.create_INP_nodes_dictionary_with_coordinates(), 0)
+        self.assertEqual(len(project.INP_nodes), 11)
+        project.add_JUNCTIONS_to_INP_nodes_dictionary()
+        project.create_INP_conduits_dictionary_with_conduits()
+        project.add_LOSSES_to_INP_conduits_dictionary()
+        project.add_XSECTIONS_to_INP_conduits_dictionary()
+        self.assertEqual(project.INP_nodes["J3"]["x"], 30.0)
+        self.assertEqual(project.INP_nodes["J3"]["max_depth"], 6.0)
+        self.assertEqual(project.INP_conduits["C2"]["conduit_outlet"], "J3")
+        self.assertEqual(project.INP_conduits["C2"]["xsections_shape"], "CIRCULAR")
+        self.assertEqual(project.INP_conduits["C2"]["losses_flapgate"], "NO")
+        self.assertEqual(project.INP_conduits["C2"]["xsections_max_depth"], 1.5)
+        self.assertNotIn("[LOSSES]", project.status_report)
+        project.INP_groups["LOSSES"] = project.INP_groups["LOSSES"] + ["C99 0.5 0.5 0 NO"]
+        project.add_LOSSES_to_INP_conduits_dictionary()
+        self.assertIn("Undefined Link (C99) reference at \n[LOSSES]\nC99 0.5 0.5 0 NO", project.status_report)
+
+    @unittest.skip("Skipping test due to long run.")
+    def test_read_INP_benchmark(self):
+        synthetic_INP(self.inp_file, 200000)
+        start = time.time()
+        groups = legacy_INP_groups(self.inp_file)
+        for chars in ("junc", "condu", "xsections", "losses", "coor", "vertices"):
+            for tag in groups:
+                if tag.lower().startswith(chars):
+                    [line.split() for line in groups[tag] if line and line[0] not in ";\n"]
+                    break
+        legacy = time.time() - start
+        start = time.time()
+        groups = read_INP_groups(self.inp_file)
+        for tag in ("JUNCTIONS", "CONDUITS", "XSECTIONS", "LOSSES", "COORDINATES", "VERTICES"):
+            groups.table(tag)
+        typed = time.time() - start
+        start = time.time()
+        with open(self.inp_file, "w") as f:
+            writer = INPWriter(f)
+            for tag, part in groups.items():
+                writer.write_group(tag, part)
+        writing = time.time() - start
+        print(
+            "200,000 links: legacy split {0:.2f} s, typed columns read {1:.2f} s, write {2:.2f} s".format(
+                legacy, typed, writing
+            )
+        )
+
+
+# Running tests:
+if __name__ == "__main__":
+    cases = [TestSWMMIO]
+    suite = unittest.TestSuite()
+    for t in cases:
+        tests = unittest.TestLoader().loadTestsFromTestCase(t)
+        suite.addTest(tests)
+    unittest.TextTestRunner(verbosity=2).run(suite)
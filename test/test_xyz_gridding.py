@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+
+# FLO-2D Preprocessor tools for QGIS
+# Copyright © 2021 Lutra Consulting for FLO-2D
+
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+import numpy as np
+
+from flo2d.misc.xyz_gridding import grid_xyz
+from affine import Affine
+from transform import rowcol
+
+
+def legacy_grid_xyz(csv_file, transform, shape, grid_nodata=-9999):
+    # Per point algorithm of the former dask script: "r_c" string key per point, grouping and filling in a loop.
+    rows, cols = shape
+    groups = {}
+    with open(csv_file, "r") as f:
+        f.readline()
+        for line in f:
+            x, y, z = [float(v) for v in line.split(",")]
+            r, c = rowcol(transform, x, y)
+            if r < rows and r >= 0 and c < cols and c >= 0:
+                groups.setdefault("{}_{}".format(r, c), []).append(z)
+    raster_array = np.full(shape, grid_nodata, dtype=np.float32)
+    for key, zs in groups.items():
+        r, c = [int(x) for x in key.split("_")]
+        raster_array[r, c] = sum(zs) / len(zs)
+    return raster_array
+
+
+class TestXYZGridding(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        # 2 x 3 raster of 10 ft pixels, upper left corner in (0, 20).
+        self.transform = Affine(10.0, 0, 0.0, 0, -10.0, 20.0)
+        self.shape = (2, 3)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def write_csv(self, points, header="X,Y,Z"):
+        path = os.path.join(self.tmp_dir, "points.csv")
+        with open(path, "w") as f:
+            f.write(header + "\n")
+            for p in points:
+                f.write(",".join(str(v) for v in p) + "\n")
+        return path
+
+    def test_rowcol_vectorized(self):
+        xs = np.array([1.0, 15.0, 29.0, -1.0])
+        ys = np.array([19.0, 5.0, 11.0, 5.0])
+        rows, cols = rowcol(self.transform, xs, ys)
+        self.assertListEqual(rows.tolist(), [0, 1, 0, 1])
+        self.assertListEqual(cols.tolist(), [0, 1, 2, -1])
+        self.assertEqual(rowcol(self.transform, 15.0, 5.0), (1, 1))
+
+    def test_grid_xyz_statistics(self):
+        points = [(1, 19, 1.0), (2, 18, 2.0), (3, 17, 6.0), (15, 5, 4.0), (-5, 5, 100.0), (25, 15, -9999)]
+        path = self.write_csv(points)
+        mean, inside, outside = grid_xyz(path, self.transform, self.shape, nodata=-9999)
+        self.assertEqual((inside, outside), (4, 1))
+        self.assertAlmostEqual(float(mean[0, 0]), 3.0)
+        self.assertAlmostEqual(float(mean[1, 1]), 4.0)
+        self.assertEqual(float(mean[0, 2]), -9999)
+        self.assertEqual(float(grid_xyz(path, self.transform, self.shape, "median")[0][0, 0]), 2.0)
+        self.assertEqual(float(grid_xyz(path, self.transform, self.shape, "min")[0][0, 0]), 1.0)
+        self.assertEqual(float(grid_xyz(path, self.transform, self.shape, "max")[0][0, 0]), 6.0)
+        self.assertEqual(float(grid_xyz(path, self.transform, self.shape, "count")[0][0, 0]), 3.0)
+        self.assertEqual(float(grid_xyz(path, self.transform, self.shape, "count")[0][0, 2]), 1.0)
+
+    def test_grid_xyz_invalid_line(self):
+        path = self.write_csv([(1, 19, 1.0), (2, 18), (3, 17, 6.0, 1.0)])
+        with self.assertRaises(ValueError):
+            grid_xyz(path, self.transform, self.shape)
+
+    def test_grid_xyz_matches_legacy(self):
+        rng = np.random.default_rng(0)
+        points = np.column_stack([rng.uniform(-5, 35, 500), rng.uniform(-5, 25, 500), rng.uniform(0, 100, 500)])
+        path = self.write_csv(points.tolist())
+        mean = grid_xyz(path, self.transform, self.shape, block_size=1000)[0]
+        np.testing.assert_allclose(mean, legacy_grid_xyz(path, self.transform, self.shape), rtol=1e-6)
+
+    @unittest.skip("Skipping test due to long run.")
+    def test_grid_xyz_benchmark(self):
+        transform = Affine(10.0, 0, 0.0, 0, -10.0, 10000.0)
+        shape = (1000, 1000)
+        rng = np.random.default_rng(0)
+        for n in (100000, 1000000):
+            points = np.column_stack([rng.uniform(0, 10000, n), rng.uniform(0, 10000, n), rng.uniform(0, 100, n)])
+            path = os.path.join(self.tmp_dir, "points_{}.csv".format(n))
+            np.savetxt(path, points, fmt="%.4f", delimiter=",", header="X,Y,Z", comments="")
+            start = time.time()
+            grid_xyz(path, transform, shape)
+            vectorized = time.time() - start
+            start = time.time()
+            legacy_grid_xyz(path, transform, shape)
+            legacy = time.time() - start
+            print(
+                "{0:,d} points: vectorized {1:.2f} s ({2:,.0f} points/s), legacy {3:.2f} s ({4:,.0f} points/s)".format(
+                    n, vectorized, n / vectorized, legacy, n / legacy
+                )
+            )
+
+
+# Running tests:
+if __name__ == "__main__":
+    cases = [TestXYZGridding]
+    suite = unittest.TestSuite()
+    for t in cases:
+        tests = unittest.TestLoader().loadTestsFromTestCase(t)
+        suite.addTest(tests)
+    unittest.TextTestRunner(verbosity=2).run(suite)